@@ -5,31 +5,83 @@ __init__.py
 Main entry point for initializing the Flask application.
 
 This module is responsible for:
-    - Configuring Flask extensions (SQLAlchemy, Migrate, Marshmallow)
+    - Configuring Flask extensions (SQLAlchemy; Migrate and Marshmallow only
+      when running a Flask CLI command, since no request uses them)
     - Registering custom error handlers
     - Registering REST API routes
+    - Setting up the worker readiness state (see app/warmup.py)
+    - Attaching the revocation snapshot, the host's shared revocation set
+      and the revocation event listener when configured
+    - Enabling request tracing when configured
+    - Setting up the user directory for the minimal claim profile
+    - Enabling the sliding renewal of access tokens by GET /verify when
+      configured
+    - Mounting the GET /verify WSGI fast path when configured
+    - Mounting the adaptive concurrency limiter and the priority lanes
+      (per-endpoint admission control) when configured
     - Creating the Flask application via the `create_app` factory
 
 Functions:
     - register_extensions(app): Initialize and register Flask extensions.
+    - register_cli_extensions(app): Initialize the extensions only needed by
+      CLI commands such as ``flask db``.
     - register_error_handlers(app): Register custom error handlers for the app.
     - create_app(config_class): Application factory that creates and configures
       the Flask app.
 """
 
 import os
+import click
 from flask import Flask
-from flask_migrate import Migrate
-from flask_marshmallow import Marshmallow
 from flask_cors import CORS
 
 from .models import db
 from .logger import logger
 from .routes import register_routes
+from .credentials import init_credentials
+from .directory import init_user_directory
+from .fastpath import init_fast_path
+from .group_commit import init_group_commit
+from .lanes import init_lanes
+from .limiter import init_limiter
+from .renewal import init_sliding_renewal
+from .roles import init_role_claims
+from .revocation.events import init_revocation_events
+from .revocation.shared import init_shared_set
+from .revocation.snapshot import init_snapshot, revocations_cli
+from .tracing import init_tracing
+from .warmup import init_readiness
 
-# Initialisation des extensions Flask
-migrate = Migrate()
-ma = Marshmallow()
+# Extensions importing heavy dependencies (Alembic, Marshmallow) are created
+# on first access through the module-level `__getattr__` below.
+_LAZY_EXTENSIONS = {}
+
+
+def _create_migrate():
+    # pylint: disable=import-outside-toplevel
+    from flask_migrate import Migrate
+    return Migrate()
+
+
+def _create_marshmallow():
+    # pylint: disable=import-outside-toplevel
+    from flask_marshmallow import Marshmallow
+    return Marshmallow()
+
+
+_EXTENSION_FACTORIES = {
+    'migrate': _create_migrate,
+    'ma': _create_marshmallow,
+}
+
+
+def __getattr__(name):
+    """Create the ``migrate`` and ``ma`` extensions on first access."""
+    if name not in _EXTENSION_FACTORIES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if name not in _LAZY_EXTENSIONS:
+        _LAZY_EXTENSIONS[name] = _EXTENSION_FACTORIES[name]()
+    return _LAZY_EXTENSIONS[name]
 
 
 def register_extensions(app):
@@ -40,11 +92,22 @@ def register_extensions(app):
         app (Flask): The Flask application instance.
     """
     db.init_app(app)
-    migrate.init_app(app, db)
-    ma.init_app(app)
     logger.info("Extensions registered successfully.")
 
 
+def register_cli_extensions(app):
+    """
+    Initialize and register the extensions only used by CLI commands.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    __getattr__('migrate').init_app(app, db)
+    __getattr__('ma').init_app(app)
+    app.cli.add_command(revocations_cli)
+    logger.info("CLI extensions registered successfully.")
+
+
 def register_error_handlers(app):
     """
     Register custom error handlers for the Flask application.
@@ -84,7 +147,8 @@ def create_app(config_class):
     logger.info("Creating app in %s environment.", env)
     app = Flask(__name__)
     app.config.from_object(config_class)
-    if env in ('development', 'staging'):
+    cors_enabled = env in ('development', 'staging')
+    if cors_enabled:
         CORS(
             app,
             supports_credentials=True,
@@ -92,8 +156,25 @@ def create_app(config_class):
             )
 
     register_extensions(app)
+    # The Flask CLI loads the application inside a click context.
+    if click.get_current_context(silent=True) is not None:
+        register_cli_extensions(app)
     register_error_handlers(app)
     register_routes(app)
+    init_readiness(app)
+    init_snapshot(app)
+    init_shared_set(app)
+    init_revocation_events(app)
+    init_tracing(app)
+    init_credentials(app)
+    init_user_directory(app)
+    init_role_claims(app)
+    init_group_commit(app)
+    init_sliding_renewal(app)
+    init_fast_path(app, cors_enabled)
+    init_limiter(app)
+    # Outermost, so that admission also covers the fast path.
+    init_lanes(app)
     logger.info("App created successfully.")
 
     return app
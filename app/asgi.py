@@ -0,0 +1,549 @@
+"""
+asgi.py
+-------
+
+ASGI deployment mode for the authentication service.
+
+``POST /login`` spends nearly all of its time waiting for the user service.
+Under a sync server every pending login holds a worker thread; in this mode
+it holds a coroutine, so one process can keep thousands of logins in
+flight:
+
+    - `AuthASGIApp` handles ``POST /login`` on the event loop, with a shared
+      ``aiohttp.ClientSession`` for the user service (`check_credentials_async`)
+      and an SQLAlchemy async engine (aiosqlite or asyncpg) for the refresh
+      token insert; other credential backends (app/credentials) run their
+      ``check_async``;
+    - every other request, login requests whose body is not a JSON object,
+      and any login that fails unexpectedly are handed to the Flask
+      application, which runs in a thread pool (`WSGIBridge`).
+
+Login responses are byte-for-byte those of LoginResource, and tokens are
+issued by the same `app.tokens.issue_login_tokens`. Refresh is still served
+by Flask.
+
+Run with ``uvicorn asgi:app``; the optional dependencies are listed in
+requirements-async.txt.
+"""
+
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from werkzeug.http import dump_cookie
+
+from app.config import _is_memory_sqlite
+from app.logger import logger
+from app.metrics import InstrumentedQueuePool
+from app.models.refresh_token import RefreshToken
+from app.directory import upsert_user
+from app.roles import login_role_claims, upsert_roles
+from app.tokens import COOKIE_OPTIONS, issue_login_tokens
+from app.tracing import (
+    TRACEPARENT_HEADER,
+    TRACESTATE_HEADER,
+    inject_trace_headers,
+    start_span,
+    tracer,
+)
+from app.utils import stub_user
+
+LOGIN_PATH = '/login'
+# Endpoint name Flask-RESTful gives LoginResource, used in request spans.
+LOGIN_ENDPOINT = 'loginresource'
+INVALID_CREDENTIALS = 'Invalid email or password'
+
+# Async drivers replacing the sync ones of DATABASE_URL.
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(database_uri):
+    """
+    Map the application's database URL to its async driver.
+
+    Args:
+        database_uri (str): The sync database URL (``DATABASE_URL``).
+
+    Returns:
+        sqlalchemy.engine.URL: The same database with an async driver.
+
+    Raises:
+        ValueError: For in-memory SQLite, which cannot be shared between
+            the sync and async engines, or an unsupported backend.
+    """
+    url = make_url(database_uri)
+    if _is_memory_sqlite(url):
+        raise ValueError("The ASGI mode needs a file or server database, "
+                         "not in-memory SQLite.")
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver for database backend {backend}.")
+    # psycopg 3 is async-capable as is.
+    if url.drivername == 'postgresql+psycopg':
+        return url
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(options, url):
+    """
+    Adapt ``SQLALCHEMY_ENGINE_OPTIONS`` to an async engine.
+
+    Args:
+        options (dict): The sync engine options.
+        url (sqlalchemy.engine.URL): The async database URL.
+
+    Returns:
+        dict: Keyword arguments for ``create_async_engine``.
+    """
+    options = dict(options)
+    if options.get('poolclass') is InstrumentedQueuePool:
+        # Async engines need the asyncio-aware queue pool, their default.
+        del options['poolclass']
+    if (options.get('poolclass') is NullPool
+            and url.get_driver_name() == 'asyncpg'):
+        # PgBouncer mode: no server-side prepared statements.
+        options['connect_args'] = {'statement_cache_size': 0}
+    if url.get_backend_name() == 'sqlite' and 'pool_size' in options:
+        # SQLite has a single writer: concurrent inserts from more
+        # connections only fail with "database is locked".
+        options.update(pool_size=1, max_overflow=0)
+    return options
+
+
+async def check_credentials_async(client, email, password):
+    """
+    Check user credentials against the user service without blocking.
+
+    Mirrors `app.utils.check_credentials`: a stub user in development and
+    test, a call to the user service in production and staging, None on
+    any failure.
+
+    Args:
+        client (aiohttp.ClientSession): Shared session for the user service.
+        email (str): The user's email address.
+        password (str): The user's password.
+
+    Returns:
+        dict or None: User information dictionary if valid, otherwise None.
+    """
+    env = os.getenv('FLASK_ENV')
+    if env in ['development', 'test']:
+        return stub_user(email)
+    if env not in ['production', 'staging']:
+        logger.error("Unsupported environment: %s", env)
+        return None
+    return await verify_with_user_service_async(client, email, password)
+
+
+async def verify_with_user_service_async(client, email, password):
+    """
+    Coroutine version of `app.utils.verify_with_user_service`.
+
+    Args:
+        client (aiohttp.ClientSession): Shared session for the user service.
+        email (str): The user's email address.
+        password (str): The user's password.
+
+    Returns:
+        dict or None: User information dictionary if valid, otherwise None.
+    """
+    user_service_url = os.getenv('USER_SERVICE_URL')
+    if not user_service_url:
+        logger.error("USER_SERVICE_URL is not set in environment variables.")
+        return None
+    internal_secret = os.getenv('INTERNAL_AUTH_TOKEN')
+    if not internal_secret:
+        logger.error(
+            "INTERNAL_AUTH_TOKEN is not set in environment variables.")
+        return None
+
+    try:
+        with start_span('user_service.verify_password',
+                        url=f"{user_service_url}/verify_password") as span:
+            headers = inject_trace_headers(
+                {'X-Internal-Token': internal_secret})
+            timeout = aiohttp.ClientTimeout(
+                total=float(os.getenv('USER_SERVICE_TIMEOUT', '2')))
+            async with client.post(
+                    f"{user_service_url}/verify_password",
+                    json={'email': email, 'password': password},
+                    headers=headers,
+                    timeout=timeout) as resp:
+                span.set_attribute('http.status_code', resp.status)
+                if resp.status != 200:
+                    logger.error("Failed to fetch user: %s - %s",
+                                 resp.status, await resp.text())
+                    return None
+                user = await resp.json(content_type=None)
+    except asyncio.TimeoutError:
+        logger.error("User service request timed out.")
+        return None
+    except aiohttp.ClientConnectionError:
+        logger.error("User service connection error.")
+        return None
+    except aiohttp.ClientError as e:
+        logger.error("User service request exception: %s", e)
+        return None
+    except ValueError as e:
+        logger.error("Error decoding JSON response: %s", e)
+        return None
+
+    if not isinstance(user, dict) or not user.get('id'):
+        logger.error("Invalid user credentials.")
+        return None
+    return user
+
+
+def _header(scope, name):
+    """Return the first value of a request header, or None."""
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def _is_json(content_type):
+    """Tell whether a content type is JSON, as ``request.is_json`` does."""
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    return mimetype == 'application/json' or (
+        mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+
+def build_environ(scope, body):
+    """
+    Build the WSGI environ of an ASGI HTTP request.
+
+    Args:
+        scope (dict): The ASGI connection scope.
+        body (bytes): The whole request body.
+
+    Returns:
+        dict: The WSGI environ.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = name if name == 'CONTENT_TYPE' else f'HTTP_{name}'
+        if key in environ:
+            separator = '; ' if key == 'HTTP_COOKIE' else ','
+            environ[key] = f'{environ[key]}{separator}{value}'
+        else:
+            environ[key] = value
+    return environ
+
+
+class WSGIBridge:
+    """
+    Serve a WSGI application from ASGI by running it in a thread pool.
+
+    Request bodies are read by the caller and responses are buffered, which
+    suits this service's small JSON payloads.
+
+    Args:
+        wsgi_app (callable): The WSGI application.
+        max_workers (int): Threads running WSGI requests concurrently.
+    """
+
+    def __init__(self, wsgi_app, max_workers):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='wsgi')
+
+    def run(self, environ):
+        """
+        Run one request through the WSGI application.
+
+        Args:
+            environ (dict): The WSGI environ.
+
+        Returns:
+            tuple: ``(status_line, headers, body)``.
+        """
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = status
+            response['headers'] = headers
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+    async def __call__(self, scope, body, send):
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(
+            self.executor, self.run, build_environ(scope, body))
+        await send({
+            'type': 'http.response.start',
+            'status': int(status[:3]),
+            'headers': [(name.lower().encode('latin-1'),
+                         value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def shutdown(self):
+        """Wait for running requests and stop the threads."""
+        self.executor.shutdown(wait=True)
+
+
+class AuthASGIApp:
+    """
+    ASGI application answering ``POST /login`` on the event loop.
+
+    The HTTP session and the async engine are created on first use, in the
+    server's event loop, and closed on lifespan shutdown.
+
+    Args:
+        app (Flask): The Flask application, for its configuration and to
+            serve every other request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.bridge = WSGIBridge(app.wsgi_app, app.config['ASYNC_WSGI_THREADS'])
+        self._client = None
+        self._engine = None
+        # Flask-RESTful serializes error dictionaries with json.dumps and
+        # the RESTFUL_JSON settings, followed by a newline.
+        settings = dict(app.config.get('RESTFUL_JSON', {}))
+        if app.debug:
+            settings.setdefault('indent', 4)
+        self._unauthorized_body = (json.dumps(
+            {'message': INVALID_CREDENTIALS}, **settings) + '\n').encode()
+        with app.app_context():
+            self._success_body = app.json.response(
+                {'message': 'Login successful'}).get_data()
+
+    @property
+    def client(self):
+        """The shared HTTP session for the user service."""
+        if self._client is None:
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.app.config['USER_SERVICE_MAX_CONNECTIONS']))
+        return self._client
+
+    @property
+    def engine(self):
+        """The async engine used for the refresh token insert."""
+        if self._engine is None:
+            url = async_database_url(
+                self.app.config['SQLALCHEMY_DATABASE_URI'])
+            self._engine = create_async_engine(url, **async_engine_options(
+                self.app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}), url))
+        return self._engine
+
+    async def aclose(self):
+        """Close the HTTP session and engine and stop the WSGI threads."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.bridge.shutdown)
+
+    async def login(self, data):
+        """
+        Authenticate a user and issue tokens, as LoginResource does.
+
+        Args:
+            data (dict): The decoded JSON request body.
+
+        Returns:
+            tuple: ``(status_code, headers, body)``.
+        """
+        logger.info("Login attempt started")
+        if not data or 'email' not in data or 'password' not in data:
+            logger.error("Invalid login request: Missing email or password")
+            return 401, [], self._unauthorized_body
+
+        email = data['email']
+        user = await self.check_credentials(email, data['password'])
+        if not user:
+            logger.error("Login failed for email: %s", email)
+            return 401, [], self._unauthorized_body
+
+        logger.info("Login successful for user: %s", user['email'])
+        role_claims, cache_entry = None, None
+        roles = self.app.extensions.get('role_claims')
+        if roles is not None:
+            # The cache read and the user service call are blocking.
+            loop = asyncio.get_running_loop()
+            role_claims, cache_entry = await loop.run_in_executor(
+                None, roles.lookup, user['id'], login_role_claims(user))
+        tokens = issue_login_tokens(user, os.environ['JWT_SECRET'],
+                                    self.app.config['TOKEN_PROFILE'],
+                                    role_claims)
+        async with self.engine.begin() as connection:
+            await connection.execute(insert(RefreshToken), {
+                'token': tokens['refresh_token'],
+                'user_id': user['id'],
+                'company_id': user.get('company_id'),
+                'email': user['email'],
+                'expires_at': tokens['refresh_token_exp'],
+            })
+            if cache_entry is not None:
+                await connection.execute(
+                    upsert_roles(connection.dialect.name, *cache_entry))
+            if 'user_directory' in self.app.extensions:
+                await connection.execute(
+                    upsert_user(connection.dialect.name, user))
+
+        cookies = [
+            dump_cookie(name, tokens[name], expires=tokens[f'{name}_exp'],
+                        **COOKIE_OPTIONS)
+            for name in ('access_token', 'refresh_token')
+        ]
+        return 200, cookies, self._success_body
+
+    async def check_credentials(self, email, password):
+        """
+        Check credentials with the configured backend (see app/credentials).
+
+        The user service is called with the shared ``aiohttp`` session;
+        other backends use their `check_async`.
+        """
+        backend = self.app.extensions['credentials']
+        if backend.name == 'auto':
+            return await check_credentials_async(self.client, email, password)
+        if backend.name == 'user_service':
+            return await verify_with_user_service_async(self.client, email,
+                                                        password)
+        return await backend.check_async(email, password)
+
+    async def _traced_login(self, scope, data):
+        """Run `login` inside a request span, as Flask's hooks would."""
+        span = tracer.start_span(
+            f'POST {LOGIN_PATH}',
+            {'http.method': 'POST', 'http.path': LOGIN_PATH},
+            traceparent=_header(scope, TRACEPARENT_HEADER.encode()),
+            tracestate=_header(scope, TRACESTATE_HEADER.encode()),
+        )
+        with span:
+            response = await self.login(data)
+            span.set_attribute('http.status_code', response[0])
+            span.set_attribute('http.endpoint', LOGIN_ENDPOINT)
+        return response
+
+    @staticmethod
+    def _json_object(scope, body):
+        """Decode a JSON object body, or return None to let Flask reply."""
+        if not _is_json(_header(scope, b'content-type')):
+            return None
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope: {scope['type']}")
+
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        body = bytes(body)
+
+        data = None
+        if scope['path'] == LOGIN_PATH and scope['method'] == 'POST':
+            data = self._json_object(scope, body)
+        if data is None:
+            await self.bridge(scope, body, send)
+            return
+        try:
+            if tracer.enabled:
+                status, cookies, payload = await self._traced_login(scope,
+                                                                    data)
+            else:
+                status, cookies, payload = await self.login(data)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Let Flask produce its usual response.
+            logger.error("Async login failed, falling back to Flask: %s", e)
+            await self.bridge(scope, body, send)
+            return
+        headers = [(b'content-type', b'application/json'),
+                   (b'content-length', str(len(payload)).encode())]
+        headers += [(b'set-cookie', cookie.encode('latin-1'))
+                    for cookie in cookies]
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': headers})
+        await send({'type': 'http.response.body', 'body': payload})
+
+
+def create_asgi_app(app):
+    """
+    Wrap the Flask application for the ASGI deployment mode.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        AuthASGIApp: The ASGI application.
+    """
+    logger.info("ASGI mode: POST /login served on the event loop.")
+    return AuthASGIApp(app)
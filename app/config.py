@@ -13,17 +13,242 @@ Classes:
     - ProductionConfig: Configuration for production.
 
 Each class defines main parameters such as the secret key, database URL,
-debug mode, and SQLAlchemy modification tracking.
+debug mode, SQLAlchemy modification tracking and connection pool options
+(sized per environment, overridable through ``DB_POOL_*`` variables).
+Optional features (such as tracing) are read from environment variables by
+the base class.
 """
 
 import os
 
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from app.metrics import InstrumentedQueuePool
+
+
+def _env_bool(name, default=False):
+    """Read a boolean flag from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _is_memory_sqlite(url):
+    """Tell whether ``url`` points to an in-memory SQLite database."""
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:')
+        or url.query.get('mode') == 'memory')
+
+
+def _engine_options(database_uri, pool_size, max_overflow, pool_timeout=10):
+    """
+    Build ``SQLALCHEMY_ENGINE_OPTIONS`` for an environment.
+
+    The arguments are the environment's defaults; ``DB_POOL_SIZE``,
+    ``DB_MAX_OVERFLOW`` and ``DB_POOL_TIMEOUT`` override them. With
+    ``DB_POOL_MODE=pgbouncer`` the application keeps no pool of its own
+    (``NullPool``) and disables server-side prepared statements, as
+    required behind PgBouncer in transaction pooling mode.
+
+    Args:
+        database_uri (str or None): The database URL.
+        pool_size (int): Connections kept open per process.
+        max_overflow (int): Extra connections allowed under load.
+        pool_timeout (float): Seconds to wait for a connection.
+
+    Returns:
+        dict: Keyword arguments for ``create_engine``.
+    """
+    options = {
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '1800')),
+    }
+    if not database_uri:
+        return options
+    url = make_url(database_uri)
+    if _is_memory_sqlite(url):
+        # Flask-SQLAlchemy shares a single connection (StaticPool).
+        return options
+    if os.environ.get('DB_POOL_MODE', 'queue') == 'pgbouncer':
+        connect_args = {}
+        if url.get_driver_name() == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        elif url.get_driver_name() == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+        # Every checkout opens a fresh connection to PgBouncer: nothing to
+        # ping or recycle.
+        return {'poolclass': NullPool, 'connect_args': connect_args}
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', pool_size)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', max_overflow)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', pool_timeout)),
+    })
+    return options
+
 
 class Config:
     """Base configuration common to all environments."""
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connections opened by each worker before reporting ready (see
+    # app/warmup.py). Pool options are set per environment below.
+    DB_POOL_WARMUP = int(os.environ.get('DB_POOL_WARMUP', '2'))
+
+    # Minimum seconds between warm-up retries triggered by GET /ready.
+    READINESS_RETRY_INTERVAL = float(
+        os.environ.get('READINESS_RETRY_INTERVAL', '5'))
+
+    # Answer GET /verify from WSGI middleware (see app/fastpath.py).
+    VERIFY_FAST_PATH = _env_bool('VERIFY_FAST_PATH')
+
+    # Longest max-age of GET /forward-auth answers (see
+    # app/resources/forward_auth.py): how long a reverse proxy may keep
+    # accepting a revoked token from its cache.
+    FORWARD_AUTH_MAX_AGE = float(os.environ.get('FORWARD_AUTH_MAX_AGE', '5'))
+
+    # Unix socket of the verification sidecar (see app/sidecar.py and
+    # sidecar.py), its permissions (octal) and the largest request frame.
+    SIDECAR_SOCKET = os.environ.get('SIDECAR_SOCKET',
+                                    '/tmp/pm-auth-verify.sock')
+    SIDECAR_SOCKET_MODE = os.environ.get('SIDECAR_SOCKET_MODE', '660')
+    SIDECAR_MAX_FRAME = int(os.environ.get('SIDECAR_MAX_FRAME', '8192'))
+
+    # Claim profile of the access tokens issued (see app/tokens.py): full,
+    # compact or minimal. Tokens of every profile are accepted. With
+    # minimal, GET /verify reads emails from the user directory and caches
+    # them for USER_DIRECTORY_TTL seconds (see app/directory.py).
+    TOKEN_PROFILE = os.environ.get('TOKEN_PROFILE', 'full')
+    USER_DIRECTORY_TTL = float(os.environ.get('USER_DIRECTORY_TTL', '300'))
+
+    # Credential backend of POST /login (see app/credentials): auto, stub,
+    # user_service or database. The database backend reads the user table
+    # of CREDENTIAL_DATABASE_URL (default: DATABASE_URL) and verifies
+    # password hashes in CREDENTIAL_HASH_WORKERS threads, with at most
+    # CREDENTIAL_HASH_QUEUE checks waiting for CREDENTIAL_HASH_TIMEOUT
+    # seconds.
+    CREDENTIAL_BACKEND = os.environ.get('CREDENTIAL_BACKEND', 'auto')
+    CREDENTIAL_DATABASE_URL = os.environ.get('CREDENTIAL_DATABASE_URL')
+    CREDENTIAL_USER_TABLE = os.environ.get('CREDENTIAL_USER_TABLE', 'users')
+    CREDENTIAL_HASH_WORKERS = int(
+        os.environ.get('CREDENTIAL_HASH_WORKERS', '2'))
+    CREDENTIAL_HASH_QUEUE = int(os.environ.get('CREDENTIAL_HASH_QUEUE', '32'))
+    CREDENTIAL_HASH_TIMEOUT = float(
+        os.environ.get('CREDENTIAL_HASH_TIMEOUT', '5'))
+
+    # Role claims (see app/roles.py): login and refresh embed the user's
+    # roles and permissions, fetched from the user service and cached per
+    # user for ROLE_CACHE_TTL seconds.
+    ROLE_CLAIMS = _env_bool('ROLE_CLAIMS')
+    ROLE_CACHE_TTL = float(os.environ.get('ROLE_CACHE_TTL', '300'))
+
+    # Group commit (see app/group_commit.py): login and refresh writes
+    # arriving within GROUP_COMMIT_MAX_WAIT_MS of each other are committed
+    # together, at most GROUP_COMMIT_MAX_BATCH per transaction; a write not
+    # started within GROUP_COMMIT_TIMEOUT seconds is cancelled (503).
+    GROUP_COMMIT = _env_bool('GROUP_COMMIT')
+    GROUP_COMMIT_MAX_BATCH = int(os.environ.get('GROUP_COMMIT_MAX_BATCH',
+                                                '64'))
+    GROUP_COMMIT_MAX_WAIT_MS = float(
+        os.environ.get('GROUP_COMMIT_MAX_WAIT_MS', '2'))
+    GROUP_COMMIT_TIMEOUT = float(os.environ.get('GROUP_COMMIT_TIMEOUT', '5'))
+
+    # Sliding renewal (see app/renewal.py): GET /verify sets a new access
+    # token cookie when the token expires within the window. A JTI is
+    # renewed at most once per interval, and no token more than
+    # SLIDING_RENEWAL_MAX_SESSION seconds after the login (default: the
+    # refresh token lifetime).
+    SLIDING_RENEWAL = _env_bool('SLIDING_RENEWAL')
+    SLIDING_RENEWAL_WINDOW = float(
+        os.environ.get('SLIDING_RENEWAL_WINDOW', '300'))
+    SLIDING_RENEWAL_INTERVAL = float(
+        os.environ.get('SLIDING_RENEWAL_INTERVAL', '60'))
+    SLIDING_RENEWAL_MAX_SESSION = float(
+        os.environ.get('SLIDING_RENEWAL_MAX_SESSION', '604800'))
+
+    # Priority lanes (see app/lanes.py): the capacity is the number of
+    # request threads per worker; verify and refresh reserve slots that
+    # login and other requests cannot take.
+    PRIORITY_LANES = _env_bool('PRIORITY_LANES')
+    LANE_CAPACITY = int(os.environ.get(
+        'LANE_CAPACITY', os.environ.get('GUNICORN_THREADS', '4')))
+    LANE_VERIFY_RESERVED = int(os.environ.get('LANE_VERIFY_RESERVED', '1'))
+    LANE_REFRESH_RESERVED = int(os.environ.get('LANE_REFRESH_RESERVED', '1'))
+    LANE_LOGIN_LIMIT = int(os.environ.get('LANE_LOGIN_LIMIT', '0'))
+    LANE_QUEUE_DEPTH = int(os.environ.get('LANE_QUEUE_DEPTH', '0'))
+    LANE_QUEUE_TIMEOUT = float(os.environ.get('LANE_QUEUE_TIMEOUT', '0.5'))
+    LANE_RETRY_AFTER = int(os.environ.get('LANE_RETRY_AFTER', '1'))
+
+    # Adaptive concurrency limit per endpoint class (see app/limiter.py),
+    # bounded by the worker's capacity.
+    ADAPTIVE_LIMIT = _env_bool('ADAPTIVE_LIMIT')
+    LIMIT_INITIAL = int(os.environ.get('LIMIT_INITIAL', LANE_CAPACITY))
+    LIMIT_MIN = int(os.environ.get('LIMIT_MIN', '1'))
+    LIMIT_MAX = int(os.environ.get('LIMIT_MAX', LANE_CAPACITY))
+    LIMIT_LATENCY_TARGET_MS = float(
+        os.environ.get('LIMIT_LATENCY_TARGET_MS', '250'))
+    LIMIT_BACKOFF = float(os.environ.get('LIMIT_BACKOFF', '0.9'))
+
+    # Revocation snapshot (see app/revocation/snapshot.py): the file written
+    # by ``flask revocations snapshot``, how often workers look for a new
+    # one, and the age up to which it answers alone when the database is
+    # down.
+    REVOCATION_SNAPSHOT_PATH = os.environ.get('REVOCATION_SNAPSHOT_PATH')
+    REVOCATION_SNAPSHOT_CHECK_INTERVAL = float(
+        os.environ.get('REVOCATION_SNAPSHOT_CHECK_INTERVAL', '1'))
+    REVOCATION_SNAPSHOT_MAX_AGE = float(
+        os.environ.get('REVOCATION_SNAPSHOT_MAX_AGE', '300'))
+
+    # Revocation set shared by the workers of a host (see
+    # app/revocation/shared.py). Trusting misses skips the blacklist query
+    # for valid tokens once the set is complete: single node, or with the
+    # revocation events below.
+    REVOCATION_SHARED_SET = _env_bool('REVOCATION_SHARED_SET')
+    REVOCATION_SHARED_PATH = os.environ.get(
+        'REVOCATION_SHARED_PATH', '/dev/shm/pm-auth-revocations')
+    REVOCATION_SHARED_CAPACITY = int(
+        os.environ.get('REVOCATION_SHARED_CAPACITY', '131072'))
+    REVOCATION_SHARED_MAX_PROBE = int(
+        os.environ.get('REVOCATION_SHARED_MAX_PROBE', '32'))
+    REVOCATION_SHARED_EVICTION = os.environ.get(
+        'REVOCATION_SHARED_EVICTION', 'expiring')
+    REVOCATION_SHARED_TRUST_MISSES = _env_bool(
+        'REVOCATION_SHARED_TRUST_MISSES')
+
+    # Revocation events between nodes (see app/revocation/events.py):
+    # LISTEN/NOTIFY on Postgres, polling otherwise or while disconnected.
+    # Misses in the shared set are trusted only if the listener confirmed
+    # it up to date within the last REVOCATION_EVENTS_MAX_LAG seconds.
+    REVOCATION_EVENTS = _env_bool('REVOCATION_EVENTS')
+    REVOCATION_EVENTS_LISTEN_URL = os.environ.get(
+        'REVOCATION_EVENTS_LISTEN_URL')
+    REVOCATION_EVENTS_POLL_INTERVAL = float(
+        os.environ.get('REVOCATION_EVENTS_POLL_INTERVAL', '1'))
+    REVOCATION_EVENTS_OVERLAP = float(
+        os.environ.get('REVOCATION_EVENTS_OVERLAP', '5'))
+    REVOCATION_EVENTS_RECONNECT_INTERVAL = float(
+        os.environ.get('REVOCATION_EVENTS_RECONNECT_INTERVAL', '5'))
+    REVOCATION_EVENTS_MAX_LAG = float(
+        os.environ.get('REVOCATION_EVENTS_MAX_LAG', '10'))
+
+    # ASGI deployment mode (see app/asgi.py): threads serving the requests
+    # handed to Flask, and connections to the user service.
+    ASYNC_WSGI_THREADS = int(os.environ.get('ASYNC_WSGI_THREADS', '16'))
+    USER_SERVICE_MAX_CONNECTIONS = int(
+        os.environ.get('USER_SERVICE_MAX_CONNECTIONS', '1000'))
+
+    # Request tracing (see app/tracing.py)
+    TRACING_ENABLED = _env_bool('TRACING_ENABLED')
+    TRACING_EXPORTER = os.environ.get('TRACING_EXPORTER', 'file')
+    TRACING_FILE = os.environ.get('TRACING_FILE', 'traces.jsonl')
+    TRACING_QUEUE_SIZE = int(os.environ.get('TRACING_QUEUE_SIZE', '2048'))
+    TRACING_BATCH_SIZE = int(os.environ.get('TRACING_BATCH_SIZE', '256'))
+    TRACING_FLUSH_INTERVAL = float(
+        os.environ.get('TRACING_FLUSH_INTERVAL', '1.0'))
+
 
 class DevelopmentConfig(Config):
     """Configuration for the development environment."""
@@ -31,6 +256,8 @@ class DevelopmentConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if not SQLALCHEMY_DATABASE_URI:
         raise ValueError("DATABASE_URL environment variable is not set.")
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(
+        SQLALCHEMY_DATABASE_URI, 5, 5)
 
 
 class TestingConfig(Config):
@@ -39,6 +266,8 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if not SQLALCHEMY_DATABASE_URI:
         raise ValueError("DATABASE_URL environment variable is not set.")
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(
+        SQLALCHEMY_DATABASE_URI, 5, 5)
 
 
 class StagingConfig(Config):
@@ -47,6 +276,8 @@ class StagingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if not SQLALCHEMY_DATABASE_URI:
         raise ValueError("DATABASE_URL environment variable is not set.")
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(
+        SQLALCHEMY_DATABASE_URI, 5, 10)
 
 
 class ProductionConfig(Config):
@@ -55,3 +286,5 @@ class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if not SQLALCHEMY_DATABASE_URI:
         raise ValueError("DATABASE_URL environment variable is not set.")
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(
+        SQLALCHEMY_DATABASE_URI, 10, 20)
@@ -0,0 +1,122 @@
+"""
+credentials.__init__.py
+-----------------------
+
+Credential backends: how ``POST /login`` checks an email and password.
+``CREDENTIAL_BACKEND`` selects one of `BACKENDS`:
+
+    - ``auto`` (default): the stub in development and test, the user
+      service in production and staging (`app.utils.check_credentials`);
+    - ``stub``: any password is accepted (app/credentials/stub.py); refused
+      in production and staging;
+    - ``user_service``: the user service over HTTP
+      (app/credentials/user_service.py);
+    - ``database``: password hashes verified against a read-only user table,
+      without a network hop (app/credentials/database.py).
+
+Every backend follows the same contract (`CredentialBackend`): the user as
+a dictionary if the credentials are valid, None otherwise or on failure.
+"""
+
+import os
+
+from flask import current_app
+
+from app import utils
+from app.credentials.base import CredentialBackend
+from app.credentials.database import DatabaseBackend, read_only_engine
+from app.credentials.stub import StubBackend
+from app.credentials.user_service import UserServiceBackend
+from app.logger import logger
+from app.models import db
+
+
+class AutoBackend(CredentialBackend):
+    """Dispatches on ``FLASK_ENV`` (see `app.utils.check_credentials`)."""
+
+    name = 'auto'
+
+    def check(self, email, password):
+        return utils.check_credentials(email, password)
+
+
+def _database_backend(app):
+    """Create the database backend from the application's configuration."""
+    config = app.config
+    database_url = config.get('CREDENTIAL_DATABASE_URL')
+    if database_url:
+        engine = read_only_engine(database_url)
+    else:
+        with app.app_context():
+            engine = db.engine
+    return DatabaseBackend(
+        engine,
+        config['CREDENTIAL_USER_TABLE'],
+        workers=config['CREDENTIAL_HASH_WORKERS'],
+        queue=config['CREDENTIAL_HASH_QUEUE'],
+        timeout=config['CREDENTIAL_HASH_TIMEOUT'],
+        owns_engine=bool(database_url),
+    )
+
+
+# CREDENTIAL_BACKEND value -> factory taking the application.
+BACKENDS = {
+    'auto': lambda app: AutoBackend(),
+    'stub': lambda app: StubBackend(),
+    'user_service': lambda app: UserServiceBackend(),
+    'database': _database_backend,
+}
+
+
+def create_backend(app):
+    """
+    Create the credential backend selected by ``CREDENTIAL_BACKEND``.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        CredentialBackend: The backend.
+
+    Raises:
+        ValueError: If the backend is unknown, or is the stub in production
+            or staging.
+    """
+    name = app.config.get('CREDENTIAL_BACKEND', 'auto')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown CREDENTIAL_BACKEND: {name}')
+    if name == 'stub' and os.getenv('FLASK_ENV') in ['production', 'staging']:
+        raise ValueError('The stub credential backend accepts any password '
+                         'and cannot be used in production or staging')
+    return BACKENDS[name](app)
+
+
+def init_credentials(app):
+    """
+    Set up the credential backend.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        CredentialBackend: The backend, also stored in
+        ``app.extensions['credentials']``.
+    """
+    backend = create_backend(app)
+    app.extensions['credentials'] = backend
+    logger.info("Credential backend: %s", backend.name)
+    return backend
+
+
+def check_credentials(email, password):
+    """
+    Check user credentials with the application's backend.
+
+    Args:
+        email (str): The user's email address.
+        password (str): The user's password.
+
+    Returns:
+        dict or None: User information dictionary if valid, otherwise None.
+    """
+    return current_app.extensions['credentials'].check(email, password)
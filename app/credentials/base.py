@@ -0,0 +1,53 @@
+"""
+base.py
+-------
+
+The interface of credential backends: what ``POST /login`` calls to check
+an email and password (see app/credentials/__init__.py).
+"""
+
+import asyncio
+
+
+class CredentialBackend:
+    """
+    Checks user credentials.
+
+    Subclasses implement `check`; `check_async` runs it in the event loop's
+    default executor unless overridden.
+
+    Attributes:
+        name (str): The ``CREDENTIAL_BACKEND`` value selecting the backend.
+        verifies_passwords (bool): False for backends accepting any
+            password (the development stub).
+    """
+
+    name = None
+    verifies_passwords = True
+
+    def check(self, email, password):
+        """
+        Check an email and password.
+
+        Args:
+            email (str): The user's email address.
+            password (str): The user's password.
+
+        Returns:
+            dict or None: The user (at least ``id`` and ``email``, and
+            ``company_id`` when known) if the credentials are valid,
+            otherwise None, including when the backend fails.
+        """
+        raise NotImplementedError
+
+    async def check_async(self, email, password):
+        """Coroutine version of `check`, for the ASGI mode (app/asgi.py)."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.check, email, password)
+
+    def close(self):
+        """Release the backend's resources."""
+
+    def summary(self):
+        """Return the backend's name and counters as a dictionary."""
+        return {'backend': self.name}
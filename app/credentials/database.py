@@ -0,0 +1,249 @@
+"""
+database.py
+-----------
+
+The direct-database credential backend: password hashes are read from the
+user table and verified in this process, without a call to the user
+service.
+
+The table is read-only for this service: one ``SELECT`` by email, on the
+application's engine or on ``CREDENTIAL_DATABASE_URL`` (a PostgreSQL
+connection then runs read-only transactions). It is ``CREDENTIAL_USER_TABLE``
+(``users`` by default, ``schema.table`` accepted) with the columns ``id``,
+``email``, ``company_id`` and ``hashed_password``, the latter in Werkzeug's
+``generate_password_hash`` format.
+
+Hashing is deliberately slow, so it runs in a pool of
+``CREDENTIAL_HASH_WORKERS`` threads, never on a request thread, with at
+most ``CREDENTIAL_HASH_QUEUE`` checks waiting: beyond that, or after
+``CREDENTIAL_HASH_TIMEOUT`` seconds, a login fails at once instead of
+holding its request thread. Unknown emails, and users whose
+``hashed_password`` is empty or malformed, are checked against a dummy hash
+of the same method, built in the pool too, so they take as long as a wrong
+password.
+"""
+
+import asyncio
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from sqlalchemy import bindparam, column, create_engine, select, table
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.credentials.base import CredentialBackend
+from app.logger import logger
+
+USER_COLUMNS = ('id', 'email', 'company_id', 'hashed_password')
+
+
+def user_query(table_name):
+    """
+    Build the lookup of a user by email.
+
+    Args:
+        table_name (str): The user table, optionally ``schema.table``.
+
+    Returns:
+        sqlalchemy.sql.Select: The query, with an ``email`` parameter.
+    """
+    schema, _, name = table_name.rpartition('.')
+    users = table(name, *(column(col) for col in USER_COLUMNS),
+                  schema=schema or None)
+    return select(users).where(users.c.email == bindparam('email'))
+
+
+def read_only_engine(database_url):
+    """
+    Create the engine of a separate user database.
+
+    Args:
+        database_url (str): The user database's URL.
+
+    Returns:
+        sqlalchemy.engine.Engine: The engine; on PostgreSQL its
+        transactions are read-only.
+    """
+    options = {'pool_pre_ping': True}
+    if make_url(database_url).get_backend_name() == 'postgresql':
+        options['connect_args'] = {
+            'options': '-c default_transaction_read_only=on'}
+    return create_engine(database_url, **options)
+
+
+class DatabaseBackend(CredentialBackend):  # pylint: disable=too-many-instance-attributes
+    """
+    Checks credentials against the user table.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine of the user database.
+        table_name (str): The user table.
+        workers (int): Hashing threads.
+        queue (int): Checks allowed to wait for a hashing thread.
+        timeout (float): Seconds a check waits for its hash.
+        owns_engine (bool): Dispose of the engine in `close`.
+
+    Attributes:
+        rejected (int): Checks failed because the hashing queue was full.
+        timeouts (int): Checks failed after waiting ``timeout`` seconds.
+        errors (int): Checks failed because the lookup or the hash check
+            failed.
+    """
+
+    name = 'database'
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, engine, table_name='users', workers=2, queue=32,
+                 timeout=5.0, owns_engine=False):
+        self.engine = engine
+        self.query = user_query(table_name)
+        self.workers = workers
+        self.timeout = timeout
+        self.owns_engine = owns_engine
+        self.rejected = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._hashers = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='credential-hash')
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        # Hash method (e.g. ``scrypt:32768:8:1``) -> hash of a random
+        # password, checked for unknown emails.
+        self._dummies = {}
+        self._method = None
+
+    def _lookup(self, email):
+        """Return the user's row as a mapping, or None."""
+        with self.engine.connect() as conn:
+            return conn.execute(self.query, {'email': email}).mappings().first()
+
+    @staticmethod
+    def _usable(row):
+        """Return the row if its hash can be checked, else None."""
+        if row is None:
+            return None
+        hashed = row['hashed_password']
+        if not isinstance(hashed, str) or hashed.count('$') < 2:
+            return None
+        return row
+
+    def _dummy_hash(self):
+        """Return a hash of the same method as the last user's."""
+        method = self._method or 'scrypt'
+        if method not in self._dummies:
+            self._dummies[method] = generate_password_hash(
+                secrets.token_urlsafe(16), method=method)
+        return self._dummies[method]
+
+    def _verify(self, hashed, password):
+        """
+        Check a password in a hashing thread.
+
+        Args:
+            hashed (str or None): The user's hash; None checks the dummy
+                hash and fails.
+
+        Returns:
+            bool: Whether the password matches.
+        """
+        if hashed is None:
+            check_password_hash(self._dummy_hash(), password)
+            return False
+        valid = check_password_hash(hashed, password)
+        # Only a method Werkzeug knows is used for dummy hashes.
+        self._method = hashed.partition('$')[0]
+        return valid
+
+    def _submit(self, row, password):
+        """
+        Queue the password check of a looked-up, usable row (or None).
+
+        Returns:
+            concurrent.futures.Future or None: The check's future, or None
+            if the hashing queue is full.
+        """
+        hashed = row['hashed_password'] if row is not None else None
+        # Released by the future's callback, once the hash is checked.
+        if not self._slots.acquire(blocking=False):  # pylint: disable=consider-using-with
+            self.rejected += 1
+            logger.warning("Credential check rejected: hashing queue full.")
+            return None
+        future = self._hashers.submit(self._verify, hashed, password)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    @staticmethod
+    def _user(row, valid):
+        """Return the user of a successful check, or None."""
+        if row is None or not valid:
+            return None
+        return {
+            'id': str(row['id']),
+            'email': row['email'],
+            'company_id': None if row['company_id'] is None
+            else str(row['company_id']),
+        }
+
+    def check(self, email, password):
+        try:
+            row = self._lookup(email)
+        except SQLAlchemyError as e:
+            self.errors += 1
+            logger.error("User lookup failed: %s", e)
+            return None
+        row = self._usable(row)
+        future = self._submit(row, password)
+        if future is None:
+            return None
+        try:
+            valid = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.timeouts += 1
+            logger.error("Password check timed out.")
+            return None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.errors += 1
+            logger.error("Password check failed: %s", e)
+            return None
+        return self._user(row, valid)
+
+    async def check_async(self, email, password):
+        try:
+            row = await asyncio.get_running_loop().run_in_executor(
+                None, self._lookup, email)
+        except SQLAlchemyError as e:
+            self.errors += 1
+            logger.error("User lookup failed: %s", e)
+            return None
+        row = self._usable(row)
+        future = self._submit(row, password)
+        if future is None:
+            return None
+        try:
+            valid = await asyncio.wait_for(asyncio.wrap_future(future),
+                                           self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error("Password check timed out.")
+            return None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.errors += 1
+            logger.error("Password check failed: %s", e)
+            return None
+        return self._user(row, valid)
+
+    def close(self):
+        self._hashers.shutdown(wait=False, cancel_futures=True)
+        if self.owns_engine:
+            self.engine.dispose()
+
+    def summary(self):
+        return {
+            'backend': self.name,
+            'hash_workers': self.workers,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+        }
@@ -0,0 +1,19 @@
+"""
+stub.py
+-------
+
+The development and test credential backend: any password is accepted.
+"""
+
+from app.credentials.base import CredentialBackend
+from app.utils import stub_user
+
+
+class StubBackend(CredentialBackend):
+    """Accepts every email and password (see `app.utils.stub_user`)."""
+
+    name = 'stub'
+    verifies_passwords = False
+
+    def check(self, email, password):
+        return stub_user(email)
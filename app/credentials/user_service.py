@@ -0,0 +1,25 @@
+"""
+user_service.py
+---------------
+
+The HTTP credential backend: the user service's ``/verify_password``
+endpoint, configured by ``USER_SERVICE_URL``, ``INTERNAL_AUTH_TOKEN`` and
+``USER_SERVICE_TIMEOUT``.
+"""
+
+from app.credentials.base import CredentialBackend
+from app.utils import verify_with_user_service
+
+
+class UserServiceBackend(CredentialBackend):
+    """
+    Checks credentials with the user service, whatever ``FLASK_ENV``.
+
+    The ASGI mode calls the user service with its own ``aiohttp`` session
+    instead of `check_async` (see `app.asgi.verify_with_user_service_async`).
+    """
+
+    name = 'user_service'
+
+    def check(self, email, password):
+        return verify_with_user_service(email, password)
@@ -0,0 +1,161 @@
+"""
+directory.py
+------------
+
+User directory: the email of every user who logged in, for access tokens of
+the ``minimal`` claim profile (see app/tokens.py), which leave it out.
+
+Logins record the user with `upsert_user` in their transaction. ``GET
+/verify`` then reads the email of a token without one through
+`UserDirectory`, which keeps the answers of each worker for ``ttl`` seconds:
+a user's email costs one query per worker and ``ttl``, not one per request.
+An email changed at the user service is picked up at the user's next login,
+and served once the cached entry expires.
+"""
+
+import threading
+import time
+
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.models.user_directory import UserDirectoryEntry
+from app.tokens import CLAIM_PROFILES
+
+EMAIL_QUERY = (
+    select(UserDirectoryEntry.email)
+    .where(UserDirectoryEntry.user_id == bindparam('user_id'))
+)
+
+# Users cached per worker; the cache is emptied when full.
+MAX_CACHED_USERS = 100000
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE.
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def upsert_user(dialect_name, user):
+    """
+    Build the statement recording a user's email at login.
+
+    Args:
+        dialect_name (str): The database dialect (``postgresql`` or
+            ``sqlite``).
+        user (dict): The user returned by the credential check.
+
+    Returns:
+        sqlalchemy.sql.Insert: An insert updating the existing entry.
+
+    Raises:
+        ValueError: If the dialect has no upsert.
+    """
+    if dialect_name not in UPSERT_INSERTS:
+        raise ValueError(f'No upsert for the {dialect_name} dialect')
+    company_id = user.get('company_id')
+    statement = UPSERT_INSERTS[dialect_name](UserDirectoryEntry).values(
+        user_id=str(user['id']),
+        email=user['email'],
+        company_id=None if company_id is None else str(company_id),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[UserDirectoryEntry.user_id],
+        set_={'email': statement.excluded.email,
+              'company_id': statement.excluded.company_id,
+              'updated_at': statement.excluded.updated_at},
+    )
+
+
+class UserDirectory:
+    """
+    Cached email lookups in the user directory.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        ttl (float): Seconds an answer is reused.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that queried the database.
+        errors (int): Lookups that failed (no email reported).
+    """
+
+    def __init__(self, engine, ttl=300.0):
+        self.engine = engine
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        # user_id -> (email or None, expiry on the monotonic clock).
+        self._cache = {}
+
+    def email(self, user_id):
+        """
+        Return the email of a user.
+
+        Args:
+            user_id: The ``sub`` claim of the token.
+
+        Returns:
+            str or None: The email, or None if the user is unknown or the
+            database fails.
+        """
+        user_id = str(user_id)
+        now = time.monotonic()
+        cached = self._cache.get(user_id)
+        if cached is not None and cached[1] > now:
+            self.hits += 1
+            return cached[0]
+        try:
+            with self.engine.connect() as conn:
+                email = conn.execute(EMAIL_QUERY,
+                                     {'user_id': user_id}).scalar()
+        except SQLAlchemyError as e:
+            self.errors += 1
+            logger.error("User directory lookup failed: %s", e)
+            return None
+        with self._lock:
+            self.misses += 1
+            if len(self._cache) >= MAX_CACHED_USERS:
+                self._cache.clear()
+            self._cache[user_id] = (email, now + self.ttl)
+        return email
+
+    def summary(self):
+        """Return the lookup counters as a dictionary."""
+        return {
+            'cached': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def init_user_directory(app):
+    """
+    Set up the user directory if the claim profile leaves emails out.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        UserDirectory or None: The directory, also stored in
+        ``app.extensions['user_directory']``.
+
+    Raises:
+        ValueError: If ``TOKEN_PROFILE`` is not a known profile.
+    """
+    profile = app.config.get('TOKEN_PROFILE', 'full')
+    if profile not in CLAIM_PROFILES:
+        raise ValueError(f'Unknown TOKEN_PROFILE: {profile}')
+    if profile != 'minimal':
+        return None
+    with app.app_context():
+        engine = db.engine
+    directory = UserDirectory(engine, app.config['USER_DIRECTORY_TTL'])
+    app.extensions['user_directory'] = directory
+    logger.info("User directory enabled for the minimal claim profile.")
+    return directory
@@ -0,0 +1,200 @@
+"""
+fastpath.py
+-----------
+
+WSGI fast path for ``GET /verify``.
+
+/verify is the hottest endpoint: every API call on the platform goes
+through it. `VerifyFastPath` is mounted in front of the Flask application
+(``app.wsgi_app``) and answers ``GET /verify`` directly from the WSGI
+environ, without a request context, Flask-RESTful dispatch or ``jsonify``:
+
+    - the cookie header is parsed with Werkzeug's parser, and only when it
+      mentions ``access_token``;
+    - the signing key is built once (``jwt.PyJWK``);
+    - the token is checked by `app.verification.check_access_token`, the
+      same code as VerifyResource, with the revocation lookup on the engine;
+    - error bodies are pre-serialized, the identity (role claims included)
+      is serialized with sorted keys as ``jsonify`` does, and the cookie of
+      a sliding renewal (app/renewal.py) is added when one is issued.
+
+Status lines, headers and bodies are byte-for-byte those of VerifyResource,
+including its 503 when the database fails. Every other request, and any
+unexpected error, is handed to the Flask application, so failures behave
+exactly as before. The renewal is issued last, once nothing can fail: a
+fallback never discards it.
+
+The fast path is enabled with ``VERIFY_FAST_PATH`` and never in debug mode
+or when CORS is on (development and staging), whose response decorations
+only Flask applies.
+"""
+
+import json
+import os
+
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.sansio.http import parse_cookie
+
+from app.logger import logger
+from app.models import db
+from app.tokens import signing_key
+from app.tracing import TRACEPARENT_HEADER, TRACESTATE_HEADER, tracer
+from app.verification import (
+    DATABASE_UNAVAILABLE,
+    EXPIRED_TOKEN,
+    INVALID_TOKEN,
+    MISSING_TOKEN,
+    REVOKED_TOKEN,
+    TokenRejected,
+    check_access_token,
+    token_identity,
+)
+
+VERIFY_PATH = '/verify'
+# Endpoint name Flask-RESTful gives VerifyResource, used in request spans.
+VERIFY_ENDPOINT = 'verifyresource'
+
+
+def _status_line(code):
+    """Return the WSGI status line Werkzeug sends for ``code``."""
+    return f'{code} {HTTP_STATUS_CODES[code].upper()}'
+
+
+def _environ_header(name):
+    """Return the WSGI environ key of an HTTP request header."""
+    return 'HTTP_' + name.upper().replace('-', '_')
+
+
+class VerifyFastPath:  # pylint: disable=too-many-instance-attributes
+    """
+    WSGI middleware answering ``GET /verify`` without entering Flask.
+
+    Args:
+        app (Flask): The application, used for its JSON settings and engine.
+        wsgi_app (callable): The WSGI application to delegate to.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self._key = None
+        self._engine = None
+        self._ok = _status_line(200)
+        self._unauthorized = _status_line(401)
+        self._unavailable = _status_line(503)
+        # Flask-RESTful serializes error dictionaries with json.dumps and
+        # the RESTFUL_JSON settings, followed by a newline.
+        settings = app.config.get('RESTFUL_JSON', {})
+        self._errors = {
+            message: (json.dumps({'message': message}, **settings)
+                      + '\n').encode()
+            for message in (MISSING_TOKEN, INVALID_TOKEN, EXPIRED_TOKEN,
+                            REVOKED_TOKEN, DATABASE_UNAVAILABLE)
+        }
+
+    def _signing_key(self):
+        """Build the HS256 key object on first use."""
+        if self._key is None:
+            self._key = signing_key(os.environ['JWT_SECRET'])
+        return self._key
+
+    def _db_engine(self):
+        """Look up the application's engine on first use."""
+        if self._engine is None:
+            with self.app.app_context():
+                self._engine = db.engine
+        return self._engine
+
+    def _success_body(self, identity):
+        """Serialize the identity like ``jsonify`` in production mode."""
+        return (self.app.json.dumps(identity, separators=(',', ':'))
+                + '\n').encode()
+
+    def verify(self, environ):
+        """
+        Verify the access token of a ``GET /verify`` request.
+
+        Args:
+            environ (dict): The WSGI environ.
+
+        Returns:
+            tuple: ``(status_line, body, extra_headers)``.
+        """
+        logger.info("Token verification attempt started")
+        cookie = environ.get('HTTP_COOKIE', '')
+        access_token = None
+        if 'access_token' in cookie:
+            access_token = parse_cookie(cookie).get('access_token')
+        if not access_token:
+            logger.error("Missing access token for verification")
+            return self._unauthorized, self._errors[MISSING_TOKEN], []
+        try:
+            payload = check_access_token(
+                access_token, self._signing_key(), self._db_engine(),
+                self.app.extensions.get('revocation_snapshot'),
+                self.app.extensions.get('revocation_shared'))
+        except TokenRejected as e:
+            return self._unauthorized, self._errors[e.message], []
+        except SQLAlchemyError as e:
+            logger.error("Token verification failed: %s", e)
+            return (self._unavailable, self._errors[DATABASE_UNAVAILABLE],
+                    [])
+        body = self._success_body(token_identity(
+            payload, self.app.extensions.get('user_directory')))
+        headers = []
+        renewal = self.app.extensions.get('sliding_renewal')
+        renewed = renewal.renew(payload) if renewal is not None else None
+        if renewed is not None:
+            headers.append(('Set-Cookie', renewal.cookie_header(*renewed)))
+        return self._ok, body, headers
+
+    def _traced_verify(self, environ):
+        """Run `verify` inside a request span, as Flask's hooks would."""
+        span = tracer.start_span(
+            f'GET {VERIFY_PATH}',
+            {'http.method': 'GET', 'http.path': VERIFY_PATH},
+            traceparent=environ.get(_environ_header(TRACEPARENT_HEADER)),
+            tracestate=environ.get(_environ_header(TRACESTATE_HEADER)),
+        )
+        with span:
+            status, body, headers = self.verify(environ)
+            span.set_attribute('http.status_code', int(status[:3]))
+            span.set_attribute('http.endpoint', VERIFY_ENDPOINT)
+        return status, body, headers
+
+    def __call__(self, environ, start_response):
+        if (environ.get('PATH_INFO') != VERIFY_PATH
+                or environ.get('REQUEST_METHOD') != 'GET'):
+            return self.wsgi_app(environ, start_response)
+        try:
+            if tracer.enabled:
+                status, body, headers = self._traced_verify(environ)
+            else:
+                status, body, headers = self.verify(environ)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # Let Flask produce its usual error response.
+            logger.error("Fast path failed, falling back to Flask: %s", e)
+            return self.wsgi_app(environ, start_response)
+        start_response(status, [('Content-Type', 'application/json'),
+                                ('Content-Length', str(len(body))),
+                                *headers])
+        return [body]
+
+
+def init_fast_path(app, cors_enabled=False):
+    """
+    Mount the /verify fast path in front of the application if enabled.
+
+    Args:
+        app (Flask): The Flask application instance.
+        cors_enabled (bool): Whether CORS headers are added to responses.
+
+    Returns:
+        bool: Whether the fast path was mounted.
+    """
+    if not app.config.get('VERIFY_FAST_PATH') or app.debug or cors_enabled:
+        return False
+    app.wsgi_app = VerifyFastPath(app, app.wsgi_app)
+    logger.info("GET /verify fast path enabled.")
+    return True
@@ -0,0 +1,299 @@
+"""
+group_commit.py
+---------------
+
+Group commit of the refresh token writes of ``POST /login`` and ``POST
+/refresh``.
+
+Each login or refresh inserts one ``refresh_tokens`` row (with the role
+cache and user directory upserts, and the delete of a rotated token) and
+commits: a login storm turns into as many one-row transactions, each paying
+a commit, i.e. a WAL flush on PostgreSQL. With ``GROUP_COMMIT`` enabled, the
+resources hand their writes to this worker's `GroupCommitWriter` and wait.
+Its thread gathers the writes submitted within ``GROUP_COMMIT_MAX_WAIT_MS``
+of the first one, up to ``GROUP_COMMIT_MAX_BATCH``, runs their statements,
+inserts all their rows with one multi-row INSERT and commits once. Each
+request returns when the commit holding its row has succeeded.
+
+``GROUP_COMMIT_TIMEOUT`` bounds the wait in the queue only: a write still
+queued then is cancelled and its request answered 503 with ``Retry-After``,
+while a write whose batch has started is waited for, since it may commit
+(a refresh must not delete the old token without handing out the new one).
+
+A write may carry a guard, a statement that must affect exactly one row
+(the delete of the token a refresh rotates): otherwise the write fails with
+`GuardFailed` and nothing of it is committed, so that two refreshes racing
+on one token cannot both succeed.
+
+When a batch fails, its writes are retried one transaction each, so that a
+failing write fails alone. The thread is started on first use, after fork
+under gunicorn.
+
+The ASGI login handler (app/asgi.py) keeps its own insert.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from sqlalchemy import insert
+from werkzeug.exceptions import ServiceUnavailable
+
+from app.logger import logger
+from app.models import db
+from app.models.refresh_token import RefreshToken
+
+
+class GuardFailed(Exception):
+    """Raised when a write's guard does not affect exactly one row."""
+
+
+def refresh_token_row(token, user_id, company_id, email, expires_at):
+    """
+    Build the ``refresh_tokens`` row of a new refresh token.
+
+    Column defaults are filled in here: every row of a multi-row INSERT
+    must have the same columns.
+
+    Returns:
+        dict: Column values.
+    """
+    return {
+        'id': str(uuid.uuid4()),
+        'token': token,
+        'user_id': user_id,
+        'company_id': company_id,
+        'email': email,
+        'expires_at': expires_at,
+        'revoked': False,
+    }
+
+
+class GroupCommitWriter:  # pylint: disable=too-many-instance-attributes
+    """
+    Writer thread committing concurrent refresh token writes together.
+
+    Attributes:
+        batches (int): Transactions committed.
+        rows (int): Rows inserted.
+        largest (int): Most writes committed in one transaction.
+        retries (int): Batches that failed and were retried write by write.
+        failures (int): Writes that failed.
+        timeouts (int): Writes cancelled after waiting too long in the
+            queue.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, engine, max_batch=64, max_wait=0.002, timeout=5.0):
+        """
+        Args:
+            engine (sqlalchemy.engine.Engine): The application's engine.
+            max_batch (int): Most writes per transaction.
+            max_wait (float): Seconds a batch waits for more writes after
+                its first.
+            timeout (float): Seconds a write may wait for its batch to
+                start.
+        """
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = self.rows = self.largest = 0
+        self.retries = self.failures = self.timeouts = 0
+
+    def write(self, rows, statements=(), guard=None):
+        """
+        Commit refresh token rows and statements, grouped with concurrent
+        writes.
+
+        Args:
+            rows (list): ``refresh_tokens`` rows (see `refresh_token_row`).
+            statements (iterable): Statements committed with the rows,
+                executed before the insert.
+            guard (sqlalchemy.sql.Executable, optional): Statement executed
+                first, which must affect exactly one row.
+
+        Raises:
+            GuardFailed: If the guard did not affect exactly one row.
+            Exception: The error of the failed transaction.
+            concurrent.futures.TimeoutError: If the write was still queued
+                after the timeout; it is cancelled and never committed.
+        """
+        future = self.submit(rows, statements, guard)
+        try:
+            future.result(self.timeout)
+        except FutureTimeoutError:
+            if future.cancel():
+                self.timeouts += 1
+                raise
+            # Its batch is running: wait for the outcome.
+            future.result()
+
+    def submit(self, rows, statements=(), guard=None):
+        """
+        Queue a write without waiting.
+
+        Returns:
+            concurrent.futures.Future: Resolved when the write is committed;
+            it can be cancelled until its batch starts.
+        """
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((list(rows), list(statements), guard, future))
+        return future
+
+    def _ensure_thread(self):
+        """Start the writer thread in this process if it is not running."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._thread = threading.Thread(
+                    target=self._run, daemon=True, name='group-commit')
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        """Body of the writer thread: gather a batch, commit it, repeat."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # Cancelled writes are dropped; the others can no longer be.
+            batch = [write for write in batch
+                     if write[3].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+
+    def _commit(self, batch):
+        """Commit a batch, then each write alone if the batch fails."""
+        # Any error is handed to the waiting requests: the thread goes on.
+        try:
+            self._execute(batch)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if len(batch) == 1:
+                self.failures += 1
+                batch[0][3].set_exception(e)
+                return
+            logger.warning("Group commit of %s writes failed, retrying "
+                           "them one by one: %s", len(batch), e)
+            self.retries += 1
+            for write in batch:
+                self._commit([write])
+            return
+        for _, _, _, future in batch:
+            future.set_result(None)
+
+    def _execute(self, batch):
+        """Run a batch's statements and insert its rows, in one transaction."""
+        rows = [row for write in batch for row in write[0]]
+        with self.engine.begin() as conn:
+            for _, statements, guard, _ in batch:
+                _check_guard(conn, guard)
+                for statement in statements:
+                    conn.execute(statement)
+            if rows:
+                conn.execute(insert(RefreshToken.__table__).values(rows))
+        self.batches += 1
+        self.rows += len(rows)
+        self.largest = max(self.largest, len(batch))
+
+    def summary(self):
+        """Return the writer's counters as a dictionary."""
+        return {
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+            'batches': self.batches,
+            'rows': self.rows,
+            'largest': self.largest,
+            'mean_batch': round(self.rows / self.batches, 2)
+                          if self.batches else 0.0,
+            'retries': self.retries,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+        }
+
+
+def _check_guard(conn, guard):
+    """Execute a write's guard, if any, and check it affected one row."""
+    if guard is not None and conn.execute(guard).rowcount != 1:
+        raise GuardFailed('guard matched no single row')
+
+
+def commit_refresh_tokens(writer, rows, statements=(), guard=None):
+    """
+    Commit the writes of a login or refresh.
+
+    Args:
+        writer (GroupCommitWriter or None): The worker's writer; without
+            one the writes are committed by the request's session.
+        rows (list): ``refresh_tokens`` rows (see `refresh_token_row`).
+        statements (iterable): Statements committed with the rows.
+        guard (sqlalchemy.sql.Executable, optional): Statement executed
+            first, which must affect exactly one row.
+
+    Raises:
+        GuardFailed: If the guard did not affect exactly one row; nothing
+            is committed.
+        werkzeug.exceptions.ServiceUnavailable: If the writer is so far
+            behind that the write was cancelled.
+    """
+    if writer is None:
+        try:
+            _check_guard(db.session, guard)
+        except GuardFailed:
+            db.session.rollback()
+            raise
+        for statement in statements:
+            db.session.execute(statement)
+        db.session.add_all(RefreshToken(**row) for row in rows)
+        db.session.commit()
+        return
+    # Give the request's connection back before waiting for the batch.
+    db.session.close()
+    try:
+        writer.write(rows, statements, guard)
+    except FutureTimeoutError as e:
+        logger.warning("Group commit queue too slow, write cancelled")
+        raise ServiceUnavailable('Database busy, retry later',
+                                 retry_after=1) from e
+
+
+def init_group_commit(app):
+    """
+    Set up the group commit writer if enabled.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        GroupCommitWriter or None: The writer, also stored in
+        ``app.extensions['group_commit']``.
+    """
+    if not app.config.get('GROUP_COMMIT'):
+        return None
+    with app.app_context():
+        engine = db.engine
+    config = app.config
+    writer = GroupCommitWriter(
+        engine, max_batch=config['GROUP_COMMIT_MAX_BATCH'],
+        max_wait=config['GROUP_COMMIT_MAX_WAIT_MS'] / 1000,
+        timeout=config['GROUP_COMMIT_TIMEOUT'])
+    app.extensions['group_commit'] = writer
+    logger.info("Group commit enabled: up to %s writes within %sms.",
+                writer.max_batch, config['GROUP_COMMIT_MAX_WAIT_MS'])
+    return writer
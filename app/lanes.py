@@ -0,0 +1,291 @@
+"""
+lanes.py
+--------
+
+Priority lanes: per-endpoint-class admission control in front of Flask.
+
+All requests of a worker share its threads, so a user-service brownout that
+makes ``/login`` hang would otherwise occupy every thread and delay
+``/verify`` for the whole platform. `PriorityLanes` is WSGI middleware that
+classifies each request into a lane and admits it only if the lane has room:
+
+    - lanes are ranked ``verify`` > ``refresh`` > ``login`` > ``default``
+      (every other path);
+    - the worker's ``capacity`` (its request threads) is shared, but
+      ``verify`` and ``refresh`` reserve slots that lower lanes may not use:
+      a lane's ceiling is the capacity minus the reservations of the lanes
+      ranked above it;
+    - a lane may also have its own concurrency ``limit``;
+    - a request that cannot run immediately, its lane being at its ceiling
+      or its limit, waits for a slot, at most ``queue_timeout`` seconds and
+      only if fewer than ``queue_depth`` requests of its lane are already
+      waiting;
+    - otherwise the request is rejected at once with a 503 and a
+      ``Retry-After`` header, without entering Flask.
+
+A waiting request holds a worker thread that ``capacity`` does not count:
+were it counted, a login queued at its ceiling would take a slot reserved
+for the lanes above. Queues therefore need threads beyond the capacity (up
+to ``queue_depth`` per lane), and are disabled by default.
+
+Probes (``/ready``, ``/metrics``, ``/version``) are never gated. Lane
+figures are served by ``GET /metrics``.
+"""
+
+import json
+import threading
+import time
+
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.wsgi import ClosingIterator
+
+from app.logger import logger
+
+# Lanes in decreasing priority.
+LANES = ('verify', 'refresh', 'login', 'default')
+
+LANE_PATHS = {
+    '/verify': 'verify',
+    '/refresh': 'refresh',
+    '/login': 'login',
+}
+
+# Paths answered regardless of load: health checks must see the worker.
+UNGATED_PATHS = ('/ready', '/metrics', '/version')
+
+OVERLOADED = 'Service overloaded, retry later'
+
+
+def classify(path):
+    """
+    Return the lane of a request path, or None if it is never gated.
+
+    Args:
+        path (str): The request's ``PATH_INFO``.
+
+    Returns:
+        str or None: One of `LANES`, or None.
+    """
+    if path in UNGATED_PATHS:
+        return None
+    return LANE_PATHS.get(path, 'default')
+
+
+def overloaded_response(retry_after, restful_json=None):
+    """
+    Build the 503 response sent to rejected requests.
+
+    Args:
+        retry_after (int): Seconds sent in ``Retry-After``.
+        restful_json (dict, optional): Flask-RESTful JSON settings, so that
+            the body is serialized like other error responses.
+
+    Returns:
+        tuple: ``(status_line, headers, body)``.
+    """
+    body = (json.dumps({'message': OVERLOADED}, **(restful_json or {}))
+            + '\n').encode()
+    return (f'503 {HTTP_STATUS_CODES[503].upper()}',
+            [('Content-Type', 'application/json'),
+             ('Content-Length', str(len(body))),
+             ('Retry-After', str(retry_after))],
+            body)
+
+
+class Lane:
+    """
+    Admission counters of one lane.
+
+    Attributes:
+        name (str): The lane name.
+        limit (int): Maximum concurrent requests (0: only the ceiling).
+        ceiling (int): Maximum requests of all lanes in progress for this
+            lane to admit one more.
+        active (int): Requests in progress.
+        waiting (int): Requests waiting for a slot.
+        admitted (int): Requests admitted so far.
+        rejected (int): Requests rejected so far.
+    """
+
+    def __init__(self, name, limit, ceiling):
+        self.name = name
+        self.limit = limit
+        self.ceiling = ceiling
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def summary(self):
+        """Return the lane's counters as a dictionary."""
+        return {
+            'limit': self.limit,
+            'ceiling': self.ceiling,
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
+
+
+class LaneScheduler:
+    """
+    Thread-safe admission of requests into lanes sharing a capacity.
+
+    Args:
+        capacity (int): Requests the worker runs concurrently (its threads).
+        reserved (dict): Slots reserved per lane, e.g. ``{'verify': 1}``.
+        limits (dict, optional): Concurrency limit per lane.
+        queue_depth (int): Maximum waiting requests per lane.
+        queue_timeout (float): Maximum seconds a request waits for a slot.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, capacity, reserved, limits=None, queue_depth=0,
+                 queue_timeout=0.0):
+        self.capacity = capacity
+        self.queue_depth = queue_depth
+        self.queue_timeout = queue_timeout
+        self.occupied = 0
+        self._condition = threading.Condition()
+        self.lanes = {}
+        above = 0
+        for name in LANES:
+            ceiling = max(1, capacity - above)
+            self.lanes[name] = Lane(name, (limits or {}).get(name, 0),
+                                    ceiling)
+            above += reserved.get(name, 0)
+
+    def _has_slot(self, lane):
+        """Tell whether ``lane`` may start one more request now."""
+        return (self.occupied < lane.ceiling
+                and (not lane.limit or lane.active < lane.limit))
+
+    def acquire(self, name):
+        """
+        Admit a request into a lane, waiting for a slot if allowed.
+
+        Args:
+            name (str): The lane name.
+
+        Returns:
+            bool: True if admitted (`release` must then be called), False
+            if the request must be rejected.
+        """
+        lane = self.lanes[name]
+        with self._condition:
+            if self._has_slot(lane):
+                lane.active += 1
+                lane.admitted += 1
+                self.occupied += 1
+                return True
+            if lane.waiting >= self.queue_depth:
+                lane.rejected += 1
+                return False
+            lane.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while not self._has_slot(lane):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        lane.rejected += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                lane.waiting -= 1
+            lane.active += 1
+            lane.admitted += 1
+            self.occupied += 1
+            return True
+
+    def release(self, name):
+        """
+        Free the slot of a finished request.
+
+        Args:
+            name (str): The lane name given to `acquire`.
+        """
+        with self._condition:
+            self.lanes[name].active -= 1
+            self.occupied -= 1
+            self._condition.notify_all()
+
+    def snapshot(self):
+        """
+        Describe the capacity and every lane's counters.
+
+        Returns:
+            dict: ``capacity``, ``occupied`` and ``lanes`` by name.
+        """
+        with self._condition:
+            return {
+                'capacity': self.capacity,
+                'occupied': self.occupied,
+                'lanes': {name: lane.summary()
+                          for name, lane in self.lanes.items()},
+            }
+
+
+class PriorityLanes:
+    """
+    WSGI middleware admitting requests through a `LaneScheduler`.
+
+    Args:
+        scheduler (LaneScheduler): The lanes.
+        wsgi_app (callable): The WSGI application to protect.
+        retry_after (int): Seconds sent in ``Retry-After`` on rejection.
+        restful_json (dict, optional): Flask-RESTful JSON settings, so that
+            rejections are serialized like other error responses.
+    """
+
+    def __init__(self, scheduler, wsgi_app, retry_after=1,
+                 restful_json=None):
+        self.scheduler = scheduler
+        self.wsgi_app = wsgi_app
+        self._status, self._headers, self._body = overloaded_response(
+            retry_after, restful_json)
+
+    def __call__(self, environ, start_response):
+        name = classify(environ.get('PATH_INFO', ''))
+        if name is None:
+            return self.wsgi_app(environ, start_response)
+        if not self.scheduler.acquire(name):
+            logger.warning("Lane %s saturated, request rejected", name)
+            start_response(self._status, list(self._headers))
+            return [self._body]
+        try:
+            app_iter = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self.scheduler.release(name)
+            raise
+        return ClosingIterator(app_iter,
+                               lambda: self.scheduler.release(name))
+
+
+def init_lanes(app):
+    """
+    Mount the priority lanes in front of the application if enabled.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        bool: Whether the lanes were mounted.
+    """
+    if not app.config.get('PRIORITY_LANES'):
+        return False
+    scheduler = LaneScheduler(
+        app.config['LANE_CAPACITY'],
+        reserved={'verify': app.config['LANE_VERIFY_RESERVED'],
+                  'refresh': app.config['LANE_REFRESH_RESERVED']},
+        limits={'login': app.config['LANE_LOGIN_LIMIT']},
+        queue_depth=app.config['LANE_QUEUE_DEPTH'],
+        queue_timeout=app.config['LANE_QUEUE_TIMEOUT'],
+    )
+    app.extensions['lanes'] = scheduler
+    app.wsgi_app = PriorityLanes(scheduler, app.wsgi_app,
+                                 app.config['LANE_RETRY_AFTER'],
+                                 app.config.get('RESTFUL_JSON'))
+    logger.info("Priority lanes enabled with capacity %d.",
+                scheduler.capacity)
+    return True
@@ -0,0 +1,196 @@
+"""
+limiter.py
+----------
+
+Adaptive concurrency limiting (AIMD) in front of Flask.
+
+When Postgres or the user service slows down, requests take longer, pile up
+in the worker's threads and every one of them ends up late. `AIMDLimit`
+keeps the number of requests in progress below a limit learned from the
+observed latency, in the manner of TCP congestion control:
+
+    - a request slower than ``latency_target`` or failing with a 5xx is a
+      congestion signal: the limit is multiplied by ``backoff`` (at most
+      once per round of requests, so a burst of slow responses counts
+      once);
+    - a fast request made while at least half of the limit was in use
+      raises the limit by ``1 / limit`` (about one per round);
+    - requests beyond the limit are rejected at once with a 503 and a
+      ``Retry-After`` header, before entering Flask.
+
+`AdaptiveLimiter` is the WSGI middleware. It keeps one limit per endpoint
+class (see `app.lanes.classify`), so slow logins during a user-service
+brownout only shrink the login limit. The limits and rejection counts are
+served by ``GET /metrics``.
+"""
+
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from app.lanes import LANES, classify, overloaded_response
+from app.logger import logger
+
+
+class AIMDLimit:  # pylint: disable=too-many-instance-attributes
+    """
+    Additive-increase, multiplicative-decrease concurrency limit.
+
+    Args:
+        initial (int): Starting limit.
+        min_limit (int): The limit never goes below this value.
+        max_limit (int): The limit never goes above this value.
+        latency_target (float): Seconds above which a request signals
+            congestion.
+        backoff (float): Factor applied to the limit on congestion.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, initial, min_limit, max_limit, latency_target,
+                 backoff=0.9):
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.inflight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.congestion = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Admit a request if the limit allows it.
+
+        Returns:
+            float or None: The admission time, to pass to `release`, or
+            None if the request must be rejected.
+        """
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                self.rejected += 1
+                return None
+            self.inflight += 1
+            self.admitted += 1
+            return time.monotonic()
+
+    def release(self, started, failed=False):
+        """
+        Record the outcome of an admitted request and adapt the limit.
+
+        Args:
+            started (float): The value returned by `acquire`.
+            failed (bool): Whether the request failed with a server error.
+        """
+        finished = time.monotonic()
+        with self._lock:
+            inflight = self.inflight
+            self.inflight -= 1
+            if failed or finished - started > self.latency_target:
+                self.congestion += 1
+                # Requests admitted before the last decrease already saw
+                # the old limit: do not back off twice for them.
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.backoff)
+                    self._last_decrease = finished
+            elif inflight * 2 >= self.limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def summary(self):
+        """Return the limit and counters as a dictionary."""
+        with self._lock:
+            return {
+                'limit': int(self.limit),
+                'inflight': self.inflight,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'congestion': self.congestion,
+            }
+
+
+class AdaptiveLimiter:
+    """
+    WSGI middleware keeping one `AIMDLimit` per endpoint class.
+
+    Args:
+        wsgi_app (callable): The WSGI application to protect.
+        limit_factory (callable): Returns a new `AIMDLimit`.
+        retry_after (int): Seconds sent in ``Retry-After`` on rejection.
+        restful_json (dict, optional): Flask-RESTful JSON settings.
+    """
+
+    def __init__(self, wsgi_app, limit_factory, retry_after=1,
+                 restful_json=None):
+        self.wsgi_app = wsgi_app
+        self.limits = {name: limit_factory() for name in LANES}
+        self._status, self._headers, self._body = overloaded_response(
+            retry_after, restful_json)
+
+    def snapshot(self):
+        """
+        Describe every endpoint class's limit.
+
+        Returns:
+            dict: `AIMDLimit.summary` by endpoint class.
+        """
+        return {name: limit.summary() for name, limit in self.limits.items()}
+
+    def __call__(self, environ, start_response):
+        name = classify(environ.get('PATH_INFO', ''))
+        if name is None:
+            return self.wsgi_app(environ, start_response)
+        limit = self.limits[name]
+        started = limit.acquire()
+        if started is None:
+            logger.warning("Concurrency limit reached for %s, request "
+                           "rejected", name)
+            start_response(self._status, list(self._headers))
+            return [self._body]
+
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        try:
+            app_iter = self.wsgi_app(environ, recording_start_response)
+        except BaseException:
+            limit.release(started, failed=True)
+            raise
+        return ClosingIterator(app_iter, lambda: limit.release(
+            started, failed=bool(statuses) and statuses[-1][0] == '5'))
+
+
+def init_limiter(app):
+    """
+    Mount the adaptive concurrency limiter if enabled.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        bool: Whether the limiter was mounted.
+    """
+    if not app.config.get('ADAPTIVE_LIMIT'):
+        return False
+    config = app.config
+
+    def limit_factory():
+        return AIMDLimit(config['LIMIT_INITIAL'], config['LIMIT_MIN'],
+                         config['LIMIT_MAX'],
+                         config['LIMIT_LATENCY_TARGET_MS'] / 1000.0,
+                         config['LIMIT_BACKOFF'])
+
+    limiter = AdaptiveLimiter(app.wsgi_app, limit_factory,
+                              config['LANE_RETRY_AFTER'],
+                              config.get('RESTFUL_JSON'))
+    app.extensions['limiter'] = limiter
+    app.wsgi_app = limiter
+    logger.info("Adaptive concurrency limit enabled (target %.0f ms).",
+                config['LIMIT_LATENCY_TARGET_MS'])
+    return True
@@ -0,0 +1,143 @@
+"""
+metrics.py
+----------
+
+Connection pool instrumentation.
+
+`InstrumentedQueuePool` is a drop-in ``QueuePool`` that records how long
+each checkout waited for a connection and how many checkouts timed out, so
+pool starvation shows up before it turns into 500s. `pool_snapshot` reports
+these together with the live pool state (checked out, idle, overflow) and
+is served by ``GET /metrics``.
+
+Metrics are per process: with several gunicorn workers, each worker has its
+own pool and reports its own figures.
+"""
+
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds (milliseconds) of the checkout wait histogram buckets.
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class PoolStats:
+    """
+    Thread-safe counters of connection checkouts.
+
+    Attributes:
+        checkouts (int): Checkouts that obtained a connection.
+        timeouts (int): Checkouts that gave up after ``pool_timeout``.
+        wait_total_ms (float): Total time spent waiting for connections.
+        wait_max_ms (float): Longest wait.
+        wait_buckets (list): Cumulative counts of waits at or below each
+            bound of `WAIT_BUCKETS_MS`, the last entry counting every wait.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def observe(self, wait_ms, timed_out=False):
+        """
+        Record one checkout.
+
+        Args:
+            wait_ms (float): Time spent in the pool, in milliseconds.
+            timed_out (bool): Whether the checkout timed out.
+        """
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            for index, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.wait_buckets[index] += 1
+            self.wait_buckets[-1] += 1
+
+    def summary(self):
+        """
+        Return the counters as a JSON-serializable dictionary.
+
+        Returns:
+            dict: Checkout counts, wait statistics and histogram.
+        """
+        with self._lock:
+            total = self.checkouts + self.timeouts
+            buckets = {f'le_{bound}ms': count for bound, count
+                       in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            buckets['total'] = self.wait_buckets[-1]
+            return {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_mean_ms': round(self.wait_total_ms / total, 4)
+                if total else 0.0,
+                'wait_max_ms': round(self.wait_max_ms, 4),
+                'wait_histogram': buckets,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    ``QueuePool`` recording checkout wait times and timeouts in ``stats``.
+
+    Statistics survive ``engine.dispose()``, which recreates the pool.
+    """
+
+    def __init__(self, creator, *args, stats=None, **kwargs):
+        super().__init__(creator, *args, **kwargs)
+        self.stats = stats or PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.observe((time.perf_counter() - started) * 1000.0,
+                               timed_out=True)
+            raise
+        self.stats.observe((time.perf_counter() - started) * 1000.0)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+def pool_snapshot(engine):
+    """
+    Describe the live state and statistics of an engine's pool.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The engine to inspect.
+
+    Returns:
+        dict: Pool class, size, checked-out, idle and overflow connections,
+        plus checkout statistics for an `InstrumentedQueuePool`.
+    """
+    pool = engine.pool
+    snapshot = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        snapshot.update({
+            'size': pool.size(),
+            'max_overflow': pool._max_overflow,  # pylint: disable=protected-access
+            'timeout_s': pool.timeout(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+        })
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        snapshot['checkout'] = stats.summary()
+    return snapshot
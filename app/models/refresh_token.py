@@ -17,6 +17,8 @@ class RefreshToken(db.Model):
         token (str): The refresh token string (unique).
         user_id (int): The ID of the user associated with the token.
         company_id (int): The ID of the company associated with the token.
+        email (str): The user's email at login, carried over to the access
+            tokens issued by refresh.
         created_at (datetime): Timestamp when the token was created.
         expires_at (datetime): Expiration datetime of the token.
         revoked (bool): Whether the token has been revoked.
@@ -31,6 +33,7 @@ class RefreshToken(db.Model):
     token = db.Column(db.String(512), unique=True, nullable=False)
     user_id = db.Column(db.String(36), nullable=False)
     company_id = db.Column(db.String(36), nullable=False)
+    email = db.Column(db.String(255), nullable=True)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     expires_at = db.Column(db.DateTime, nullable=False)
     revoked = db.Column(db.Boolean, default=False)
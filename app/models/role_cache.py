@@ -0,0 +1,38 @@
+"""
+role_cache.py
+-------------
+This module defines the RoleCacheEntry model, the roles and permissions of
+each user as last fetched from the user service, embedded in the access
+tokens issued at login and refresh.
+"""
+from . import db
+
+
+class RoleCacheEntry(db.Model):
+    """
+    SQLAlchemy model for the role cache.
+
+    Attributes:
+        user_id (str): The user's ID (primary key).
+        roles (list): The user's role names.
+        permissions (list): The user's permission names.
+        fetched_at (datetime): When the user service answered (UTC).
+        invalidated_at (datetime): When the entry was last invalidated
+            (UTC); roles fetched before are neither used nor written back.
+    """
+    __tablename__ = 'role_cache'
+
+    user_id = db.Column(db.String(36), primary_key=True)
+    roles = db.Column(db.JSON, nullable=False)
+    permissions = db.Column(db.JSON, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False)
+    invalidated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        """
+        Return a string representation of the RoleCacheEntry instance.
+
+        Returns:
+            str: String representation including user_id.
+        """
+        return f"<RoleCacheEntry user_id={self.user_id}>"
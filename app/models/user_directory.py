@@ -0,0 +1,35 @@
+"""
+user_directory.py
+-----------------
+This module defines the UserDirectoryEntry model, the email of each user
+who logged in, for the access tokens that leave it out.
+"""
+from . import db
+
+
+class UserDirectoryEntry(db.Model):
+    """
+    SQLAlchemy model for the user directory.
+
+    Attributes:
+        user_id (str): The user's ID (primary key).
+        email (str): The user's email address at their last login.
+        company_id (str): The ID of the user's company.
+        updated_at (datetime): Timestamp of the last login recorded.
+    """
+    __tablename__ = 'user_directory'
+
+    user_id = db.Column(db.String(36), primary_key=True)
+    email = db.Column(db.String(255), nullable=False)
+    company_id = db.Column(db.String(36), nullable=True)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(),
+                           onupdate=db.func.now())
+
+    def __repr__(self):
+        """
+        Return a string representation of the UserDirectoryEntry instance.
+
+        Returns:
+            str: String representation including user_id.
+        """
+        return f"<UserDirectoryEntry user_id={self.user_id}>"
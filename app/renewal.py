@@ -0,0 +1,191 @@
+"""
+renewal.py
+----------
+
+Sliding renewal of access tokens by ``GET /verify``.
+
+Clients call /verify constantly and /refresh once per access token
+lifetime, which costs a round trip and a refresh token rotation. With
+``SLIDING_RENEWAL`` enabled, a /verify that accepts a token expiring within
+``SLIDING_RENEWAL_WINDOW`` seconds also sets a new access token cookie on
+its response, so that active clients rarely need /refresh:
+
+    - the token is renewed only once `app.verification.check_access_token`
+      has accepted it, revocation check included;
+    - the new token carries the same identity and the ``auth_time`` of the
+      original login, and no token is renewed more than
+      ``SLIDING_RENEWAL_MAX_SESSION`` seconds after it: sessions still end,
+      and then need /refresh or a new login;
+    - a JTI is renewed at most once per ``SLIDING_RENEWAL_INTERVAL``
+      seconds by a worker, so that a burst of /verify calls made with one
+      token does not mint a token each.
+
+The renewed token has a new JTI; the old one stays valid until it expires,
+at most ``SLIDING_RENEWAL_WINDOW`` seconds later.
+
+Tokens with role claims (app/roles.py) are renewed with the user's cached
+roles, and only while that cache entry is fresh: once it expires or is
+invalidated, the client goes through /refresh, which fetches them again.
+"""
+
+import os
+import threading
+import time
+
+from werkzeug.http import dump_cookie
+
+from app.logger import logger
+from app.tokens import ACCESS_TOKEN_LIFETIME, COOKIE_OPTIONS, issue_access_token
+
+# Claims copied from the renewed token.
+IDENTITY_CLAIMS = ('sub', 'email', 'company_id')
+
+
+class SlidingRenewal:  # pylint: disable=too-many-instance-attributes
+    """
+    Decides which verified tokens to renew, and issues their successors.
+
+    Args:
+        window (float): Seconds before expiry from which tokens are renewed.
+        interval (float): Minimum seconds between two renewals of a JTI.
+        max_session (float): Seconds after ``auth_time`` beyond which tokens
+            are no longer renewed.
+        profile (str): Claim profile of the new tokens (see app/tokens.py).
+        role_claims (RoleClaims, optional): Cached role claims, when tokens
+            carry them.
+
+    Attributes:
+        renewed (int): Tokens issued.
+        limited (int): Renewals skipped by the per-JTI limit.
+        ended (int): Renewals refused because the session is too old.
+        stale_roles (int): Renewals refused because the user's cached roles
+            are no longer fresh.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, window, interval, max_session, profile='full',
+                 role_claims=None):
+        self.window = window
+        self.interval = interval
+        self.max_session = max_session
+        self.profile = profile
+        self.role_claims = role_claims
+        self.renewed = 0
+        self.limited = 0
+        self.ended = 0
+        self.stale_roles = 0
+        self._lock = threading.Lock()
+        # JTI -> (last renewal, token expiry), pruned once tokens expire.
+        self._recent = {}
+        self._next_prune = 0.0
+
+    def _allow(self, jti, expires_at, now):
+        """Apply the per-JTI limit; record the renewal if allowed."""
+        with self._lock:
+            if now >= self._next_prune:
+                self._recent = {key: value for key, value
+                                in self._recent.items() if value[1] > now}
+                self._next_prune = now + self.interval
+            last = self._recent.get(jti)
+            if last is not None and now - last[0] < self.interval:
+                self.limited += 1
+                return False
+            self._recent[jti] = (now, expires_at)
+            return True
+
+    def renew(self, payload, now=None):
+        """
+        Issue a successor for a verified token close to expiry.
+
+        Args:
+            payload (dict): Claims of a token accepted by
+                `app.verification.check_access_token`.
+            now (float, optional): Current Unix time.
+
+        Returns:
+            tuple or None: The new token and its expiry (aware datetime), or
+            None if the token is not renewed.
+        """
+        now = time.time() if now is None else now
+        expires_at = payload.get('exp')
+        jti = payload.get('jti')
+        if expires_at is None or expires_at - now > self.window:
+            return None
+        # Tokens issued by /refresh carry no auth_time: count the session
+        # from their own issue.
+        auth_time = payload.get('auth_time',
+                                expires_at
+                                - ACCESS_TOKEN_LIFETIME.total_seconds())
+        if now - auth_time >= self.max_session:
+            with self._lock:
+                self.ended += 1
+            return None
+        if not self._allow(jti, expires_at, now):
+            return None
+        claims = {name: payload[name] for name in IDENTITY_CLAIMS
+                  if name in payload}
+        claims['auth_time'] = int(auth_time)
+        if 'roles' in payload and self.role_claims is not None:
+            role_claims = self.role_claims.cached(payload.get('sub'))
+            if role_claims is None:
+                with self._lock:
+                    self.stale_roles += 1
+                return None
+            claims.update(role_claims)
+        token, token_exp = issue_access_token(
+            claims, os.environ['JWT_SECRET'], profile=self.profile)
+        with self._lock:
+            self.renewed += 1
+        logger.info("Access token renewed for user %s", claims.get('sub'))
+        return token, token_exp
+
+    @staticmethod
+    def cookie_header(token, expires_at):
+        """
+        Return the ``Set-Cookie`` value ``response.set_cookie`` would send.
+
+        Args:
+            token (str): The new access token.
+            expires_at (datetime.datetime): Its expiry.
+
+        Returns:
+            str: The header value.
+        """
+        return dump_cookie('access_token', token, expires=expires_at,
+                           **COOKIE_OPTIONS)
+
+    def summary(self):
+        """Return the renewal counters as a dictionary."""
+        with self._lock:
+            return {
+                'window_s': self.window,
+                'renewed': self.renewed,
+                'limited': self.limited,
+                'ended': self.ended,
+                'stale_roles': self.stale_roles,
+                'tracked_jtis': len(self._recent),
+            }
+
+
+def init_sliding_renewal(app):
+    """
+    Enable sliding renewal in ``GET /verify`` if configured.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        SlidingRenewal or None: The renewal policy, also stored in
+        ``app.extensions['sliding_renewal']``.
+    """
+    if not app.config.get('SLIDING_RENEWAL'):
+        return None
+    renewal = SlidingRenewal(app.config['SLIDING_RENEWAL_WINDOW'],
+                             app.config['SLIDING_RENEWAL_INTERVAL'],
+                             app.config['SLIDING_RENEWAL_MAX_SESSION'],
+                             app.config['TOKEN_PROFILE'],
+                             app.extensions.get('role_claims'))
+    app.extensions['sliding_renewal'] = renewal
+    logger.info("Sliding renewal enabled, %ss before expiry.",
+                renewal.window)
+    return renewal
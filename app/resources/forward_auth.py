@@ -0,0 +1,116 @@
+"""
+forward_auth.py
+---------------
+This module provides the ForwardAuthResource, the access token check of
+reverse proxies (nginx ``auth_request``, Traefik ``ForwardAuth``).
+"""
+import os
+import time
+from urllib.parse import quote
+
+from flask import current_app, make_response, request
+from flask_restful import Resource
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.verification import (
+    DATABASE_UNAVAILABLE,
+    MISSING_TOKEN,
+    TokenRejected,
+    check_access_token,
+    token_identity,
+)
+
+# Response header -> identity field (see `app.verification.token_identity`).
+IDENTITY_HEADERS = {
+    'X-Auth-User-Id': 'user_id',
+    'X-Auth-Company-Id': 'company_id',
+    'X-Auth-Email': 'email',
+    'X-Auth-Roles': 'roles',
+    'X-Auth-Permissions': 'permissions',
+}
+
+# Generic caches must not share one user's answer with another; the
+# proxy configurations key their cache on the access token instead.
+VARY = 'Cookie'
+
+
+def _header_value(value):
+    """Return an identity field as a header value (lists comma-separated)."""
+    if isinstance(value, list):
+        value = ','.join(value)
+    return quote(str(value), safe="@.+-_~!$&'*=:,/ ")
+
+
+def cache_control(expires_at, max_age, now=None):
+    """
+    Return the ``Cache-Control`` value of an accepted token.
+
+    Args:
+        expires_at (float): The token's ``exp`` claim.
+        max_age (float): ``FORWARD_AUTH_MAX_AGE``, the longest a proxy may
+            keep accepting a token after it is revoked.
+        now (float, optional): Current Unix time.
+
+    Returns:
+        str: ``max-age`` capped by the token's remaining lifetime and
+        ``max_age``, or ``no-store`` when it would be zero.
+    """
+    now = time.time() if now is None else now
+    seconds = int(min(expires_at - now, max_age))
+    return f'max-age={seconds}' if seconds > 0 else 'no-store'
+
+
+class ForwardAuthResource(Resource):
+    """
+    Resource answering the authentication subrequests of reverse proxies.
+
+    GET /forward-auth:
+        - Checks the access token cookie as GET /verify does.
+        - Answers 204 without a body, with the identity in ``X-Auth-*``
+          headers, and a ``Cache-Control`` max-age capped by the token's
+          remaining lifetime and ``FORWARD_AUTH_MAX_AGE``, so that the
+          proxy can cache the answer per token.
+        - Answers 401 with ``Cache-Control: no-store`` otherwise, and 503
+          (not cached either) when the database fails.
+
+    Tokens are not renewed here (see app/renewal.py): cached answers cannot
+    carry a new cookie.
+    """
+    def get(self):
+        """
+        Check the access token of a proxied request.
+
+        Expects an 'access_token' cookie.
+        Returns 204 with identity headers if the token is valid, 401 with an
+        error message if it is missing, invalid, expired, or revoked, and
+        503 if its revocation cannot be checked.
+        """
+        access_token = request.cookies.get('access_token')
+        headers = {'Cache-Control': 'no-store', 'Vary': VARY}
+        if not access_token:
+            logger.error("Missing access token for forward auth")
+            return {'message': MISSING_TOKEN}, 401, headers
+
+        try:
+            payload = check_access_token(
+                access_token, os.environ['JWT_SECRET'], db.engine,
+                current_app.extensions.get('revocation_snapshot'),
+                current_app.extensions.get('revocation_shared'))
+        except TokenRejected as e:
+            return {'message': e.message}, 401, headers
+        except SQLAlchemyError as e:
+            logger.error("Forward auth failed: %s", e)
+            return {'message': DATABASE_UNAVAILABLE}, 503, headers
+
+        identity = token_identity(
+            payload, current_app.extensions.get('user_directory'))
+        response = make_response('', 204)
+        for header, field in IDENTITY_HEADERS.items():
+            if identity.get(field) is not None:
+                response.headers[header] = _header_value(identity[field])
+        response.headers['Cache-Control'] = cache_control(
+            payload['exp'], current_app.config['FORWARD_AUTH_MAX_AGE'])
+        response.headers['Vary'] = VARY
+        return response
@@ -5,16 +5,15 @@ This module provides the LoginResource for handling user authentication and
 token issuance.
 """
 import os
-from datetime import datetime, timedelta, timezone
-import secrets
-import uuid
-from flask import request, make_response, jsonify
+from flask import current_app, request, make_response, jsonify
 from flask_restful import Resource
-import jwt
 
-from app.utils import check_credentials
+from app.credentials import check_credentials
+from app.directory import upsert_user
+from app.group_commit import commit_refresh_tokens, refresh_token_row
 from app.logger import logger
-from app.models.refresh_token import RefreshToken
+from app.roles import login_role_claims, upsert_roles
+from app.tokens import COOKIE_OPTIONS, issue_login_tokens
 from app.models import db
 
 
@@ -23,9 +22,16 @@ class LoginResource(Resource):
     Resource for handling user login and issuing JWT access and refresh tokens.
 
     POST /login:
-        - Validates user credentials.
-        - Issues JWT access and refresh tokens.
+        - Validates user credentials with the configured backend (see
+          app/credentials).
+        - Issues JWT access and refresh tokens, the access token with the
+          user's role claims when enabled (see app/roles.py).
         - Sets tokens as HttpOnly cookies in the response.
+        - With ``GROUP_COMMIT``, commits the refresh token with concurrent
+          logins and refreshes (see app/group_commit.py).
+
+    In the ASGI deployment mode the request is handled on the event loop by
+    app/asgi.py, which shares `issue_login_tokens` with this resource.
     """
     def post(self):
         """
@@ -51,48 +57,39 @@ class LoginResource(Resource):
 
         logger.info("Login successful for user: %s", user['email'])
 
-        # Génération des tokens
-        access_token_exp = datetime.now(timezone.utc) + timedelta(minutes=15)
-        refresh_token_exp = datetime.now(timezone.utc) + timedelta(days=7)
-        jti = str(uuid.uuid4())
-        access_token = jwt.encode(
-            {
-                'sub': user['id'],
-                'email': user['email'],
-                'company_id': user.get('company_id'),
-                'exp': access_token_exp,
-                'jti': jti
-            },
-            os.environ['JWT_SECRET'],
-            algorithm='HS256'
-        )
-
-        refresh_token_str = secrets.token_urlsafe(64)
-        refresh_token = RefreshToken(
-            token=refresh_token_str,
-            user_id=user['id'],
-            company_id=user.get('company_id'),
-            expires_at=refresh_token_exp
-        )
-        db.session.add(refresh_token)
-        db.session.commit()
+        role_claims, cache_entry = None, None
+        if 'role_claims' in current_app.extensions:
+            role_claims, cache_entry = current_app.extensions[
+                'role_claims'].lookup(user['id'], login_role_claims(user))
+        tokens = issue_login_tokens(user, os.environ['JWT_SECRET'],
+                                    current_app.config['TOKEN_PROFILE'],
+                                    role_claims)
+        dialect = db.session.get_bind().dialect.name
+        statements = []
+        if cache_entry is not None:
+            statements.append(upsert_roles(dialect, *cache_entry))
+        if 'user_directory' in current_app.extensions:
+            # The access token leaves the email out: /verify reads it here.
+            statements.append(upsert_user(dialect, user))
+        commit_refresh_tokens(
+            current_app.extensions.get('group_commit'),
+            [refresh_token_row(tokens['refresh_token'], user['id'],
+                               user.get('company_id'), user['email'],
+                               tokens['refresh_token_exp'])],
+            statements)
 
         # Création de la réponse avec cookies httpOnly
         response = make_response(jsonify({'message': 'Login successful'}))
         response.set_cookie(
             'access_token',
-            access_token,
-            httponly=True,
-            secure=True,
-            samesite='Strict',
-            expires=access_token_exp
+            tokens['access_token'],
+            expires=tokens['access_token_exp'],
+            **COOKIE_OPTIONS
         )
         response.set_cookie(
             'refresh_token',
-            refresh_token_str,
-            httponly=True,
-            secure=True,
-            samesite='Strict',
-            expires=refresh_token_exp
+            tokens['refresh_token'],
+            expires=tokens['refresh_token_exp'],
+            **COOKIE_OPTIONS
         )
         return response
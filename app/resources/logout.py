@@ -3,17 +3,93 @@ logout.py
 ---------
 This module provides the LogoutResource for handling user logout, token
 revocation, and cookie cleanup.
+
+A logout is one round trip to PostgreSQL: `logout_statements` builds a
+single statement whose CTEs blacklist the access token and delete the
+refresh token, and which sends the revocation notification; it runs in
+autocommit, a single statement being atomic on its own. Other databases,
+SQLite included, do not allow INSERT or DELETE in a CTE: the insert and the
+delete run in one transaction instead.
 """
 import os
+import uuid
 from datetime import datetime, timezone
 import jwt
-from flask import request, make_response, jsonify
+from flask import current_app, request, make_response, jsonify
 from flask_restful import Resource
+from sqlalchemy import delete, func, insert, select
 
+from app.directory import UPSERT_INSERTS
 from app.models.token_blacklist import TokenBlacklist
 from app.models.refresh_token import RefreshToken
 from app.models import db
 from app.logger import logger
+from app.revocation.events import CHANNEL, notification_payloads
+from app.tokens import expand_claims
+from app.tracing import start_span
+
+
+def logout_statements(dialect_name, refresh_token, entry=None, payloads=()):
+    """
+    Build the statements of a logout.
+
+    Args:
+        dialect_name (str): The database's dialect name.
+        refresh_token (str): The refresh token to delete.
+        entry (dict, optional): The access token's blacklist entry
+            (``jti``, ``user_id``, ``company_id``, ``expires_at``); an entry
+            already present is left alone.
+        payloads (iterable): Revocation notifications (PostgreSQL only, see
+            `app.revocation.events.notification_payloads`).
+
+    Returns:
+        list: On PostgreSQL one SELECT, its CTEs doing the writes; on other
+        databases the blacklist insert (if any) and the refresh token
+        delete.
+    """
+    blacklist = TokenBlacklist.__table__
+    tokens = RefreshToken.__table__
+    remove = delete(tokens).where(tokens.c.token == refresh_token)
+    revoke = None
+    if entry is not None:
+        if dialect_name in UPSERT_INSERTS:
+            revoke = UPSERT_INSERTS[dialect_name](blacklist).values(
+                id=str(uuid.uuid4()), **entry).on_conflict_do_nothing(
+                    index_elements=[blacklist.c.jti])
+        else:
+            revoke = insert(blacklist).values(id=str(uuid.uuid4()), **entry)
+    if dialect_name != 'postgresql':
+        return [s for s in (revoke, remove) if s is not None]
+
+    columns = [select(func.count()).select_from(
+        remove.returning(tokens.c.id).cte('removed')
+    ).scalar_subquery().label('removed')]
+    if revoke is not None:
+        columns.append(select(func.count()).select_from(
+            revoke.returning(blacklist.c.jti).cte('revoked')
+        ).scalar_subquery().label('revoked'))
+    columns.extend(func.pg_notify(CHANNEL, payload).label(f'notify_{n}')
+                   for n, payload in enumerate(payloads))
+    return [select(*columns)]
+
+
+def execute_logout(engine, statements):
+    """
+    Run the statements of `logout_statements`.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        statements (list): The statements.
+    """
+    if len(statements) == 1 and engine.dialect.name == 'postgresql':
+        # One atomic statement: no BEGIN and COMMIT round trips.
+        with engine.connect() as conn:
+            conn.execution_options(isolation_level='AUTOCOMMIT')
+            conn.execute(statements[0])
+        return
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(statement)
 
 
 class LogoutResource(Resource):
@@ -22,7 +98,8 @@ class LogoutResource(Resource):
 
     POST /logout:
         - Blacklists the access token (if valid).
-        - Deletes the refresh token from the database.
+        - Deletes the refresh token from the database, in the same
+          statement on PostgreSQL (see `logout_statements`).
         - Removes authentication cookies from the client.
     """
     def post(self):
@@ -44,27 +121,24 @@ class LogoutResource(Resource):
             return {'message': 'Missing tokens'}, 400
 
         # Blacklist the access token
+        entry, revoked = None, None
         try:
-            payload = jwt.decode(
-                access_token,
-                os.environ['JWT_SECRET'],
-                algorithms=['HS256']
-            )
+            with start_span('jwt.decode', alg='HS256'):
+                payload = expand_claims(jwt.decode(
+                    access_token,
+                    os.environ['JWT_SECRET'],
+                    algorithms=['HS256']
+                ))
             jti = payload.get('jti')
-            user_id = payload.get('sub')
-            company_id = payload.get('company_id')
-            expires_at = datetime.fromtimestamp(
-                payload['exp'],
-                tz=timezone.utc
-                )
             if jti:
-                blacklist_entry = TokenBlacklist(
-                    jti=jti,
-                    user_id=user_id,
-                    company_id=company_id,
-                    expires_at=expires_at
-                )
-                db.session.add(blacklist_entry)
+                entry = {
+                    'jti': jti,
+                    'user_id': payload.get('sub'),
+                    'company_id': payload.get('company_id'),
+                    'expires_at': datetime.fromtimestamp(payload['exp'],
+                                                         tz=timezone.utc),
+                }
+                revoked = (jti, payload['exp'])
         except jwt.ExpiredSignatureError:
             logger.warning("Access token expired during logout")
         except jwt.InvalidTokenError as e:
@@ -72,14 +146,19 @@ class LogoutResource(Resource):
         except Exception as e:
             logger.error("Unexpected error during logout: %s", e)
 
-        # Delete the refresh token from the database
-        refresh_token = (
-            RefreshToken.query.filter_by(token=refresh_token_str).first()
-        )
-        if refresh_token:
-            db.session.delete(refresh_token)
+        # Delete the refresh token with the same round trip; the revocation
+        # is sent to the other nodes when it commits.
+        engine = db.engine
+        dialect_name = engine.dialect.name
+        payloads = (notification_payloads([revoked])
+                    if revoked and dialect_name == 'postgresql' else ())
+        execute_logout(engine, logout_statements(
+            dialect_name, refresh_token_str, entry, payloads))
 
-        db.session.commit()
+        # Make the revocation visible to every worker of the host at once
+        shared = current_app.extensions.get('revocation_shared')
+        if revoked and shared is not None:
+            shared.add(*revoked)
 
         # Remove cookies on the client side
         response = make_response(jsonify({'message': 'Logout successful'}))
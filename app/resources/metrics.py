@@ -0,0 +1,81 @@
+"""
+metrics.py
+----------
+
+This module defines the MetricsResource, exposing the connection pool state
+of the answering worker and the figures of its optional components through
+a REST endpoint.
+"""
+import os
+
+from flask import current_app
+from flask_restful import Resource
+
+from app.metrics import pool_snapshot
+from app.models import db
+
+
+class MetricsResource(Resource):
+    """
+    Resource for providing runtime metrics of the answering worker.
+
+    Methods:
+        get():
+            Retrieve the metrics of the answering worker.
+    """
+
+    def get(self):
+        """
+        Retrieve the metrics of the answering worker.
+
+        Returns 200 with these sections, the optional ones only when
+        their component is enabled:
+            - ``pid``: the worker's process id;
+            - ``pool``: `app.metrics.pool_snapshot`;
+            - ``lanes``: `app.lanes.LaneScheduler.snapshot`;
+            - ``limiter``: `app.limiter.AdaptiveLimiter.snapshot`;
+            - ``revocation_snapshot``:
+              `app.revocation.snapshot.RevocationSnapshot.summary`;
+            - ``revocation_shared``:
+              `app.revocation.shared.SharedRevocationSet.summary`;
+            - ``revocation_events``:
+              `app.revocation.events.RevocationListener.summary`;
+            - ``sliding_renewal``: `app.renewal.SlidingRenewal.summary`;
+            - ``user_directory``: `app.directory.UserDirectory.summary`;
+            - ``role_claims``: `app.roles.RoleClaims.summary`;
+            - ``credentials``:
+              `app.credentials.base.CredentialBackend.summary`;
+            - ``group_commit``: `app.group_commit.GroupCommitWriter.summary`.
+        """
+        metrics = {"pid": os.getpid(), "pool": pool_snapshot(db.engine)}
+        lanes = current_app.extensions.get('lanes')
+        if lanes is not None:
+            metrics["lanes"] = lanes.snapshot()
+        limiter = current_app.extensions.get('limiter')
+        if limiter is not None:
+            metrics["limiter"] = limiter.snapshot()
+        snapshot = current_app.extensions.get('revocation_snapshot')
+        if snapshot is not None:
+            metrics["revocation_snapshot"] = snapshot.summary()
+        shared = current_app.extensions.get('revocation_shared')
+        if shared is not None:
+            metrics["revocation_shared"] = shared.summary()
+        events = current_app.extensions.get('revocation_events')
+        if events is not None:
+            metrics["revocation_events"] = events.summary()
+        renewal = current_app.extensions.get('sliding_renewal')
+        if renewal is not None:
+            metrics["sliding_renewal"] = renewal.summary()
+        directory = current_app.extensions.get('user_directory')
+        if directory is not None:
+            metrics["user_directory"] = directory.summary()
+        role_claims = current_app.extensions.get('role_claims')
+        if role_claims is not None:
+            metrics["role_claims"] = role_claims.summary()
+        credentials = current_app.extensions.get('credentials')
+        if credentials is not None:
+            metrics["credentials"] = credentials.summary()
+        group_commit = current_app.extensions.get('group_commit')
+        if group_commit is not None:
+            metrics["group_commit"] = group_commit.summary()
+        return metrics, 200
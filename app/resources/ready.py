@@ -0,0 +1,39 @@
+"""
+ready.py
+--------
+
+This module defines the ReadyResource, the readiness probe polled by the
+orchestrator before routing traffic to a worker.
+"""
+from flask import current_app
+from flask_restful import Resource
+
+from app.warmup import warm_worker
+
+
+class ReadyResource(Resource):
+    """
+    Resource reporting whether the worker finished its warm-up.
+
+    Methods:
+        get():
+            Return 200 once the worker is ready, 503 otherwise.
+    """
+
+    def get(self):
+        """
+        Report worker readiness.
+
+        A ready worker answers from memory, without touching the database.
+        While not ready, the warm-up is retried at most once every
+        ``READINESS_RETRY_INTERVAL`` seconds.
+
+        Returns:
+            dict: ``{"ready": bool}`` with HTTP status 200 or 503.
+        """
+        readiness = current_app.extensions['readiness']
+        if not readiness.ready and readiness.attempt_due():
+            warm_worker(current_app)
+        if readiness.ready:
+            return {"ready": True}, 200
+        return {"ready": False}, 503
@@ -8,12 +8,20 @@ using a valid refresh token.
 import os
 from datetime import datetime, timedelta, timezone
 import jwt
-from flask import request, make_response, jsonify
+from flask import current_app, request, make_response, jsonify
 from flask_restful import Resource
+from sqlalchemy import delete
 
+from app.group_commit import (
+    GuardFailed,
+    commit_refresh_tokens,
+    refresh_token_row,
+)
 from app.models.refresh_token import RefreshToken
 from app.models import db
 from app.logger import logger
+from app.roles import upsert_roles
+from app.tokens import issue_access_token
 
 
 class RefreshResource(Resource):
@@ -23,8 +31,12 @@ class RefreshResource(Resource):
     POST /refresh:
         - Validates the refresh token from cookies.
         - Issues a new JWT access token if the refresh token is valid and not
-          expired.
-        - Optionally supports refresh token rotation.
+          expired, with the email recorded at login and, when enabled, the
+          user's role claims (see app/roles.py).
+        - Rotates the refresh token; a token already rotated by a concurrent
+          refresh is answered 401.
+        - With ``GROUP_COMMIT``, commits the rotation with concurrent logins
+          and refreshes (see app/group_commit.py).
     """
     def post(self):
         """
@@ -61,32 +73,41 @@ class RefreshResource(Resource):
         # Generate a new access token
         user_id = refresh_token.user_id
         company_id = refresh_token.company_id
-        access_token_exp = datetime.now(timezone.utc) + timedelta(minutes=15)
-        jti = jwt.utils.base64url_encode(os.urandom(16)).decode('utf-8')
-        access_token = jwt.encode(
-            {
-                'sub': user_id,
-                'company_id': company_id,
-                'exp': access_token_exp,
-                'jti': jti
-            },
+        email = refresh_token.email
+        claims = {'sub': user_id, 'company_id': company_id}
+        if email is not None:
+            claims['email'] = email
+        cache_entry = None
+        if 'role_claims' in current_app.extensions:
+            role_claims, cache_entry = current_app.extensions[
+                'role_claims'].lookup(user_id)
+            claims.update(role_claims or {})
+        access_token, access_token_exp = issue_access_token(
+            claims,
             os.environ['JWT_SECRET'],
-            algorithm='HS256'
-        )
+            profile=current_app.config['TOKEN_PROFILE'])
 
-        # Optional: refresh token rotation (not implemented here)
-        # Delete the old refresh token and create a new one
-        db.session.delete(refresh_token)
+        # Rotation: the old refresh token is deleted and a new one created.
+        # The delete guards the write: of two refreshes racing on one
+        # token, only the first to delete it gets a new one.
+        statements = []
+        if cache_entry is not None:
+            statements.append(upsert_roles(
+                db.session.get_bind().dialect.name, *cache_entry))
         new_refresh_token_str = jwt.utils.base64url_encode(
             os.urandom(64)).decode('utf-8')
-        new_refresh_token = RefreshToken(
-            token=new_refresh_token_str,
-            user_id=user_id,
-            company_id=company_id,
-            expires_at=datetime.now(timezone.utc) + timedelta(days=7)
-        )
-        db.session.add(new_refresh_token)
-        db.session.commit()
+        try:
+            commit_refresh_tokens(
+                current_app.extensions.get('group_commit'),
+                [refresh_token_row(
+                    new_refresh_token_str, user_id, company_id, email,
+                    datetime.now(timezone.utc) + timedelta(days=7))],
+                statements,
+                guard=delete(RefreshToken).where(
+                    RefreshToken.id == refresh_token.id))
+        except GuardFailed:
+            logger.error("Refresh token already rotated")
+            return {'message': 'Invalid refresh token'}, 401
         logger.info("New access token generated for user %s", user_id)
 
         # Set the new access token as an HttpOnly cookie
@@ -0,0 +1,89 @@
+"""
+revocations.py
+--------------
+This module provides the RevocationsResource, the incremental feed of the
+token blacklist read by the local-verification client (auth_client).
+"""
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, request
+from flask_restful import Resource
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.revocation import timestamp
+from app.revocation.events import FULL_QUERY, POLL_QUERY, read_clock
+from app.utils import internal_token_valid
+
+
+def _as_utc(value):
+    """Return a database datetime as an aware UTC datetime."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+class RevocationsResource(Resource):
+    """
+    Resource serving the token blacklist to downstream verifiers.
+
+    GET /revocations:
+        - Requires the ``X-Internal-Token`` header (``INTERNAL_AUTH_TOKEN``).
+        - Without ``since``: every unexpired entry, and a cursor taken from
+          the database's clock.
+        - With ``since`` (a previous cursor): the entries created since,
+          re-reading ``REVOCATION_EVENTS_OVERLAP`` seconds before it so that
+          rows committed late are not missed, and the new cursor.
+    """
+    def get(self):
+        """
+        Return blacklist entries and the cursor of the next request.
+
+        Returns 403 if the internal token is wrong, 400 if 'since' is not a
+        number, 503 if the database fails, otherwise the entries as 'jti'
+        and 'exp' (Unix seconds) pairs with the 'cursor'.
+        """
+        if not internal_token_valid(request.headers.get('X-Internal-Token')):
+            logger.error("Revocation feed refused: bad internal token")
+            return {'message': 'Forbidden'}, 403
+        since = request.args.get('since')
+        overlap = timedelta(
+            seconds=current_app.config['REVOCATION_EVENTS_OVERLAP'])
+        poll_since = None
+        if since is not None:
+            # nan, inf and out-of-range values parse as floats but are not
+            # datetimes.
+            try:
+                since = float(since)
+                if not math.isfinite(since):
+                    raise ValueError(since)
+                cursor = datetime.fromtimestamp(since, timezone.utc)
+                poll_since = (cursor - overlap).replace(tzinfo=None)
+            except (ValueError, OverflowError, OSError):
+                return {'message': 'since must be a number'}, 400
+
+        try:
+            with db.engine.connect() as conn:
+                if poll_since is None:
+                    cursor = _as_utc(read_clock(conn))
+                    rows = conn.execute(FULL_QUERY).all()
+                else:
+                    rows = conn.execute(POLL_QUERY,
+                                        {'since': poll_since}).all()
+        except SQLAlchemyError as e:
+            logger.error("Revocation feed failed: %s", e)
+            return {'message': 'Database unavailable'}, 503
+
+        now = time.time()
+        revocations = []
+        for jti, expires_at, created_at in rows:
+            if created_at is not None:
+                cursor = max(cursor, _as_utc(created_at))
+            exp = timestamp(expires_at)
+            if exp > now:
+                revocations.append({'jti': jti, 'exp': exp})
+        return {'cursor': cursor.timestamp(), 'full': since is None,
+                'revocations': revocations}, 200
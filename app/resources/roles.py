@@ -0,0 +1,48 @@
+"""
+roles.py
+--------
+This module provides the RoleInvalidationResource, through which the user
+service drops cached role claims when a user's roles change.
+"""
+from flask import current_app, request
+from flask_restful import Resource
+
+from app.logger import logger
+from app.models import db
+from app.utils import internal_token_valid
+
+
+class RoleInvalidationResource(Resource):
+    """
+    Resource for invalidating cached role claims (see app/roles.py).
+
+    POST /roles/invalidate:
+        - Requires the ``X-Internal-Token`` header (``INTERNAL_AUTH_TOKEN``).
+        - Invalidates the cache entries of ``user_ids``, or every entry
+          when the body has none: the next login or refresh of these users
+          fetches their roles from the user service.
+    """
+    def post(self):
+        """
+        Invalidate cached role claims.
+
+        Expects an optional JSON body with a 'user_ids' list.
+        Returns 403 if the internal token is wrong, 404 if role claims are
+        disabled, 400 if 'user_ids' is not a list, otherwise the number of
+        users (or entries) invalidated.
+        """
+        if not internal_token_valid(request.headers.get('X-Internal-Token')):
+            logger.error("Role invalidation refused: bad internal token")
+            return {'message': 'Forbidden'}, 403
+        role_claims = current_app.extensions.get('role_claims')
+        if role_claims is None:
+            return {'message': 'Role claims are disabled'}, 404
+
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('user_ids')
+        if user_ids is not None and not isinstance(user_ids, list):
+            return {'message': 'user_ids must be a list'}, 400
+        invalidated = role_claims.invalidate(db.session, user_ids)
+        db.session.commit()
+        logger.info("Role claims invalidated: %s entries", invalidated)
+        return {'invalidated': invalidated}, 200
@@ -5,13 +5,20 @@ This module provides the VerifyResource for handling JWT access token
 verification.
 """
 import os
-from datetime import datetime, timezone
-import jwt
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 from flask_restful import Resource
+from sqlalchemy.exc import SQLAlchemyError
 
-from app.models.token_blacklist import TokenBlacklist
+from app.models import db
 from app.logger import logger
+from app.tokens import COOKIE_OPTIONS
+from app.verification import (
+    DATABASE_UNAVAILABLE,
+    MISSING_TOKEN,
+    TokenRejected,
+    check_access_token,
+    token_identity,
+)
 
 
 class VerifyResource(Resource):
@@ -22,6 +29,11 @@ class VerifyResource(Resource):
         - Checks the presence and validity of the access token from cookies.
         - Verifies the token signature, expiration, and blacklist status.
         - Returns user information if the token is valid.
+        - With sliding renewal (app/renewal.py), sets a new access token
+          cookie when the token is close to expiry.
+
+    In production the request is normally answered by the WSGI fast path
+    (app/fastpath.py), which shares `check_access_token` with this resource.
     """
     def get(self):
         """
@@ -30,49 +42,32 @@ class VerifyResource(Resource):
         Expects an 'access_token' cookie.
         If the token is valid, returns user information and a validity flag.
         Returns 401 with an error message if the token is missing, invalid,
-        expired, or revoked.
+        expired, or revoked, and 503 if its revocation cannot be checked.
         """
         logger.info("Token verification attempt started")
         access_token = request.cookies.get('access_token')
         if not access_token:
             logger.error("Missing access token for verification")
-            return {'message': 'Missing access token'}, 401
+            return {'message': MISSING_TOKEN}, 401
 
         try:
-            payload = jwt.decode(
-                access_token,
-                os.environ['JWT_SECRET'],
-                algorithms=['HS256']
-            )
-            jti = payload.get('jti')
-            if not jti:
-                logger.error("No JTI in token")
-                return {'message': 'Invalid token'}, 401
-
-            # Check if the token is blacklisted
-            blacklisted = TokenBlacklist.query.filter_by(jti=jti).first()
-            if blacklisted:
-                logger.warning("Token is blacklisted")
-                return {'message': 'Token revoked'}, 401
-
-            # Check expiration
-            exp = payload.get('exp')
-            if exp and datetime.fromtimestamp(
-                    exp, tz=timezone.utc) < datetime.now(timezone.utc):
-                logger.warning("Token expired")
-                return {'message': 'Token expired'}, 401
-
-            # Successful authentication
-            return jsonify({
-                'user_id': payload.get('sub'),
-                'company_id': payload.get('company_id'),
-                'email': payload.get('email'),
-                'valid': True
-            })
+            payload = check_access_token(
+                access_token, os.environ['JWT_SECRET'], db.engine,
+                current_app.extensions.get('revocation_snapshot'),
+                current_app.extensions.get('revocation_shared'))
+        except TokenRejected as e:
+            return {'message': e.message}, 401
+        except SQLAlchemyError as e:
+            logger.error("Token verification failed: %s", e)
+            return {'message': DATABASE_UNAVAILABLE}, 503
 
-        except jwt.ExpiredSignatureError:
-            logger.warning("Token expired (jwt.ExpiredSignatureError)")
-            return {'message': 'Token expired'}, 401
-        except jwt.InvalidTokenError as e:
-            logger.error("Invalid token: %s", e)
-            return {'message': 'Invalid token'}, 401
+        # Successful authentication
+        response = jsonify(token_identity(
+            payload, current_app.extensions.get('user_directory')))
+        renewal = current_app.extensions.get('sliding_renewal')
+        renewed = renewal.renew(payload) if renewal is not None else None
+        if renewed is not None:
+            token, expires_at = renewed
+            response.set_cookie('access_token', token, expires=expires_at,
+                                **COOKIE_OPTIONS)
+        return response
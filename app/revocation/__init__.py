@@ -0,0 +1,74 @@
+"""
+revocation.__init__.py
+----------------------
+
+Copies of the token blacklist kept outside the database, so that revocation
+checks keep working, and get cheaper, without a query per request.
+
+Entries are identified by a fixed-size digest of the token's JTI
+(`jti_digest`) rather than by the JTI itself, which keeps the structures
+compact and their records fixed-size.
+"""
+
+import hashlib
+import time
+from datetime import timezone
+
+from sqlalchemy import select
+
+from app.models.token_blacklist import TokenBlacklist
+
+# Bytes of the BLAKE2b digest identifying a JTI (128 bits: collisions are
+# not a concern at blacklist sizes).
+DIGEST_SIZE = 16
+
+BLACKLIST_QUERY = select(TokenBlacklist.jti, TokenBlacklist.expires_at)
+
+
+def jti_digest(jti):
+    """
+    Return the fixed-size digest identifying a JTI.
+
+    Args:
+        jti (str): The token's unique identifier.
+
+    Returns:
+        bytes: `DIGEST_SIZE` bytes.
+    """
+    return hashlib.blake2b(jti.encode(), digest_size=DIGEST_SIZE).digest()
+
+
+def timestamp(value):
+    """
+    Return a datetime as Unix seconds, naive values being UTC.
+
+    Args:
+        value (datetime.datetime): The datetime.
+
+    Returns:
+        int: Whole seconds since the epoch.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def unexpired_entries(engine, now=None):
+    """
+    Read the blacklist entries whose token has not expired yet.
+
+    Expiry is compared in Python: the column holds naive UTC datetimes.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        now (float, optional): Current Unix time.
+
+    Returns:
+        list: ``(jti, expires_at)`` pairs, expiry in Unix seconds.
+    """
+    now = time.time() if now is None else now
+    with engine.connect() as conn:
+        rows = conn.execute(BLACKLIST_QUERY).all()
+    entries = [(jti, timestamp(expires_at)) for jti, expires_at in rows]
+    return [(jti, expires_at) for jti, expires_at in entries
+            if expires_at > now]
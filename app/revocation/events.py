@@ -0,0 +1,519 @@
+"""
+events.py
+---------
+
+Revocation events: propagate revocations to the shared revocation set of
+every node.
+
+A revocation is recorded in ``token_blacklist`` by whichever node handled
+it, and written at once to that host's shared set (app/revocation/shared.py).
+Other nodes learn about it through this module:
+
+    - the revoking statement sends the payloads of `notification_payloads`
+      with ``pg_notify`` on the ``token_revocations`` channel (see
+      app/resources/logout.py). Postgres delivers them on commit, and not at
+      all on rollback; other databases rely on polling;
+    - on each node, one worker (elected with ``flock`` on a lock file next
+      to the shared set) runs a `RevocationListener` thread. It ``LISTEN``\\s
+      on a dedicated connection and applies every event to the shared set
+      as it arrives;
+    - on SQLite, or while the listening connection is down, the listener
+      polls ``token_blacklist`` instead, for rows created since its cursor
+      (minus an ``overlap`` covering transactions that commit late). After
+      each (re)connection it polls once, so no event is lost in between.
+
+Every successful wait or poll proves the set up to date and is recorded
+with `SharedRevocationSet.mark_synced`: workers trust misses in the set only
+while that is recent (``REVOCATION_EVENTS_MAX_LAG``).
+
+Propagation latency (publication to application, using the publisher's
+clock for events and the database clock, taken as UTC, for polled rows) is
+reported by ``GET /metrics`` on the worker running the listener.
+"""
+
+import fcntl
+import json
+import os
+import select
+import threading
+import time
+from datetime import timedelta, timezone
+
+from sqlalchemy import (
+    bindparam,
+    create_engine,
+    func,
+    select as sql_select,
+)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool
+
+from app.logger import logger
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.revocation import timestamp
+
+CHANNEL = 'token_revocations'
+# Postgres limits a notification payload to 8000 bytes.
+MAX_PAYLOAD = 7900
+
+_POLL_COLUMNS = (TokenBlacklist.jti, TokenBlacklist.expires_at,
+                 TokenBlacklist.created_at)
+FULL_QUERY = sql_select(*_POLL_COLUMNS)
+CLOCK_QUERY = sql_select(func.now())
+# ``created_at`` is a timestamp without time zone: PostgreSQL fills it with
+# now() converted to the session's time zone, which LOCALTIMESTAMP reads.
+LOCAL_CLOCK_QUERY = sql_select(func.localtimestamp())
+POLL_QUERY = (
+    sql_select(*_POLL_COLUMNS)
+    .where(TokenBlacklist.created_at >= bindparam('since'))
+    .order_by(TokenBlacklist.created_at)
+)
+
+# Upper bounds (milliseconds) of the propagation latency histogram buckets.
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000, 30000)
+
+
+def _naive(value):
+    """Return a datetime without time zone, converted to UTC if aware."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def read_clock(conn):
+    """
+    Read the database's clock in the frame of ``created_at`` values.
+
+    Args:
+        conn (sqlalchemy.engine.Connection): An open connection.
+
+    Returns:
+        datetime: The current time, without time zone.
+    """
+    query = (LOCAL_CLOCK_QUERY if conn.dialect.name == 'postgresql'
+             else CLOCK_QUERY)
+    return _naive(conn.execute(query).scalar_one())
+
+
+def _payloads(entries, published_at):
+    """Split revocations into JSON payloads below `MAX_PAYLOAD` bytes."""
+    batch = []
+    size = 0
+    for jti, expires_at in entries:
+        item = [jti, int(expires_at)]
+        item_size = len(json.dumps(item)) + 1
+        if batch and size + item_size > MAX_PAYLOAD:
+            yield json.dumps({'ts': published_at, 'revoked': batch})
+            batch, size = [], 0
+        batch.append(item)
+        size += item_size
+    if batch:
+        yield json.dumps({'ts': published_at, 'revoked': batch})
+
+
+def notification_payloads(entries):
+    """
+    Return the payloads announcing revocations to the other nodes.
+
+    Bulk revocations are sent in as few notifications as the payload size
+    allows.
+
+    Args:
+        entries (iterable): ``(jti, expires_at)`` pairs, expiry in Unix
+            seconds.
+
+    Returns:
+        list: JSON payloads for ``pg_notify`` on `CHANNEL`.
+    """
+    return list(_payloads(entries, time.time()))
+
+
+class PropagationStats:
+    """
+    Thread-safe propagation latency counters.
+
+    Attributes:
+        events (dict): Revocations applied, by source (``notify``,
+            ``poll``).
+        latency_total_ms (float): Sum of the recorded latencies.
+        latency_max_ms (float): Highest recorded latency.
+        latency_buckets (list): Cumulative counts of latencies at or below
+            each bound of `LATENCY_BUCKETS_MS`, the last entry counting
+            every latency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events = {'notify': 0, 'poll': 0}
+        self.latency_total_ms = 0.0
+        self.latency_max_ms = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, source, latency_ms):
+        """
+        Record one applied revocation.
+
+        Args:
+            source (str): ``notify`` or ``poll``.
+            latency_ms (float): Time from publication to application.
+        """
+        latency_ms = max(0.0, latency_ms)
+        with self._lock:
+            self.events[source] += 1
+            self.latency_total_ms += latency_ms
+            self.latency_max_ms = max(self.latency_max_ms, latency_ms)
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                if latency_ms <= bound:
+                    self.latency_buckets[index] += 1
+            self.latency_buckets[-1] += 1
+
+    def summary(self):
+        """Return the counters as a JSON-serializable dictionary."""
+        with self._lock:
+            total = self.latency_buckets[-1]
+            buckets = {f'le_{bound}ms': count for bound, count
+                       in zip(LATENCY_BUCKETS_MS, self.latency_buckets)}
+            buckets['total'] = total
+            return {
+                'events': dict(self.events),
+                'latency_mean_ms': round(self.latency_total_ms / total, 3)
+                if total else 0.0,
+                'latency_max_ms': round(self.latency_max_ms, 3),
+                'latency_histogram': buckets,
+            }
+
+
+def _wait_notifications(connection, timeout):
+    """
+    Yield notification payloads received within ``timeout`` seconds.
+
+    Supports psycopg 2 and psycopg 3 (3.2 or later) DBAPI connections.
+    """
+    if hasattr(connection, 'poll'):
+        # psycopg 2: notifications are read by poll() once the socket is
+        # readable.
+        if select.select([connection], [], [], timeout)[0]:
+            connection.poll()
+            while connection.notifies:
+                yield connection.notifies.pop(0).payload
+        return
+    for notification in connection.notifies(timeout=timeout):
+        yield notification.payload
+
+
+class RevocationListener:  # pylint: disable=too-many-instance-attributes
+    """
+    Keeps a shared revocation set in sync with the revocations of all
+    nodes.
+
+    `run` (the thread body) repeats `step`, which tests may call directly.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine, used
+            for polling.
+        shared_set (SharedRevocationSet): The host's set.
+        listen_url (str, optional): Database URL of the listening
+            connection; defaults to the engine's (set it to a direct
+            connection when the engine goes through PgBouncer).
+        poll_interval (float): Seconds between polls, and at most between
+            liveness checks of the listening connection.
+        overlap (float): Seconds re-read before the polling cursor.
+        reconnect_interval (float): Seconds between attempts to listen
+            again.
+
+    Attributes:
+        mode (str): ``standby`` (another worker listens), ``listen`` or
+            ``poll``.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, engine, shared_set, listen_url=None, poll_interval=1.0,
+                 overlap=5.0, reconnect_interval=5.0):
+        self.engine = engine
+        self.shared_set = shared_set
+        self.listen_url = listen_url
+        self.poll_interval = poll_interval
+        self.overlap = timedelta(seconds=overlap)
+        self.reconnect_interval = reconnect_interval
+        self.stats = PropagationStats()
+        self.mode = 'standby'
+        self.reconnects = 0
+        self.last_error = None
+        self._cursor = None
+        self._seen = set()
+        self._listen_engine = None
+        self._connection = None
+        self._next_connect = 0.0
+        self._lock_fd = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def can_listen(self):
+        """Tell whether the database supports LISTEN/NOTIFY."""
+        url = make_url(self.listen_url) if self.listen_url else self.engine.url
+        return url.get_backend_name() == 'postgresql'
+
+    def _is_leader(self):
+        """Try to become, or tell whether this process is, the listener."""
+        if self._lock_fd is None:
+            self._lock_fd = os.open(self.shared_set.path + '.listener',
+                                    os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+                return False
+            logger.info("Revocation listener elected in worker %d.",
+                        os.getpid())
+        return True
+
+    def apply_payload(self, payload, now=None):
+        """
+        Apply one notification to the shared set.
+
+        Args:
+            payload (str): A JSON payload from `notification_payloads`.
+            now (float, optional): Current Unix time.
+
+        Returns:
+            int: Revocations applied (0 for a malformed payload).
+        """
+        try:
+            event = json.loads(payload)
+            published_at = float(event['ts'])
+            revoked = [(str(jti), float(exp)) for jti, exp in event['revoked']]
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Malformed revocation event ignored: %s", e)
+            return 0
+        for jti, expires_at in revoked:
+            self.shared_set.add(jti, expires_at)
+        latency_ms = ((time.time() if now is None else now)
+                      - published_at) * 1000.0
+        for _ in revoked:
+            self.stats.observe('notify', latency_ms)
+        return len(revoked)
+
+    def poll(self):
+        """
+        Apply the blacklist rows created since the cursor.
+
+        The first poll reads the whole blacklist and starts the cursor at
+        the database's clock, so that later polls read new rows only.
+
+        Returns:
+            int: Rows read.
+
+        Raises:
+            sqlalchemy.exc.SQLAlchemyError: If the database fails.
+        """
+        full = self._cursor is None
+        with self.engine.connect() as conn:
+            if full:
+                cursor = read_clock(conn)
+                rows = conn.execute(FULL_QUERY).all()
+            else:
+                cursor = self._cursor
+                rows = conn.execute(
+                    POLL_QUERY, {'since': cursor - self.overlap}).all()
+        now = time.time()
+        # Rows already read by the previous poll come back within the
+        # overlap: only the others count as propagated now.
+        seen = set()
+        for jti, expires_at, created_at in rows:
+            self.shared_set.add(jti, timestamp(expires_at))
+            seen.add(jti)
+            if created_at is None:
+                continue
+            if not full and jti not in self._seen:
+                self.stats.observe('poll',
+                                   (now - timestamp(created_at)) * 1000.0)
+            cursor = max(cursor, _naive(created_at))
+        self._cursor = cursor
+        self._seen = seen
+        self.shared_set.mark_synced(now)
+        return len(rows)
+
+    def _connect(self):
+        """Open the listening connection, then catch up by polling."""
+        if self._listen_engine is None:
+            self._listen_engine = create_engine(
+                make_url(self.listen_url) if self.listen_url
+                else self.engine.url, poolclass=NullPool)
+        connection = self._listen_engine.raw_connection()
+        try:
+            driver_connection = connection.driver_connection
+            driver_connection.autocommit = True
+            cursor = driver_connection.cursor()
+            cursor.execute(f'LISTEN {CHANNEL}')
+            cursor.close()
+            self.poll()
+        except BaseException:
+            connection.close()
+            raise
+        self._connection = connection
+        self.mode = 'listen'
+        logger.info("Listening for revocation events.")
+
+    def _disconnect(self, error):
+        """Drop the listening connection and fall back to polling."""
+        self.last_error = str(error)
+        self.mode = 'poll'
+        self.reconnects += 1
+        self._next_connect = time.monotonic() + self.reconnect_interval
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:  # pylint: disable=broad-exception-caught
+                pass
+            self._connection = None
+        logger.warning("Revocation events unavailable, polling: %s", error)
+
+    def _listen_once(self):
+        """Apply the events of one wait, then check the connection."""
+        driver_connection = self._connection.driver_connection
+        for payload in _wait_notifications(driver_connection,
+                                           self.poll_interval):
+            self.apply_payload(payload)
+        cursor = driver_connection.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+        cursor.close()
+        self.shared_set.mark_synced()
+
+    def step(self):
+        """
+        Run one iteration: listen for up to ``poll_interval`` seconds, or
+        poll once.
+
+        Returns:
+            str: The mode the iteration ran in.
+        """
+        if not self._is_leader():
+            self.mode = 'standby'
+            self._stopped.wait(self.poll_interval)
+            return self.mode
+        if self.mode == 'standby':
+            self.mode = 'poll'
+        if (self._connection is None and self.can_listen()
+                and time.monotonic() >= self._next_connect):
+            try:
+                self._connect()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self._disconnect(e)
+        if self._connection is not None:
+            try:
+                self._listen_once()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                self._disconnect(e)
+            return self.mode
+        try:
+            self.poll()
+            self.last_error = None
+        except SQLAlchemyError as e:
+            self.last_error = str(e)
+            logger.warning("Revocation poll failed: %s", e)
+        self._stopped.wait(self.poll_interval)
+        return 'poll'
+
+    def run(self):
+        """Thread body: `step` until `stop` is called."""
+        while not self._stopped.is_set():
+            try:
+                self.step()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logger.error("Revocation listener error: %s", e)
+                self._stopped.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Start the listener thread in this process, once.
+
+        Returns:
+            bool: Whether a thread was started.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True,
+                                        name='revocation-listener')
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Stop the thread and release the connection and leadership."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.mode = 'standby'
+
+    def summary(self):
+        """Return the listener's state and statistics as a dictionary."""
+        summary = {
+            'mode': self.mode,
+            'reconnects': self.reconnects,
+            'last_error': self.last_error,
+        }
+        summary.update(self.stats.summary())
+        return summary
+
+
+def init_revocation_events(app):
+    """
+    Set up the revocation listener if events are enabled.
+
+    The thread itself is started after fork by `start_listener`.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        RevocationListener or None: The listener, also stored in
+        ``app.extensions['revocation_events']``.
+    """
+    if not app.config.get('REVOCATION_EVENTS'):
+        return None
+    shared_set = app.extensions.get('revocation_shared')
+    if shared_set is None:
+        logger.warning("REVOCATION_EVENTS needs REVOCATION_SHARED_SET: "
+                       "events disabled.")
+        return None
+    config = app.config
+    shared_set.max_sync_lag = config['REVOCATION_EVENTS_MAX_LAG']
+    with app.app_context():
+        engine = db.engine
+    listener = RevocationListener(
+        engine, shared_set,
+        listen_url=config.get('REVOCATION_EVENTS_LISTEN_URL'),
+        poll_interval=config['REVOCATION_EVENTS_POLL_INTERVAL'],
+        overlap=config['REVOCATION_EVENTS_OVERLAP'],
+        reconnect_interval=config['REVOCATION_EVENTS_RECONNECT_INTERVAL'])
+    app.extensions['revocation_events'] = listener
+    return listener
+
+
+def start_listener(app):
+    """
+    Start this worker's listener thread, if events are enabled.
+
+    Called by the worker warm-up, after fork.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        bool: Whether a thread was started.
+    """
+    listener = app.extensions.get('revocation_events')
+    if listener is None:
+        return False
+    return listener.start()
@@ -0,0 +1,357 @@
+"""
+shared.py
+---------
+
+Revocation set shared by every worker of a host.
+
+`SharedRevocationSet` is a fixed-size hash table of revoked JTI digests
+(see `app.revocation.jti_digest`) with their expiry, in a file mapped
+shared by all processes (``/dev/shm`` by default, so it lives in memory).
+A logout handled by any worker is written once and is seen at once by the
+others; the table exists once per host instead of once per worker.
+
+Layout:
+
+    header  8s magic ``RVKSHM01``, uint64 slot count, uint64 used slots,
+            uint64 evictions, uint64 flags, float64 seeding time, float64
+            last synchronization time
+    slots   16-byte digest and int64 expiry (Unix seconds); an expiry of 0
+            marks an empty slot
+
+Lookups are lock-free and probe linearly from the digest's hash, up to
+``max_probe`` slots or the first empty one. Writers serialize with a
+process-local lock and ``flock`` on the file, and write the digest before
+the expiry, so a concurrent reader sees either the old entry, an expired
+one or the new one. Expired slots are reused by later inserts: entries
+leave the table when the tokens they revoke expire.
+
+When every slot within ``max_probe`` of a new digest is in use by an
+unexpired entry, the ``eviction`` policy applies:
+
+    - ``expiring`` replaces the entry that expires first;
+    - ``reject`` keeps the table as it is and drops the new entry.
+
+Either way the table no longer holds the whole blacklist.
+
+The set is *complete* once it was seeded from the database (`seed`, run by
+the worker warm-up) and nothing has been evicted since. A complete set
+answers positive lookups in every case. With ``trust_misses`` it also
+answers negative ones, without a query. This is only correct when every
+revocation reaches this host's set: on a single node, or with the
+revocation events of app/revocation/events.py. In the latter case
+``max_sync_lag`` is set and misses are trusted only while the event
+listener has confirmed, less than ``max_sync_lag`` seconds ago, that the
+set is up to date (`mark_synced`).
+"""
+
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+from app.logger import logger
+from app.models import db
+from app.revocation import DIGEST_SIZE, jti_digest, unexpired_entries
+
+MAGIC = b'RVKSHM01'
+HEADER = struct.Struct(f'<{len(MAGIC)}sQQQQdd')
+TIME = struct.Struct('<d')
+SLOT = struct.Struct(f'<{DIGEST_SIZE}sq')
+EXPIRY = struct.Struct('<q')
+HASH = struct.Struct('<Q')
+
+# Header field offsets.
+_USED = len(MAGIC) + 8
+_EVICTIONS = _USED + 8
+_FLAGS = _EVICTIONS + 8
+_SEEDED_AT = _FLAGS + 8
+_SYNCED_AT = _SEEDED_AT + 8
+
+FLAG_SEEDED = 1
+FLAG_COMPLETE = 2
+
+EVICTION_POLICIES = ('expiring', 'reject')
+
+
+class SharedRevocationSet:  # pylint: disable=too-many-instance-attributes
+    """
+    Hash set of revoked JTI digests in a shared memory-mapped file.
+
+    The file is created (or reused, when another worker created it) on
+    construction.
+
+    Args:
+        path (str): The shared file, normally under ``/dev/shm``.
+        capacity (int): Number of slots (24 bytes each).
+        max_probe (int): Slots examined per lookup or insert.
+        eviction (str): One of `EVICTION_POLICIES`.
+        trust_misses (bool): Whether a complete set answers negative
+            lookups without the database.
+
+    Raises:
+        ValueError: If the file exists with another capacity, or the
+            eviction policy is unknown.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, path, capacity, max_probe=32, eviction='expiring',
+                 trust_misses=False):
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f'Unknown eviction policy: {eviction}')
+        self.path = path
+        self.capacity = capacity
+        self.max_probe = min(max_probe, capacity)
+        self.eviction = eviction
+        self.trust_misses = trust_misses
+        self.max_sync_lag = None
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        self._fd_pid = None
+        size = HEADER.size + capacity * SLOT.size
+        with self._locked():
+            stat = os.fstat(self._fd)
+            if stat.st_size == 0:
+                os.ftruncate(self._fd, size)
+                os.pwrite(self._fd,
+                          HEADER.pack(MAGIC, capacity, 0, 0, 0, 0.0, 0.0), 0)
+            elif stat.st_size != size:
+                raise ValueError(f'{path} holds a set of another capacity')
+            self._map = mmap.mmap(self._fd, size)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a shared revocation set')
+
+    def _lock_fd(self):
+        """
+        Return this process's descriptor of the file, for ``flock``.
+
+        A descriptor inherited across fork shares its lock with the parent,
+        so every process opens its own.
+        """
+        if self._fd_pid != os.getpid():
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            self._fd_pid = os.getpid()
+        return self._fd
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Serialize writers across threads and processes."""
+        with self._thread_lock:
+            fd = self._lock_fd()
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _header(self, offset):
+        """Read a uint64 header field."""
+        return HASH.unpack_from(self._map, offset)[0]
+
+    def _slots(self, digest):
+        """Yield the slot offsets probed for ``digest``."""
+        start = HASH.unpack_from(digest)[0] % self.capacity
+        for step in range(self.max_probe):
+            yield HEADER.size + ((start + step) % self.capacity) * SLOT.size
+
+    def contains(self, jti, now=None):
+        """
+        Tell whether the set holds an unexpired revocation of the JTI.
+
+        Args:
+            jti (str): The token's unique identifier.
+            now (float, optional): Current Unix time.
+
+        Returns:
+            bool: True if the token is revoked according to the set.
+        """
+        digest = jti_digest(jti)
+        now = time.time() if now is None else now
+        data = self._map
+        for offset in self._slots(digest):
+            expires_at = EXPIRY.unpack_from(data, offset + DIGEST_SIZE)[0]
+            if expires_at == 0:
+                return False
+            if data[offset:offset + DIGEST_SIZE] == digest:
+                return expires_at > now
+        return False
+
+    def complete(self):
+        """Tell whether the set holds the whole blacklist."""
+        return bool(self._header(_FLAGS) & FLAG_COMPLETE)
+
+    def trusted(self):
+        """Tell whether a miss means the token is not revoked."""
+        if not (self.trust_misses and self.complete()):
+            return False
+        if self.max_sync_lag is None:
+            return True
+        age = self.synced_age()
+        return age is not None and age <= self.max_sync_lag
+
+    def mark_synced(self, now=None):
+        """
+        Record that the set holds every revocation made until ``now``.
+
+        Args:
+            now (float, optional): Unix time; defaults to now.
+        """
+        TIME.pack_into(self._map, _SYNCED_AT,
+                       time.time() if now is None else now)
+
+    def synced_age(self):
+        """Return the seconds since `mark_synced`, or None if never."""
+        synced_at = TIME.unpack_from(self._map, _SYNCED_AT)[0]
+        if not synced_at:
+            return None
+        return max(0.0, time.time() - synced_at)
+
+    def _insert(self, digest, expires_at, now):
+        """Insert or extend one entry; the writer lock must be held."""
+        data = self._map
+        candidate = None
+        for offset in self._slots(digest):
+            current = EXPIRY.unpack_from(data, offset + DIGEST_SIZE)[0]
+            if current == 0:
+                candidate = candidate if candidate is not None else offset
+                break
+            if data[offset:offset + DIGEST_SIZE] == digest:
+                if expires_at > current:
+                    EXPIRY.pack_into(data, offset + DIGEST_SIZE, expires_at)
+                return True
+            if current <= now and candidate is None:
+                candidate = offset
+        if candidate is None:
+            self._evicted()
+            if self.eviction == 'reject':
+                return False
+            candidate = min(self._slots(digest), key=lambda offset: (
+                EXPIRY.unpack_from(data, offset + DIGEST_SIZE)[0]))
+        elif EXPIRY.unpack_from(data, candidate + DIGEST_SIZE)[0] == 0:
+            HASH.pack_into(data, _USED, self._header(_USED) + 1)
+        # Digest first: until the expiry is written, readers see an empty
+        # or expired slot.
+        data[candidate:candidate + DIGEST_SIZE] = digest
+        EXPIRY.pack_into(data, candidate + DIGEST_SIZE, expires_at)
+        return True
+
+    def _evicted(self):
+        """Count an eviction; the set is no longer complete."""
+        HASH.pack_into(self._map, _EVICTIONS, self._header(_EVICTIONS) + 1)
+        HASH.pack_into(self._map, _FLAGS,
+                       self._header(_FLAGS) & ~FLAG_COMPLETE)
+
+    def add(self, jti, expires_at):
+        """
+        Record a revocation.
+
+        Args:
+            jti (str): The revoked token's unique identifier.
+            expires_at (float): The token's expiry, in Unix seconds.
+
+        Returns:
+            bool: False if the entry was dropped (``reject`` policy).
+        """
+        now = time.time()
+        if expires_at <= now:
+            return True
+        with self._locked():
+            return self._insert(jti_digest(jti), int(expires_at), now)
+
+    def seed(self, entries, force=False):
+        """
+        Load the blacklist into the set and mark it complete.
+
+        Args:
+            entries (callable): Returns the ``(jti, expires_at)`` pairs of
+                the blacklist (expiry in Unix seconds). Called with the
+                writer lock held, so that no revocation recorded meanwhile
+                is lost.
+            force (bool): Seed again even if already seeded.
+
+        Returns:
+            bool: Whether the set was seeded by this call.
+        """
+        with self._locked():
+            if self._header(_FLAGS) & FLAG_SEEDED and not force:
+                return False
+            now = time.time()
+            evictions = self._header(_EVICTIONS)
+            for jti, expires_at in entries():
+                if expires_at > now:
+                    self._insert(jti_digest(jti), int(expires_at), now)
+            evicted = self._header(_EVICTIONS) - evictions
+            flags = FLAG_SEEDED | (0 if evicted else FLAG_COMPLETE)
+            HASH.pack_into(self._map, _FLAGS, flags)
+            TIME.pack_into(self._map, _SEEDED_AT, now)
+            TIME.pack_into(self._map, _SYNCED_AT, now)
+        logger.info("Shared revocation set seeded: %d slots used, %d "
+                    "evictions.", self._header(_USED), evicted)
+        return True
+
+    def summary(self):
+        """Return the set's state as a dictionary."""
+        seeded_at = TIME.unpack_from(self._map, _SEEDED_AT)[0]
+        synced_age = self.synced_age()
+        return {
+            'capacity': self.capacity,
+            'used': self._header(_USED),
+            'evictions': self._header(_EVICTIONS),
+            'complete': self.complete(),
+            'trusted': self.trusted(),
+            'seeded_at': seeded_at or None,
+            'synced_age_s': round(synced_age, 3)
+            if synced_age is not None else None,
+        }
+
+
+def init_shared_set(app):
+    """
+    Open the host's shared revocation set if enabled.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        SharedRevocationSet or None: The set, also stored in
+        ``app.extensions['revocation_shared']``.
+    """
+    if not app.config.get('REVOCATION_SHARED_SET'):
+        return None
+    config = app.config
+    try:
+        shared_set = SharedRevocationSet(
+            config['REVOCATION_SHARED_PATH'],
+            config['REVOCATION_SHARED_CAPACITY'],
+            config['REVOCATION_SHARED_MAX_PROBE'],
+            config['REVOCATION_SHARED_EVICTION'],
+            config['REVOCATION_SHARED_TRUST_MISSES'])
+    except (OSError, ValueError) as e:
+        # Remove the file (e.g. after a capacity change) to re-enable it.
+        logger.error("Shared revocation set disabled: %s", e)
+        return None
+    app.extensions['revocation_shared'] = shared_set
+    logger.info("Shared revocation set enabled: %s, %d slots.",
+                shared_set.path, shared_set.capacity)
+    return shared_set
+
+
+def seed_shared_set(app):
+    """
+    Seed the shared set from the database unless already done.
+
+    Called by the worker warm-up; the first worker of the host does the
+    work. Must be called in an application context.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        bool: Whether this call seeded the set.
+    """
+    shared_set = app.extensions.get('revocation_shared')
+    if shared_set is None:
+        return False
+    return shared_set.seed(lambda: unexpired_entries(db.engine))
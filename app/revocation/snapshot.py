@@ -0,0 +1,319 @@
+"""
+snapshot.py
+-----------
+
+Memory-mapped snapshot of the token blacklist.
+
+A background job (``flask revocations snapshot``, run from cron or as a
+sidecar with ``--interval``) exports the unexpired entries of
+``token_blacklist`` to a compact binary file, replaced atomically:
+
+    header   8s magic ``RVKSNAP1``, uint64 entry count, float64 generation
+             time (Unix seconds)
+    entries  16-byte JTI digest (see `app.revocation.jti_digest`) and int64
+             expiry (Unix seconds), sorted by digest
+
+Workers map the file read-only (`RevocationSnapshot`) and look digests up by
+binary search: the pages come from the page cache and are shared by every
+process of the host, and a freshly started worker has the whole blacklist
+at once. A replaced file is noticed within ``check_interval`` seconds.
+
+`app.verification.is_revoked` uses the snapshot in two ways:
+
+    - a JTI found in the snapshot is revoked, without a query;
+    - if the database cannot be reached, the snapshot answers alone
+      (degraded mode), as long as it is younger than ``max_age`` seconds.
+      Tokens revoked after the snapshot was generated are then accepted
+      until the database is back or the next snapshot includes them.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.revocation import (
+    DIGEST_SIZE,
+    jti_digest,
+    timestamp,
+    unexpired_entries,
+)
+
+MAGIC = b'RVKSNAP1'
+HEADER = struct.Struct(f'<{len(MAGIC)}sQd')
+RECORD = struct.Struct(f'<{DIGEST_SIZE}sq')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing or malformed."""
+
+
+def write_snapshot(path, entries, generated_at=None):
+    """
+    Write a snapshot file atomically.
+
+    The file is written next to ``path`` and renamed over it, so readers
+    never see a partial snapshot.
+
+    Args:
+        path (str): Destination file.
+        entries (iterable): ``(jti, expires_at)`` pairs; ``expires_at`` is
+            a datetime (naive values are UTC) or Unix seconds.
+        generated_at (float, optional): Generation time in Unix seconds;
+            defaults to now.
+
+    Returns:
+        int: Number of entries written.
+    """
+    records = {}
+    for jti, expires_at in entries:
+        if isinstance(expires_at, datetime):
+            expires_at = timestamp(expires_at)
+        expires_at = int(expires_at)
+        digest = jti_digest(jti)
+        records[digest] = max(expires_at, records.get(digest, expires_at))
+    if generated_at is None:
+        generated_at = time.time()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.revocations-')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(HEADER.pack(MAGIC, len(records), generated_at))
+            for digest in sorted(records):
+                fh.write(RECORD.pack(digest, records[digest]))
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(records)
+
+
+def export_snapshot(engine, path, now=None):
+    """
+    Export the unexpired blacklist entries to a snapshot file.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        path (str): Destination file.
+        now (float, optional): Unix seconds before which entries are
+            expired; defaults to now.
+
+    Returns:
+        int: Number of entries written.
+    """
+    now = time.time() if now is None else now
+    return write_snapshot(path, unexpired_entries(engine, now),
+                          generated_at=now)
+
+
+class _Mapping:
+    """A loaded snapshot file: its map and header fields."""
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as fh:
+                stat = os.fstat(fh.fileno())
+                if stat.st_size < HEADER.size:
+                    raise SnapshotError(f'{path}: truncated header')
+                self.data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError as e:
+            raise SnapshotError(f'{path}: {e}') from e
+        magic, self.count, self.generated_at = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise SnapshotError(f'{path}: not a revocation snapshot')
+        if stat.st_size != HEADER.size + self.count * RECORD.size:
+            raise SnapshotError(f'{path}: size does not match its header')
+        self.key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def lookup(self, digest):
+        """Return the expiry of ``digest``, or None (binary search)."""
+        data = self.data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = HEADER.size + middle * RECORD.size
+            current = data[offset:offset + DIGEST_SIZE]
+            if current < digest:
+                low = middle + 1
+            elif current > digest:
+                high = middle
+            else:
+                return RECORD.unpack_from(data, offset)[1]
+        return None
+
+
+class RevocationSnapshot:  # pylint: disable=too-many-instance-attributes
+    """
+    Read-only view of a snapshot file, reloaded when the file is replaced.
+
+    The file is opened on first use. Lookups never fail: without a loaded
+    snapshot they find nothing.
+
+    Args:
+        path (str): The snapshot file.
+        check_interval (float): Minimum seconds between checks for a new
+            file.
+        max_age (float): Age in seconds beyond which the snapshot no longer
+            answers alone in degraded mode.
+
+    Attributes:
+        degraded (int): Revocation checks answered from the snapshot alone
+            because the database was unavailable.
+    """
+
+    def __init__(self, path, check_interval=1.0, max_age=300.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self.degraded = 0
+        self._mapping = None
+        self._error = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self, force=False):
+        """
+        Map the file again if it was replaced since the last check.
+
+        Args:
+            force (bool): Check now, even within ``check_interval``.
+
+        Returns:
+            bool: Whether a snapshot is loaded.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return self._mapping is not None
+        with self._lock:
+            if not force and now < self._next_check:
+                return self._mapping is not None
+            self._next_check = now + self.check_interval
+            try:
+                stat = os.stat(self.path)
+                key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                if self._mapping is None or self._mapping.key != key:
+                    # The previous map is closed when its last reader
+                    # drops it.
+                    self._mapping = _Mapping(self.path)
+                    logger.info("Revocation snapshot loaded: %d entries.",
+                                self._mapping.count)
+                self._error = None
+            except (OSError, SnapshotError) as e:
+                # Logged once per distinct problem, not on every check.
+                if str(e) != self._error:
+                    logger.warning("Revocation snapshot not reloaded: %s", e)
+                self._error = str(e)
+        return self._mapping is not None
+
+    def age(self):
+        """Return the snapshot's age in seconds, or None if not loaded."""
+        mapping = self._mapping
+        if mapping is None:
+            return None
+        return max(0.0, time.time() - mapping.generated_at)
+
+    def contains(self, jti, now=None):
+        """
+        Tell whether the snapshot lists the JTI as revoked and unexpired.
+
+        Args:
+            jti (str): The token's unique identifier.
+            now (float, optional): Current Unix time.
+
+        Returns:
+            bool: True if the token is revoked according to the snapshot.
+        """
+        self.refresh()
+        mapping = self._mapping
+        if mapping is None:
+            return False
+        expires_at = mapping.lookup(jti_digest(jti))
+        if expires_at is None:
+            return False
+        return expires_at > (time.time() if now is None else now)
+
+    def usable_when_degraded(self):
+        """Tell whether the snapshot may answer without the database."""
+        self.refresh()
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    def summary(self):
+        """Return the snapshot's state as a dictionary."""
+        mapping = self._mapping
+        age = self.age()
+        return {
+            'path': self.path,
+            'loaded': mapping is not None,
+            'entries': mapping.count if mapping is not None else 0,
+            'age_s': round(age, 1) if age is not None else None,
+            'degraded': self.degraded,
+        }
+
+
+revocations_cli = AppGroup('revocations',
+                           help='Maintain the revocation snapshot.')
+
+
+@revocations_cli.command('snapshot')
+@click.option('--path', help='Snapshot file (default: '
+              'REVOCATION_SNAPSHOT_PATH).')
+@click.option('--interval', type=float, default=0.0,
+              help='Export again every INTERVAL seconds (0: once).')
+def snapshot_command(path, interval):
+    """Export the unexpired blacklist entries to the snapshot file."""
+    path = path or current_app.config.get('REVOCATION_SNAPSHOT_PATH')
+    if not path:
+        raise click.UsageError('No --path and REVOCATION_SNAPSHOT_PATH '
+                               'is not set.')
+    while True:
+        started = time.perf_counter()
+        try:
+            count = export_snapshot(db.engine, path)
+        except SQLAlchemyError as e:
+            if interval <= 0:
+                raise
+            # Keep the previous snapshot: it is what workers fall back on.
+            logger.error("Revocation snapshot export failed: %s", e)
+        else:
+            click.echo(f'{path}: {count} entries in '
+                       f'{(time.perf_counter() - started) * 1000:.0f} ms')
+        if interval <= 0:
+            return
+        time.sleep(interval)
+
+
+def init_snapshot(app):
+    """
+    Attach the revocation snapshot reader if a path is configured.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        RevocationSnapshot or None: The reader, also stored in
+        ``app.extensions['revocation_snapshot']``.
+    """
+    path = app.config.get('REVOCATION_SNAPSHOT_PATH')
+    if not path:
+        return None
+    snapshot = RevocationSnapshot(
+        path, app.config['REVOCATION_SNAPSHOT_CHECK_INTERVAL'],
+        app.config['REVOCATION_SNAPSHOT_MAX_AGE'])
+    app.extensions['revocation_snapshot'] = snapshot
+    logger.info("Revocation snapshot enabled: %s.", path)
+    return snapshot
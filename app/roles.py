@@ -0,0 +1,326 @@
+"""
+roles.py
+--------
+
+Role and permission claims in access tokens, so that downstream services
+can usually authorize a request from the token, or from ``GET /verify``,
+without calling the user service.
+
+With ``ROLE_CLAIMS`` enabled, ``POST /login`` and ``POST /refresh`` embed
+the user's ``roles`` and ``permissions`` (``r`` and ``p`` in compact
+profiles, see app/tokens.py). They come from the user service
+(``GET /users/<user_id>/roles``, see `fetch_roles`), or from the credential
+check when the user it returns already carries them, and are cached per
+user in the ``role_cache`` table for ``ROLE_CACHE_TTL`` seconds: a user's
+roles cost one call per TTL, shared by every worker and node.
+
+``POST /roles/invalidate`` (app/resources/roles.py), called by the user
+service when roles change, marks cache entries invalidated: the next login
+or refresh fetches the new roles. A login or refresh that fetched roles
+before the invalidation does not write them back, its upsert being
+conditional on the entry's ``invalidated_at`` (times are taken from the
+nodes' clocks). Invalidating every entry only marks the users that have
+one: a user without an entry whose fetch straddles it is cached with those
+roles for up to ``ROLE_CACHE_TTL``. Tokens already issued keep theirs until
+they expire; sliding renewal (app/renewal.py) only renews them while their
+user's entry is fresh, so clients of an invalidated user go through
+/refresh within one access token lifetime.
+
+A token without the claims (role claims disabled, or the user service
+failing) tells downstream services to fall back to the user service.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+import requests
+from sqlalchemy import bindparam, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.directory import UPSERT_INSERTS
+from app.logger import logger
+from app.models import db
+from app.models.role_cache import RoleCacheEntry
+from app.tracing import inject_trace_headers, start_span
+
+ROLE_CLAIMS = ('roles', 'permissions')
+
+ENTRY_QUERY = (
+    select(RoleCacheEntry.roles, RoleCacheEntry.permissions,
+           RoleCacheEntry.fetched_at, RoleCacheEntry.invalidated_at)
+    .where(RoleCacheEntry.user_id == bindparam('user_id'))
+)
+
+
+def _names(value):
+    """Return ``value`` if it is a list of strings, otherwise None."""
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    return None
+
+
+def parse_role_claims(data):
+    """
+    Extract role claims from a user service answer.
+
+    Args:
+        data (dict): An answer with a ``roles`` list and an optional
+            ``permissions`` list.
+
+    Returns:
+        dict or None: ``roles`` and ``permissions``, or None if ``data``
+        has no valid roles.
+    """
+    if not isinstance(data, dict):
+        return None
+    roles = _names(data.get('roles'))
+    permissions = _names(data.get('permissions', []))
+    if roles is None or permissions is None:
+        return None
+    return {'roles': roles, 'permissions': permissions}
+
+
+def fetch_roles(user_id):
+    """
+    Fetch a user's roles and permissions from the user service.
+
+    Args:
+        user_id (str): The user's ID.
+
+    Returns:
+        dict or None: ``roles`` and ``permissions``, or None if the user
+        service is not configured or fails.
+    """
+    user_service_url = os.getenv('USER_SERVICE_URL')
+    internal_secret = os.getenv('INTERNAL_AUTH_TOKEN')
+    if not user_service_url or not internal_secret:
+        logger.error("USER_SERVICE_URL or INTERNAL_AUTH_TOKEN is not set.")
+        return None
+    url = f"{user_service_url}/users/{user_id}/roles"
+    try:
+        with start_span('user_service.roles', url=url) as span:
+            resp = requests.get(
+                url,
+                headers=inject_trace_headers(
+                    {'X-Internal-Token': internal_secret}),
+                timeout=float(os.getenv('USER_SERVICE_TIMEOUT', '2')))
+            span.set_attribute('http.status_code', resp.status_code)
+        if resp.status_code != 200:
+            logger.error("Failed to fetch roles: %s - %s",
+                         resp.status_code, resp.text)
+            return None
+        claims = parse_role_claims(resp.json())
+    except requests.RequestException as e:
+        logger.error("User service roles request failed: %s", e)
+        return None
+    except ValueError as e:
+        logger.error("Error decoding JSON response: %s", e)
+        return None
+    if claims is None:
+        logger.error("Invalid roles for user %s.", user_id)
+    return claims
+
+
+def _naive_utc(value):
+    """Return an aware datetime as a naive UTC one, as stored."""
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def upsert_roles(dialect_name, user_id, claims, fetched_at):
+    """
+    Build the statement caching a user's role claims.
+
+    An entry invalidated after ``fetched_at`` is left as it is.
+
+    Args:
+        dialect_name (str): The database dialect (``postgresql`` or
+            ``sqlite``).
+        user_id (str): The user's ID.
+        claims (dict): ``roles`` and ``permissions``.
+        fetched_at (datetime.datetime): When they were fetched (aware).
+
+    Returns:
+        sqlalchemy.sql.Insert: An insert updating the existing entry.
+
+    Raises:
+        ValueError: If the dialect has no upsert.
+    """
+    if dialect_name not in UPSERT_INSERTS:
+        raise ValueError(f'No upsert for the {dialect_name} dialect')
+    statement = UPSERT_INSERTS[dialect_name](RoleCacheEntry).values(
+        user_id=str(user_id),
+        roles=claims['roles'],
+        permissions=claims['permissions'],
+        fetched_at=_naive_utc(fetched_at),
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[RoleCacheEntry.user_id],
+        set_={'roles': statement.excluded.roles,
+              'permissions': statement.excluded.permissions,
+              'fetched_at': statement.excluded.fetched_at},
+        where=or_(RoleCacheEntry.invalidated_at.is_(None),
+                  RoleCacheEntry.invalidated_at
+                  < statement.excluded.fetched_at),
+    )
+
+
+class RoleClaims:
+    """
+    Cached role claims of users.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        ttl (float): Seconds a cache entry is used.
+        fetch (callable): Fetches the claims of a user ID (`fetch_roles`).
+
+    Attributes:
+        hits (int): Lookups answered by a fresh cache entry.
+        misses (int): Lookups that fetched the claims.
+        errors (int): Lookups without claims (fetch or cache failure).
+    """
+
+    def __init__(self, engine, ttl=300.0, fetch=fetch_roles):
+        self.engine = engine
+        self.ttl = timedelta(seconds=ttl)
+        self.fetch = fetch
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def cached(self, user_id, now=None):
+        """
+        Return a user's claims if their cache entry is fresh.
+
+        Args:
+            user_id (str): The user's ID.
+            now (datetime.datetime, optional): Current time (aware).
+
+        Returns:
+            dict or None: ``roles`` and ``permissions``, or None if the
+            entry is missing, stale, invalidated or cannot be read.
+        """
+        now = datetime.now(timezone.utc) if now is None else now
+        try:
+            with self.engine.connect() as conn:
+                row = conn.execute(ENTRY_QUERY,
+                                   {'user_id': str(user_id)}).first()
+        except SQLAlchemyError as e:
+            logger.error("Role cache lookup failed: %s", e)
+            return None
+        if row is None or (row.invalidated_at is not None
+                           and row.invalidated_at >= row.fetched_at):
+            return None
+        fetched_at = row.fetched_at.replace(tzinfo=timezone.utc)
+        if now - fetched_at >= self.ttl:
+            return None
+        return {'roles': row.roles, 'permissions': row.permissions}
+
+    def lookup(self, user_id, known=None):
+        """
+        Return a user's claims for a new token.
+
+        Args:
+            user_id (str): The user's ID.
+            known (dict, optional): Claims already at hand (returned by the
+                credential check), used instead of a cached entry.
+
+        Returns:
+            tuple: The claims (or None) and the `upsert_roles` arguments
+            to run in the caller's transaction (or None when the cache is
+            current).
+        """
+        now = datetime.now(timezone.utc)
+        if known is None:
+            claims = self.cached(user_id, now)
+            if claims is not None:
+                self.hits += 1
+                return claims, None
+            claims = self.fetch(user_id)
+        else:
+            claims = known
+        if claims is None:
+            self.errors += 1
+            return None, None
+        self.misses += 1
+        return claims, (str(user_id), claims, now)
+
+    @staticmethod
+    def invalidate(session, user_ids=None, now=None):
+        """
+        Invalidate cache entries, in the caller's transaction.
+
+        Named users without an entry get an invalidated one, so that a
+        fetch in progress is not cached either.
+
+        Args:
+            session (sqlalchemy.orm.Session): The session to use.
+            user_ids (list, optional): The users whose entries are
+                invalidated; all entries when None.
+            now (datetime.datetime, optional): Current time (aware).
+
+        Returns:
+            int: The number of users (or entries) invalidated.
+        """
+        now = _naive_utc(datetime.now(timezone.utc) if now is None else now)
+        if user_ids is None:
+            return session.execute(
+                update(RoleCacheEntry).values(invalidated_at=now)).rowcount
+        user_ids = sorted({str(u) for u in user_ids})
+        if not user_ids:
+            return 0
+        statement = UPSERT_INSERTS[session.get_bind().dialect.name](
+            RoleCacheEntry).values([
+                {'user_id': user_id, 'roles': [], 'permissions': [],
+                 'fetched_at': now, 'invalidated_at': now}
+                for user_id in user_ids])
+        session.execute(statement.on_conflict_do_update(
+            index_elements=[RoleCacheEntry.user_id],
+            set_={'invalidated_at': statement.excluded.invalidated_at}))
+        return len(user_ids)
+
+    def summary(self):
+        """Return the lookup counters as a dictionary."""
+        return {
+            'ttl_s': self.ttl.total_seconds(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+        }
+
+
+def login_role_claims(user):
+    """
+    Return the role claims carried by the user of a credential check.
+
+    Args:
+        user (dict): The user returned by the credential check.
+
+    Returns:
+        dict or None: ``roles`` and ``permissions``, or None if the user
+        carries no valid roles.
+    """
+    if 'roles' not in user:
+        return None
+    return parse_role_claims(user)
+
+
+def init_role_claims(app):
+    """
+    Enable role claims in issued access tokens if configured.
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        RoleClaims or None: The role cache, also stored in
+        ``app.extensions['role_claims']``.
+    """
+    if not app.config.get('ROLE_CLAIMS'):
+        return None
+    with app.app_context():
+        engine = db.engine
+    role_claims = RoleClaims(engine, app.config['ROLE_CACHE_TTL'])
+    app.extensions['role_claims'] = role_claims
+    logger.info("Role claims enabled, cached for %ss.",
+                app.config['ROLE_CACHE_TTL'])
+    return role_claims
@@ -13,6 +13,11 @@ from app.resources.login import LoginResource
 from app.resources.logout import LogoutResource
 from app.resources.verify import VerifyResource
 from app.resources.refresh import RefreshResource
+from app.resources.ready import ReadyResource
+from app.resources.metrics import MetricsResource
+from app.resources.forward_auth import ForwardAuthResource
+from app.resources.roles import RoleInvalidationResource
+from app.resources.revocations import RevocationsResource
 
 
 def register_routes(app):
@@ -33,6 +38,11 @@ def register_routes(app):
     api.add_resource(LoginResource, '/login')
     api.add_resource(LogoutResource, '/logout')
     api.add_resource(VerifyResource, '/verify')
+    api.add_resource(ForwardAuthResource, '/forward-auth')
     api.add_resource(RefreshResource, '/refresh')
+    api.add_resource(ReadyResource, '/ready')
+    api.add_resource(MetricsResource, '/metrics')
+    api.add_resource(RoleInvalidationResource, '/roles/invalidate')
+    api.add_resource(RevocationsResource, '/revocations')
 
     logger.info("Routes registered successfully.")
@@ -0,0 +1,179 @@
+"""
+schema.py
+---------
+
+Cheap database schema revision check for container start-up.
+
+``flask db upgrade`` imports Alembic, builds its migration environment and
+connects to the database even when there is nothing to do, which every
+replica pays for on boot. This module compares the head revisions declared
+in ``migrations/versions`` (read with ``ast``, without importing Alembic)
+with the ``alembic_version`` table, and only runs the upgrade when they
+differ.
+
+Usage:
+    python -m app.schema upgrade   # upgrade only if the schema is behind
+    python -m app.schema check     # exit status 1 if the schema is behind
+"""
+
+import ast
+import os
+import sys
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+
+# Same per-environment files as wsgi.py.
+ENV_FILES = {
+    'production': '.env.production',
+    'staging': '.env.staging',
+    'testing': '.env.test',
+}
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def _revision_ids(value):
+    """Normalize a ``down_revision`` value to a tuple of revision ids."""
+    if value is None:
+        return ()
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value)
+
+
+def _read_revision(path):
+    """
+    Extract ``revision`` and ``down_revision`` from a migration script.
+
+    Args:
+        path (str): Path of the migration script.
+
+    Returns:
+        tuple: ``(revision, down_revisions)``, revision being None if the
+        file does not declare one.
+    """
+    with open(path, encoding='utf-8') as fh:
+        tree = ast.parse(fh.read(), filename=path)
+    values = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1:
+            target = node.targets[0]
+            if (isinstance(target, ast.Name)
+                    and target.id in ('revision', 'down_revision')):
+                values[target.id] = ast.literal_eval(node.value)
+    return values.get('revision'), _revision_ids(values.get('down_revision'))
+
+
+def head_revisions(migrations_dir=MIGRATIONS_DIR):
+    """
+    Return the head revisions of the migration scripts.
+
+    Args:
+        migrations_dir (str): The Flask-Migrate migrations directory.
+
+    Returns:
+        set: Revisions that no other revision builds upon.
+    """
+    versions_dir = os.path.join(migrations_dir, 'versions')
+    revisions, parents = set(), set()
+    for name in os.listdir(versions_dir):
+        if not name.endswith('.py'):
+            continue
+        revision, down_revisions = _read_revision(
+            os.path.join(versions_dir, name))
+        if revision:
+            revisions.add(revision)
+            parents.update(down_revisions)
+    return revisions - parents
+
+
+def current_revisions(database_url):
+    """
+    Return the revisions recorded in the database's ``alembic_version``.
+
+    Args:
+        database_url (str): SQLAlchemy database URL.
+
+    Returns:
+        set: Applied head revisions; empty if the table does not exist.
+    """
+    engine = create_engine(database_url)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text('SELECT version_num FROM alembic_version'))
+            return {row[0] for row in rows}
+    except SQLAlchemyError:
+        return set()
+    finally:
+        engine.dispose()
+
+
+def schema_is_current(database_url, migrations_dir=MIGRATIONS_DIR):
+    """
+    Tell whether the database is at the latest migration.
+
+    Args:
+        database_url (str): SQLAlchemy database URL.
+        migrations_dir (str): The Flask-Migrate migrations directory.
+
+    Returns:
+        bool: True if the applied revisions are exactly the heads.
+    """
+    return current_revisions(database_url) == head_revisions(migrations_dir)
+
+
+def upgrade_if_needed(app, migrations_dir=MIGRATIONS_DIR):
+    """
+    Run the migrations unless the schema is already current.
+
+    Args:
+        app (Flask): The Flask application instance.
+        migrations_dir (str): The Flask-Migrate migrations directory.
+
+    Returns:
+        bool: True if an upgrade was run.
+    """
+    if schema_is_current(app.config['SQLALCHEMY_DATABASE_URI'],
+                         migrations_dir):
+        logger.info("Database schema is current, skipping migrations.")
+        return False
+    logger.info("Database schema is behind, running migrations.")
+    # Alembic is only imported when there is something to migrate.
+    # pylint: disable=import-outside-toplevel
+    from flask_migrate import upgrade
+    from app import register_cli_extensions
+
+    register_cli_extensions(app)
+    with app.app_context():
+        upgrade(directory=migrations_dir)
+    return True
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    args = sys.argv[1:] if argv is None else argv
+    command = args[0] if args else 'upgrade'
+    if command not in ('check', 'upgrade'):
+        print(f"Unknown command: {command} (expected 'check' or 'upgrade')",
+              file=sys.stderr)
+        return 2
+    load_dotenv(ENV_FILES.get(os.environ.get('FLASK_ENV', 'development'),
+                              '.env.development'))
+    current = schema_is_current(os.environ['DATABASE_URL'])
+    if command == 'check':
+        return 0 if current else 1
+    if not current:
+        # The application, and Alembic, are only loaded when needed.
+        # pylint: disable=import-outside-toplevel
+        from wsgi import app
+        upgrade_if_needed(app)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
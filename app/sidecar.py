@@ -0,0 +1,223 @@
+"""
+sidecar.py
+----------
+
+Token verification over a Unix domain socket, for services running on the
+same host as the auth service.
+
+``GET /verify`` costs a co-located caller an HTTP request and a JSON body
+per API call. `VerifySidecar` answers the same question on a Unix socket
+(``SIDECAR_SOCKET``) with length-prefixed binary frames, checking tokens
+with `app.verification.check_access_token` and building identities with
+`token_identity`, exactly as VerifyResource does. Sliding renewal does not
+apply: the sidecar has no cookie to set.
+
+Protocol (integers are big-endian):
+
+    request:  u32 length, then the access token (ASCII); an empty token is
+              answered `MISSING`.
+    response: u32 length, then a u8 status (`STATUSES`). With `OK`, the
+              identity follows: ``user_id``, ``company_id`` and ``email`` as
+              strings, then ``roles`` and ``permissions`` as lists.
+
+A string is a u16 byte length followed by UTF-8, 0xFFFF standing for None;
+a list is a u16 item count followed by strings, 0xFFFF standing for a claim
+the token does not carry.
+
+Requests may be pipelined: a client can send several frames without
+waiting, and the answers come back in the same order, written together for
+the frames read together. A frame over ``SIDECAR_MAX_FRAME`` bytes closes
+the connection.
+
+Run it next to the web server with ``python sidecar.py`` (see the top-level
+sidecar.py); each connection is served by a thread.
+"""
+
+import os
+import socketserver
+import struct
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.tokens import signing_key
+from app.verification import (
+    EXPIRED_TOKEN,
+    INVALID_TOKEN,
+    MISSING_TOKEN,
+    REVOKED_TOKEN,
+    TokenRejected,
+    check_access_token,
+    token_identity,
+)
+
+FRAME = struct.Struct('>I')
+FIELD = struct.Struct('>H')
+ABSENT = 0xFFFF
+
+OK = 0
+MISSING = 1
+INVALID = 2
+EXPIRED = 3
+REVOKED = 4
+UNAVAILABLE = 5
+STATUSES = {MISSING_TOKEN: MISSING, INVALID_TOKEN: INVALID,
+            EXPIRED_TOKEN: EXPIRED, REVOKED_TOKEN: REVOKED}
+
+RECV_SIZE = 65536
+
+
+def _string(value):
+    """Encode a nullable string field."""
+    if value is None:
+        return FIELD.pack(ABSENT)
+    data = str(value).encode()[:ABSENT - 1]
+    return FIELD.pack(len(data)) + data
+
+
+def _list(values):
+    """Encode a list field, None when the claim is absent."""
+    if values is None:
+        return FIELD.pack(ABSENT)
+    values = list(values)[:ABSENT - 1]
+    return FIELD.pack(len(values)) + b''.join(_string(v) for v in values)
+
+
+def encode_identity(identity):
+    """
+    Encode an identity as an `OK` response frame.
+
+    Args:
+        identity (dict): The identity returned by `token_identity`.
+
+    Returns:
+        bytes: The frame, length prefix included.
+    """
+    body = b''.join((
+        bytes((OK,)),
+        _string(identity['user_id']),
+        _string(identity['company_id']),
+        _string(identity['email']),
+        _list(identity.get('roles')),
+        _list(identity.get('permissions')),
+    ))
+    return FRAME.pack(len(body)) + body
+
+
+def encode_status(status):
+    """Encode a rejection response frame."""
+    return FRAME.pack(1) + bytes((status,))
+
+
+class SidecarHandler(socketserver.BaseRequestHandler):
+    """Serves the frames of one connection, in order."""
+
+    def handle(self):
+        """Read frames until the client disconnects, answering each batch."""
+        server = self.server
+        server.connections += 1
+        buffer = bytearray()
+        while True:
+            chunk = self.request.recv(RECV_SIZE)
+            if not chunk:
+                return
+            buffer += chunk
+            answers = []
+            offset = 0
+            while len(buffer) - offset >= FRAME.size:
+                (length,) = FRAME.unpack_from(buffer, offset)
+                if length > server.max_frame:
+                    logger.error("Sidecar frame of %s bytes refused", length)
+                    return
+                end = offset + FRAME.size + length
+                if len(buffer) < end:
+                    break
+                answers.append(server.answer(
+                    bytes(buffer[offset + FRAME.size:end])))
+                offset = end
+            del buffer[:offset]
+            if answers:
+                self.request.sendall(b''.join(answers))
+
+
+class VerifySidecar(socketserver.ThreadingMixIn,  # pylint: disable=too-many-instance-attributes
+                    socketserver.UnixStreamServer):
+    """
+    Unix socket server answering token verifications.
+
+    Attributes:
+        requests (int): Frames answered.
+        rejected (int): Tokens rejected.
+        errors (int): Verifications that failed (database unavailable).
+        connections (int): Connections accepted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, app, path=None):
+        """
+        Bind the socket, replacing a stale one.
+
+        Args:
+            app (Flask): The application, for its configuration and
+                extensions.
+            path (str, optional): Socket path; ``SIDECAR_SOCKET`` by
+                default.
+        """
+        path = path or app.config['SIDECAR_SOCKET']
+        if os.path.exists(path):
+            os.unlink(path)
+        self.app = app
+        self.max_frame = app.config['SIDECAR_MAX_FRAME']
+        self.key = signing_key(os.environ['JWT_SECRET'])
+        with app.app_context():
+            self.engine = db.engine
+        self.requests = self.rejected = self.errors = self.connections = 0
+        super().__init__(path, SidecarHandler)
+        os.chmod(path, int(app.config['SIDECAR_SOCKET_MODE'], 8))
+
+    def server_close(self):
+        """Close the socket and remove its file."""
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def answer(self, token):
+        """
+        Verify one token.
+
+        Args:
+            token (bytes): The token read from a request frame.
+
+        Returns:
+            bytes: The response frame.
+        """
+        self.requests += 1
+        if not token:
+            self.rejected += 1
+            return encode_status(MISSING)
+        extensions = self.app.extensions
+        try:
+            payload = check_access_token(
+                token.decode('ascii', 'replace'), self.key, self.engine,
+                extensions.get('revocation_snapshot'),
+                extensions.get('revocation_shared'))
+            return encode_identity(token_identity(
+                payload, extensions.get('user_directory')))
+        except TokenRejected as e:
+            self.rejected += 1
+            return encode_status(STATUSES[e.message])
+        except SQLAlchemyError as e:
+            self.errors += 1
+            logger.error("Sidecar verification failed: %s", e)
+            return encode_status(UNAVAILABLE)
+
+    def summary(self):
+        """Return the counters, as the /metrics extensions do."""
+        return {
+            'requests': self.requests,
+            'rejected': self.rejected,
+            'errors': self.errors,
+            'connections': self.connections,
+        }
@@ -0,0 +1,202 @@
+"""
+tokens.py
+---------
+
+Token issuance shared by ``POST /login`` (LoginResource) and the login
+handler of the ASGI deployment mode (app/asgi.py), so both issue the same
+access and refresh tokens and set the same cookies, and by the sliding
+renewal of ``GET /verify`` (app/renewal.py).
+
+Access tokens travel in a cookie with every request of the platform, so
+their claims follow a configurable profile (``TOKEN_PROFILE``):
+
+    - ``full``: named claims (``sub``, ``email``, ``company_id``,
+      ``auth_time``) and a UUID ``jti``;
+    - ``compact``: one- or two-letter claim keys (`COMPACT_KEYS`), a 16-byte
+      random ``j`` encoded in base64url, UUID ids packed the same way under
+      upper-case keys, no ``typ`` header;
+    - ``minimal``: ``compact`` without the email, which ``GET /verify``
+      reads from the user directory (app/directory.py) instead.
+
+With ``ROLE_CLAIMS`` enabled, access tokens also carry ``roles`` and
+``permissions`` (``r`` and ``p``), see app/roles.py.
+
+``exp`` keeps its name, as an integer, in every profile. Tokens of every
+profile are accepted whatever the configured one: `expand_claims` maps
+compact claims back to their full names right after decoding.
+"""
+
+import base64
+import os
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from app.tracing import start_span
+
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=15)
+REFRESH_TOKEN_LIFETIME = timedelta(days=7)
+
+# Attributes of the access_token and refresh_token cookies.
+COOKIE_OPTIONS = {'httponly': True, 'secure': True, 'samesite': 'Strict'}
+
+CLAIM_PROFILES = ('full', 'compact', 'minimal')
+# Full claim name -> compact key. Ids packed from UUIDs use the key in upper
+# case.
+COMPACT_KEYS = {'sub': 'u', 'company_id': 'c', 'email': 'e',
+                'auth_time': 'at', 'jti': 'j', 'roles': 'r',
+                'permissions': 'p'}
+_PACKED_IDS = ('sub', 'company_id')
+
+
+def _b64(data):
+    """Encode bytes in unpadded base64url."""
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def signing_key(secret):
+    """
+    Build the HS256 key object of a secret, to decode with it repeatedly.
+
+    Args:
+        secret (str): The ``JWT_SECRET``.
+
+    Returns:
+        jwt.PyJWK: The key; PyJWT skips preparing it on every decode.
+    """
+    return jwt.PyJWK({'kty': 'oct', 'k': _b64(secret.encode())},
+                     algorithm='HS256')
+
+
+def _pack_uuid(value):
+    """Return a canonical UUID string as 22 base64url characters, or None."""
+    if not isinstance(value, str) or len(value) != 36:
+        return None
+    try:
+        packed = uuid.UUID(value)
+    except ValueError:
+        return None
+    return _b64(packed.bytes) if str(packed) == value else None
+
+
+def _unpack_uuid(value):
+    """Reverse `_pack_uuid`."""
+    return str(uuid.UUID(bytes=base64.urlsafe_b64decode(value + '==')))
+
+
+def compact_claims(claims, profile):
+    """
+    Encode identity claims in a claim profile, with a new JTI.
+
+    Args:
+        claims (dict): Full claims (``sub``, ``email``, ``company_id``,
+            ``auth_time``, and ``roles`` and ``permissions`` if known);
+            absent or None claims are left out of compact profiles.
+        profile (str): One of `CLAIM_PROFILES`.
+
+    Returns:
+        dict: The token's claims, ``exp`` aside.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if profile == 'full':
+        return {**claims, 'jti': str(uuid.uuid4())}
+    if profile not in CLAIM_PROFILES:
+        raise ValueError(f'Unknown claim profile: {profile}')
+    encoded = {}
+    for name, value in claims.items():
+        if value is None or (name == 'email' and profile == 'minimal'):
+            continue
+        packed = _pack_uuid(value) if name in _PACKED_IDS else None
+        if packed is not None:
+            encoded[COMPACT_KEYS[name].upper()] = packed
+        else:
+            encoded[COMPACT_KEYS[name]] = value
+    encoded['j'] = _b64(os.urandom(16))
+    return encoded
+
+
+def expand_claims(payload):
+    """
+    Return decoded claims under their full names, whatever the profile.
+
+    Args:
+        payload (dict): Claims decoded by PyJWT.
+
+    Returns:
+        dict: ``payload`` itself for full tokens; otherwise the claims with
+        full names, ``email`` being absent when the token omits it.
+    """
+    if 'j' not in payload or 'jti' in payload:
+        return payload
+    expanded = {'exp': payload.get('exp')}
+    for name, key in COMPACT_KEYS.items():
+        if key in payload:
+            expanded[name] = payload[key]
+        elif key.upper() in payload:
+            expanded[name] = _unpack_uuid(payload[key.upper()])
+    return expanded
+
+
+def issue_access_token(claims, secret, now=None, profile='full'):
+    """
+    Create an access token with a new JTI.
+
+    Args:
+        claims (dict): The identity claims (``sub``, ``email``,
+            ``company_id``, ``auth_time``).
+        secret (str): The HS256 signing secret.
+        now (datetime.datetime, optional): Issue time (aware).
+        profile (str): Claim profile, one of `CLAIM_PROFILES`.
+
+    Returns:
+        tuple: The encoded JWT and its expiry (aware datetime).
+    """
+    now = datetime.now(timezone.utc) if now is None else now
+    access_token_exp = now + ACCESS_TOKEN_LIFETIME
+    payload = compact_claims(claims, profile)
+    payload['exp'] = int(access_token_exp.timestamp())
+    # PyJWT drops a ``typ`` header set to None.
+    headers = None if profile == 'full' else {'typ': None}
+    with start_span('jwt.encode', alg='HS256'):
+        access_token = jwt.encode(payload, secret, algorithm='HS256',
+                                  headers=headers)
+    return access_token, access_token_exp
+
+
+def issue_login_tokens(user, secret, profile='full', role_claims=None):
+    """
+    Create the access and refresh tokens of a successful login.
+
+    Args:
+        user (dict): The user returned by the credential check.
+        secret (str): The HS256 signing secret.
+        profile (str): Claim profile of the access token.
+        role_claims (dict, optional): ``roles`` and ``permissions`` to embed
+            (see app/roles.py).
+
+    Returns:
+        dict: ``access_token`` and ``access_token_exp``, the encoded JWT and
+        its expiry, and ``refresh_token`` and ``refresh_token_exp``, the
+        opaque refresh token to store and its expiry.
+    """
+    now = datetime.now(timezone.utc)
+    access_token, access_token_exp = issue_access_token(
+        {
+            'sub': user['id'],
+            'email': user['email'],
+            'company_id': user.get('company_id'),
+            'auth_time': int(now.timestamp()),
+            **(role_claims or {}),
+        },
+        secret, now, profile)
+    refresh_token_exp = now + REFRESH_TOKEN_LIFETIME
+    return {
+        'access_token': access_token,
+        'access_token_exp': access_token_exp,
+        'refresh_token': secrets.token_urlsafe(64),
+        'refresh_token_exp': refresh_token_exp,
+    }
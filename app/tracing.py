@@ -0,0 +1,576 @@
+"""
+tracing.py
+----------
+
+Lightweight request tracing for the authentication service.
+
+This module provides a minimal, dependency-free tracer that records spans for
+the request handler, JWT operations, database statements and outgoing calls
+to the user service. Spans follow the W3C Trace Context format so that an
+incoming ``traceparent`` header is honored and propagated downstream.
+
+Finished spans are handed to a batching processor that never blocks the
+request thread: spans are queued and written by a background thread to a
+local JSON-lines file or kept in memory for tests.
+
+Usage:
+    from app.tracing import start_span
+    with start_span("jwt.decode") as span:
+        span.set_attribute("alg", "HS256")
+"""
+
+import contextvars
+import json
+import os
+import queue
+import re
+import threading
+import time
+import weakref
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.logger import logger
+
+TRACEPARENT_HEADER = 'traceparent'
+TRACESTATE_HEADER = 'tracestate'
+
+_TRACEPARENT_RE = re.compile(
+    r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$'
+)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_trace_id():
+    """Return a random 128-bit trace id as 32 lowercase hex characters."""
+    return os.urandom(16).hex()
+
+
+def _new_span_id():
+    """Return a random 64-bit span id as 16 lowercase hex characters."""
+    return os.urandom(8).hex()
+
+
+def parse_traceparent(header):
+    """
+    Parse a W3C ``traceparent`` header.
+
+    Args:
+        header (str): The header value.
+
+    Returns:
+        tuple or None: ``(trace_id, parent_span_id, flags)`` if the header is
+        well formed, otherwise None.
+    """
+    if not header:
+        return None
+    match = _TRACEPARENT_RE.match(header.strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id, span_id, flags
+
+
+class Span:  # pylint: disable=too-many-instance-attributes
+    """
+    A single timed operation within a trace.
+
+    Attributes:
+        name (str): Operation name.
+        trace_id (str): 32 hex characters identifying the trace.
+        span_id (str): 16 hex characters identifying this span.
+        parent_id (str): Span id of the parent, or None for a root span.
+        flags (str): W3C trace flags propagated downstream.
+        tracestate (str): Opaque vendor state propagated downstream.
+        attributes (dict): Key/value annotations.
+        status (str): 'ok' or 'error'.
+    """
+    __slots__ = (
+        'name', 'trace_id', 'span_id', 'parent_id', 'flags', 'tracestate',
+        'attributes', 'status', 'start_ns', 'end_ns', '_tracer', '_token'
+    )
+
+    def __init__(self, owner, name, trace_id, parent_id, *,  # pylint: disable=too-many-arguments
+                 flags='01', tracestate=None, attributes=None):
+        self._tracer = owner
+        self._token = None
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.flags = flags
+        self.tracestate = tracestate
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = 'ok'
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        """Set a single attribute on the span."""
+        self.attributes[key] = value
+
+    def record_exception(self, exc):
+        """Mark the span as failed and record the exception type."""
+        self.status = 'error'
+        self.attributes['exception.type'] = type(exc).__name__
+
+    def traceparent(self):
+        """Return the W3C ``traceparent`` header value for this span."""
+        return f"00-{self.trace_id}-{self.span_id}-{self.flags}"
+
+    def activate(self):
+        """Make this span the current span of the execution context."""
+        self._token = _current_span.set(self)
+        return self
+
+    def end(self):
+        """Finish the span and hand it to the tracer's processor."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if self._token is not None:
+            try:
+                _current_span.reset(self._token)
+            except ValueError:
+                # Ended from a different context (e.g. teardown callbacks).
+                _current_span.set(None)
+            self._token = None
+        self._tracer.on_end(self)
+
+    def to_dict(self):
+        """Return a JSON-serializable representation of the span."""
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+    def __enter__(self):
+        return self.activate()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.record_exception(exc)
+        self.end()
+        return False
+
+
+class _NoopSpan:
+    """Span stand-in used when tracing is disabled."""
+    __slots__ = ()
+
+    def activate(self):
+        """Return the span: a no-op span never becomes current."""
+        return self
+
+    def set_attribute(self, key, value):
+        """Ignore the attribute."""
+
+    def record_exception(self, exc):
+        """Ignore the exception."""
+
+    def end(self):
+        """Do nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class InMemorySpanExporter:
+    """Exporter that keeps finished spans in a list, intended for tests."""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        """Append a batch of span dictionaries."""
+        with self._lock:
+            self.spans.extend(span.to_dict() for span in spans)
+
+    def clear(self):
+        """Forget every exported span."""
+        with self._lock:
+            self.spans.clear()
+
+    def shutdown(self):
+        """Nothing to release."""
+
+
+class FileSpanExporter:
+    """Exporter that appends spans as JSON lines to a local file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        """Write a batch of spans, one JSON document per line."""
+        lines = ''.join(
+            json.dumps(span.to_dict(), default=str) + '\n' for span in spans
+        )
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as fh:
+                fh.write(lines)
+
+    def shutdown(self):
+        """Nothing to release; the file is reopened for every batch."""
+
+
+class BatchSpanProcessor:  # pylint: disable=too-many-instance-attributes
+    """
+    Queue finished spans and export them in batches from a daemon thread.
+
+    ``on_end`` never blocks: when the queue is full the span is dropped and
+    counted in ``dropped``.
+    """
+
+    def __init__(self, exporter, max_queue_size=2048, max_batch_size=256,
+                 flush_interval=1.0):
+        self.exporter = exporter
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._flush_requests = queue.Queue()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start()
+        # Threads do not survive fork: restart the exporter in children of
+        # a preloading server (see gunicorn.conf.py).
+        after_fork = weakref.WeakMethod(self._after_fork)
+        os.register_at_fork(
+            after_in_child=lambda: after_fork() and after_fork()())
+
+    def _start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='span-exporter', daemon=True
+        )
+        self._thread.start()
+
+    def _after_fork(self):
+        """Drop the parent's queued spans and restart the exporter thread."""
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._flush_requests = queue.Queue()
+        if not self._stopped.is_set():
+            self._start()
+
+    def on_end(self, span):
+        """Enqueue a finished span without blocking."""
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        batch = []
+        while len(batch) < self.max_batch_size:
+            try:
+                span = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if span is not None:
+                batch.append(span)
+        return batch
+
+    def _export(self, batch):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.error("Span export failed: %s", e)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                first = None
+            batch = [first] if first is not None else []
+            batch.extend(self._drain())
+            if batch:
+                self._export(batch)
+            while not self._flush_requests.empty():
+                done = self._flush_requests.get_nowait()
+                self._flush_all()
+                done.set()
+        self._flush_all()
+
+    def _flush_all(self):
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+    def force_flush(self, timeout=5.0):
+        """
+        Export every queued span before returning.
+
+        Args:
+            timeout (float): Maximum number of seconds to wait.
+
+        Returns:
+            bool: True if the queue was flushed within the timeout.
+        """
+        done = threading.Event()
+        self._flush_requests.put(done)
+        self._wake()
+        return done.wait(timeout)
+
+    def _wake(self):
+        """Wake the exporter thread if it is waiting on an empty queue."""
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def shutdown(self):
+        """Stop the exporter thread after exporting queued spans."""
+        self._stopped.set()
+        self._wake()
+        self._thread.join(timeout=5.0)
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """
+    Create spans and route finished ones to a processor.
+
+    A tracer without a processor is disabled and hands out no-op spans, so
+    instrumented code costs almost nothing when tracing is off.
+    """
+
+    def __init__(self):
+        self.processor = None
+
+    @property
+    def enabled(self):
+        """Whether spans are currently being recorded."""
+        return self.processor is not None
+
+    def configure(self, processor):
+        """
+        Replace the active processor, shutting down the previous one.
+
+        Args:
+            processor (BatchSpanProcessor or None): The new processor, or None
+                to disable tracing.
+        """
+        previous, self.processor = self.processor, processor
+        if previous is not None:
+            previous.shutdown()
+
+    def start_span(self, name, attributes=None, traceparent=None,
+                   tracestate=None):
+        """
+        Start a span as a child of the current span.
+
+        Args:
+            name (str): Operation name.
+            attributes (dict, optional): Initial attributes.
+            traceparent (str, optional): Incoming W3C header used as the
+                remote parent when there is no current span.
+            tracestate (str, optional): Incoming ``tracestate`` header.
+
+        Returns:
+            Span: The started span (or a no-op span when disabled).
+        """
+        if self.processor is None:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id,
+                        flags=parent.flags, tracestate=parent.tracestate,
+                        attributes=attributes)
+        remote = parse_traceparent(traceparent)
+        if remote is not None:
+            trace_id, parent_id, flags = remote
+            return Span(self, name, trace_id, parent_id, flags=flags,
+                        tracestate=tracestate, attributes=attributes)
+        return Span(self, name, _new_trace_id(), None, attributes=attributes)
+
+    def on_end(self, span):
+        """Forward a finished span to the processor, if any."""
+        processor = self.processor
+        if processor is not None:
+            processor.on_end(span)
+
+
+tracer = Tracer()
+
+
+def start_span(name, **attributes):
+    """
+    Start a child span of the current span on the global tracer.
+
+    Intended to be used as a context manager.
+
+    Args:
+        name (str): Operation name.
+        **attributes: Initial span attributes.
+
+    Returns:
+        Span: The started span.
+    """
+    return tracer.start_span(name, attributes)
+
+
+def current_span():
+    """Return the span active in the current context, or None."""
+    return _current_span.get()
+
+
+def inject_trace_headers(headers):
+    """
+    Add W3C trace context headers for the current span to ``headers``.
+
+    Args:
+        headers (dict): Outgoing HTTP headers, modified in place.
+
+    Returns:
+        dict: The same headers mapping.
+    """
+    span = _current_span.get()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.traceparent()
+        if span.tracestate:
+            headers[TRACESTATE_HEADER] = span.tracestate
+    return headers
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+# pylint: disable=unused-argument
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    """Open a span around every DB statement issued inside a trace."""
+    if tracer.processor is None or _current_span.get() is None:
+        return
+    span = tracer.start_span('db.statement', {
+        'db.system': conn.dialect.name,
+        'db.statement': statement,
+        'db.executemany': executemany,
+    }).activate()
+    conn.info.setdefault('_trace_spans', []).append(span)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Close the span opened by `_before_cursor_execute`."""
+    spans = conn.info.get('_trace_spans')
+    if spans:
+        spans.pop().end()
+# pylint: enable=too-many-arguments,too-many-positional-arguments
+# pylint: enable=unused-argument
+
+
+def _handle_error(exception_context):
+    """Close the statement span of a failed DB call."""
+    conn = exception_context.connection
+    spans = conn.info.get('_trace_spans') if conn is not None else None
+    if spans:
+        span = spans.pop()
+        span.record_exception(exception_context.original_exception)
+        span.end()
+
+
+_db_listeners_installed = False
+
+
+def _install_db_listeners():
+    """Register the SQLAlchemy cursor hooks once per process."""
+    global _db_listeners_installed  # pylint: disable=global-statement
+    if _db_listeners_installed:
+        return
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    _db_listeners_installed = True
+
+
+def build_exporter(config):
+    """
+    Build the span exporter selected by the application configuration.
+
+    Args:
+        config (dict): The Flask application configuration.
+
+    Returns:
+        FileSpanExporter or InMemorySpanExporter: The exporter instance.
+    """
+    kind = config.get('TRACING_EXPORTER', 'file')
+    if kind == 'memory':
+        return InMemorySpanExporter()
+    if kind == 'file':
+        return FileSpanExporter(config.get('TRACING_FILE', 'traces.jsonl'))
+    raise ValueError(f"Unsupported TRACING_EXPORTER: {kind}")
+
+
+def init_tracing(app):
+    """
+    Configure the global tracer and instrument the Flask application.
+
+    Does nothing unless ``TRACING_ENABLED`` is set in the configuration.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    if not app.config.get('TRACING_ENABLED'):
+        return
+
+    processor = BatchSpanProcessor(
+        build_exporter(app.config),
+        max_queue_size=app.config.get('TRACING_QUEUE_SIZE', 2048),
+        max_batch_size=app.config.get('TRACING_BATCH_SIZE', 256),
+        flush_interval=app.config.get('TRACING_FLUSH_INTERVAL', 1.0),
+    )
+    tracer.configure(processor)
+    app.extensions['tracing'] = processor
+    _install_db_listeners()
+
+    @app.before_request
+    def _start_request_span():
+        span = tracer.start_span(
+            f"{request.method} {request.path}",
+            {'http.method': request.method, 'http.path': request.path},
+            traceparent=request.headers.get(TRACEPARENT_HEADER),
+            tracestate=request.headers.get(TRACESTATE_HEADER),
+        )
+        g.trace_span = span.activate()
+
+    @app.after_request
+    def _tag_request_span(response):
+        span = g.get('trace_span')
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            if request.endpoint:
+                span.set_attribute('http.endpoint', request.endpoint)
+            if response.status_code >= 500:
+                span.status = 'error'
+        return response
+
+    @app.teardown_request
+    def _end_request_span(exc):
+        span = g.pop('trace_span', None)
+        if span is not None:
+            if exc is not None:
+                span.record_exception(exc)
+            span.end()
+
+    logger.info("Tracing enabled with %s exporter.",
+                app.config.get('TRACING_EXPORTER', 'file'))
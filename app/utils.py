@@ -4,12 +4,124 @@ utils.py
 This module provides utility functions for authentication, including credential
 checking
 against a user service or a local stub for development and testing
-environments.
+environments, and the check of the internal token other services present.
 """
+import hmac
 import os
 import dotenv
 import requests
 from app.logger import logger
+from app.tracing import start_span, inject_trace_headers
+
+
+def internal_token_valid(token):
+    """
+    Tell whether a request's ``X-Internal-Token`` is the service's own.
+
+    Args:
+        token (str or None): The header value.
+
+    Returns:
+        bool: True if ``INTERNAL_AUTH_TOKEN`` is set and matches.
+    """
+    expected = os.getenv('INTERNAL_AUTH_TOKEN')
+    if not expected or token is None:
+        return False
+    return hmac.compare_digest(token, expected)
+
+
+def stub_user(email):
+    """
+    Return the stub user accepted in development and test.
+
+    Args:
+        email (str): The user's email address.
+
+    Returns:
+        dict: A fixed user with the given email.
+    """
+    return {
+        'id': 1,
+        'username': 'testuser',
+        'is_admin': True,
+        'email': email,
+        'hashed_password': 'fakehash'
+    }
+
+
+def verify_with_user_service(email, password):
+    """
+    Check user credentials with the user service's ``/verify_password``.
+
+    Args:
+        email (str): The user's email address.
+        password (str): The user's password.
+
+    Returns:
+        dict or None: User information dictionary if valid, otherwise None
+        (including when the user service is not configured or fails).
+    """
+    user_service_url = os.getenv('USER_SERVICE_URL')
+    if not user_service_url:
+        logger.error(
+            "USER_SERVICE_URL is not set in environment variables.")
+        return None
+    internal_secret = os.getenv('INTERNAL_AUTH_TOKEN')
+    if not internal_secret:
+        logger.error(
+            "INTERNAL_AUTH_TOKEN is not set in environment variables.")
+        return None
+
+    try:
+        payload = {'email': email, 'password': password}
+        logger.debug(
+            f"Verifying password for user {email} at {user_service_url}/verify_password"
+            )
+
+        # Call the user service to verify the password
+        with start_span('user_service.verify_password',
+                        url=f"{user_service_url}/verify_password") as span:
+            requests_headers = inject_trace_headers(
+                {'X-Internal-Token': internal_secret})
+            resp = requests.post(
+                f"{user_service_url}/verify_password",
+                json=payload,
+                headers=requests_headers,
+                timeout=float(os.getenv('USER_SERVICE_TIMEOUT', '2'))
+                )
+            span.set_attribute('http.status_code', resp.status_code)
+        if resp.status_code != 200:
+            logger.error(
+                "Failed to fetch user: %s - %s",
+                resp.status_code,
+                resp.text
+                )
+            return None
+        logger.debug("Response status code: %s", resp.status_code)
+        logger.debug("Response text: %s", resp.text)
+
+        user = resp.json()
+        logger.debug("User data: %s", user)
+        user_id = user.get('id')
+
+        if not user_id:
+            logger.error("Invalid user credentials.")
+            return None
+
+        return user
+
+    except requests.Timeout:
+        logger.error("User service request timed out.")
+        return None
+    except requests.ConnectionError:
+        logger.error("User service connection error.")
+        return None
+    except requests.RequestException as e:
+        logger.error("User service request exception: %s", e)
+        return None
+    except ValueError as e:
+        logger.error("Error decoding JSON response: %s", e)
+        return None
 
 
 def check_credentials(email, password):
@@ -21,6 +133,8 @@ def check_credentials(email, password):
     service API.
     Returns user information if credentials are valid, otherwise returns None.
 
+    This is the ``auto`` credential backend (see app/credentials).
+
     Args:
         email (str): The user's email address.
         password (str): The user's password.
@@ -31,74 +145,11 @@ def check_credentials(email, password):
     env = os.getenv('FLASK_ENV')
     if env in ['development', 'test']:
         # Stub: accept any credentials in dev/test
-        return {
-            'id': 1,
-            'username': 'testuser',
-            'is_admin': True,
-            'email': email,
-            'hashed_password': 'fakehash'
-        }
+        return stub_user(email)
 
     if env in ['production', 'staging']:
         dotenv.load_dotenv(f'.env.{env}')
-        user_service_url = os.getenv('USER_SERVICE_URL')
-        if not user_service_url:
-            logger.error(
-                "USER_SERVICE_URL is not set in environment variables.")
-            return None
-        internal_secret = os.getenv('INTERNAL_AUTH_TOKEN')
-        if not internal_secret:
-            logger.error(
-                "INTERNAL_AUTH_TOKEN is not set in environment variables.")
-            return None
-
-        try:
-            payload = {'email': email, 'password': password}
-            logger.debug(
-                f"Verifying password for user {email} at {user_service_url}/verify_password"
-                )
-
-            # Call the user service to verify the password
-            requests_headers = {'X-Internal-Token': internal_secret}
-            resp = requests.post(
-                f"{user_service_url}/verify_password",
-                json=payload,
-                headers=requests_headers,
-                timeout=2
-                )
-            if resp.status_code != 200:
-                logger.error(
-                    "Failed to fetch user: %s - %s",
-                    resp.status_code,
-                    resp.text
-                    )
-                return None
-            logger.debug("Response status code: %s", resp.status_code)
-            logger.debug("Response text: %s", resp.text)
-
-            user = resp.json()
-            logger.debug("User data: %s", user)
-            user_id = user.get('id')
-
-            if not user_id:
-                logger.error("Invalid user credentials.")
-                return None
-
-            return user
-
-        except requests.Timeout:
-            logger.error("User service request timed out.")
-            return None
-        except requests.ConnectionError:
-            logger.error("User service connection error.")
-            return None
-        except requests.RequestException as e:
-            logger.error("User service request exception: %s", e)
-            return None
-        except ValueError as e:
-            logger.error("Error decoding JSON response: %s", e)
-            return None
+        return verify_with_user_service(email, password)
 
-    else:
-        logger.error("Unsupported environment: %s", env)
-        return None
+    logger.error("Unsupported environment: %s", env)
+    return None
@@ -0,0 +1,163 @@
+"""
+verification.py
+---------------
+
+Access token verification shared by ``GET /verify`` (VerifyResource) and
+its WSGI fast path (app/fastpath.py), so both accept and reject exactly the
+same tokens with the same messages.
+
+The revocation check consults, when configured, the host's shared
+revocation set (app/revocation/shared.py) and the revocation snapshot
+(app/revocation/snapshot.py) before the database: a JTI either lists is
+rejected without a query, a miss in a trusted shared set is final, and the
+snapshot answers alone while the database is unreachable.
+"""
+
+import jwt
+from sqlalchemy import bindparam, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models.token_blacklist import TokenBlacklist
+from app.tokens import expand_claims
+from app.tracing import start_span
+
+MISSING_TOKEN = 'Missing access token'
+INVALID_TOKEN = 'Invalid token'
+EXPIRED_TOKEN = 'Token expired'
+REVOKED_TOKEN = 'Token revoked'
+# Answered with a 503 when the revocation check cannot be made.
+DATABASE_UNAVAILABLE = 'Database unavailable'
+
+# Built once: executions reuse SQLAlchemy's compiled form.
+REVOKED_QUERY = (
+    select(TokenBlacklist.id)
+    .where(TokenBlacklist.jti == bindparam('jti'))
+    .limit(1)
+)
+
+
+class TokenRejected(Exception):
+    """
+    Raised when an access token is not accepted.
+
+    Attributes:
+        message (str): The client-facing reason, returned with a 401.
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def is_revoked(engine, jti, snapshot=None, shared=None):
+    """
+    Tell whether the token with the given JTI is blacklisted.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): The application's engine.
+        jti (str): The token's unique identifier.
+        snapshot (RevocationSnapshot, optional): Revocation snapshot checked
+            before the database, and used alone if the database fails.
+        shared (SharedRevocationSet, optional): The host's revocation set,
+            checked first.
+
+    Returns:
+        bool: True if the token was revoked.
+
+    Raises:
+        sqlalchemy.exc.SQLAlchemyError: If the database fails and no recent
+            enough snapshot is available.
+    """
+    if shared is not None:
+        if shared.contains(jti):
+            return True
+        if shared.trusted():
+            return False
+    if snapshot is not None and snapshot.contains(jti):
+        return True
+    try:
+        with engine.connect() as conn:
+            return conn.execute(REVOKED_QUERY,
+                                {'jti': jti}).first() is not None
+    except SQLAlchemyError as e:
+        if snapshot is None or not snapshot.usable_when_degraded():
+            raise
+        snapshot.degraded += 1
+        logger.warning("Database unavailable, revocation checked against "
+                       "the snapshot only: %s", e)
+        return False
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def check_access_token(token, key, engine, snapshot=None, shared=None):
+    """
+    Validate an access token and return its claims.
+
+    The signature and the ``exp`` claim are checked by PyJWT, the claims
+    are expanded from their profile (see `app.tokens.expand_claims`), then
+    the token's JTI is looked up in the blacklist.
+
+    Args:
+        token (str): The encoded JWT from the ``access_token`` cookie.
+        key (str or jwt.PyJWK): The HS256 signing key.
+        engine (sqlalchemy.engine.Engine): Engine used for the revocation
+            check.
+        snapshot (RevocationSnapshot, optional): See `is_revoked`.
+        shared (SharedRevocationSet, optional): See `is_revoked`.
+
+    Returns:
+        dict: The token's claims, under their full names.
+
+    Raises:
+        TokenRejected: If the token is invalid, expired or revoked.
+    """
+    try:
+        with start_span('jwt.decode', alg='HS256'):
+            payload = expand_claims(
+                jwt.decode(token, key, algorithms=['HS256']))
+    except jwt.ExpiredSignatureError as e:
+        logger.warning("Token expired (jwt.ExpiredSignatureError)")
+        raise TokenRejected(EXPIRED_TOKEN) from e
+    except (jwt.InvalidTokenError, ValueError) as e:
+        # ValueError: compact claims that do not unpack.
+        logger.error("Invalid token: %s", e)
+        raise TokenRejected(INVALID_TOKEN) from e
+
+    jti = payload.get('jti')
+    if not jti:
+        logger.error("No JTI in token")
+        raise TokenRejected(INVALID_TOKEN)
+    if is_revoked(engine, jti, snapshot, shared):
+        logger.warning("Token is blacklisted")
+        raise TokenRejected(REVOKED_TOKEN)
+    return payload
+
+
+def token_identity(payload, directory=None):
+    """
+    Return the identity ``GET /verify`` reports for valid token claims.
+
+    Args:
+        payload (dict): Claims returned by `check_access_token`.
+        directory (UserDirectory, optional): Where the email of tokens
+            without one is read.
+
+    Returns:
+        dict: ``user_id``, ``company_id``, ``email`` and ``valid`` (True),
+        and ``roles`` and ``permissions`` when the token carries them (see
+        app/roles.py).
+    """
+    email = payload.get('email')
+    if 'email' not in payload and directory is not None:
+        email = directory.email(payload.get('sub'))
+    identity = {
+        'user_id': payload.get('sub'),
+        'company_id': payload.get('company_id'),
+        'email': email,
+        'valid': True
+    }
+    for name in ('roles', 'permissions'):
+        if name in payload:
+            identity[name] = payload[name]
+    return identity
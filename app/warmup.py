@@ -0,0 +1,263 @@
+"""
+warmup.py
+---------
+
+Warm-up helpers run before the application serves traffic.
+
+With ``preload_app`` gunicorn builds the application once in the master and
+forks the workers from it. Whatever the master has already imported,
+compiled or cached is then shared copy-on-write with every worker, so this
+module front-loads the lazy work done on the first requests:
+
+    - `warm_imports` imports the modules the request path would import
+      lazily (JWT algorithms and crypto backends, the HTTP client stack);
+    - `warm_queries` runs every hot query once so that SQLAlchemy's
+      compiled-statement cache holds their compiled form;
+    - `warm_requests` sends one request through the WSGI stack to build the
+      URL matcher and JSON provider state;
+    - `preload` does all of the above, releases the database connections
+      and moves every surviving object to the permanent GC generation
+      (``gc.freeze``) so that collections in the workers do not write to
+      the shared pages;
+    - `warm_worker` runs in each worker after fork: it opens the minimum
+      number of pooled connections (``DB_POOL_WARMUP``), runs the hot
+      queries, seeds the host's shared revocation set if it is enabled and
+      not seeded yet, starts the revocation event listener thread if
+      enabled, and only then marks the worker ready for ``GET /ready``.
+"""
+
+import gc
+import importlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import jwt
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.logger import logger
+from app.models import db
+from app.models.refresh_token import RefreshToken
+from app.models.token_blacklist import TokenBlacklist
+from app.revocation.events import start_listener
+from app.revocation.shared import seed_shared_set
+from app.verification import is_revoked
+
+# Modules imported lazily on the request path.
+LAZY_IMPORTS = (
+    'jwt.algorithms',
+    'cryptography.hazmat.primitives.asymmetric.ec',
+    'cryptography.hazmat.primitives.asymmetric.rsa',
+    'requests.adapters',
+    'urllib3.util.ssl_',
+    'encodings.idna',
+    'http.cookies',
+)
+
+_PROBE = '__warmup__'
+_PROBE_SECRET = 'warmup-secret-key-0123456789abcdef'
+
+
+def warm_imports():
+    """
+    Import the modules that requests would otherwise import lazily.
+
+    Optional modules (e.g. ``cryptography``) are skipped when missing.
+
+    Returns:
+        list: The modules that were imported.
+    """
+    imported = []
+    for name in LAZY_IMPORTS:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        imported.append(name)
+    # One round trip initializes PyJWT's algorithm registry and HMAC code.
+    token = jwt.encode({'jti': _PROBE}, _PROBE_SECRET, algorithm='HS256')
+    jwt.decode(token, _PROBE_SECRET, algorithms=['HS256'])
+    return imported
+
+
+def warm_queries():
+    """
+    Run every hot query once so that its compiled form is cached.
+
+    Covers the blacklist and refresh-token lookups and the ORM inserts and
+    deletes issued by /login, /logout and /refresh. Writes happen in a
+    transaction that is rolled back. Must be called in an application
+    context.
+
+    Returns:
+        bool: True if the queries ran, False if the database was not
+        reachable or its schema is not in place.
+    """
+    now = datetime.now(timezone.utc)
+    probe = f'{_PROBE}{os.getpid()}'
+    try:
+        is_revoked(db.engine, probe)
+        RefreshToken.query.filter_by(token=probe).first()
+        refresh_token = RefreshToken(token=probe, user_id=_PROBE,
+                                     company_id=_PROBE, expires_at=now)
+        db.session.add(refresh_token)
+        db.session.add(TokenBlacklist(jti=probe, user_id=_PROBE,
+                                      company_id=_PROBE, expires_at=now))
+        db.session.flush()
+        db.session.delete(refresh_token)
+        db.session.flush()
+        return True
+    except SQLAlchemyError as e:
+        logger.warning("Query warm-up skipped: %s", e)
+        return False
+    finally:
+        db.session.rollback()
+        db.session.remove()
+
+
+def warm_requests(app):
+    """
+    Send a request through the WSGI stack to initialize routing state.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    with app.test_client() as client:
+        client.get('/version')
+
+
+def preload(app, freeze=True):
+    """
+    Prepare a preloaded application to be shared by forked workers.
+
+    Args:
+        app (Flask): The Flask application instance.
+        freeze (bool): Whether to call ``gc.freeze`` at the end.
+
+    Returns:
+        dict: What was warmed: ``imports``, ``queries`` and ``frozen``
+        (number of objects moved to the permanent generation).
+    """
+    imports = warm_imports()
+    with app.app_context():
+        queries = warm_queries()
+        warm_requests(app)
+        # Connections must not be shared across fork; the engine, and its
+        # compiled cache, are kept.
+        db.engine.dispose()
+    frozen = 0
+    if freeze:
+        gc.collect()
+        gc.freeze()
+        frozen = gc.get_freeze_count()
+    logger.info("Preload done: %d modules, queries warmed: %s, "
+                "%d objects frozen.", len(imports), queries, frozen)
+    return {'imports': imports, 'queries': queries, 'frozen': frozen}
+
+
+class Readiness:
+    """
+    Readiness state of a worker, stored in ``app.extensions['readiness']``.
+
+    Attributes:
+        ready (bool): Whether the worker finished its warm-up.
+        error (str or None): Why the last warm-up attempt failed.
+        retry_interval (float): Minimum seconds between warm-up attempts
+            triggered by readiness probes.
+    """
+
+    def __init__(self, retry_interval):
+        self.ready = False
+        self.error = None
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self._last_attempt = None
+
+    def attempt_due(self):
+        """Tell whether a new warm-up attempt may start now."""
+        return (self._last_attempt is None
+                or time.monotonic() - self._last_attempt
+                >= self.retry_interval)
+
+    def record_attempt(self, error=None):
+        """Record the outcome of a warm-up attempt."""
+        self._last_attempt = time.monotonic()
+        self.error = error
+        self.ready = error is None
+
+
+def init_readiness(app):
+    """
+    Attach a not-yet-ready `Readiness` state to the application.
+
+    Args:
+        app (Flask): The Flask application instance.
+    """
+    app.extensions['readiness'] = Readiness(
+        app.config['READINESS_RETRY_INTERVAL'])
+
+
+def warm_pool(count):
+    """
+    Open ``count`` pooled connections at once and return them to the pool.
+
+    The count is capped to the pool size so that the warm-up never waits on
+    an exhausted pool. Must be called in an application context.
+
+    Args:
+        count (int): Number of connections to open.
+
+    Returns:
+        int: Number of connections opened.
+    """
+    pool_size = getattr(db.engine.pool, 'size', None)
+    if callable(pool_size):
+        count = min(count, pool_size())
+    connections = []
+    try:
+        for _ in range(count):
+            connection = db.engine.connect()
+            connections.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in connections:
+            connection.close()
+    return len(connections)
+
+
+def warm_worker(app):
+    """
+    Warm a worker's connection pool and queries, then mark it ready.
+
+    Called from gunicorn's ``post_worker_init`` hook, before the worker
+    accepts connections, and retried by ``GET /ready`` while the worker is
+    not ready (e.g. the database was down at start-up).
+
+    Args:
+        app (Flask): The Flask application instance.
+
+    Returns:
+        bool: Whether the worker is ready.
+    """
+    readiness = app.extensions['readiness']
+    with readiness.lock:
+        if readiness.ready:
+            return True
+        started = time.perf_counter()
+        try:
+            with app.app_context():
+                opened = warm_pool(app.config['DB_POOL_WARMUP'])
+                if not warm_queries():
+                    raise SQLAlchemyError('hot queries failed')
+                seed_shared_set(app)
+            start_listener(app)
+        except SQLAlchemyError as e:
+            readiness.record_attempt(error=str(e))
+            logger.warning("Worker warm-up failed: %s", e)
+            return False
+        readiness.record_attempt()
+    logger.info("Worker %d ready: %d connections opened in %.1f ms.",
+                os.getpid(), opened, (time.perf_counter() - started) * 1000)
+    return True
@@ -0,0 +1,18 @@
+"""
+asgi.py
+-------
+
+ASGI entry point for the asynchronous deployment mode.
+
+The Flask application is built by ``wsgi.py`` (same environment detection
+and .env files) and wrapped by `app.asgi.create_asgi_app`, which serves
+``POST /login`` on the event loop and every other request through Flask.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+
+from app.asgi import create_asgi_app
+from wsgi import app as flask_app
+
+app = create_asgi_app(flask_app)
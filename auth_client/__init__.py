@@ -0,0 +1,26 @@
+"""
+auth_client.__init__.py
+-----------------------
+
+Client library for downstream Python services: verifies the auth service's
+access tokens in-process (see client.py), or through the service's Unix
+socket sidecar on the same host (see sidecar.py). It depends on PyJWT and
+requests only, not on the service's code or configuration.
+
+Usage:
+    client = AuthClient('http://auth:5000', secret, internal_token)
+    client.start()
+    identity = client.verify(request.cookies.get('access_token'))
+"""
+
+from auth_client.claims import expand_claims
+from auth_client.client import (
+    AuthClient,
+    AuthServiceUnavailable,
+    RevocationCache,
+    TokenRejected,
+)
+from auth_client.sidecar import SidecarClient
+
+__all__ = ['AuthClient', 'AuthServiceUnavailable', 'RevocationCache',
+           'SidecarClient', 'TokenRejected', 'expand_claims']
@@ -0,0 +1,69 @@
+"""
+claims.py
+---------
+
+Access token claims under their full names, whatever the claim profile the
+auth service issued them in (see app/tokens.py, which this module mirrors
+without depending on the service's code).
+"""
+
+import base64
+import uuid
+
+# Full claim name -> compact key; ids packed from UUIDs use it in upper case.
+COMPACT_KEYS = {'sub': 'u', 'company_id': 'c', 'email': 'e',
+                'auth_time': 'at', 'jti': 'j', 'roles': 'r',
+                'permissions': 'p'}
+
+
+def _unpack_uuid(value):
+    """Return a UUID packed in 22 base64url characters as a string."""
+    return str(uuid.UUID(bytes=base64.urlsafe_b64decode(value + '==')))
+
+
+def expand_claims(payload):
+    """
+    Return decoded claims under their full names.
+
+    Args:
+        payload (dict): Claims decoded by PyJWT.
+
+    Returns:
+        dict: ``payload`` itself for full tokens; otherwise the claims with
+        full names, ``email`` being absent when the token omits it.
+
+    Raises:
+        ValueError: If packed ids do not unpack.
+    """
+    if 'j' not in payload or 'jti' in payload:
+        return payload
+    expanded = {'exp': payload.get('exp')}
+    for name, key in COMPACT_KEYS.items():
+        if key in payload:
+            expanded[name] = payload[key]
+        elif key.upper() in payload:
+            expanded[name] = _unpack_uuid(payload[key.upper()])
+    return expanded
+
+
+def identity(claims):
+    """
+    Return the identity ``GET /verify`` reports for expanded claims.
+
+    Args:
+        claims (dict): Claims returned by `expand_claims`.
+
+    Returns:
+        dict: ``user_id``, ``company_id``, ``email`` and ``valid``, and
+        ``roles`` and ``permissions`` when the token carries them.
+    """
+    result = {
+        'user_id': claims.get('sub'),
+        'company_id': claims.get('company_id'),
+        'email': claims.get('email'),
+        'valid': True,
+    }
+    for name in ('roles', 'permissions'):
+        if name in claims:
+            result[name] = claims[name]
+    return result
@@ -0,0 +1,329 @@
+"""
+client.py
+---------
+
+Access token verification inside downstream Python services, without a
+round trip to the auth service for each request.
+
+`AuthClient` checks the HS256 signature and the expiry with a key object
+built once, remembers the identity of each verified token until it expires,
+and checks revocation against a local copy of the blacklist, kept in sync
+from the auth service's ``GET /revocations`` feed: one full read, then only
+the entries created since the previous cursor.
+
+It falls back to the auth service's ``GET /verify`` when it cannot answer
+alone:
+
+    - the local blacklist is older than ``max_lag`` seconds (never synced,
+      or the feed failing), so a recent logout could be missed;
+    - the signature does not match the configured secret (the secret may
+      have been rotated on the service);
+    - the token leaves the email out (``minimal`` claim profile), which
+      only the service's user directory knows.
+
+The identity returned by remote verifications is cached like local ones.
+"""
+
+import base64
+import threading
+import time
+
+import jwt
+import requests
+
+from auth_client.claims import expand_claims, identity
+
+MISSING_TOKEN = 'Missing access token'
+INVALID_TOKEN = 'Invalid token'
+EXPIRED_TOKEN = 'Token expired'
+REVOKED_TOKEN = 'Token revoked'
+
+
+class TokenRejected(Exception):
+    """
+    Raised when an access token is not accepted.
+
+    Attributes:
+        message (str): The reason, as ``GET /verify`` words it.
+    """
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class AuthServiceUnavailable(Exception):
+    """Raised when a verification needs the auth service and it fails."""
+
+
+def signing_key(secret):
+    """
+    Build the HS256 key object of a secret.
+
+    Args:
+        secret (str): The ``JWT_SECRET`` shared with the auth service.
+
+    Returns:
+        jwt.PyJWK: The key, reused for every decode.
+    """
+    return jwt.PyJWK({
+        'kty': 'oct',
+        'k': base64.urlsafe_b64encode(secret.encode()).rstrip(b'=').decode(),
+    }, algorithm='HS256')
+
+
+class RevocationCache:
+    """
+    Local copy of the auth service's token blacklist.
+
+    Attributes:
+        cursor (float or None): Where the next incremental read starts.
+        synced_at (float or None): ``time.monotonic()`` of the last sync.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.cursor = None
+        self.synced_at = None
+
+    def apply(self, feed, now=None):
+        """
+        Apply a ``GET /revocations`` answer.
+
+        Args:
+            feed (dict): The decoded answer (``cursor``, ``full`` and
+                ``revocations``).
+            now (float, optional): Current Unix time, to drop entries of
+                expired tokens.
+
+        Returns:
+            int: The number of entries received.
+        """
+        now = time.time() if now is None else now
+        received = {entry['jti']: entry['exp']
+                    for entry in feed['revocations']}
+        with self._lock:
+            entries = {} if feed['full'] else self._entries
+            entries.update(received)
+            self._entries = {jti: exp for jti, exp in entries.items()
+                             if exp > now}
+            self.cursor = feed['cursor']
+            self.synced_at = time.monotonic()
+        return len(received)
+
+    def contains(self, jti):
+        """Tell whether a JTI is revoked."""
+        return jti in self._entries
+
+    def age(self):
+        """Return the seconds since the last sync (infinite if none)."""
+        if self.synced_at is None:
+            return float('inf')
+        return time.monotonic() - self.synced_at
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AuthClient:  # pylint: disable=too-many-instance-attributes
+    """
+    Verifies access tokens in-process, backed by the auth service.
+
+    Attributes:
+        revocations (RevocationCache): The local blacklist.
+        local (int): Tokens verified in-process (decode and checks).
+        cached (int): Tokens answered from the verified-token cache.
+        remote (int): Verifications delegated to ``GET /verify``.
+        rejected (int): Tokens rejected, locally or remotely.
+        syncs (int): Successful revocation syncs.
+        sync_errors (int): Failed revocation syncs.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, base_url, secret, internal_token, sync_interval=5.0,
+                 max_lag=30.0, timeout=2.0, cache_size=10000, session=None):
+        """
+        Args:
+            base_url (str): The auth service's URL.
+            secret (str): The ``JWT_SECRET`` shared with the auth service.
+            internal_token (str): The service's ``INTERNAL_AUTH_TOKEN``,
+                which ``GET /revocations`` requires.
+            sync_interval (float): Seconds between syncs of the background
+                thread (see `start`).
+            max_lag (float): Age in seconds past which the local blacklist
+                is not trusted and verifications go remote.
+            timeout (float): Timeout in seconds of requests to the service.
+            cache_size (int): Verified tokens remembered; 0 disables the
+                cache.
+            session (requests.Session, optional): Session for requests to
+                the service.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.internal_token = internal_token
+        self.sync_interval = sync_interval
+        self.max_lag = max_lag
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.session = session or requests.Session()
+        self.revocations = RevocationCache()
+        self._key = signing_key(secret)
+        self._verified = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.local = self.cached = self.remote = self.rejected = 0
+        self.syncs = self.sync_errors = 0
+
+    def verify(self, token):
+        """
+        Verify an access token.
+
+        Args:
+            token (str): The encoded JWT from the ``access_token`` cookie.
+
+        Returns:
+            dict: The identity ``GET /verify`` would return.
+
+        Raises:
+            TokenRejected: If the token is missing, invalid, expired or
+                revoked.
+            AuthServiceUnavailable: If the token needs the auth service and
+                it cannot be reached.
+        """
+        if not token:
+            self.rejected += 1
+            raise TokenRejected(MISSING_TOKEN)
+        fresh = self.revocations.age() <= self.max_lag
+        entry = self._verified.get(token)
+        if entry is not None and fresh and entry[1] > time.time():
+            self._check_revocation(entry[2])
+            self.cached += 1
+            return entry[0]
+
+        try:
+            claims = expand_claims(
+                jwt.decode(token, self._key, algorithms=['HS256']))
+        except jwt.ExpiredSignatureError as e:
+            self.rejected += 1
+            raise TokenRejected(EXPIRED_TOKEN) from e
+        except jwt.InvalidSignatureError:
+            claims = None
+        except (jwt.InvalidTokenError, ValueError) as e:
+            self.rejected += 1
+            raise TokenRejected(INVALID_TOKEN) from e
+
+        if claims is not None and not claims.get('jti'):
+            self.rejected += 1
+            raise TokenRejected(INVALID_TOKEN)
+        if claims is None or not fresh or 'email' not in claims:
+            result = self._verify_remote(token)
+            if claims is not None:
+                self._remember(token, result, claims)
+            return result
+
+        self._check_revocation(claims['jti'])
+        result = identity(claims)
+        self._remember(token, result, claims)
+        self.local += 1
+        return result
+
+    def _check_revocation(self, jti):
+        """Reject a JTI listed in the local blacklist."""
+        if self.revocations.contains(jti):
+            self.rejected += 1
+            raise TokenRejected(REVOKED_TOKEN)
+
+    def _remember(self, token, result, claims):
+        """Cache a verified token's identity until it expires."""
+        if not self.cache_size:
+            return
+        if len(self._verified) >= self.cache_size:
+            self._verified.clear()
+        self._verified[token] = (result, claims.get('exp') or 0,
+                                 claims['jti'])
+
+    def _verify_remote(self, token):
+        """Verify a token with ``GET /verify``."""
+        self.remote += 1
+        try:
+            response = self.session.get(f'{self.base_url}/verify',
+                                        cookies={'access_token': token},
+                                        timeout=self.timeout)
+        except requests.RequestException as e:
+            raise AuthServiceUnavailable(str(e)) from e
+        if response.status_code == 401:
+            self.rejected += 1
+            raise TokenRejected(response.json().get('message', INVALID_TOKEN))
+        if response.status_code != 200:
+            raise AuthServiceUnavailable(
+                f'GET /verify answered {response.status_code}')
+        return response.json()
+
+    def sync(self):
+        """
+        Bring the local blacklist up to date.
+
+        Reads every entry on the first call, then the entries created since
+        the previous cursor.
+
+        Returns:
+            bool: True if the blacklist was synced.
+        """
+        params = {}
+        if self.revocations.cursor is not None:
+            params['since'] = self.revocations.cursor
+        try:
+            response = self.session.get(
+                f'{self.base_url}/revocations', params=params,
+                headers={'X-Internal-Token': self.internal_token},
+                timeout=self.timeout)
+            response.raise_for_status()
+            self.revocations.apply(response.json())
+        except (requests.RequestException, ValueError, KeyError):
+            self.sync_errors += 1
+            return False
+        self.syncs += 1
+        return True
+
+    def start(self):
+        """Sync now, then every ``sync_interval`` seconds in a thread."""
+        if self._thread is not None:
+            return
+        self.sync()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='auth-client-sync')
+        self._thread.start()
+
+    def _run(self):
+        """Body of the sync thread."""
+        while not self._stop.wait(self.sync_interval):
+            self.sync()
+
+    def stop(self):
+        """Stop the sync thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def metrics(self):
+        """
+        Return the client's counters.
+
+        ``hits`` counts the verifications answered in-process (decoded or
+        cached), ``misses`` those delegated to the auth service.
+        """
+        return {
+            'hits': self.local + self.cached,
+            'misses': self.remote,
+            'local': self.local,
+            'cached': self.cached,
+            'remote': self.remote,
+            'rejected': self.rejected,
+            'revocations': len(self.revocations),
+            'revocation_age_s': round(self.revocations.age(), 3),
+            'syncs': self.syncs,
+            'sync_errors': self.sync_errors,
+        }
@@ -0,0 +1,181 @@
+"""
+sidecar.py
+----------
+
+Client of the auth service's verification sidecar: token checks over a
+Unix domain socket, for services on the same host (see app/sidecar.py in
+the auth service for the protocol).
+
+`SidecarClient.verify` sends one token and waits for its answer;
+`SidecarClient.verify_many` pipelines a batch: request frames are written
+``depth`` at a time and their answers read back in order (bounding what is
+in flight keeps both ends from blocking on full socket buffers).
+"""
+
+import socket
+import struct
+import threading
+
+from auth_client.client import (
+    EXPIRED_TOKEN,
+    INVALID_TOKEN,
+    MISSING_TOKEN,
+    REVOKED_TOKEN,
+    AuthServiceUnavailable,
+    TokenRejected,
+)
+
+FRAME = struct.Struct('>I')
+FIELD = struct.Struct('>H')
+ABSENT = 0xFFFF
+
+OK = 0
+UNAVAILABLE = 5
+MESSAGES = {1: MISSING_TOKEN, 2: INVALID_TOKEN, 3: EXPIRED_TOKEN,
+            4: REVOKED_TOKEN}
+
+
+def _string(body, offset):
+    """Decode a nullable string field; return it and the next offset."""
+    (length,) = FIELD.unpack_from(body, offset)
+    offset += FIELD.size
+    if length == ABSENT:
+        return None, offset
+    return body[offset:offset + length].decode(), offset + length
+
+
+def decode_response(body):
+    """
+    Decode the body of a response frame.
+
+    Args:
+        body (bytes): The frame without its length prefix.
+
+    Returns:
+        dict: The identity ``GET /verify`` would return.
+
+    Raises:
+        TokenRejected: If the sidecar rejected the token.
+        AuthServiceUnavailable: If the sidecar could not verify it.
+    """
+    status = body[0]
+    if status in MESSAGES:
+        raise TokenRejected(MESSAGES[status])
+    if status != OK:
+        raise AuthServiceUnavailable(f'Sidecar status {status}')
+    identity = {}
+    offset = 1
+    for name in ('user_id', 'company_id', 'email'):
+        identity[name], offset = _string(body, offset)
+    identity['valid'] = True
+    for name in ('roles', 'permissions'):
+        (count,) = FIELD.unpack_from(body, offset)
+        offset += FIELD.size
+        if count == ABSENT:
+            continue
+        values = []
+        for _ in range(count):
+            value, offset = _string(body, offset)
+            values.append(value)
+        identity[name] = values
+    return identity
+
+
+class SidecarClient:
+    """
+    Connection to the verification sidecar, shared by threads.
+
+    Args:
+        path (str): The sidecar's socket (``SIDECAR_SOCKET``).
+        timeout (float): Socket timeout in seconds.
+    """
+
+    def __init__(self, path, timeout=2.0):
+        self.path = path
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Open the connection on first use."""
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._sock = sock
+            self._file = sock.makefile('rb')
+
+    def close(self):
+        """Close the connection; the next call reconnects."""
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def _read_frame(self):
+        """Read one response body."""
+        header = self._file.read(FRAME.size)
+        if len(header) < FRAME.size:
+            raise ConnectionError('Sidecar closed the connection')
+        (length,) = FRAME.unpack(header)
+        body = self._file.read(length)
+        if len(body) < length:
+            raise ConnectionError('Sidecar closed the connection')
+        return body
+
+    def _exchange(self, tokens):
+        """Send request frames and return the response bodies."""
+        request = b''.join(FRAME.pack(len(t)) + t
+                           for t in (token.encode() for token in tokens))
+        with self._lock:
+            try:
+                self._connect()
+                self._sock.sendall(request)
+                return [self._read_frame() for _ in tokens]
+            except OSError as e:
+                self.close()
+                raise AuthServiceUnavailable(str(e)) from e
+
+    def verify(self, token):
+        """
+        Verify an access token.
+
+        Args:
+            token (str): The encoded JWT from the ``access_token`` cookie.
+
+        Returns:
+            dict: The identity ``GET /verify`` would return.
+
+        Raises:
+            TokenRejected: If the token is missing, invalid, expired or
+                revoked.
+            AuthServiceUnavailable: If the sidecar cannot be reached or
+                cannot verify the token.
+        """
+        return decode_response(self._exchange([token or ''])[0])
+
+    def verify_many(self, tokens, depth=128):
+        """
+        Verify several tokens in pipelined exchanges.
+
+        Args:
+            tokens (list): Encoded JWTs.
+            depth (int): Requests written before reading their answers.
+
+        Returns:
+            list: For each token, in order, its identity or the
+            `TokenRejected` / `AuthServiceUnavailable` it was answered with.
+
+        Raises:
+            AuthServiceUnavailable: If the sidecar cannot be reached.
+        """
+        results = []
+        tokens = [token or '' for token in tokens]
+        for start in range(0, len(tokens), depth):
+            for body in self._exchange(tokens[start:start + depth]):
+                try:
+                    results.append(decode_response(body))
+                except (TokenRejected, AuthServiceUnavailable) as e:
+                    results.append(e)
+        return results
@@ -0,0 +1,15 @@
+"""
+benchmarks
+----------
+
+Performance benchmarks for the authentication service.
+
+Benchmarks are plain Python modules meant to be run with ``python -m``; they
+write machine-readable JSON results that can be compared with
+``python -m benchmarks.compare``.
+
+Modules:
+    - common: Latency recording, percentile summaries and result files.
+    - endpoints: In-process benchmark of /login, /verify, /refresh, /logout.
+    - compare: Regression check between two result files.
+"""
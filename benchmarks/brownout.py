@@ -0,0 +1,164 @@
+"""
+brownout.py
+-----------
+
+Measure /verify during a user-service brownout, with and without priority
+lanes.
+
+A single gunicorn worker (``--threads`` threads) is started against the
+user-service emulator. After one fast login provides an access token, the
+emulator's latency is raised to ``--upstream-latency`` and, for
+``--duration`` seconds, ``--login-clients`` clients log in back to back
+while ``--verify-clients`` clients call /verify. Without lanes the hanging
+logins take every thread and /verify queues behind them; with
+``PRIORITY_LANES`` logins are capped below the capacity reserved for verify
+and refresh, and excess logins get an immediate 503.
+
+Usage:
+    python -m benchmarks.brownout --threads 4 --upstream-latency 2000 \\
+        --duration 10 --output brownout.json
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.loadgen import free_port, start_local_instance
+from benchmarks.user_service import FaultProfile, UserServiceEmulator
+
+MODES = ('shared', 'lanes')
+
+
+async def _client_loop(session, request, deadline, recorder, expected):
+    """Send ``request()`` back to back until the deadline."""
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with request(session) as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        recorder.record(time.perf_counter() - started, status,
+                        ok=status == expected)
+
+
+async def drive(base_url, login_clients, verify_clients, duration,
+                latency_ms, emulator):
+    """
+    Run the brownout scenario against a running instance.
+
+    Args:
+        base_url (str): Base URL of the service.
+        login_clients (int): Concurrent login clients.
+        verify_clients (int): Concurrent /verify clients.
+        duration (float): Run length in seconds.
+        latency_ms (str): User-service latency during the brownout.
+        emulator (UserServiceEmulator): The emulator, to inject latency.
+
+    Returns:
+        dict: Recorder summaries keyed ``login`` and ``verify``.
+    """
+    body = {'email': 'user1@example.com', 'password': 'secret'}
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.post(f'{base_url}/login', json=body) as response:
+            token = response.cookies['access_token'].value
+        emulator.faults.latency = latency_ms
+
+        recorders = {'login': LatencyRecorder(), 'verify': LatencyRecorder()}
+        for recorder in recorders.values():
+            recorder.start()
+        deadline = time.perf_counter() + duration
+        clients = [
+            _client_loop(session,
+                         lambda s: s.post(f'{base_url}/login', json=body),
+                         deadline, recorders['login'], 200)
+            for _ in range(login_clients)
+        ] + [
+            _client_loop(session,
+                         lambda s: s.get(f'{base_url}/verify',
+                                         headers={'Cookie':
+                                                  f'access_token={token}'}),
+                         deadline, recorders['verify'], 200)
+            for _ in range(verify_clients)
+        ]
+        await asyncio.gather(*clients)
+        for recorder in recorders.values():
+            recorder.stop()
+    return {name: recorder.summary() for name, recorder in recorders.items()}
+
+
+def bench_mode(mode, args):
+    """
+    Run the scenario on a fresh instance.
+
+    Args:
+        mode (str): ``shared`` (lanes off) or ``lanes``.
+        args (argparse.Namespace): Parsed command-line options.
+
+    Returns:
+        dict: Summaries from `drive`.
+    """
+    extra_env = {
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_THREADS': str(args.threads),
+        'PRIORITY_LANES': 'true' if mode == 'lanes' else 'false',
+        'USER_SERVICE_TIMEOUT': str(args.upstream_latency / 1000.0 + 5),
+    }
+    port = free_port()
+    with UserServiceEmulator(faults=FaultProfile()) as emulator:
+        instance = start_local_instance(port, emulator.url,
+                                        extra_env=extra_env,
+                                        server='gunicorn')
+        try:
+            return asyncio.run(drive(
+                f'http://127.0.0.1:{port}', args.login_clients,
+                args.verify_clients, args.duration,
+                str(args.upstream_latency), emulator))
+        finally:
+            instance.terminate()
+            instance.wait(timeout=35)
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Measure /verify during a user-service brownout.')
+    parser.add_argument('--modes', nargs='+', choices=MODES,
+                        default=list(MODES))
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--login-clients', type=int, default=16)
+    parser.add_argument('--verify-clients', type=int, default=4)
+    parser.add_argument('--upstream-latency', type=float, default=2000.0,
+                        help='User-service latency during the brownout (ms).')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--output', help='JSON result file.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode in args.modes:
+        summaries = bench_mode(mode, args)
+        for endpoint, summary in summaries.items():
+            results[f'{mode}/{endpoint}'] = summary
+        verify = summaries['verify']
+        print(f"{mode:<7} verify {verify['throughput_rps']:>8.1f} req/s  "
+              f"p99 {verify['latency_ms']['p99']:>8.1f} ms  "
+              f"login statuses {summaries['login']['status_counts']}",
+              file=sys.stderr)
+
+    meta = run_metadata(benchmark='brownout', modes=args.modes,
+                        threads=args.threads,
+                        login_clients=args.login_clients,
+                        verify_clients=args.verify_clients,
+                        upstream_latency=args.upstream_latency,
+                        duration=args.duration)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+client_verify.py
+----------------
+
+Measure token verification in downstream services with the client library
+(auth_client), against the round trip to ``GET /verify`` it replaces.
+
+The application is served on a local port (werkzeug, threaded) and the
+client replays access tokens of ``--users`` users, in three modes:
+
+    - ``cached``: the default client, answering repeated tokens from its
+      verified-token cache;
+    - ``local``: the client with its cache disabled, decoding and checking
+      every token in-process;
+    - ``remote``: every verification delegated to ``GET /verify`` (what the
+      client does while its revocation copy is stale).
+
+Besides the usual throughput and latency summary, each mode reports
+``verifications_per_cpu_second``: verifications divided by the CPU time of
+the process, i.e. the rate one core sustains. In ``remote`` mode the CPU
+time includes the server thread answering /verify, which runs in the same
+process.
+
+Usage:
+    python -m benchmarks.client_verify --users 100 --iterations 20000 \\
+        --output client.json
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.endpoints import prepare_environment
+
+MODES = ('cached', 'local', 'remote')
+INTERNAL_TOKEN = 'benchmark-internal-token'
+
+
+def serve(database_url):
+    """Serve the application on a local port; return the server."""
+    # Imported lazily: app.config reads DATABASE_URL at import time.
+    # pylint: disable=import-outside-toplevel
+    from werkzeug.serving import make_server
+
+    from app import create_app
+    from app.config import TestingConfig
+    from app.models import db
+
+    application = create_app(type('ClientConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': False,
+    }))
+    with application.app_context():
+        db.create_all()
+    server = make_server('127.0.0.1', 0, application, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def issue_tokens(users):
+    """Issue access tokens for ``users`` users."""
+    from app.tokens import issue_access_token  # pylint: disable=import-outside-toplevel
+
+    return [issue_access_token({
+        'sub': f'user-{number}',
+        'email': f'user{number}@example.com',
+        'company_id': f'company-{number % 20}',
+    }, os.environ['JWT_SECRET'])[0] for number in range(users)]
+
+
+def bench_mode(base_url, mode, tokens, iterations, rng):
+    """
+    Replay tokens through a client configured for ``mode``.
+
+    Returns:
+        dict: The throughput and latency summary, with
+        ``verifications_per_cpu_second`` and the client's metrics.
+    """
+    from auth_client import AuthClient  # pylint: disable=import-outside-toplevel
+
+    client = AuthClient(base_url, os.environ['JWT_SECRET'], INTERNAL_TOKEN,
+                        cache_size=0 if mode == 'local' else 10000,
+                        max_lag=-1 if mode == 'remote' else 3600)
+    client.sync()
+    recorder = LatencyRecorder()
+    cpu_started = time.process_time()
+    recorder.start()
+    for _ in range(iterations):
+        started = time.perf_counter()
+        identity = client.verify(rng.choice(tokens))
+        recorder.record(time.perf_counter() - started, 200,
+                        ok=identity['valid'])
+    recorder.stop()
+    cpu = time.process_time() - cpu_started
+    summary = recorder.summary()
+    summary['verifications_per_cpu_second'] = round(
+        iterations / cpu, 1) if cpu else None
+    summary['client'] = client.metrics()
+    return summary
+
+
+def run(database_url=None, users=100, iterations=5000, seed=1, modes=MODES):
+    """
+    Measure the selected modes.
+
+    Args:
+        database_url (str, optional): SQLAlchemy URL of the benchmark
+            database; a temporary SQLite file by default (the server's
+            threads must share it).
+
+    Returns:
+        tuple: ``(meta, results)`` ready for `write_results`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{directory}/auth.db"
+        prepare_environment(database_url)
+        previous_token = os.environ.get('INTERNAL_AUTH_TOKEN')
+        os.environ['INTERNAL_AUTH_TOKEN'] = INTERNAL_TOKEN
+        server = serve(database_url)
+        try:
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            tokens = issue_tokens(users)
+            rng = random.Random(seed)
+            results = {mode: bench_mode(base_url, mode, tokens, iterations,
+                                        rng)
+                       for mode in modes}
+        finally:
+            server.shutdown()
+            if previous_token is None:
+                del os.environ['INTERNAL_AUTH_TOKEN']
+            else:
+                os.environ['INTERNAL_AUTH_TOKEN'] = previous_token
+    meta = run_metadata(benchmark='client_verify', users=users,
+                        iterations=iterations, seed=seed,
+                        cpu_count=os.cpu_count())
+    return meta, results
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    modes = tuple(m for m in args.modes.split(',') if m)
+    meta, results = run(args.database_url, args.users, args.iterations,
+                        args.seed, modes)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
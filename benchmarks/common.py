@@ -0,0 +1,233 @@
+"""
+common.py
+---------
+
+Shared helpers for the benchmark modules: latency recording, percentile
+summaries, result files and the regression comparison used by
+``benchmarks.compare``.
+"""
+
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Metrics where a higher value is better; every other metric is a latency.
+HIGHER_IS_BETTER = ('throughput_rps',)
+
+
+def percentile(sorted_values, q):
+    """
+    Compute the q-th percentile of pre-sorted values by linear interpolation.
+
+    Args:
+        sorted_values (list): Values sorted in ascending order.
+        q (float): Percentile between 0 and 100.
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return float(sorted_values[low])
+    weight = rank - low
+    return sorted_values[low] * (1 - weight) + sorted_values[high] * weight
+
+
+def summarize_latencies(latencies_ms):
+    """
+    Summarize latencies (in milliseconds) as mean, max and percentiles.
+
+    Args:
+        latencies_ms (list): Individual request latencies.
+
+    Returns:
+        dict: Summary keyed by ``mean``, ``max`` and ``pNN``.
+    """
+    values = sorted(latencies_ms)
+    summary = {
+        'mean': sum(values) / len(values) if values else 0.0,
+        'max': values[-1] if values else 0.0,
+    }
+    for q in PERCENTILES:
+        summary[f'p{q}'] = percentile(values, q)
+    return {key: round(value, 4) for key, value in summary.items()}
+
+
+class LatencyRecorder:
+    """
+    Collect per-request latencies and outcomes for one benchmark scenario.
+
+    Attributes:
+        latencies_ms (list): Latency of every recorded request.
+        statuses (Counter): Count of requests per HTTP status code (or error
+            label for transport failures).
+        errors (int): Requests whose outcome was not the expected one.
+    """
+
+    def __init__(self):
+        self.latencies_ms = []
+        self.statuses = Counter()
+        self.errors = 0
+        self._started = None
+        self._elapsed = 0.0
+
+    def start(self):
+        """Mark the beginning of the measured interval."""
+        self._started = time.perf_counter()
+
+    def stop(self):
+        """Mark the end of the measured interval."""
+        self._elapsed += time.perf_counter() - self._started
+        self._started = None
+
+    def record(self, latency_s, status, ok=True):
+        """
+        Record a single request.
+
+        Args:
+            latency_s (float): Request latency in seconds.
+            status (int or str): HTTP status code or error label.
+            ok (bool): Whether the outcome matched the expectation.
+        """
+        self.latencies_ms.append(latency_s * 1000.0)
+        self.statuses[str(status)] += 1
+        if not ok:
+            self.errors += 1
+
+    def summary(self):
+        """
+        Return the machine-readable summary of the recorded requests.
+
+        Returns:
+            dict: Request count, error count, throughput and latencies.
+        """
+        count = len(self.latencies_ms)
+        elapsed = self._elapsed or sum(self.latencies_ms) / 1000.0
+        return {
+            'requests': count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / count, 6) if count else 0.0,
+            'elapsed_s': round(elapsed, 6),
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'latency_ms': summarize_latencies(self.latencies_ms),
+            'status_counts': dict(sorted(self.statuses.items())),
+        }
+
+
+def _git_revision():
+    """Return the current git commit hash, or None outside a checkout."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_metadata(**extra):
+    """
+    Describe the environment a benchmark ran in.
+
+    Args:
+        **extra: Benchmark-specific fields to include.
+
+    Returns:
+        dict: Timestamp, interpreter, platform, CPU count and git revision.
+    """
+    meta = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'git_revision': _git_revision(),
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_results(path, meta, results, **sections):
+    """
+    Write benchmark results as JSON, or print them when ``path`` is None.
+
+    Args:
+        path (str or None): Destination file.
+        meta (dict): Output of `run_metadata`.
+        results (dict): Scenario name to summary; these are the entries
+            compared by `compare_results`.
+        **sections: Additional top-level sections (e.g. time series).
+    """
+    document = json.dumps({'meta': meta, 'results': results, **sections},
+                          indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as fh:
+            fh.write(document + '\n')
+    else:
+        print(document)
+
+
+def load_results(path):
+    """Load a result file written by `write_results`."""
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def _flatten(summary):
+    """Extract the comparable metrics of a scenario summary."""
+    metrics = {'throughput_rps': summary.get('throughput_rps', 0.0)}
+    for key, value in summary.get('latency_ms', {}).items():
+        if key.startswith('p'):
+            metrics[f'latency_{key}_ms'] = value
+    return metrics
+
+
+def compare_results(baseline, candidate, threshold=0.10):
+    """
+    Compare two result documents and flag regressions.
+
+    Throughput regresses when it drops by more than ``threshold``; latency
+    percentiles regress when they grow by more than ``threshold``.
+
+    Args:
+        baseline (dict): Reference result document.
+        candidate (dict): New result document.
+        threshold (float): Tolerated relative change, e.g. 0.10 for 10%.
+
+    Returns:
+        list: One dict per compared metric with ``scenario``, ``metric``,
+        ``baseline``, ``candidate``, ``change`` and ``regression`` keys.
+    """
+    rows = []
+    base_results = baseline.get('results', {})
+    cand_results = candidate.get('results', {})
+    for scenario in sorted(set(base_results) & set(cand_results)):
+        base = _flatten(base_results[scenario])
+        cand = _flatten(cand_results[scenario])
+        for metric in sorted(set(base) & set(cand)):
+            before, after = base[metric], cand[metric]
+            change = (after - before) / before if before else 0.0
+            if metric in HIGHER_IS_BETTER:
+                regression = change < -threshold
+            else:
+                regression = change > threshold
+            rows.append({
+                'scenario': scenario,
+                'metric': metric,
+                'baseline': before,
+                'candidate': after,
+                'change': round(change, 4),
+                'regression': regression,
+            })
+    return rows
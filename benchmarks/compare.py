@@ -0,0 +1,65 @@
+"""
+compare.py
+----------
+
+Compare two benchmark result files and flag regressions.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json --threshold 0.1
+
+Exits with status 1 when any throughput drops, or any latency percentile
+grows, by more than the threshold.
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import compare_results, load_results
+
+
+def format_rows(rows):
+    """
+    Render comparison rows as a fixed-width text table.
+
+    Args:
+        rows (list): Output of `compare_results`.
+
+    Returns:
+        str: The table.
+    """
+    lines = [f"{'scenario':<12} {'metric':<20} {'baseline':>12} "
+             f"{'candidate':>12} {'change':>9}"]
+    for row in rows:
+        flag = '  REGRESSION' if row['regression'] else ''
+        lines.append(
+            f"{row['scenario']:<12} {row['metric']:<20} "
+            f"{row['baseline']:>12.3f} {row['candidate']:>12.3f} "
+            f"{row['change']:>+8.1%}{flag}"
+        )
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """Command-line entry point; returns the process exit status."""
+    parser = argparse.ArgumentParser(
+        description='Flag regressions between two benchmark runs.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Tolerated relative change (default: 0.10)')
+    args = parser.parse_args(argv)
+
+    rows = compare_results(load_results(args.baseline),
+                           load_results(args.candidate), args.threshold)
+    print(format_rows(rows))
+    regressions = [row for row in rows if row['regression']]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above "
+              f"{args.threshold:.0%}.")
+        return 1
+    print("\nNo regression.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+group_commit.py
+---------------
+
+Measure login throughput under a login storm with and without group commit
+(``GROUP_COMMIT``, see app/group_commit.py).
+
+For each mode an application is built on the benchmark database, and
+``--threads`` threads log users in through ``POST /login`` with the Flask
+test client for ``--duration`` seconds, credentials checked by a stub. The
+results are keyed by mode:
+
+    - the usual throughput and latency summary of the logins;
+    - ``transactions``: commits of refresh token writes (one per login
+      without group commit) and ``mean_batch``, logins per commit.
+
+With SQLite the database is a temporary file (with ``synchronous=FULL``,
+each commit syncs it to disk); pass a PostgreSQL URL with
+``--database-url`` to measure against a server.
+
+Usage:
+    python -m benchmarks.group_commit --threads 32 --duration 5 \\
+        --max-wait-ms 2 --output group_commit.json
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.endpoints import prepare_environment
+
+MODES = ('off', 'on')
+
+
+def stub_check_credentials(email, password):  # pylint: disable=unused-argument
+    """Stand-in for the user service."""
+    return {'id': email.partition('@')[0], 'email': email,
+            'company_id': 'company-1'}
+
+
+def build_app(database_url, mode, max_batch, max_wait_ms):
+    """Create the application, with group commit when ``mode`` is on."""
+    # Imported lazily: app.config reads DATABASE_URL at import time.
+    # pylint: disable=import-outside-toplevel
+    from app import create_app
+    from app.config import TestingConfig
+
+    return create_app(type('GroupCommitConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': False,
+        'GROUP_COMMIT': mode == 'on',
+        'GROUP_COMMIT_MAX_BATCH': max_batch,
+        'GROUP_COMMIT_MAX_WAIT_MS': max_wait_ms,
+    }))
+
+
+def storm(application, threads, duration):
+    """
+    Log users in from ``threads`` threads for ``duration`` seconds.
+
+    Returns:
+        LatencyRecorder: The recorded logins.
+    """
+    recorder = LatencyRecorder()
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        client = application.test_client(use_cookies=False)
+        sent = 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            response = client.post('/login', json={
+                'email': f'user{number}-{sent}@example.com',
+                'password': 'secret'})
+            latency = time.perf_counter() - started
+            with lock:
+                recorder.record(latency, response.status_code,
+                                ok=response.status_code == 200)
+            sent += 1
+
+    workers = [threading.Thread(target=worker, args=(n,))
+               for n in range(threads)]
+    recorder.start()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    recorder.stop()
+    return recorder
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments
+def bench_mode(database_url, mode, threads, duration, max_batch,
+               max_wait_ms):
+    """
+    Measure one mode.
+
+    Returns:
+        dict: The login summary, with the transaction counts.
+    """
+    from app.models import db  # pylint: disable=import-outside-toplevel
+
+    application = build_app(database_url, mode, max_batch, max_wait_ms)
+    with application.app_context():
+        db.create_all()
+    try:
+        with mock.patch('app.resources.login.check_credentials',
+                        stub_check_credentials):
+            recorder = storm(application, threads, duration)
+    finally:
+        with application.app_context():
+            db.drop_all()
+            db.engine.dispose()
+    summary = recorder.summary()
+    writer = application.extensions.get('group_commit')
+    logins = summary['requests'] - summary['errors']
+    summary['transactions'] = writer.batches if writer else logins
+    summary['mean_batch'] = (round(logins / summary['transactions'], 2)
+                             if summary['transactions'] else 0.0)
+    return summary
+
+
+def run(database_url=None, threads=16, duration=3.0, max_batch=64,
+        max_wait_ms=2.0, modes=MODES):
+    """
+    Measure the selected modes.
+
+    Args:
+        database_url (str, optional): SQLAlchemy URL of a dedicated
+            benchmark database; a temporary SQLite file by default.
+
+    Returns:
+        tuple: ``(meta, results)`` ready for `write_results`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{directory}/auth.db"
+        prepare_environment(database_url)
+        results = {mode: bench_mode(database_url, mode, threads, duration,
+                                    max_batch, max_wait_ms)
+                   for mode in modes}
+    meta = run_metadata(benchmark='group_commit', threads=threads,
+                        duration=duration, max_batch=max_batch,
+                        max_wait_ms=max_wait_ms, cpu_count=os.cpu_count())
+    return meta, results
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    modes = tuple(m for m in args.modes.split(',') if m)
+    meta, results = run(args.database_url, args.threads, args.duration,
+                        args.max_batch, args.max_wait_ms, modes)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
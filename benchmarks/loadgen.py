@@ -0,0 +1,475 @@
+"""
+loadgen.py
+----------
+
+Closed-loop, multi-process load generator reproducing production traffic.
+
+Every virtual user follows the real client workflow:
+
+    1. POST /login once per session;
+    2. GET /verify repeatedly with the access token, with exponentially
+       distributed think time (``--verify-rate`` requests/s per user);
+    3. POST /refresh every ``--refresh-interval`` seconds (15 minutes in
+       production; shorten it to compress time);
+    4. POST /logout with probability ``--logout-probability`` after each
+       verify, then start a new session.
+
+Users are spread over ``--processes`` worker processes with ``--users``
+threads each, so the service sees realistic concurrency, connection churn
+and lock contention rather than a single-threaded microbenchmark.
+
+Unless ``--target`` points at a running instance, the generator starts a
+local instance (``benchmarks.serve``) on a throwaway SQLite database, wired
+to a fault-injecting user-service emulator (``benchmarks.user_service``).
+
+Results are reported per time window: request count, error rate and
+p50/p95/p99 latency for each endpoint, plus totals for the whole run.
+
+Usage:
+    python -m benchmarks.loadgen --processes 4 --users 16 --duration 60 \\
+        --upstream-latency lognormal:50,0.5 --upstream-error-rate 0.02 \\
+        --upstream-reset-rate 0.005 --output load.json
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks.common import run_metadata, summarize_latencies, write_results
+from benchmarks.user_service import (
+    BAD_PASSWORD,
+    DEFAULT_INTERNAL_TOKEN,
+    UserServiceEmulator,
+    add_fault_arguments,
+    faults_from_args,
+)
+
+DEFAULT_JWT_SECRET = 'loadgen-jwt-secret-key-0123456789abcdef'
+REQUEST_TIMEOUT = 10
+
+
+def free_port():
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30.0):
+    """
+    Poll ``url`` until it answers, or raise RuntimeError on timeout.
+
+    Args:
+        url (str): URL to poll.
+        timeout (float): Maximum number of seconds to wait.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def start_local_instance(port, user_service_url, database_url=None,
+                         extra_env=None, command=None, server='werkzeug'):
+    """
+    Start the service in a subprocess wired to the user-service emulator.
+
+    Args:
+        port (int): Port to listen on.
+        user_service_url (str): Base URL of the user service.
+        database_url (str, optional): Database to use; defaults to a
+            throwaway SQLite file.
+        extra_env (dict, optional): Additional environment variables.
+        command (list, optional): Server command; defaults to
+            ``benchmarks.serve``.
+        server (str): Server used by ``benchmarks.serve`` (``werkzeug``,
+            ``gunicorn`` or ``uvicorn``).
+
+    Returns:
+        subprocess.Popen: The server process.
+    """
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(
+            tempfile.mkdtemp(prefix='auth-load-'), 'auth.db')
+    env = dict(os.environ)
+    env.update({
+        'FLASK_ENV': 'production',
+        'DATABASE_URL': database_url,
+        'JWT_SECRET': env.get('JWT_SECRET', DEFAULT_JWT_SECRET),
+        'USER_SERVICE_URL': user_service_url,
+        'INTERNAL_AUTH_TOKEN': DEFAULT_INTERNAL_TOKEN,
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'ERROR'),
+    })
+    env.update(extra_env or {})
+    if command is None:
+        command = [sys.executable, '-m', 'benchmarks.serve',
+                   '--port', str(port), '--server', server, '--create-db']
+    process = subprocess.Popen(  # pylint: disable=consider-using-with
+        command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f'http://127.0.0.1:{port}/version')
+    return process
+
+
+class VirtualUser:
+    """
+    One closed-loop client session replaying the production workflow.
+
+    Each call is recorded as ``(t, endpoint, latency_ms, ok)`` where ``t``
+    is the offset in seconds from the start of the run.
+    """
+
+    def __init__(self, base_url, profile, started_at, sink, seed):
+        self.base_url = base_url
+        self.profile = profile
+        self.started_at = started_at
+        self.sink = sink
+        self.rng = random.Random(seed)
+        self.http = requests.Session()
+        self.access_token = None
+        self.refresh_token = None
+
+    def _call(self, endpoint, method, expected, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.http.request(
+                method, self.base_url + '/' + endpoint,
+                timeout=REQUEST_TIMEOUT, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        self.sink.append((time.monotonic() - self.started_at, endpoint,
+                          latency_ms, status == expected))
+        return response if status == expected else None
+
+    def _cookies(self):
+        # Cookies are passed explicitly: they are issued with the Secure
+        # flag, which requests would otherwise refuse to send over HTTP.
+        return {'access_token': self.access_token or '',
+                'refresh_token': self.refresh_token or ''}
+
+    def login(self):
+        """Open a session; returns True on success."""
+        email = f'user{self.rng.randrange(self.profile["user_pool"])}@example.com'
+        password = (BAD_PASSWORD
+                    if self.rng.random() < self.profile['bad_login_rate']
+                    else 'password')
+        response = self._call('login', 'POST',
+                              200 if password != BAD_PASSWORD else 401,
+                              json={'email': email, 'password': password})
+        if response is None or password == BAD_PASSWORD:
+            return False
+        self.access_token = response.cookies.get('access_token')
+        self.refresh_token = response.cookies.get('refresh_token')
+        return True
+
+    def verify(self):
+        """Verify the current access token; returns True on success."""
+        return self._call('verify', 'GET', 200,
+                          cookies=self._cookies()) is not None
+
+    def refresh(self):
+        """Refresh the access token; returns True on success."""
+        response = self._call('refresh', 'POST', 200, cookies=self._cookies())
+        if response is None:
+            return False
+        self.access_token = response.cookies.get('access_token',
+                                                 self.access_token)
+        self.refresh_token = response.cookies.get('refresh_token',
+                                                  self.refresh_token)
+        return True
+
+    def logout(self):
+        """Close the session."""
+        self._call('logout', 'POST', 200, cookies=self._cookies())
+        self.access_token = self.refresh_token = None
+
+    def _think(self, deadline):
+        pause = self.rng.expovariate(self.profile['verify_rate'])
+        time.sleep(max(0.0, min(pause, deadline - time.monotonic())))
+
+    def run(self, deadline):
+        """Replay sessions until ``deadline`` (a ``time.monotonic`` value)."""
+        while time.monotonic() < deadline:
+            if not self.login():
+                self._think(deadline)
+                continue
+            last_refresh = time.monotonic()
+            while time.monotonic() < deadline:
+                self._think(deadline)
+                if time.monotonic() >= deadline:
+                    break
+                if not self.verify():
+                    break
+                if (time.monotonic() - last_refresh
+                        >= self.profile['refresh_interval']):
+                    if not self.refresh():
+                        break
+                    last_refresh = time.monotonic()
+                if self.rng.random() < self.profile['logout_probability']:
+                    self.logout()
+                    break
+
+
+class SampleSink:
+    """Thread-safe sample buffer shared by the users of one process."""
+
+    def __init__(self):
+        self._samples = []
+        self._lock = threading.Lock()
+
+    def append(self, sample):
+        """Record one sample."""
+        with self._lock:
+            self._samples.append(sample)
+
+    def drain(self):
+        """Return and forget the buffered samples."""
+        with self._lock:
+            samples, self._samples = self._samples, []
+        return samples
+
+
+def _run_user(user, delay, deadline):
+    """Start ``user`` after ``delay`` seconds and run it until ``deadline``."""
+    time.sleep(delay)
+    user.run(deadline)
+
+
+def worker_process(worker_id, base_url, profile, started_at, deadline,
+                   results):
+    """
+    Run ``profile['users']`` virtual users in threads and ship samples.
+
+    Samples are pushed to ``results`` in batches so that the parent can
+    aggregate them across processes; a final None marks the end.
+    """
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    sink = SampleSink()
+    threads = []
+    for n in range(profile['users']):
+        user = VirtualUser(base_url, profile, started_at, sink,
+                           seed=profile['seed'] * 100003 + worker_id * 1009 + n)
+        # Ramp users in over the ramp-up period to avoid a login stampede.
+        delay = profile['ramp_up'] * n / max(1, profile['users'])
+        thread = threading.Thread(target=_run_user,
+                                  args=(user, delay, deadline), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.5)
+        batch = sink.drain()
+        if batch:
+            results.put(batch)
+    batch = sink.drain()
+    if batch:
+        results.put(batch)
+    results.put(None)
+
+
+def aggregate(samples, window):
+    """
+    Summarize samples per time window and endpoint, plus run totals.
+
+    Args:
+        samples (list): ``(t, endpoint, latency_ms, ok)`` tuples.
+        window (float): Window length in seconds.
+
+    Returns:
+        dict: ``{'windows': [...], 'totals': {...}}``.
+    """
+    by_window = defaultdict(lambda: defaultdict(list))
+    totals = defaultdict(list)
+    for t, endpoint, latency_ms, ok in samples:
+        by_window[int(t // window)][endpoint].append((latency_ms, ok))
+        totals[endpoint].append((latency_ms, ok))
+
+    def _summary(entries, elapsed):
+        errors = sum(1 for _, ok in entries if not ok)
+        latencies = summarize_latencies([lat for lat, _ in entries])
+        return {
+            'requests': len(entries),
+            'errors': errors,
+            'error_rate': round(errors / len(entries), 6),
+            'throughput_rps': round(len(entries) / elapsed, 2),
+            'latency_ms': {k: latencies[k] for k in ('p50', 'p95', 'p99')},
+        }
+
+    windows = []
+    for index in sorted(by_window):
+        windows.append({
+            'start_s': index * window,
+            'endpoints': {name: _summary(entries, window)
+                          for name, entries in sorted(by_window[index].items())},
+        })
+    elapsed = max((t for t, _, _, _ in samples), default=0.0) or window
+    return {
+        'windows': windows,
+        'totals': {name: _summary(entries, elapsed)
+                   for name, entries in sorted(totals.items())},
+    }
+
+
+def format_report(report):
+    """Render the per-window report as a text table."""
+    lines = [f"{'window':>7} {'endpoint':<8} {'reqs':>6} {'err%':>6} "
+             f"{'p50':>8} {'p95':>8} {'p99':>8}"]
+    rows = [(f"{w['start_s']:>6.0f}s", w['endpoints']) for w in report['windows']]
+    rows.append(('  total', report['totals']))
+    for label, endpoints in rows:
+        for name, s in endpoints.items():
+            lat = s['latency_ms']
+            lines.append(
+                f"{label:>7} {name:<8} {s['requests']:>6} "
+                f"{s['error_rate'] * 100:>5.1f}% {lat['p50']:>8.2f} "
+                f"{lat['p95']:>8.2f} {lat['p99']:>8.2f}")
+    return '\n'.join(lines)
+
+
+def run_load(base_url, profile, processes, duration):
+    """
+    Drive ``base_url`` with ``processes`` worker processes for ``duration``.
+
+    Args:
+        base_url (str): Root URL of the service under test.
+        profile (dict): Workload parameters (see `build_profile`).
+        processes (int): Number of worker processes.
+        duration (float): Length of the run in seconds.
+
+    Returns:
+        list: Every recorded sample.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    started_at = time.monotonic()
+    deadline = started_at + duration
+    workers = [
+        ctx.Process(target=worker_process,
+                    args=(n, base_url, profile, started_at, deadline, results))
+        for n in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    samples, finished = [], 0
+    while finished < processes:
+        try:
+            batch = results.get(timeout=duration + REQUEST_TIMEOUT + 30)
+        except queue.Empty:
+            break
+        if batch is None:
+            finished += 1
+        else:
+            samples.extend(batch)
+    for worker in workers:
+        worker.join(timeout=5)
+    return samples
+
+
+def build_profile(args):
+    """Extract the per-user workload parameters from parsed arguments."""
+    return {
+        'users': args.users,
+        'verify_rate': args.verify_rate,
+        'refresh_interval': args.refresh_interval,
+        'logout_probability': args.logout_probability,
+        'bad_login_rate': args.bad_login_rate,
+        'user_pool': args.user_pool,
+        'ramp_up': args.ramp_up,
+        'seed': args.seed,
+    }
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Closed-loop load generator for the auth service.')
+    parser.add_argument('--target',
+                        help='Base URL of a running instance; by default a '
+                             'local instance is started.')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--users', type=int, default=8,
+                        help='Concurrent virtual users per process.')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--ramp-up', type=float, default=2.0)
+    parser.add_argument('--verify-rate', type=float, default=5.0,
+                        help='Verify requests per second per user.')
+    parser.add_argument('--refresh-interval', type=float, default=900.0)
+    parser.add_argument('--logout-probability', type=float, default=0.01)
+    parser.add_argument('--bad-login-rate', type=float, default=0.02)
+    parser.add_argument('--user-pool', type=int, default=10000)
+    add_fault_arguments(parser, 'upstream-')
+    parser.add_argument('--database-url',
+                        help='Database of the local instance (default: a '
+                             'throwaway SQLite file).')
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'),
+                        default='werkzeug',
+                        help='Server running the local instance.')
+    parser.add_argument('--window', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON result file.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    args = parse_args(argv)
+    profile = build_profile(args)
+    faults = faults_from_args(args, 'upstream-')
+    emulator = server = None
+    base_url = args.target
+    try:
+        if base_url is None:
+            emulator = UserServiceEmulator(faults=faults,
+                                           seed=args.seed).start()
+            port = free_port()
+            server = start_local_instance(port, emulator.url,
+                                          args.database_url,
+                                          server=args.server)
+            base_url = f'http://127.0.0.1:{port}'
+        samples = run_load(base_url.rstrip('/'), profile, args.processes,
+                           args.duration)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if emulator is not None:
+            emulator.stop()
+
+    report = aggregate(samples, args.window)
+    print(format_report(report), file=sys.stderr)
+    meta = run_metadata(benchmark='loadgen', target=base_url,
+                        server=None if args.target else args.server,
+                        processes=args.processes, duration=args.duration,
+                        **profile,
+                        upstream_faults=None if args.target else {
+                            'latency': faults.latency,
+                            'error_rate': faults.error_rate,
+                            'reset_rate': faults.reset_rate,
+                            'invalid_json_rate': faults.invalid_json_rate,
+                            'slow_body_rate': faults.slow_body_rate,
+                        },
+                        upstream_stats=dict(emulator.stats) if emulator
+                        else None)
+    write_results(args.output, meta, report['totals'],
+                  windows=report['windows'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+login_concurrency.py
+--------------------
+
+Measure how many logins one process keeps in flight when the user service
+is slow.
+
+For each server in ``--servers`` a single-process local instance is started
+(see `benchmarks.loadgen.start_local_instance`) against the user-service
+emulator with injected latency, then ``--concurrency`` clients log in back
+to back for ``--duration`` seconds. A sync server (gunicorn, ``--threads``
+threads) waits on at most one login per thread, so its throughput is capped
+at threads / upstream latency; the ASGI mode (uvicorn) keeps every pending
+login on the event loop and is only bounded by CPU.
+
+Usage:
+    python -m benchmarks.login_concurrency --servers gunicorn uvicorn \\
+        --concurrency 500 --upstream-latency 200 --duration 15
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.loadgen import free_port, start_local_instance
+from benchmarks.user_service import (
+    UserServiceEmulator,
+    add_fault_arguments,
+    faults_from_args,
+)
+
+
+async def _client_loop(client, url, number, deadline, recorder):
+    """Log in back to back until the deadline."""
+    body = {'email': f'user{number}@example.com', 'password': 'secret'}
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            async with client.post(url, json=body) as response:
+                await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        recorder.record(time.perf_counter() - started, status,
+                        ok=status == 200)
+
+
+async def drive_logins(base_url, concurrency, duration, timeout=60.0):
+    """
+    Run ``concurrency`` closed-loop login clients against ``base_url``.
+
+    Args:
+        base_url (str): Base URL of the service.
+        concurrency (int): Concurrent clients.
+        duration (float): Run length in seconds.
+        timeout (float): Per-request timeout in seconds.
+
+    Returns:
+        dict: The `benchmarks.common.LatencyRecorder` summary.
+    """
+    recorder = LatencyRecorder()
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=timeout)) as client:
+        recorder.start()
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            _client_loop(client, f'{base_url}/login', number, deadline,
+                         recorder)
+            for number in range(concurrency)))
+        recorder.stop()
+    return recorder.summary()
+
+
+def bench_logins(server, faults, concurrency, duration, threads=None):
+    """
+    Run the login load against one single-process server.
+
+    Args:
+        server (str): ``gunicorn`` or ``uvicorn``.
+        faults (FaultProfile): User-service fault settings.
+        concurrency (int): Concurrent clients.
+        duration (float): Run length in seconds.
+        threads (int, optional): gunicorn threads.
+
+    Returns:
+        dict: Summary from `drive_logins`.
+    """
+    extra_env = {'GUNICORN_WORKERS': '1'}
+    if threads:
+        extra_env['GUNICORN_THREADS'] = str(threads)
+    port = free_port()
+    with UserServiceEmulator(faults=faults) as emulator:
+        instance = start_local_instance(port, emulator.url,
+                                        extra_env=extra_env, server=server)
+        try:
+            return asyncio.run(drive_logins(f'http://127.0.0.1:{port}',
+                                            concurrency, duration))
+        finally:
+            instance.terminate()
+            instance.wait(timeout=35)
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Compare pending logins of sync and async servers.')
+    parser.add_argument('--servers', nargs='+',
+                        choices=('gunicorn', 'uvicorn'),
+                        default=['gunicorn', 'uvicorn'])
+    parser.add_argument('--threads', type=int,
+                        help='gunicorn threads (default: gunicorn.conf.py).')
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--output', help='JSON result file.')
+    add_fault_arguments(parser, 'upstream-')
+    parser.set_defaults(upstream_latency='200')
+    args = parser.parse_args(argv)
+
+    faults = faults_from_args(args, 'upstream-')
+    results = {}
+    for server in args.servers:
+        summary = bench_logins(server, faults, args.concurrency,
+                               args.duration, threads=args.threads)
+        results[f'{server}/login'] = summary
+        print(f"{server:<9} login {summary['throughput_rps']:>8.1f} req/s  "
+              f"p99 {summary['latency_ms']['p99']:.1f} ms  "
+              f"errors {summary['errors']}", file=sys.stderr)
+
+    meta = run_metadata(benchmark='login_concurrency', servers=args.servers,
+                        threads=args.threads, concurrency=args.concurrency,
+                        duration=args.duration,
+                        upstream_latency=args.upstream_latency)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+memory.py
+---------
+
+Measure per-worker memory of the production server with and without the
+preload warm-up (``GUNICORN_WARMUP``, see app/warmup.py).
+
+For each mode a local gunicorn instance with ``--workers`` workers is started
+(see `benchmarks.loadgen.start_local_instance`), driven for ``--duration``
+seconds so that every worker serves traffic, then the memory of each worker
+is read from ``/proc/<pid>/smaps_rollup``:
+
+    - ``rss_kb``: resident memory, shared pages included;
+    - ``pss_kb``: proportional share, i.e. shared pages divided among the
+      processes mapping them;
+    - ``private_kb``: pages private to the worker (dirty or clean), which is
+      what copy-on-write duplication grows.
+
+Results are keyed ``<mode>/worker`` with the mean per worker, and the total
+PSS of master plus workers. Linux only.
+
+Usage:
+    python -m benchmarks.memory --workers 4 --duration 10 --output memory.json
+"""
+
+import argparse
+import os
+import sys
+
+from benchmarks.common import run_metadata, write_results
+from benchmarks.loadgen import free_port, run_load, start_local_instance
+from benchmarks.server import verify_profile
+from benchmarks.user_service import UserServiceEmulator
+
+MODES = {'cold': '0', 'warm': '1'}
+FIELDS = {'Rss': 'rss_kb', 'Pss': 'pss_kb', 'Private_Clean': 'private_kb',
+          'Private_Dirty': 'private_kb'}
+
+
+def read_memory(pid):
+    """
+    Read the memory summary of a process.
+
+    Args:
+        pid (int): Process id.
+
+    Returns:
+        dict: ``rss_kb``, ``pss_kb`` and ``private_kb`` in kilobytes.
+    """
+    usage = dict.fromkeys(set(FIELDS.values()), 0)
+    with open(f'/proc/{pid}/smaps_rollup', encoding='utf-8') as fh:
+        for line in fh:
+            name, _, rest = line.partition(':')
+            if name in FIELDS:
+                usage[FIELDS[name]] += int(rest.split()[0])
+    return usage
+
+
+def child_pids(pid):
+    """Return the ids of the direct children of ``pid``."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', encoding='utf-8') as fh:
+                stat = fh.read()
+        except OSError:
+            continue
+        # The command name may contain spaces: fields start after ')'.
+        if int(stat.rpartition(')')[2].split()[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def measure(mode, workers, profile, duration):
+    """
+    Start a gunicorn instance in ``mode``, load it and measure its workers.
+
+    Args:
+        mode (str): ``cold`` or ``warm``.
+        workers (int): gunicorn worker processes.
+        profile (dict): Load-generator profile.
+        duration (float): Load duration in seconds.
+
+    Returns:
+        dict: Mean per-worker usage under ``worker`` and the master's
+        under ``master``, plus the total PSS.
+    """
+    port = free_port()
+    extra_env = {'GUNICORN_WORKERS': str(workers),
+                 'GUNICORN_WARMUP': MODES[mode]}
+    with UserServiceEmulator(seed=profile['seed']) as emulator:
+        instance = start_local_instance(port, emulator.url,
+                                        extra_env=extra_env,
+                                        server='gunicorn')
+        try:
+            run_load(f'http://127.0.0.1:{port}', profile, 1, duration)
+            master = read_memory(instance.pid)
+            per_worker = [read_memory(pid) for pid in child_pids(instance.pid)]
+        finally:
+            instance.terminate()
+            instance.wait(timeout=35)
+    count = len(per_worker) or 1
+    mean = {key: round(sum(w[key] for w in per_worker) / count)
+            for key in master}
+    return {
+        'workers': len(per_worker),
+        'worker': mean,
+        'master': master,
+        'total_pss_kb': master['pss_kb'] + sum(w['pss_kb'] for w in per_worker),
+    }
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Per-worker memory with and without preload warm-up.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--modes', nargs='+', choices=MODES,
+                        default=list(MODES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON result file.')
+    args = parser.parse_args(argv)
+
+    profile = verify_profile(args.users, args.seed)
+    results = {}
+    for mode in args.modes:
+        usage = measure(mode, args.workers, profile, args.duration)
+        results[f'{mode}/worker'] = usage
+        worker = usage['worker']
+        print(f"{mode:<5} {usage['workers']} workers: rss {worker['rss_kb']} kB"
+              f"  pss {worker['pss_kb']} kB  private {worker['private_kb']} kB"
+              f"  total pss {usage['total_pss_kb']} kB", file=sys.stderr)
+
+    meta = run_metadata(benchmark='memory', workers=args.workers,
+                        users=args.users, duration=args.duration,
+                        seed=args.seed)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+overload.py
+-----------
+
+Measure goodput past saturation, with and without the adaptive concurrency
+limit.
+
+A single gunicorn worker is started against a user-service emulator that
+processes at most ``--upstream-capacity`` requests at once (``--upstream-
+latency`` each), so its latency grows with load like a saturated
+dependency. Logins are then sent open-loop at each rate of ``--rates``
+(requests per second, ``--step`` seconds each). Goodput counts the logins
+answered 200 within ``--slo-ms``. Without a limit, requests past saturation
+queue until they time out and goodput collapses; with ``ADAPTIVE_LIMIT``
+the excess is rejected early with 503s and goodput stays near capacity.
+
+Usage:
+    python -m benchmarks.overload --rates 50 100 200 300 400 --step 5 \\
+        --output overload.json
+"""
+
+import argparse
+import asyncio
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.loadgen import free_port, start_local_instance
+from benchmarks.user_service import FaultProfile, UserServiceEmulator
+
+MODES = ('unlimited', 'adaptive')
+
+
+async def _login(session, url, number, recorder, good, slo_s):
+    """Send one login and record its outcome."""
+    body = {'email': f'user{number}@example.com', 'password': 'secret'}
+    started = time.perf_counter()
+    try:
+        async with session.post(url, json=body) as response:
+            await response.read()
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    latency = time.perf_counter() - started
+    recorder.record(latency, status, ok=status == 200)
+    if status == 200 and latency <= slo_s:
+        good.append(latency)
+
+
+async def offer_load(base_url, rate, duration, slo_s, timeout=30.0):
+    """
+    Send logins open-loop at a fixed rate.
+
+    Args:
+        base_url (str): Base URL of the service.
+        rate (float): Requests per second.
+        duration (float): Seconds of load.
+        slo_s (float): Latency under which a success counts as goodput.
+        timeout (float): Client timeout in seconds.
+
+    Returns:
+        dict: `benchmarks.common.LatencyRecorder` summary plus
+        ``offered_rps`` and ``goodput_rps``.
+    """
+    recorder = LatencyRecorder()
+    good = []
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        tasks = []
+        recorder.start()
+        started = time.perf_counter()
+        for number in range(int(rate * duration)):
+            delay = started + number / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_login(
+                session, f'{base_url}/login', number, recorder, good,
+                slo_s)))
+        await asyncio.gather(*tasks)
+        recorder.stop()
+    summary = recorder.summary()
+    summary['offered_rps'] = rate
+    summary['goodput_rps'] = round(len(good) / duration, 2)
+    return summary
+
+
+def bench_mode(mode, args):
+    """
+    Run every rate of ``args.rates`` against a fresh instance.
+
+    Args:
+        mode (str): ``unlimited`` or ``adaptive``.
+        args (argparse.Namespace): Parsed command-line options.
+
+    Returns:
+        dict: `offer_load` summaries keyed by rate.
+    """
+    extra_env = {
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_THREADS': str(args.threads),
+        'ADAPTIVE_LIMIT': 'true' if mode == 'adaptive' else 'false',
+        'LIMIT_LATENCY_TARGET_MS': str(args.latency_target_ms),
+    }
+    faults = FaultProfile(latency=args.upstream_latency,
+                          capacity=args.upstream_capacity)
+    port = free_port()
+    results = {}
+    with UserServiceEmulator(faults=faults) as emulator:
+        instance = start_local_instance(port, emulator.url,
+                                        extra_env=extra_env,
+                                        server='gunicorn')
+        try:
+            for rate in args.rates:
+                results[rate] = asyncio.run(offer_load(
+                    f'http://127.0.0.1:{port}', rate, args.step,
+                    args.slo_ms / 1000.0))
+        finally:
+            instance.terminate()
+            instance.wait(timeout=35)
+    return results
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Measure login goodput past saturation.')
+    parser.add_argument('--modes', nargs='+', choices=MODES,
+                        default=list(MODES))
+    parser.add_argument('--rates', nargs='+', type=float,
+                        default=[50, 100, 200, 300, 400])
+    parser.add_argument('--step', type=float, default=5.0,
+                        help='Seconds of load per rate.')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--upstream-latency', default='20')
+    parser.add_argument('--upstream-capacity', type=int, default=2)
+    parser.add_argument('--latency-target-ms', type=float, default=250.0)
+    parser.add_argument('--slo-ms', type=float, default=500.0)
+    parser.add_argument('--output', help='JSON result file.')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode in args.modes:
+        for rate, summary in bench_mode(mode, args).items():
+            results[f'{mode}/{rate:g}rps'] = summary
+            print(f"{mode:<9} offered {rate:>6.0f} req/s  goodput "
+                  f"{summary['goodput_rps']:>7.1f} req/s  p99 "
+                  f"{summary['latency_ms']['p99']:>8.1f} ms  "
+                  f"statuses {summary['status_counts']}", file=sys.stderr)
+
+    meta = run_metadata(benchmark='overload', modes=args.modes,
+                        rates=args.rates, step=args.step,
+                        threads=args.threads,
+                        upstream_latency=args.upstream_latency,
+                        upstream_capacity=args.upstream_capacity,
+                        latency_target_ms=args.latency_target_ms,
+                        slo_ms=args.slo_ms)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+serve.py
+--------
+
+Start a local instance of the service for load tests.
+
+The application is loaded from ``wsgi.py`` (so ``FLASK_ENV`` and the usual
+environment variables apply) and served either by Werkzeug's threaded
+development server, by gunicorn with the production configuration
+(``gunicorn.conf.py``) or by uvicorn in the ASGI deployment mode
+(``asgi.py``). The ``--create-db`` flag creates the tables first,
+which is convenient with a throwaway SQLite file.
+
+Usage:
+    FLASK_ENV=production DATABASE_URL=sqlite:////tmp/auth.db \\
+        JWT_SECRET=... USER_SERVICE_URL=http://127.0.0.1:5001 \\
+        INTERNAL_AUTH_TOKEN=... python -m benchmarks.serve --port 5000 \\
+        --server gunicorn --workers 4
+"""
+
+import argparse
+import os
+import sys
+
+from werkzeug.serving import run_simple
+
+SERVERS = ('werkzeug', 'gunicorn', 'uvicorn')
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+def gunicorn_command(host, port, workers=None, threads=None):
+    """
+    Build the command line serving ``wsgi:app`` with gunicorn.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        workers (int, optional): Overrides the configured worker count.
+        threads (int, optional): Overrides the configured thread count.
+
+    Returns:
+        list: Arguments suitable for ``os.execvp`` or ``subprocess``.
+    """
+    command = [sys.executable, '-m', 'gunicorn', '-c', GUNICORN_CONFIG,
+               '--bind', f'{host}:{port}']
+    if workers:
+        command += ['--workers', str(workers)]
+    if threads:
+        command += ['--threads', str(threads)]
+    return command + ['wsgi:app']
+
+
+def uvicorn_command(host, port, workers=None):
+    """
+    Build the command line serving ``asgi:app`` with uvicorn.
+
+    Args:
+        host (str): Interface to bind.
+        port (int): Port to bind.
+        workers (int, optional): Worker processes (default: one).
+
+    Returns:
+        list: Arguments suitable for ``os.execvp`` or ``subprocess``.
+    """
+    command = [sys.executable, '-m', 'uvicorn', '--host', host,
+               '--port', str(port), '--no-access-log',
+               '--log-level', 'warning']
+    if workers:
+        command += ['--workers', str(workers)]
+    return command + ['asgi:app']
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Serve the application for load tests.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--server', choices=SERVERS, default='werkzeug')
+    parser.add_argument('--workers', type=int,
+                        help='gunicorn or uvicorn worker processes.')
+    parser.add_argument('--threads', type=int,
+                        help='gunicorn threads per worker.')
+    parser.add_argument('--create-db', action='store_true',
+                        help='Create the database tables before serving.')
+    args = parser.parse_args(argv)
+
+    # Imported here so that the environment is read at start-up only.
+    # pylint: disable=import-outside-toplevel
+    from wsgi import app
+    from app.models import db
+
+    if args.create_db:
+        with app.app_context():
+            db.create_all()
+
+    if args.server == 'gunicorn':
+        command = gunicorn_command(args.host, args.port, args.workers,
+                                   args.threads)
+        os.execvp(command[0], command)
+    if args.server == 'uvicorn':
+        command = uvicorn_command(args.host, args.port, args.workers)
+        os.execvp(command[0], command)
+    run_simple(args.host, args.port, app, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
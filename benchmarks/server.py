@@ -0,0 +1,127 @@
+"""
+server.py
+---------
+
+Compare the throughput of the development server and the production server.
+
+For each server in ``--servers`` a local instance is started on a throwaway
+SQLite database (see `benchmarks.loadgen.start_local_instance`), then driven
+by the closed-loop load generator with a verify-heavy profile: each virtual
+user logs in once and calls /verify back to back. Results are keyed
+``<server>/<endpoint>`` so two runs can be compared with
+``benchmarks.compare``.
+
+Usage:
+    python -m benchmarks.server --servers werkzeug gunicorn \\
+        --workers 4 --threads 4 --duration 20 --output server.json
+"""
+
+import argparse
+import sys
+
+from benchmarks.common import run_metadata, write_results
+from benchmarks.loadgen import (
+    aggregate,
+    free_port,
+    run_load,
+    start_local_instance,
+)
+from benchmarks.serve import SERVERS
+from benchmarks.user_service import UserServiceEmulator
+
+
+def verify_profile(users, seed):
+    """
+    Workload where every user hammers /verify with almost no think time.
+
+    Args:
+        users (int): Virtual users per load-generator process.
+        seed (int): Random seed.
+
+    Returns:
+        dict: A profile accepted by `benchmarks.loadgen.run_load`.
+    """
+    return {
+        'users': users,
+        'verify_rate': 10000.0,
+        'refresh_interval': 1e9,
+        'logout_probability': 0.0,
+        'bad_login_rate': 0.0,
+        'user_pool': 1000,
+        'ramp_up': 0.5,
+        'seed': seed,
+    }
+
+
+def bench_server(server, profile, processes, duration, *, workers=None,
+                 threads=None):
+    """
+    Run the load against one server.
+
+    Args:
+        server (str): ``werkzeug`` or ``gunicorn``.
+        profile (dict): Load-generator profile.
+        processes (int): Load-generator processes.
+        duration (float): Run length in seconds.
+        workers (int, optional): gunicorn worker processes.
+        threads (int, optional): gunicorn threads per worker.
+
+    Returns:
+        dict: Per-endpoint totals from `benchmarks.loadgen.aggregate`.
+    """
+    extra_env = {}
+    if workers:
+        extra_env['GUNICORN_WORKERS'] = str(workers)
+    if threads:
+        extra_env['GUNICORN_THREADS'] = str(threads)
+    port = free_port()
+    with UserServiceEmulator(seed=profile['seed']) as emulator:
+        instance = start_local_instance(port, emulator.url,
+                                        extra_env=extra_env, server=server)
+        try:
+            samples = run_load(f'http://127.0.0.1:{port}', profile,
+                               processes, duration)
+        finally:
+            instance.terminate()
+            instance.wait(timeout=35)
+    return aggregate(samples, duration)['totals']
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Compare development and production server throughput.')
+    parser.add_argument('--servers', nargs='+', choices=SERVERS,
+                        default=['werkzeug', 'gunicorn'])
+    parser.add_argument('--workers', type=int,
+                        help='gunicorn workers (default: from the CPU count).')
+    parser.add_argument('--threads', type=int,
+                        help='gunicorn threads per worker.')
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=15.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON result file.')
+    args = parser.parse_args(argv)
+
+    profile = verify_profile(args.users, args.seed)
+    results = {}
+    for server in args.servers:
+        totals = bench_server(server, profile, args.processes, args.duration,
+                              workers=args.workers, threads=args.threads)
+        for endpoint, summary in totals.items():
+            results[f'{server}/{endpoint}'] = summary
+        verify = totals.get('verify', {})
+        print(f"{server:<9} verify {verify.get('throughput_rps', 0):>9.1f} "
+              f"req/s  p99 {verify.get('latency_ms', {}).get('p99', 0):.2f} ms",
+              file=sys.stderr)
+
+    meta = run_metadata(benchmark='server', servers=args.servers,
+                        workers=args.workers, threads=args.threads,
+                        processes=args.processes, users=args.users,
+                        duration=args.duration, seed=args.seed)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
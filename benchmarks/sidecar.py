@@ -0,0 +1,182 @@
+"""
+sidecar.py
+----------
+
+Compare token verification over the Unix socket sidecar (app/sidecar.py)
+with ``GET /verify`` over HTTP, for a caller on the same host.
+
+One application serves both: HTTP/1.1 with keep-alive on a local TCP port
+(Werkzeug, threaded, with the /verify fast path) and the sidecar on a Unix
+socket. A single client replays access tokens of ``--users`` users through
+each transport:
+
+    - ``http``: ``GET /verify`` on a persistent ``requests`` session;
+    - ``uds``: `auth_client.SidecarClient.verify`, one token at a time;
+    - ``uds_pipelined``: `SidecarClient.verify_many` with ``--depth``
+      requests in flight; each verification is recorded with the latency
+      of its batch.
+
+Results are the usual throughput and latency summary per transport.
+
+Usage:
+    python -m benchmarks.sidecar --users 100 --iterations 10000 --depth 32 \\
+        --output sidecar.json
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.endpoints import prepare_environment
+
+TRANSPORTS = ('http', 'uds', 'uds_pipelined')
+
+
+def serve(database_url, socket_path):
+    """
+    Serve the application over HTTP and its sidecar.
+
+    Returns:
+        tuple: The HTTP server and the sidecar, both running in threads.
+    """
+    # Imported lazily: app.config reads DATABASE_URL at import time.
+    # pylint: disable=import-outside-toplevel
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from app import create_app
+    from app.config import TestingConfig
+    from app.models import db
+    from app.sidecar import VerifySidecar
+
+    application = create_app(type('SidecarConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': False,
+        'VERIFY_FAST_PATH': True,
+        'SIDECAR_SOCKET': socket_path,
+    }))
+    with application.app_context():
+        db.create_all()
+    handler = type('KeepAliveHandler', (WSGIRequestHandler,),
+                   {'protocol_version': 'HTTP/1.1'})
+    http = make_server('127.0.0.1', 0, application, threaded=True,
+                       request_handler=handler)
+    sidecar = VerifySidecar(application)
+    for server in (http, sidecar):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return http, sidecar
+
+
+def issue_tokens(users):
+    """Issue access tokens for ``users`` users."""
+    from app.tokens import issue_access_token  # pylint: disable=import-outside-toplevel
+
+    return [issue_access_token({
+        'sub': f'user-{number}',
+        'email': f'user{number}@example.com',
+        'company_id': f'company-{number % 20}',
+    }, os.environ['JWT_SECRET'])[0] for number in range(users)]
+
+
+def bench_http(http_url, sample):
+    """Replay tokens through ``GET /verify``; return the summary."""
+    import requests  # pylint: disable=import-outside-toplevel
+
+    recorder = LatencyRecorder()
+    with requests.Session() as session:
+        recorder.start()
+        for token in sample:
+            started = time.perf_counter()
+            response = session.get(f'{http_url}/verify',
+                                   cookies={'access_token': token})
+            recorder.record(time.perf_counter() - started,
+                            response.status_code,
+                            ok=response.status_code == 200)
+        recorder.stop()
+    return recorder.summary()
+
+
+def bench_sidecar(socket_path, sample, depth):
+    """Replay tokens through the sidecar, ``depth`` at a time."""
+    from auth_client import SidecarClient  # pylint: disable=import-outside-toplevel
+
+    client = SidecarClient(socket_path)
+    recorder = LatencyRecorder()
+    recorder.start()
+    for start in range(0, len(sample), depth):
+        batch = sample[start:start + depth]
+        started = time.perf_counter()
+        results = (client.verify_many(batch, depth=depth) if depth > 1
+                   else [client.verify(batch[0])])
+        latency = time.perf_counter() - started
+        for result in results:
+            ok = isinstance(result, dict)
+            recorder.record(latency, 200 if ok else 'rejected', ok=ok)
+    recorder.stop()
+    client.close()
+    return recorder.summary()
+
+
+# pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
+def run(database_url=None, users=100, iterations=5000, depth=32, seed=1,
+        transports=TRANSPORTS):
+    """
+    Measure the selected transports.
+
+    Args:
+        database_url (str, optional): SQLAlchemy URL of the benchmark
+            database; a temporary SQLite file by default (the servers'
+            threads must share it).
+
+    Returns:
+        tuple: ``(meta, results)`` ready for `write_results`.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = database_url or f"sqlite:///{directory}/auth.db"
+        socket_path = os.path.join(directory, 'verify.sock')
+        prepare_environment(database_url)
+        http, sidecar = serve(database_url, socket_path)
+        try:
+            http_url = f'http://127.0.0.1:{http.server_port}'
+            tokens = issue_tokens(users)
+            rng = random.Random(seed)
+            sample = [rng.choice(tokens) for _ in range(iterations)]
+            runners = {
+                'http': lambda: bench_http(http_url, sample),
+                'uds': lambda: bench_sidecar(socket_path, sample, 1),
+                'uds_pipelined': lambda: bench_sidecar(socket_path, sample,
+                                                       depth),
+            }
+            results = {transport: runners[transport]()
+                       for transport in transports}
+        finally:
+            http.shutdown()
+            sidecar.shutdown()
+            sidecar.server_close()
+    meta = run_metadata(benchmark='sidecar', users=users,
+                        iterations=iterations, depth=depth, seed=seed)
+    return meta, results
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--database-url')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--depth', type=int, default=32)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--transports', default=','.join(TRANSPORTS))
+    parser.add_argument('--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    transports = tuple(t for t in args.transports.split(',') if t)
+    meta, results = run(args.database_url, args.users, args.iterations,
+                        args.depth, args.seed, transports)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+startup.py
+----------
+
+Measure the cold-start path of a replica in fresh interpreters:
+
+    - ``create_app``: time to import ``wsgi`` (create the application), and
+      whether the extensions only used by CLI commands (Alembic, Marshmallow)
+      stayed unloaded;
+    - ``schema_check``: wall time of ``python -m app.schema check`` against
+      an up-to-date database, i.e. the boot-time cost of the skipped
+      migration step.
+
+Each measurement runs ``--repeat`` times on a throwaway SQLite database.
+
+Usage:
+    python -m benchmarks.startup --repeat 10 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import run_metadata, summarize_latencies, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported to serve requests.
+LAZY_MODULES = ('alembic', 'flask_migrate', 'flask_marshmallow',
+                'marshmallow')
+
+_CREATE_APP = f"""
+import json, sys, time
+started = time.perf_counter()
+import wsgi
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    'elapsed_s': elapsed,
+    'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def startup_env(database_url):
+    """Environment of a production replica on ``database_url``."""
+    env = dict(os.environ)
+    env.update({
+        'FLASK_ENV': 'production',
+        'DATABASE_URL': database_url,
+        'JWT_SECRET': env.get('JWT_SECRET', 'startup-jwt-secret'),
+        'LOG_LEVEL': 'ERROR',
+    })
+    return env
+
+
+def time_create_app(env):
+    """
+    Import ``wsgi`` in a fresh interpreter.
+
+    Args:
+        env (dict): Process environment.
+
+    Returns:
+        dict: ``elapsed_s`` and the ``loaded`` lazy modules.
+    """
+    out = subprocess.run([sys.executable, '-c', _CREATE_APP], env=env,
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def time_schema_check(env):
+    """
+    Run ``python -m app.schema check`` in a fresh interpreter.
+
+    Args:
+        env (dict): Process environment.
+
+    Returns:
+        tuple: ``(elapsed_s, returncode)``.
+    """
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-m', 'app.schema', 'check'],
+                          env=env, cwd=ROOT, capture_output=True, check=False)
+    return time.perf_counter() - started, proc.returncode
+
+
+def measure_startup(repeat=5):
+    """
+    Measure application creation and the schema check ``repeat`` times.
+
+    Args:
+        repeat (int): Runs per measurement.
+
+    Returns:
+        dict: Result entries ``create_app`` and ``schema_check``, each with
+        a latency summary; ``create_app`` also lists ``loaded_lazy_modules``
+        and ``schema_check`` the ``skipped`` flag (schema found current).
+    """
+    with tempfile.TemporaryDirectory(prefix='auth-startup-') as tmp:
+        env = startup_env('sqlite:///' + os.path.join(tmp, 'auth.db'))
+        subprocess.run([sys.executable, '-m', 'app.schema', 'upgrade'],
+                       env=env, cwd=ROOT, capture_output=True, check=True)
+        create, loaded = [], set()
+        check, codes = [], set()
+        for _ in range(repeat):
+            result = time_create_app(env)
+            create.append(result['elapsed_s'] * 1000.0)
+            loaded.update(result['loaded'])
+            elapsed, code = time_schema_check(env)
+            check.append(elapsed * 1000.0)
+            codes.add(code)
+    return {
+        'create_app': {
+            'runs': repeat,
+            'latency_ms': summarize_latencies(create),
+            'loaded_lazy_modules': sorted(loaded),
+        },
+        'schema_check': {
+            'runs': repeat,
+            'latency_ms': summarize_latencies(check),
+            'skipped': codes == {0},
+        },
+    }
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Measure application cold-start time.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='JSON result file.')
+    args = parser.parse_args(argv)
+
+    results = measure_startup(args.repeat)
+    for name, summary in results.items():
+        print(f"{name:<13} p50 {summary['latency_ms']['p50']:>8.1f} ms  "
+              f"max {summary['latency_ms']['max']:>8.1f} ms", file=sys.stderr)
+    write_results(args.output, run_metadata(benchmark='startup',
+                                            repeat=args.repeat), results)
+
+
+if __name__ == '__main__':
+    main()
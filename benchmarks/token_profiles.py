@@ -0,0 +1,151 @@
+"""
+token_profiles.py
+-----------------
+
+Compare the claim profiles of access tokens (``TOKEN_PROFILE``, see
+app/tokens.py): size on the wire and ``GET /verify`` throughput.
+
+For each profile an application is built with the /verify fast path, users
+with UUID ids (as the user service issues them) log in through ``POST
+/login``, and their access tokens are replayed against /verify with the
+Flask test client. Results are keyed by profile:
+
+    - ``token_bytes``: mean length of the access token;
+    - ``cookie_header_bytes``: mean length of the ``Cookie`` request header
+      carrying it, which every request of the platform pays;
+    - the usual throughput and latency summary of the /verify replay. With
+      the ``minimal`` profile it includes the user directory lookups, one
+      per user (then cached).
+
+Usage:
+    python -m benchmarks.token_profiles --users 200 --iterations 5000 \\
+        --output profiles.json
+"""
+
+import argparse
+import random
+import time
+import uuid
+from unittest import mock
+
+from benchmarks.common import LatencyRecorder, run_metadata, write_results
+from benchmarks.endpoints import DEFAULT_DATABASE_URL, prepare_environment
+
+PROFILES = ('full', 'compact', 'minimal')
+
+
+def stub_check_credentials(email, password):  # pylint: disable=unused-argument
+    """Stand-in for the user service, with UUID user and company ids."""
+    return {
+        'id': str(uuid.uuid5(uuid.NAMESPACE_URL, email)),
+        'email': email,
+        'company_id': str(uuid.uuid5(uuid.NAMESPACE_DNS,
+                                     email.rpartition('@')[2])),
+    }
+
+
+def build_app(database_url, profile):
+    """Create the application issuing tokens of ``profile``."""
+    # Imported lazily: app.config reads DATABASE_URL at import time.
+    from app import create_app  # pylint: disable=import-outside-toplevel
+    from app.config import TestingConfig  # pylint: disable=import-outside-toplevel
+
+    config = type('ProfileConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'TESTING': False,
+        'VERIFY_FAST_PATH': True,
+        'TOKEN_PROFILE': profile,
+    })
+    return create_app(config)
+
+
+def login_tokens(client, users):
+    """Log ``users`` users in and return their access tokens."""
+    tokens = []
+    for number in range(users):
+        response = client.post('/login', json={
+            'email': f'user{number}@company{number % 20}.example.com',
+            'password': 'secret',
+        })
+        assert response.status_code == 200, response.status_code
+        cookie = response.headers.getlist('Set-Cookie')[0]
+        tokens.append(cookie.split(';')[0].partition('=')[2])
+    return tokens
+
+
+def bench_profile(database_url, profile, users, iterations, rng):
+    """
+    Measure one profile.
+
+    Returns:
+        dict: Token sizes and the /verify summary.
+    """
+    application = build_app(database_url, profile)
+    # pylint: disable=import-outside-toplevel
+    from app.models import db
+
+    with application.app_context():
+        db.create_all()
+        client = application.test_client(use_cookies=False)
+        try:
+            with mock.patch('app.resources.login.check_credentials',
+                            stub_check_credentials):
+                tokens = login_tokens(client, users)
+            headers = [{'Cookie': f'access_token={token}'}
+                       for token in tokens]
+            recorder = LatencyRecorder()
+            recorder.start()
+            for _ in range(iterations):
+                started = time.perf_counter()
+                response = client.get('/verify', headers=rng.choice(headers))
+                recorder.record(time.perf_counter() - started,
+                                response.status_code,
+                                ok=response.status_code == 200)
+            recorder.stop()
+        finally:
+            db.session.remove()
+            db.drop_all()
+    summary = recorder.summary()
+    summary['token_bytes'] = round(
+        sum(len(token) for token in tokens) / len(tokens), 1)
+    summary['cookie_header_bytes'] = round(
+        sum(len(h['Cookie']) for h in headers) / len(headers), 1)
+    return summary
+
+
+def run(database_url=DEFAULT_DATABASE_URL, users=100, iterations=2000,
+        seed=1, profiles=PROFILES):
+    """
+    Measure the selected profiles.
+
+    Returns:
+        tuple: ``(meta, results)`` ready for `write_results`.
+    """
+    prepare_environment(database_url)
+    rng = random.Random(seed)
+    results = {profile: bench_profile(database_url, profile, users,
+                                      iterations, rng)
+               for profile in profiles}
+    meta = run_metadata(benchmark='token_profiles', users=users,
+                        iterations=iterations, seed=seed)
+    return meta, results
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--output', help='JSON result file (default: stdout)')
+    args = parser.parse_args(argv)
+    profiles = tuple(p for p in args.profiles.split(',') if p)
+    meta, results = run(args.database_url, args.users, args.iterations,
+                        args.seed, profiles)
+    write_results(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""
+user_service.py
+---------------
+
+Local emulator of the user service with injectable faults.
+
+Implements ``POST /verify_password`` the way ``check_credentials`` expects
+it: the request carries an ``X-Internal-Token`` header and a JSON body with
+``email`` and ``password``; a successful response is the user as JSON.
+``GET /users/<user_id>/roles`` answers the role claims of a user
+(`make_roles`, see app/roles.py), without faults.
+
+Point ``USER_SERVICE_URL`` at the emulator to exercise the production code
+path (HTTP call, timeouts, JSON parsing, connection handling) instead of the
+in-process stub. Every request draws one outcome:
+
+    - reset: the connection is closed with a TCP RST before any answer;
+    - error: an HTTP error status (503 by default);
+    - invalid_json: a 200 whose body is not JSON;
+    - slow_body: a valid answer whose body is trickled out in chunks;
+    - ok: a normal answer (401 for `BAD_PASSWORD`).
+
+Latency is drawn from a configurable distribution before answering, see
+`parse_latency`. With a ``capacity``, only that many requests are processed
+at once and the others queue, like a saturated service whose latency grows
+with load. The emulator speaks HTTP/1.1 with keep-alive and counts
+TCP connections separately from requests, so connection reuse by the
+client is observable.
+
+Usage:
+    python -m benchmarks.user_service --port 5001 \\
+        --latency lognormal:20,0.6 --error-rate 0.01 --reset-rate 0.005
+"""
+
+import argparse
+import json
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_INTERNAL_TOKEN = 'benchmark-internal-token'
+BAD_PASSWORD = 'wrong-password'
+
+OUTCOMES = ('reset', 'error', 'invalid_json', 'slow_body')
+
+
+def make_user(email):
+    """
+    Build the deterministic user returned for ``email``.
+
+    Args:
+        email (str): The user's email address.
+
+    Returns:
+        dict: User payload with string ``id`` and ``company_id``.
+    """
+    number = zlib.crc32(email.encode()) % 100000
+    return {
+        'id': str(number),
+        'email': email,
+        'company_id': str(number % 50),
+        'username': email.split('@')[0],
+        'is_admin': False,
+    }
+
+
+def make_roles(user_id):
+    """
+    Build the deterministic role claims returned for ``user_id``.
+
+    Args:
+        user_id (str): The user's ID.
+
+    Returns:
+        dict: ``roles`` and ``permissions`` lists.
+    """
+    number = zlib.crc32(user_id.encode())
+    roles = ['member'] + (['admin'] if number % 10 == 0 else [])
+    permissions = ['projects:read', 'tasks:write']
+    if 'admin' in roles:
+        permissions.append('users:manage')
+    return {'roles': roles, 'permissions': permissions}
+
+
+def parse_latency(spec):
+    """
+    Build a latency sampler from a textual specification.
+
+    Supported forms (all values in milliseconds):
+        ``20`` or ``fixed:20``      constant delay;
+        ``uniform:10,50``           uniform between two bounds;
+        ``normal:20,5``             normal with mean and standard deviation;
+        ``lognormal:20,0.6``        log-normal with median and sigma, the
+                                    usual shape of service latencies;
+        ``exp:20``                  exponential with the given mean.
+
+    Args:
+        spec (str): The specification.
+
+    Returns:
+        callable: ``sampler(rng) -> seconds`` (never negative).
+
+    Raises:
+        ValueError: If the specification is not understood.
+    """
+    kind, _, raw = str(spec).partition(':')
+    if not raw:
+        kind, raw = 'fixed', kind
+    try:
+        params = [float(value) for value in raw.split(',')]
+    except ValueError as e:
+        raise ValueError(f"Invalid latency specification: {spec}") from e
+
+    samplers = {
+        ('fixed', 1): lambda rng: params[0],
+        ('uniform', 2): lambda rng: rng.uniform(params[0], params[1]),
+        ('normal', 2): lambda rng: rng.gauss(params[0], params[1]),
+        ('lognormal', 2): lambda rng: rng.lognormvariate(
+            math.log(params[0]), params[1]) if params[0] > 0 else 0.0,
+        ('exp', 1): lambda rng: rng.expovariate(1.0 / params[0])
+        if params[0] > 0 else 0.0,
+    }
+    sampler = samplers.get((kind, len(params)))
+    if sampler is None:
+        raise ValueError(f"Invalid latency specification: {spec}")
+    return lambda rng: max(0.0, sampler(rng)) / 1000.0
+
+
+class FaultProfile:
+    """
+    Fault-injection settings of the emulator; may be changed while running.
+
+    Attributes:
+        latency (str): Latency specification, see `parse_latency`.
+        error_rate (float): Probability of answering ``error_status``.
+        error_status (int): HTTP status used for injected errors.
+        reset_rate (float): Probability of resetting the connection.
+        invalid_json_rate (float): Probability of a non-JSON 200 body.
+        slow_body_rate (float): Probability of trickling the body.
+        slow_body_ms (float): Delay between body chunks of a slow body.
+        slow_body_chunks (int): Number of chunks of a slow body.
+        capacity (int): Requests processed at once, the others queue as in
+            a saturated service (0: unlimited).
+    """
+
+    def __init__(self, latency='0', error_rate=0.0, error_status=503,
+                 reset_rate=0.0, invalid_json_rate=0.0, slow_body_rate=0.0,
+                 slow_body_ms=100.0, slow_body_chunks=5, capacity=0):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.slow_body_rate = slow_body_rate
+        self.slow_body_ms = slow_body_ms
+        self.slow_body_chunks = slow_body_chunks
+        self._latency = None
+        self._sampler = None
+        self.latency = latency
+
+    @property
+    def latency(self):
+        """The latency specification."""
+        return self._latency
+
+    @latency.setter
+    def latency(self, spec):
+        self._sampler = parse_latency(spec)
+        self._latency = spec
+
+    def sample_latency(self, rng):
+        """Draw a delay, in seconds."""
+        return self._sampler(rng)
+
+    def draw_outcome(self, rng):
+        """
+        Draw the outcome of one request.
+
+        Returns:
+            str: One of `OUTCOMES` or ``'ok'``.
+        """
+        roll = rng.random()
+        for outcome, rate in (('reset', self.reset_rate),
+                              ('error', self.error_rate),
+                              ('invalid_json', self.invalid_json_rate),
+                              ('slow_body', self.slow_body_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return 'ok'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler serving ``/verify_password``."""
+    protocol_version = 'HTTP/1.1'
+    server_version = 'UserServiceEmulator/1.0'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Silence per-request logging."""
+
+    def setup(self):
+        super().setup()
+        self.server.emulator.count('connections')
+
+    def _send(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode())
+
+    def _send_slowly(self, status, payload, faults):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.flush()
+        chunks = max(1, faults.slow_body_chunks)
+        size = math.ceil(len(body) / chunks)
+        for start in range(0, len(body), size):
+            time.sleep(faults.slow_body_ms / 1000.0)
+            self.wfile.write(body[start:start + size])
+            self.wfile.flush()
+
+    def _reset(self):
+        # SO_LINGER with a zero timeout makes close() send a RST.
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+                                   struct.pack('ii', 1, 0))
+        self.close_connection = True
+        self.connection.close()
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Health check and role claims."""
+        emulator = self.server.emulator
+        parts = self.path.split('/')
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif len(parts) == 4 and parts[1] == 'users' and parts[3] == 'roles':
+            emulator.count('requests')
+            emulator.count('roles')
+            if self.headers.get('X-Internal-Token') != emulator.internal_token:
+                self._send_json(403, {'message': 'Forbidden'})
+                return
+            self._send_json(200, make_roles(parts[2]))
+        else:
+            self._send_json(404, {'message': 'Not found'})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer a password verification request."""
+        emulator = self.server.emulator
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        emulator.count('requests')
+
+        if self.path != '/verify_password':
+            self._send_json(404, {'message': 'Not found'})
+            return
+        if self.headers.get('X-Internal-Token') != emulator.internal_token:
+            self._send_json(403, {'message': 'Forbidden'})
+            return
+
+        faults = emulator.faults
+        emulator.acquire_slot(faults.capacity)
+        try:
+            self._answer(emulator, faults, raw)
+        finally:
+            emulator.release_slot()
+
+    def _answer(self, emulator, faults, raw):
+        outcome, delay = emulator.draw(faults)
+        if delay:
+            time.sleep(delay)
+        emulator.count(outcome)
+        if outcome == 'reset':
+            self._reset()
+            return
+        if outcome == 'error':
+            self._send_json(faults.error_status,
+                            {'message': 'Injected failure'})
+            return
+        if outcome == 'invalid_json':
+            self._send(200, b'<html>not json</html>', 'text/html')
+            return
+
+        try:
+            data = json.loads(raw or b'{}')
+        except ValueError:
+            self._send_json(400, {'message': 'Invalid JSON'})
+            return
+        if data.get('password') == BAD_PASSWORD or not data.get('email'):
+            self._send_json(401, {'message': 'Invalid credentials'})
+            return
+        if outcome == 'slow_body':
+            self._send_slowly(200, make_user(data['email']), faults)
+            return
+        self._send_json(200, make_user(data['email']))
+
+
+class _Server(ThreadingHTTPServer):
+    """Threaded server that stays quiet about client-side disconnects."""
+    daemon_threads = True
+    # The default backlog (5) resets connections under bursts of
+    # concurrent clients, e.g. async logins.
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        """Ignore errors caused by injected resets and client timeouts."""
+
+
+class UserServiceEmulator:
+    """
+    Threaded HTTP server emulating the user service.
+
+    Attributes:
+        faults (FaultProfile): Active fault-injection settings.
+        internal_token (str): Expected ``X-Internal-Token`` value.
+        stats (Counter): ``requests``, ``connections`` and one entry per
+            outcome.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, faults=None,
+                 internal_token=DEFAULT_INTERNAL_TOKEN, seed=None):
+        self.faults = faults or FaultProfile()
+        self.internal_token = internal_token
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._slots = threading.Condition()
+        self._busy = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.emulator = self
+        self._thread = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to use as ``USER_SERVICE_URL``."""
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        """Number of requests received so far."""
+        return self.stats['requests']
+
+    def count(self, key):
+        """Increment one of the `stats` counters."""
+        with self._lock:
+            self.stats[key] += 1
+
+    def acquire_slot(self, capacity):
+        """Wait until fewer than ``capacity`` requests are processed."""
+        with self._slots:
+            while capacity and self._busy >= capacity:
+                self._slots.wait()
+            self._busy += 1
+
+    def release_slot(self):
+        """Free the slot taken by `acquire_slot`."""
+        with self._slots:
+            self._busy -= 1
+            self._slots.notify()
+
+    def draw(self, faults):
+        """Draw ``(outcome, delay_seconds)`` for one request."""
+        with self._lock:
+            return faults.draw_outcome(self._rng), faults.sample_latency(
+                self._rng)
+
+    def serve_forever(self):
+        """Serve in the calling thread until `stop` is called."""
+        self._server.serve_forever(poll_interval=0.05)
+
+    def start(self):
+        """Serve in a background thread and return ``self``."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name='user-service-emulator',
+            daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+
+def add_fault_arguments(parser, prefix=''):
+    """
+    Add the fault-injection options to an argument parser.
+
+    Args:
+        parser (argparse.ArgumentParser): Parser to extend.
+        prefix (str): Prefix of the option names, e.g. ``'upstream-'``.
+    """
+    parser.add_argument(f'--{prefix}latency', default='0',
+                        help='Latency distribution, e.g. 20, uniform:10,50, '
+                             'lognormal:20,0.6 (milliseconds).')
+    parser.add_argument(f'--{prefix}error-rate', type=float, default=0.0)
+    parser.add_argument(f'--{prefix}error-status', type=int, default=503)
+    parser.add_argument(f'--{prefix}reset-rate', type=float, default=0.0)
+    parser.add_argument(f'--{prefix}invalid-json-rate', type=float,
+                        default=0.0)
+    parser.add_argument(f'--{prefix}slow-body-rate', type=float, default=0.0)
+    parser.add_argument(f'--{prefix}slow-body-ms', type=float, default=100.0)
+    parser.add_argument(f'--{prefix}capacity', type=int, default=0,
+                        help='Requests processed at once (0: unlimited).')
+
+
+def faults_from_args(args, prefix=''):
+    """
+    Build a `FaultProfile` from options added by `add_fault_arguments`.
+
+    Args:
+        args (argparse.Namespace): Parsed arguments.
+        prefix (str): Prefix used when adding the options.
+
+    Returns:
+        FaultProfile: The fault settings.
+    """
+    attr = prefix.replace('-', '_')
+    return FaultProfile(
+        latency=getattr(args, f'{attr}latency'),
+        error_rate=getattr(args, f'{attr}error_rate'),
+        error_status=getattr(args, f'{attr}error_status'),
+        reset_rate=getattr(args, f'{attr}reset_rate'),
+        invalid_json_rate=getattr(args, f'{attr}invalid_json_rate'),
+        slow_body_rate=getattr(args, f'{attr}slow_body_rate'),
+        slow_body_ms=getattr(args, f'{attr}slow_body_ms'),
+        capacity=getattr(args, f'{attr}capacity'),
+    )
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(
+        description='Run a fault-injecting user-service emulator.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--internal-token', default=DEFAULT_INTERNAL_TOKEN)
+    parser.add_argument('--seed', type=int)
+    add_fault_arguments(parser)
+    args = parser.parse_args(argv)
+
+    emulator = UserServiceEmulator(args.host, args.port,
+                                   faults_from_args(args),
+                                   args.internal_token, args.seed)
+    print(f'User service emulator listening on {emulator.url}', flush=True)
+    try:
+        emulator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(dict(emulator.stats)), flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+gunicorn.conf.py
+----------------
+
+Gunicorn configuration for running the service in production.
+
+The worker model is preforked processes running a small thread pool each
+(``gthread``): the work per request is short and mostly waits on Postgres
+or the user service, so threads give cheap concurrency inside a process
+while processes give CPU parallelism. The application is imported once in
+the master (``preload_app``) and inherited by the workers on fork.
+
+Every setting can be overridden from the environment:
+
+    GUNICORN_BIND              Listen address (default 0.0.0.0:5000).
+    GUNICORN_WORKERS           Worker processes (default: 2 x CPUs + 1,
+                               CPUs being the cgroup quota when one is set).
+    GUNICORN_THREADS           Threads per worker (default 4).
+    GUNICORN_TIMEOUT           Seconds before a silent worker is killed and
+                               restarted (default 30).
+    GUNICORN_GRACEFUL_TIMEOUT  Seconds given to in-flight requests on
+                               reload or shutdown (default 30).
+    GUNICORN_KEEPALIVE         Keep-alive seconds (default 5).
+    GUNICORN_MAX_REQUESTS      Recycle a worker after this many requests,
+                               with jitter (default 10000, 0 disables).
+    GUNICORN_PRELOAD           Preload the app in the master (default true).
+    GUNICORN_WARMUP            With preload, warm imports and the compiled
+                               statement cache, then ``gc.freeze()`` before
+                               forking (default true; see app/warmup.py).
+
+Each worker opens ``DB_POOL_WARMUP`` pooled connections and runs the hot
+queries before accepting requests (``post_worker_init``); ``GET /ready``
+reports it.
+
+Graceful reload: ``kill -HUP <master>`` starts new workers with the new
+configuration and stops the old ones once their in-flight requests are
+done. Because the app is preloaded, new code is picked up with
+``kill -USR2 <master>`` (starts a new master) followed by ``kill -TERM``
+of the old master.
+
+Usage:
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import math
+import os
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+
+
+def _env_bool(name, default):
+    """Read a boolean flag from the environment."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def available_cpus(cpu_max_path=CGROUP_CPU_MAX):
+    """
+    Return the number of CPUs this process may actually use.
+
+    Honors the CPU affinity mask and, in containers, the cgroup v2 quota
+    (``cpu.max``), which ``os.cpu_count()`` ignores.
+
+    Args:
+        cpu_max_path (str): Location of the cgroup ``cpu.max`` file.
+
+    Returns:
+        int: At least 1.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open(cpu_max_path, encoding='utf-8') as fh:
+            quota, period = fh.read().split()
+        if quota != 'max':
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def default_workers(cpus=None):
+    """
+    Size the worker pool from the CPU count.
+
+    Args:
+        cpus (int, optional): CPU count; detected when omitted.
+
+    Returns:
+        int: ``2 * cpus + 1`` worker processes.
+    """
+    return 2 * (cpus or available_cpus()) + 1
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+workers = int(os.environ.get('GUNICORN_WORKERS') or default_workers())
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+warmup = _env_bool('GUNICORN_WARMUP', True)
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Recycling workers bounds the impact of slow leaks; the jitter avoids all
+# workers restarting at the same moment.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '10000'))
+max_requests_jitter = max_requests // 10
+
+# Heartbeat files in memory rather than on a possibly slow container disk.
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
+
+def when_ready(server):
+    """
+    Warm the preloaded application and freeze it before the first fork.
+
+    Args:
+        server (gunicorn.arbiter.Arbiter): The master process.
+    """
+    if not (preload_app and warmup):
+        return
+    # Imported here: the application is only importable once gunicorn has
+    # set up the environment and loaded it.
+    from app.warmup import preload  # pylint: disable=import-outside-toplevel
+    preload(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    """
+    Open the worker's pooled connections before it accepts requests.
+
+    The worker reports ready on ``GET /ready`` once this is done.
+
+    Args:
+        worker (gunicorn.workers.base.Worker): The initialized worker.
+    """
+    # pylint: disable=import-outside-toplevel
+    from app.warmup import warm_worker
+    warm_worker(worker.wsgi)
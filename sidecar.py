@@ -0,0 +1,28 @@
+"""
+sidecar.py
+----------
+
+Entry point of the Unix socket verification sidecar (see app/sidecar.py).
+
+The Flask application is built by ``wsgi.py`` (same environment detection
+and .env files); the sidecar verifies tokens with its configuration and
+extensions, on ``SIDECAR_SOCKET``, until interrupted.
+
+Usage:
+    SIDECAR_SOCKET=/run/pm-auth/verify.sock python sidecar.py
+"""
+
+from app.logger import logger
+from app.sidecar import VerifySidecar
+from wsgi import app
+
+if __name__ == '__main__':
+    server = VerifySidecar(app)
+    logger.info("Verification sidecar listening on %s",
+                app.config['SIDECAR_SOCKET'])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -10,6 +10,7 @@ os.environ['FLASK_ENV'] = 'testing'
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env.test'))
 from app import create_app
 from app.models import db
+from benchmarks.user_service import DEFAULT_INTERNAL_TOKEN, UserServiceEmulator
 
 @fixture
 def app():
@@ -32,3 +33,19 @@ def client(app):
 def session(app):
     with app.app_context():
         yield db.session
+
+@fixture
+def user_service(monkeypatch):
+    """
+    Fixture running the fault-injecting user-service emulator.
+
+    The environment is switched to production so that check_credentials
+    calls the emulator over HTTP instead of returning the local stub.
+    Tune faults through ``user_service.faults``.
+    """
+    emulator = UserServiceEmulator(seed=0).start()
+    monkeypatch.setenv('FLASK_ENV', 'production')
+    monkeypatch.setenv('USER_SERVICE_URL', emulator.url)
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', DEFAULT_INTERNAL_TOKEN)
+    yield emulator
+    emulator.stop()
@@ -0,0 +1,211 @@
+"""
+test_asgi.py
+------------
+Tests for the ASGI deployment mode: login on the event loop must answer
+exactly like LoginResource, every other request must reach Flask, and
+pending logins must not block each other.
+"""
+import asyncio
+import time
+
+import jwt
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('aiohttp')
+pytest.importorskip('aiosqlite')
+pytest.importorskip('greenlet')
+
+# pylint: disable=wrong-import-position
+from app import create_app
+from app.asgi import async_database_url, create_asgi_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.refresh_token import RefreshToken
+from benchmarks.user_service import BAD_PASSWORD
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """Flask application on a SQLite file, shared with the async engine."""
+    class FileConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'auth.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.drop_all()
+
+
+def asgi_requests(app, calls):
+    """Send ``(method, path, kwargs)`` calls concurrently to the ASGI app."""
+    asgi_app = create_asgi_app(app)
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport,
+                                     base_url='http://localhost') as client:
+            try:
+                return await asyncio.gather(*(
+                    client.request(method, path, **kwargs)
+                    for method, path, kwargs in calls))
+            finally:
+                await asgi_app.aclose()
+
+    return asyncio.run(run())
+
+
+def cookie_attributes(header):
+    """Return a Set-Cookie header without the cookie value."""
+    name_value, _, attributes = header.partition(';')
+    return name_value.split('=', 1)[0], attributes
+
+
+def test_login_matches_login_resource(file_app, user_service):
+    """A successful login answers like Flask and issues working tokens."""
+    body = {'email': 'user1@example.com', 'password': 'secret'}
+    expected = file_app.test_client().post('/login', json=body)
+    (response,) = asgi_requests(file_app, [('POST', '/login', {'json': body})])
+
+    assert response.status_code == expected.status_code == 200
+    assert response.content == expected.data
+    assert response.headers['content-type'] == expected.headers['Content-Type']
+    cookies = response.headers.get_list('set-cookie')
+    # Expiry dates may differ by a second between the two logins.
+    assert ([cookie_attributes(c)[0] for c in cookies]
+            == [cookie_attributes(c)[0]
+                for c in expected.headers.getlist('Set-Cookie')])
+    assert all('HttpOnly' in c and 'Secure' in c and 'SameSite=Strict' in c
+               for c in cookies)
+
+    payload = jwt.decode(response.cookies['access_token'],
+                         options={'verify_signature': False})
+    assert payload['email'] == body['email']
+    with file_app.app_context():
+        stored = RefreshToken.query.filter_by(
+            token=response.cookies['refresh_token']).one()
+        assert stored.user_id == payload['sub']
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'email': 'user1@example.com', 'password': BAD_PASSWORD}},
+    {'json': {'email': 'user1@example.com'}},
+    {'json': {}},
+    {'content': b'null', 'headers': {'Content-Type': 'application/json'}},
+    {'content': b'{"email": ', 'headers': {'Content-Type': 'application/json'}},
+    {'content': b'email=a', 'headers': {'Content-Type': 'text/plain'}},
+])
+def test_login_errors_match_login_resource(file_app, user_service, kwargs):
+    """Rejected and malformed logins answer exactly like Flask."""
+    flask_kwargs = dict(kwargs)
+    if 'content' in flask_kwargs:
+        flask_kwargs['data'] = flask_kwargs.pop('content')
+    expected = file_app.test_client().post('/login', **flask_kwargs)
+    (response,) = asgi_requests(file_app, [('POST', '/login', kwargs)])
+    assert response.status_code == expected.status_code
+    assert response.content == expected.data
+
+
+def test_upstream_errors_reject_login(file_app, user_service):
+    """User-service failures are rejected with a 401, as in sync mode."""
+    user_service.faults.error_rate = 1.0
+    (response,) = asgi_requests(file_app, [(
+        'POST', '/login',
+        {'json': {'email': 'user1@example.com', 'password': 'secret'}})])
+    assert response.status_code == 401
+    assert response.json() == {'message': 'Invalid email or password'}
+
+
+def test_other_requests_are_served_by_flask(file_app):
+    """Requests other than POST /login go through the WSGI bridge."""
+    client = file_app.test_client()
+    responses = asgi_requests(file_app, [
+        ('GET', '/version', {}),
+        ('GET', '/verify', {}),
+        ('GET', '/missing', {}),
+    ])
+    for response, path in zip(responses, ('/version', '/verify', '/missing')):
+        expected = client.get(path)
+        assert response.status_code == expected.status_code
+        assert response.content == expected.data
+
+
+def test_login_falls_back_to_flask_on_error(file_app, user_service,
+                                            monkeypatch):
+    """An unexpected error on the event loop is retried by Flask."""
+    async def broken_login(self, data):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr('app.asgi.AuthASGIApp.login', broken_login)
+    (response,) = asgi_requests(file_app, [(
+        'POST', '/login',
+        {'json': {'email': 'user1@example.com', 'password': 'secret'}})])
+    assert response.status_code == 200
+    assert 'access_token' in response.cookies
+
+
+def test_pending_logins_do_not_block(file_app, user_service):
+    """Concurrent logins wait on the user service together."""
+    user_service.faults.latency = 'fixed:200'
+    count = 50
+    started = time.perf_counter()
+    responses = asgi_requests(file_app, [
+        ('POST', '/login',
+         {'json': {'email': f'user{i}@example.com', 'password': 'secret'}})
+        for i in range(count)])
+    elapsed = time.perf_counter() - started
+    assert [r.status_code for r in responses] == [200] * count
+    # Serialized, the logins would take count * 200 ms = 10 s.
+    assert elapsed < 3.0
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('sqlite:////tmp/auth.db', 'sqlite+aiosqlite:////tmp/auth.db'),
+    ('postgresql://u:p@db/auth', 'postgresql+asyncpg://u:p@db/auth'),
+    ('postgresql+psycopg2://u:p@db/auth', 'postgresql+asyncpg://u:p@db/auth'),
+    ('postgresql+psycopg://u:p@db/auth', 'postgresql+psycopg://u:p@db/auth'),
+])
+def test_async_database_url(url, expected):
+    """Sync drivers are replaced by their async counterparts."""
+    assert async_database_url(url).render_as_string(
+        hide_password=False) == expected
+
+
+def test_async_database_url_rejects_memory_sqlite():
+    """In-memory SQLite cannot be shared between the two engines."""
+    with pytest.raises(ValueError):
+        async_database_url('sqlite:///:memory:')
+
+
+def test_login_with_database_backend(tmp_path):
+    """Logins are checked by the configured credential backend."""
+    from sqlalchemy import create_engine, text  # pylint: disable=import-outside-toplevel
+    from werkzeug.security import generate_password_hash  # pylint: disable=import-outside-toplevel
+
+    url = f"sqlite:///{tmp_path / 'auth.db'}"
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE users (id TEXT, email TEXT, '
+                          'company_id TEXT, hashed_password TEXT)'))
+        conn.execute(text("INSERT INTO users VALUES ('u-1', 'a@b.c', 'c-1', "
+                          ":hashed)"), {'hashed': generate_password_hash(
+                              'secret', method='pbkdf2:sha256:1000')})
+    engine.dispose()
+
+    class DatabaseConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = url
+        CREDENTIAL_BACKEND = 'database'
+
+    app = create_app(DatabaseConfig)
+    with app.app_context():
+        db.create_all()
+    responses = asgi_requests(app, [
+        ('POST', '/login', {'json': {'email': 'a@b.c', 'password': password}})
+        for password in ('secret', BAD_PASSWORD)])
+    app.extensions['credentials'].close()
+    assert [r.status_code for r in responses] == [200, 401]
+    payload = jwt.decode(responses[0].cookies['access_token'],
+                         options={'verify_signature': False})
+    assert payload['sub'] == 'u-1'
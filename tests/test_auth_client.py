@@ -0,0 +1,239 @@
+"""
+test_auth_client.py
+-------------------
+This module contains tests for the local-verification client library
+(auth_client) and the GET /revocations feed it syncs from, against the
+application served on a local port.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from werkzeug.serving import make_server
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.tokens import (
+    CLAIM_PROFILES,
+    COMPACT_KEYS,
+    compact_claims,
+    expand_claims,
+    issue_access_token,
+)
+from auth_client import AuthClient, AuthServiceUnavailable, TokenRejected
+from auth_client import claims as client_claims
+from benchmarks.loadgen import free_port
+
+INTERNAL_TOKEN = 'test-internal-token'
+CLAIMS = {'sub': 'u-1', 'email': 'user@example.com', 'company_id': 'c-1'}
+
+
+def access_token(claims=None, issued=None, profile='full'):
+    """Issue an access token for `CLAIMS`."""
+    return issue_access_token(claims or CLAIMS, os.environ['JWT_SECRET'],
+                              issued, profile)[0]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    """Serve the application on a local port; yield its URL."""
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', INTERNAL_TOKEN)
+    url = f"sqlite:///{tmp_path / 'auth.db'}"
+    application = create_app(type('FileConfig', (TestingConfig,),
+                                  {'SQLALCHEMY_DATABASE_URI': url}))
+    with application.app_context():
+        db.create_all()
+    server = make_server('127.0.0.1', 0, application, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+
+
+def make_client(base_url, **kwargs):
+    """Create a client of the served application."""
+    return AuthClient(base_url, os.environ['JWT_SECRET'], INTERNAL_TOKEN,
+                      **kwargs)
+
+
+def revoke(client, base_url, token):
+    """Log a token out through the service."""
+    response = client.session.post(
+        f'{base_url}/logout',
+        cookies={'access_token': token, 'refresh_token': 'unknown'})
+    assert response.status_code == 200
+
+
+def test_claims_mirror_the_service():
+    """
+    Test that the client expands every claim profile like the service.
+    """
+    assert client_claims.COMPACT_KEYS == COMPACT_KEYS
+    full = {'sub': '0f8fad5b-d9cb-469f-a165-70867728950e',
+            'company_id': '7c9e6679-7425-40de-944b-e07fc1f90ae7',
+            'email': 'user@example.com', 'auth_time': 1, 'roles': ['admin'],
+            'permissions': ['read']}
+    for profile in CLAIM_PROFILES:
+        payload = {**compact_claims(full, profile), 'exp': 2}
+        assert client_claims.expand_claims(payload) == expand_claims(payload)
+
+
+def test_revocations_requires_internal_token(client, monkeypatch):
+    """
+    Test that the feed refuses callers without the internal token.
+    """
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', INTERNAL_TOKEN)
+    assert client.get('/revocations').status_code == 403
+    for since in ('x', 'nan', 'inf', '-inf', '1e20', '-1e20'):
+        response = client.get(f'/revocations?since={since}',
+                              headers={'X-Internal-Token': INTERNAL_TOKEN})
+        assert response.status_code == 400
+        assert response.json == {'message': 'since must be a number'}
+
+
+def test_revocations_full_and_incremental(client, monkeypatch):
+    """
+    Test the full read and the incremental read after a logout.
+    """
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', INTERNAL_TOKEN)
+    headers = {'X-Internal-Token': INTERNAL_TOKEN}
+    first = client.get('/revocations', headers=headers).json
+    assert first['full'] is True
+    assert first['revocations'] == []
+
+    client.set_cookie('access_token', access_token())
+    client.set_cookie('refresh_token', 'unknown')
+    assert client.post('/logout').status_code == 200
+    later = client.get(f"/revocations?since={first['cursor']}",
+                       headers=headers).json
+    assert later['full'] is False
+    assert len(later['revocations']) == 1
+    assert later['revocations'][0]['exp'] > time.time()
+    assert later['cursor'] >= first['cursor']
+
+
+def test_local_verification(service):
+    """
+    Test that a synced client verifies tokens without the service.
+    """
+    auth = make_client(service)
+    assert auth.sync()
+    token = access_token()
+    expected = auth.session.get(f'{service}/verify',
+                                cookies={'access_token': token}).json()
+    assert auth.verify(token) == expected
+    assert auth.verify(token) == expected
+    metrics = auth.metrics()
+    assert metrics['hits'] == 2
+    assert metrics['misses'] == 0
+    assert metrics['local'] == 1 and metrics['cached'] == 1
+
+
+def test_revocation_propagates(service):
+    """
+    Test that a logout reaches the client at its next sync, including for
+    tokens it already cached.
+    """
+    auth = make_client(service)
+    auth.sync()
+    token = access_token()
+    auth.verify(token)
+    revoke(auth, service, token)
+    assert auth.verify(token)['valid'] is True
+    assert auth.sync()
+    assert len(auth.revocations) == 1
+    with pytest.raises(TokenRejected) as error:
+        auth.verify(token)
+    assert error.value.message == 'Token revoked'
+
+
+def test_stale_revocations_fall_back_to_the_service(service):
+    """
+    Test that without a recent sync verifications go to GET /verify.
+    """
+    auth = make_client(service, max_lag=30)
+    token = access_token()
+    assert auth.verify(token)['user_id'] == 'u-1'
+    revoke(auth, service, token)
+    with pytest.raises(TokenRejected) as error:
+        auth.verify(token)
+    assert error.value.message == 'Token revoked'
+    assert auth.metrics()['misses'] == 2
+    assert auth.metrics()['rejected'] == 1
+
+
+def test_minimal_tokens_are_verified_remotely(service):
+    """
+    Test that tokens without an email are resolved by the service once.
+    """
+    auth = make_client(service)
+    auth.sync()
+    token = access_token(profile='minimal')
+    assert auth.verify(token)['user_id'] == 'u-1'
+    assert auth.verify(token)['user_id'] == 'u-1'
+    assert auth.metrics()['remote'] == 1
+    assert auth.metrics()['cached'] == 1
+
+
+def test_local_rejections(service):
+    """
+    Test that expired and malformed tokens are rejected in-process.
+    """
+    auth = make_client(service)
+    auth.sync()
+    issued = datetime.now(timezone.utc) - timedelta(hours=1)
+    for token, message in ((access_token(issued=issued), 'Token expired'),
+                           ('not-a-jwt', 'Invalid token'),
+                           ('', 'Missing access token')):
+        with pytest.raises(TokenRejected) as error:
+            auth.verify(token)
+        assert error.value.message == message
+    assert auth.metrics()['remote'] == 0
+
+
+def test_foreign_signature(service):
+    """
+    Test that a token signed with another key is checked remotely, then
+    rejected.
+    """
+    auth = make_client(service)
+    auth.sync()
+    token = issue_access_token(CLAIMS, 'another-secret')[0]
+    with pytest.raises(TokenRejected) as error:
+        auth.verify(token)
+    assert error.value.message == 'Invalid token'
+    assert auth.metrics()['remote'] == 1
+
+
+def test_service_unavailable():
+    """
+    Test that verifications needing an unreachable service raise, and that
+    failed syncs are counted.
+    """
+    auth = make_client(f'http://127.0.0.1:{free_port()}', timeout=0.5)
+    assert not auth.sync()
+    assert auth.metrics()['sync_errors'] == 1
+    with pytest.raises(AuthServiceUnavailable):
+        auth.verify(access_token())
+
+
+def test_background_sync(service):
+    """
+    Test that the sync thread follows logouts.
+    """
+    auth = make_client(service, sync_interval=0.05)
+    auth.start()
+    try:
+        token = access_token()
+        jti = jwt.decode(token, options={'verify_signature': False})['jti']
+        revoke(auth, service, token)
+        deadline = time.monotonic() + 5
+        while not auth.revocations.contains(jti):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        auth.stop()
+    assert auth.metrics()['syncs'] >= 2
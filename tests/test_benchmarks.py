@@ -0,0 +1,136 @@
+"""
+test_benchmarks.py
+------------------
+This module contains tests for the benchmark helpers: percentile summaries,
+the regression comparison and a smoke run of the endpoint suite.
+"""
+import json
+
+from benchmarks import (
+    client_verify,
+    compare,
+    group_commit,
+    sidecar,
+    token_profiles,
+)
+from benchmarks.common import compare_results, percentile, summarize_latencies
+from benchmarks.endpoints import SCENARIOS, run_suite
+
+
+def make_document(throughput, p95):
+    """Build a minimal result document for comparisons."""
+    return {'results': {'verify': {
+        'throughput_rps': throughput,
+        'latency_ms': {'mean': 1.0, 'max': 5.0, 'p50': 1.0, 'p95': p95},
+    }}}
+
+
+def test_percentile_interpolates():
+    """
+    Test percentile computation on a small sorted sample.
+    """
+    values = [1, 2, 3, 4]
+    assert percentile(values, 0) == 1
+    assert percentile(values, 50) == 2.5
+    assert percentile(values, 100) == 4
+    assert percentile([], 99) == 0.0
+    summary = summarize_latencies([3.0, 1.0, 2.0])
+    assert summary['p50'] == 2.0
+    assert summary['max'] == 3.0
+
+
+def test_compare_flags_regressions():
+    """
+    Test that throughput drops and latency increases beyond the threshold
+    are flagged, and smaller changes are not.
+    """
+    baseline = make_document(1000, 2.0)
+    rows = compare_results(baseline, make_document(950, 2.1), 0.10)
+    assert not any(row['regression'] for row in rows)
+
+    rows = compare_results(baseline, make_document(800, 3.0), 0.10)
+    flagged = {row['metric'] for row in rows if row['regression']}
+    assert flagged == {'throughput_rps', 'latency_p95_ms'}
+
+
+def test_compare_cli_exit_status(tmp_path):
+    """
+    Test that the compare command exits non-zero on regression.
+    """
+    base = tmp_path / 'base.json'
+    good = tmp_path / 'good.json'
+    bad = tmp_path / 'bad.json'
+    base.write_text(json.dumps(make_document(1000, 2.0)))
+    good.write_text(json.dumps(make_document(1010, 1.9)))
+    bad.write_text(json.dumps(make_document(500, 2.0)))
+    assert compare.main([str(base), str(good)]) == 0
+    assert compare.main([str(base), str(bad)]) == 1
+
+
+def test_endpoint_suite_smoke():
+    """
+    Test a tiny run of the endpoint suite against in-memory SQLite.
+
+    Every scenario must run, return the expected statuses for its token mix
+    and produce a complete summary.
+    """
+    meta, results = run_suite('sqlite:///:memory:', iterations=40, warmup=5)
+    assert meta['database'] == 'sqlite'
+    assert set(results) == set(SCENARIOS)
+    for summary in results.values():
+        assert summary['requests'] == 40
+        assert summary['errors'] == 0
+        assert summary['throughput_rps'] > 0
+        assert set(summary['latency_ms']) >= {'p50', 'p95', 'p99'}
+
+
+def test_token_profiles_smoke():
+    """
+    Test a tiny run of the claim profile benchmark: compact profiles must
+    produce smaller tokens that /verify accepts.
+    """
+    _, results = token_profiles.run('sqlite:///:memory:', users=5,
+                                    iterations=20)
+    assert set(results) == set(token_profiles.PROFILES)
+    assert all(summary['errors'] == 0 for summary in results.values())
+    assert (results['full']['token_bytes'] > results['compact']['token_bytes']
+            > results['minimal']['token_bytes'])
+
+
+def test_client_verify_smoke():
+    """
+    Test a tiny run of the client library benchmark: in-process modes must
+    not reach the service, and beat the remote round trip per core.
+    """
+    _, results = client_verify.run(users=5, iterations=50)
+    assert set(results) == set(client_verify.MODES)
+    assert all(summary['errors'] == 0 for summary in results.values())
+    assert results['cached']['client']['misses'] == 0
+    assert results['local']['client']['misses'] == 0
+    assert results['remote']['client']['misses'] == 50
+    assert (results['local']['verifications_per_cpu_second']
+            > results['remote']['verifications_per_cpu_second'])
+
+
+def test_sidecar_smoke():
+    """
+    Test a tiny run of the sidecar benchmark: every transport verifies
+    every token.
+    """
+    _, results = sidecar.run(users=5, iterations=40, depth=8)
+    assert set(results) == set(sidecar.TRANSPORTS)
+    for summary in results.values():
+        assert summary['requests'] == 40
+        assert summary['errors'] == 0
+
+
+def test_group_commit_smoke():
+    """
+    Test a tiny run of the group commit benchmark: every login succeeds,
+    and logins share commits with group commit on.
+    """
+    _, results = group_commit.run(threads=4, duration=0.3, max_wait_ms=20)
+    assert set(results) == set(group_commit.MODES)
+    assert all(summary['errors'] == 0 for summary in results.values())
+    assert results['off']['mean_batch'] == 1.0
+    assert results['on']['mean_batch'] > 1.0
@@ -0,0 +1,245 @@
+"""
+test_credentials.py
+-------------------
+This module contains tests for the credential backends: a contract shared by
+every backend, and the direct-database backend's bounded hashing.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine, text
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from app.config import TestingConfig
+from app.credentials import create_backend
+from app.credentials.database import DatabaseBackend
+from app.credentials.stub import StubBackend
+from app.credentials.user_service import UserServiceBackend
+from app.models import db
+from benchmarks.user_service import BAD_PASSWORD
+
+EMAIL = 'ada@example.com'
+PASSWORD = 'correct horse'
+# Cheap hashes keep the tests fast.
+HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def user_engine(tmp_path):
+    """A SQLite user table holding `EMAIL` with `PASSWORD`."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE users (id TEXT PRIMARY KEY, '
+                          'email TEXT UNIQUE, company_id TEXT, '
+                          'hashed_password TEXT)'))
+        conn.execute(text('INSERT INTO users VALUES (:id, :email, :company, '
+                          ':hashed)'),
+                     {'id': 'u-1', 'email': EMAIL, 'company': 'c-1',
+                      'hashed': generate_password_hash(PASSWORD,
+                                                       method=HASH_METHOD)})
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(params=['stub', 'user_service', 'database'])
+def backend(request, user_engine):
+    """Every credential backend, with a user it accepts."""
+    if request.param == 'stub':
+        instance = StubBackend()
+    elif request.param == 'user_service':
+        request.getfixturevalue('user_service')
+        instance = UserServiceBackend()
+    else:
+        instance = DatabaseBackend(user_engine, workers=2, queue=8)
+    yield instance
+    instance.close()
+
+
+def test_valid_credentials(backend):
+    """
+    Test that valid credentials return the user.
+    """
+    user = backend.check(EMAIL, PASSWORD)
+    assert user['email'] == EMAIL
+    assert user['id']
+
+
+def test_wrong_password(backend):
+    """
+    Test that a wrong password is refused.
+    """
+    if not backend.verifies_passwords:
+        pytest.skip('The backend accepts any password')
+    assert backend.check(EMAIL, BAD_PASSWORD) is None
+
+
+def test_concurrent_checks(backend):
+    """
+    Test that concurrent checks all succeed.
+    """
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        users = list(pool.map(lambda _: backend.check(EMAIL, PASSWORD),
+                              range(8)))
+    assert all(user and user['email'] == EMAIL for user in users)
+
+
+def test_async_matches_sync(backend):
+    """
+    Test that check_async answers as check does.
+    """
+    async def both():
+        return (await backend.check_async(EMAIL, PASSWORD),
+                await backend.check_async(EMAIL, BAD_PASSWORD))
+
+    valid, invalid = asyncio.run(both())
+    assert valid == backend.check(EMAIL, PASSWORD)
+    assert invalid == backend.check(EMAIL, BAD_PASSWORD)
+
+
+def test_database_unknown_email(user_engine):
+    """
+    Test that an unknown email is refused after a dummy hash check.
+    """
+    backend = DatabaseBackend(user_engine)
+    backend.check(EMAIL, PASSWORD)
+    assert backend.check('nobody@example.com', PASSWORD) is None
+    assert list(backend._dummies) == [HASH_METHOD]  # pylint: disable=protected-access
+    backend.close()
+
+
+@pytest.mark.parametrize('hashed', [None, '', 'not-a-hash', 'bogus$salt$hash'])
+def test_database_unusable_hash(user_engine, hashed):
+    """
+    Test that a user whose hash is missing or malformed is refused.
+    """
+    with user_engine.begin() as conn:
+        conn.execute(text('UPDATE users SET hashed_password = :hashed'),
+                     {'hashed': hashed})
+    backend = DatabaseBackend(user_engine)
+    assert backend.check(EMAIL, PASSWORD) is None
+    assert asyncio.run(backend.check_async(EMAIL, PASSWORD)) is None
+    backend.close()
+
+
+def test_database_dummy_hash_in_pool(user_engine, monkeypatch):
+    """
+    Test that the dummy hash is built by a hashing thread.
+    """
+    threads = []
+
+    def recording_hash(password, method):
+        threads.append(threading.current_thread().name)
+        return generate_password_hash(password, method=method)
+
+    monkeypatch.setattr('app.credentials.database.generate_password_hash',
+                        recording_hash)
+    backend = DatabaseBackend(user_engine)
+    backend.check(EMAIL, PASSWORD)
+    assert backend.check('nobody@example.com', PASSWORD) is None
+    assert len(threads) == 1
+    assert threads[0].startswith('credential-hash')
+    backend.close()
+
+
+def test_database_user_fields(user_engine):
+    """
+    Test the user returned by the database backend.
+    """
+    backend = DatabaseBackend(user_engine)
+    assert backend.check(EMAIL, PASSWORD) == {
+        'id': 'u-1', 'email': EMAIL, 'company_id': 'c-1'}
+    backend.close()
+
+
+def test_database_rejects_when_saturated(user_engine, monkeypatch):
+    """
+    Test that checks beyond the hashing queue fail at once.
+    """
+    release = threading.Event()
+
+    def slow_check(hashed, password):  # pylint: disable=unused-argument
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr('app.credentials.database.check_password_hash',
+                        slow_check)
+    backend = DatabaseBackend(user_engine, workers=1, queue=1)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        pending = [pool.submit(backend.check, EMAIL, PASSWORD)
+                   for _ in range(2)]
+        while backend._slots._value:  # pylint: disable=protected-access
+            time.sleep(0.001)
+        assert backend.check(EMAIL, PASSWORD) is None
+        release.set()
+        assert all(future.result() for future in pending)
+    assert backend.summary()['rejected'] == 1
+    backend.close()
+
+
+def test_database_timeout(user_engine, monkeypatch):
+    """
+    Test that a check waiting past the timeout fails.
+    """
+    release = threading.Event()
+    monkeypatch.setattr('app.credentials.database.check_password_hash',
+                        lambda hashed, password: release.wait(5))
+    backend = DatabaseBackend(user_engine, workers=1, timeout=0.05)
+    assert backend.check(EMAIL, PASSWORD) is None
+    release.set()
+    assert backend.timeouts == 1
+    backend.close()
+
+
+def test_database_lookup_error(tmp_path):
+    """
+    Test that a missing user table fails the check.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    backend = DatabaseBackend(engine)
+    assert backend.check(EMAIL, PASSWORD) is None
+    assert backend.errors == 1
+    backend.close()
+
+
+def test_login_with_database_backend(user_engine):
+    """
+    Test POST /login with CREDENTIAL_BACKEND=database.
+    """
+    config = type('CredentialConfig', (TestingConfig,), {
+        'CREDENTIAL_BACKEND': 'database',
+        'CREDENTIAL_DATABASE_URL': str(user_engine.url),
+    })
+    application = create_app(config)
+    with application.app_context():
+        db.create_all()
+        client = application.test_client()
+        response = client.post('/login', json={'email': EMAIL,
+                                               'password': PASSWORD})
+        assert response.status_code == 200
+        response = client.post('/login', json={'email': EMAIL,
+                                               'password': BAD_PASSWORD})
+        assert response.status_code == 401
+        metrics = client.get('/metrics').json
+        db.drop_all()
+    application.extensions['credentials'].close()
+    assert metrics['credentials']['backend'] == 'database'
+
+
+def test_backend_selection(monkeypatch):
+    """
+    Test that unknown backends, and the stub in production, are refused.
+    """
+    application = create_app(TestingConfig)
+    assert application.extensions['credentials'].name == 'auto'
+    application.config['CREDENTIAL_BACKEND'] = 'ldap'
+    with pytest.raises(ValueError):
+        create_backend(application)
+    application.config['CREDENTIAL_BACKEND'] = 'stub'
+    assert create_backend(application).name == 'stub'
+    monkeypatch.setenv('FLASK_ENV', 'production')
+    with pytest.raises(ValueError):
+        create_backend(application)
@@ -0,0 +1,216 @@
+"""
+test_fastpath.py
+----------------
+This module contains tests for the GET /verify WSGI fast path: responses
+must be byte-for-byte those of VerifyResource (database failures included),
+other requests and unexpected failures must go through Flask, and request
+spans must still be recorded.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from werkzeug.test import Client
+
+from app import create_app, fastpath
+from app.config import TestingConfig
+from app.fastpath import VerifyFastPath
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.tokens import issue_access_token
+from app.tracing import tracer
+from app.verification import check_access_token
+from tests.test_verify import make_access_token
+
+REVOKED_JTI = 'revoked-jti'
+
+
+class FastPathConfig(TestingConfig):
+    """Testing configuration with the /verify fast path enabled."""
+    VERIFY_FAST_PATH = True
+
+
+class TracedFastPathConfig(FastPathConfig):
+    """Fast path with the in-memory span exporter."""
+    TRACING_ENABLED = True
+    TRACING_EXPORTER = 'memory'
+    TRACING_FLUSH_INTERVAL = 0.01
+
+
+def build(config):
+    """Create an application with the revoked token in its database."""
+    application = create_app(config)
+    with application.app_context():
+        db.create_all()
+        db.session.add(TokenBlacklist(
+            jti=REVOKED_JTI, user_id='1', company_id='42',
+            expires_at=datetime.now(timezone.utc) + timedelta(minutes=15)))
+        db.session.commit()
+    return application
+
+
+@pytest.fixture
+def apps():
+    """A fast-path application and a reference one, on identical data."""
+    fast, reference = build(FastPathConfig), build(TestingConfig)
+    yield fast, reference
+    for application in (fast, reference):
+        with application.app_context():
+            db.drop_all()
+
+
+def raw_get(application, path='/verify', cookie=None, method='GET'):
+    """Send a request and return status line, headers and body."""
+    client = Client(application, use_cookies=False)
+    headers = {'Cookie': cookie} if cookie is not None else {}
+    response = client.open(path, method=method, headers=headers)
+    return response.status, sorted(response.headers.items()), response.data
+
+
+def no_jti_token():
+    """A correctly signed token without a JTI."""
+    return jwt.encode(
+        {'sub': '1', 'exp': datetime.now(timezone.utc) + timedelta(minutes=5)},
+        os.environ['JWT_SECRET'], algorithm='HS256')
+
+
+def role_token(profile='full'):
+    """A token carrying role and permission claims."""
+    return issue_access_token(
+        {'sub': 'u1', 'email': 'a@b', 'company_id': 'c1',
+         'roles': ['admin'], 'permissions': ['x']},
+        os.environ['JWT_SECRET'], profile=profile)[0]
+
+
+COOKIES = {
+    'no cookie': lambda: None,
+    'empty cookie header': lambda: '',
+    'other cookies only': lambda: 'session=abc; theme=dark',
+    'empty token': lambda: 'access_token=',
+    'garbage token': lambda: 'access_token=not-a-jwt',
+    'wrong secret': lambda: 'access_token=' + make_access_token(
+        secret='another-secret-key-0123456789abcdef'),
+    'expired': lambda: 'access_token=' + make_access_token(expired=True),
+    'revoked': lambda: 'access_token=' + make_access_token(jti=REVOKED_JTI),
+    'no jti': lambda: 'access_token=' + no_jti_token(),
+    'valid': lambda: 'access_token=' + make_access_token(),
+    'valid among others': lambda: 'a=1; access_token=' + make_access_token()
+                                  + '; b=2',
+    'quoted value': lambda: 'access_token="' + make_access_token() + '"',
+    'duplicate cookie': lambda: 'access_token=' + make_access_token()
+                                + '; access_token=garbage',
+    'unicode and null claims': lambda: 'access_token=' + make_access_token(
+        email='zoë@exämple.com', company_id=None),
+    'integer and nested claims': lambda: 'access_token=' + make_access_token(
+        user_id=7, company_id={'b': 1, 'a': [1, 2]}),
+    'role claims': lambda: 'access_token=' + role_token(),
+    'compact role claims': lambda: 'access_token=' + role_token('compact'),
+}
+
+
+@pytest.mark.parametrize('case', COOKIES)
+def test_fast_path_matches_resource(apps, case):
+    """
+    Test that the fast path answers exactly like VerifyResource.
+    """
+    fast, reference = apps
+    assert isinstance(fast.wsgi_app, VerifyFastPath)
+    assert not isinstance(reference.wsgi_app, VerifyFastPath)
+    cookie = COOKIES[case]()
+    assert raw_get(fast, cookie=cookie) == raw_get(reference, cookie=cookie)
+
+
+def test_fast_path_is_used(apps, monkeypatch):
+    """
+    Test that GET /verify does not reach the Flask application.
+    """
+    fast, _ = apps
+    monkeypatch.setattr(fast.wsgi_app, 'wsgi_app',
+                        lambda environ, start_response: pytest.fail('Flask'))
+    status, _, _ = raw_get(fast, cookie='access_token=' + make_access_token())
+    assert status == '200 OK'
+
+
+@pytest.mark.parametrize('path, method', [
+    ('/verify', 'HEAD'),
+    ('/verify', 'POST'),
+    ('/verify/', 'GET'),
+    ('/version', 'GET'),
+    ('/missing', 'GET'),
+])
+def test_other_requests_go_through_flask(apps, path, method):
+    """
+    Test that every other request is delegated unchanged.
+    """
+    fast, reference = apps
+    cookie = 'access_token=' + make_access_token()
+    assert (raw_get(fast, path, cookie, method)
+            == raw_get(reference, path, cookie, method))
+
+
+def test_database_failure_answers_503(monkeypatch):
+    """
+    Test that a database failure gets VerifyResource's 503 from the fast
+    path, checking the token once.
+    """
+    apps = [build(config) for config in (FastPathConfig, TestingConfig)]
+    for application in apps:
+        with application.app_context():
+            TokenBlacklist.__table__.drop(db.engine)
+    calls = []
+    monkeypatch.setattr(fastpath, 'check_access_token',
+                        lambda *args: calls.append(args)
+                        or check_access_token(*args))
+    cookie = 'access_token=' + make_access_token()
+    fast_response = raw_get(apps[0], cookie=cookie)
+    assert fast_response[0] == '503 SERVICE UNAVAILABLE'
+    assert fast_response == raw_get(apps[1], cookie=cookie)
+    assert len(calls) == 1
+
+
+def test_failure_falls_back_to_flask(apps, monkeypatch):
+    """
+    Test that an unexpected error hands the request to Flask.
+    """
+    fast, reference = apps
+
+    def failing_identity(*_):
+        raise RuntimeError('unexpected')
+
+    monkeypatch.setattr(fastpath, 'token_identity', failing_identity)
+    cookie = 'access_token=' + make_access_token()
+    fast_response = raw_get(fast, cookie=cookie)
+    assert fast_response[0] == '200 OK'
+    assert fast_response == raw_get(reference, cookie=cookie)
+
+
+def test_not_mounted_in_debug():
+    """
+    Test that debug mode keeps the Flask handler.
+    """
+    config = type('DebugFastPathConfig', (FastPathConfig,), {'DEBUG': True})
+    assert not isinstance(create_app(config).wsgi_app, VerifyFastPath)
+
+
+def test_fast_path_records_request_span():
+    """
+    Test that the fast path records the request, JWT and database spans.
+    """
+    application = build(TracedFastPathConfig)
+    try:
+        cookie = 'access_token=' + make_access_token()
+        status, _, _ = raw_get(application, cookie=cookie)
+        assert status == '200 OK'
+        processor = application.extensions['tracing']
+        assert processor.force_flush()
+        spans = {span['name']: span for span in processor.exporter.spans}
+        request_span = spans['GET /verify']
+        assert request_span['attributes']['http.status_code'] == 200
+        assert request_span['attributes']['http.endpoint'] == 'verifyresource'
+        assert spans['jwt.decode']['parent_id'] == request_span['span_id']
+        assert spans['db.statement']['trace_id'] == request_span['trace_id']
+    finally:
+        with application.app_context():
+            db.drop_all()
+        tracer.configure(None)
@@ -0,0 +1,226 @@
+"""
+test_forward_auth.py
+--------------------
+This module contains tests for GET /forward-auth: the identity headers and
+cache lifetime of its answers, and the nginx and Traefik configurations
+using it (run through nginx when it is installed).
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import yaml
+from werkzeug.serving import make_server
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.resources.forward_auth import IDENTITY_HEADERS, cache_control
+from app.tokens import issue_access_token
+from benchmarks.loadgen import free_port
+
+DEPLOY = Path(__file__).resolve().parent.parent / 'deploy'
+CLAIMS = {'sub': 'u-1', 'email': 'zoë@example.com', 'company_id': 'c-1'}
+
+
+def access_token(claims=None, issued=None):
+    """Issue an access token for `CLAIMS`."""
+    return issue_access_token(claims or CLAIMS, os.environ['JWT_SECRET'],
+                              issued)[0]
+
+
+def test_identity_headers(client):
+    """
+    Test that a valid token is answered 204 with the identity in headers.
+    """
+    client.set_cookie('access_token', access_token(
+        {**CLAIMS, 'roles': ['member', 'admin'], 'permissions': []}))
+    response = client.get('/forward-auth')
+    assert response.status_code == 204
+    assert response.data == b''
+    assert response.headers['X-Auth-User-Id'] == 'u-1'
+    assert response.headers['X-Auth-Company-Id'] == 'c-1'
+    assert response.headers['X-Auth-Email'] == 'zo%C3%AB@example.com'
+    assert response.headers['X-Auth-Roles'] == 'member,admin'
+    assert response.headers['X-Auth-Permissions'] == ''
+    assert response.headers['Cache-Control'] == 'max-age=5'
+    assert response.headers['Vary'] == 'Cookie'
+
+
+@pytest.mark.parametrize('token, message', [
+    (None, 'Missing access token'),
+    ('not-a-jwt', 'Invalid token'),
+])
+def test_rejections_are_not_cached(client, token, message):
+    """
+    Test that rejected tokens are answered 401 with no-store.
+    """
+    if token is not None:
+        client.set_cookie('access_token', token)
+    response = client.get('/forward-auth')
+    assert response.status_code == 401
+    assert response.json == {'message': message}
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_revoked_token(client):
+    """
+    Test that a token revoked by /logout is rejected.
+    """
+    token = access_token()
+    client.set_cookie('access_token', token)
+    assert client.get('/forward-auth').status_code == 204
+    client.set_cookie('refresh_token', 'unknown')
+    assert client.post('/logout').status_code == 200
+    client.set_cookie('access_token', token)
+    response = client.get('/forward-auth')
+    assert response.status_code == 401
+    assert response.json == {'message': 'Token revoked'}
+
+
+def test_database_failure_is_not_cached(client):
+    """
+    Test that a database failure is answered 503 with no-store.
+    """
+    TokenBlacklist.__table__.drop(db.engine)
+    client.set_cookie('access_token', access_token())
+    response = client.get('/forward-auth')
+    assert response.status_code == 503
+    assert response.json == {'message': 'Database unavailable'}
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_cache_control():
+    """
+    Test that max-age is capped by the token's lifetime and the bound.
+    """
+    assert cache_control(1000, 5, now=900) == 'max-age=5'
+    assert cache_control(1000, 60, now=997.5) == 'max-age=2'
+    assert cache_control(1000, 60, now=999.5) == 'no-store'
+    assert cache_control(1000, 0, now=900) == 'no-store'
+
+
+def test_expiring_token_lifetime(client):
+    """
+    Test the max-age of a token about to expire.
+    """
+    issued = datetime.now(timezone.utc) - timedelta(minutes=15, seconds=-3)
+    client.set_cookie('access_token', access_token(issued=issued))
+    response = client.get('/forward-auth')
+    assert response.status_code == 204
+    assert response.headers['Cache-Control'] in ('max-age=2', 'max-age=1',
+                                                 'no-store')
+
+
+def test_nginx_configuration_matches_the_endpoint():
+    """
+    Test that the nginx configuration forwards every identity header.
+    """
+    config = (DEPLOY / 'nginx' / 'forward-auth.conf').read_text()
+    assert 'proxy_pass http://auth_service/forward-auth;' in config
+    assert 'proxy_cache_key $cookie_access_token;' in config
+    forwarded = set(re.findall(r'\$upstream_http_(x_auth_\w+)', config))
+    assert forwarded == {h.lower().replace('-', '_')
+                         for h in IDENTITY_HEADERS}
+    for header in IDENTITY_HEADERS:
+        assert f'proxy_set_header {header} ' in config
+
+
+def test_traefik_configuration_matches_the_endpoint():
+    """
+    Test that the Traefik middleware copies every identity header.
+    """
+    config = yaml.safe_load((DEPLOY / 'traefik' / 'forward-auth.yml')
+                            .read_text())
+    middleware = config['http']['middlewares']['forward-auth']['forwardAuth']
+    assert middleware['address'].endswith('/forward-auth')
+    assert middleware['authResponseHeaders'] == list(IDENTITY_HEADERS)
+
+
+class _EchoHandler(BaseHTTPRequestHandler):
+    """Protected application echoing the user id set by the proxy."""
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer with the X-Auth-User-Id header."""
+        body = (self.headers.get('X-Auth-User-Id') or '').encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """Stay quiet."""
+
+
+def _serve(server):
+    """Run a server in a daemon thread."""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.mark.skipif(shutil.which('nginx') is None,
+                    reason='nginx is not installed')
+def test_through_nginx(tmp_path):
+    """
+    Test the nginx configuration end to end: authentication and caching.
+    """
+    url = f"sqlite:///{tmp_path / 'auth.db'}"
+    application = create_app(type('FileConfig', (TestingConfig,),
+                                  {'SQLALCHEMY_DATABASE_URI': url}))
+    with application.app_context():
+        db.create_all()
+    calls = []
+    application.before_request(lambda: calls.append(1))
+    auth = _serve(make_server('127.0.0.1', 0, application, threaded=True))
+    app = _serve(ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler))
+
+    listen = free_port()
+    config = (DEPLOY / 'nginx' / 'forward-auth.conf').read_text()
+    config = config.replace('server auth:5000;',
+                            f'server 127.0.0.1:{auth.server_port};')
+    config = config.replace('server app:8000;',
+                            f'server 127.0.0.1:{app.server_port};')
+    config = config.replace('listen 8080;', f'listen 127.0.0.1:{listen};')
+    (tmp_path / 'tmp').mkdir()
+    (tmp_path / 'cache').mkdir()
+    (tmp_path / 'forward-auth.conf').write_text(config)
+    nginx = subprocess.Popen(['nginx', '-p', str(tmp_path), '-c',
+                              'forward-auth.conf', '-g', 'daemon off;'])
+    try:
+        base = f'http://127.0.0.1:{listen}/'
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base, timeout=1)
+            except urllib.error.HTTPError:
+                break
+            except OSError:
+                time.sleep(0.05)
+        token = access_token()
+        request = urllib.request.Request(
+            base, headers={'Cookie': f'access_token={token}'})
+        for _ in range(3):
+            with urllib.request.urlopen(request, timeout=5) as response:
+                assert response.read() == b'u-1'
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(base, timeout=5)
+        assert error.value.code == 401
+        # One answer cached for the token, plus the rejected probes.
+        authenticated = len(calls)
+        with urllib.request.urlopen(request, timeout=5):
+            pass
+        assert len(calls) == authenticated
+    finally:
+        nginx.terminate()
+        nginx.wait(5)
+        auth.shutdown()
+        app.shutdown()
@@ -0,0 +1,214 @@
+"""
+test_group_commit.py
+--------------------
+This module contains tests for the group commit of login and refresh writes
+(app/group_commit.py): concurrent writes sharing transactions, batch
+bounds, and failures isolated to their own write.
+"""
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import create_app
+from app.config import TestingConfig
+from app.group_commit import GroupCommitWriter, refresh_token_row
+from app.models import db
+from app.models.refresh_token import RefreshToken
+
+
+def stub_check_credentials(email, password):  # pylint: disable=unused-argument
+    """Accept any password, with a company."""
+    return {'id': email.partition('@')[0], 'email': email,
+            'company_id': 'c-1'}
+
+
+@pytest.fixture
+def group_app(tmp_path):
+    """Application with group commit on a SQLite file shared by threads."""
+    url = f"sqlite:///{tmp_path / 'auth.db'}"
+    application = create_app(type('GroupCommitConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'GROUP_COMMIT': True,
+        'GROUP_COMMIT_MAX_WAIT_MS': 50,
+    }))
+    with application.app_context():
+        db.create_all()
+    with mock.patch('app.resources.login.check_credentials',
+                    stub_check_credentials):
+        yield application
+
+
+def expires():
+    """Expiry of test refresh tokens."""
+    return datetime.now(timezone.utc) + timedelta(days=1)
+
+
+def count_tokens(engine):
+    """Count the stored refresh tokens."""
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(
+            RefreshToken.__table__)).scalar_one()
+
+
+def test_concurrent_logins_share_commits(group_app):
+    """
+    Test that concurrent logins are committed in fewer transactions, each
+    login answered after its row is stored.
+    """
+    statuses = []
+    barrier = threading.Barrier(16)
+
+    def login(number):
+        client = group_app.test_client()
+        barrier.wait()
+        response = client.post('/login', json={
+            'email': f'user{number}@example.com', 'password': 'secret'})
+        statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=login, args=(n,)) for n in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200] * 16
+    writer = group_app.extensions['group_commit']
+    with group_app.app_context():
+        assert count_tokens(db.engine) == 16
+    assert writer.rows == 16
+    assert writer.batches < 16
+    assert writer.largest > 1
+    summary = group_app.test_client().get('/metrics').json['group_commit']
+    assert summary['rows'] == 16
+
+
+def test_refresh_rotation(group_app):
+    """
+    Test that refresh deletes the old token and stores the new one.
+    """
+    client = group_app.test_client()
+    assert client.post('/login', json={'email': 'user@example.com',
+                                       'password': 'secret'}
+                       ).status_code == 200
+    old = client.get_cookie('refresh_token').value
+    response = client.post('/refresh')
+    assert response.status_code == 200
+    with group_app.app_context():
+        tokens = db.session.execute(select(RefreshToken.token)).scalars()
+        tokens = list(tokens)
+    assert len(tokens) == 1 and tokens[0] != old
+
+
+def test_batch_size_bound(group_app):
+    """
+    Test that a transaction never holds more than max_batch writes.
+    """
+    with group_app.app_context():
+        engine = db.engine
+    writer = GroupCommitWriter(engine, max_batch=4, max_wait=0.2)
+    futures = [writer.submit([refresh_token_row(f't-{n}', 'u', 'c', None,
+                                                expires())])
+               for n in range(10)]
+    for future in futures:
+        future.result(5)
+    assert writer.largest == 4
+    assert writer.batches == 3
+    assert count_tokens(engine) == 10
+
+
+def test_failing_write_fails_alone(group_app):
+    """
+    Test that a write violating a constraint fails without failing the
+    writes committed with it.
+    """
+    with group_app.app_context():
+        engine = db.engine
+    writer = GroupCommitWriter(engine, max_batch=8, max_wait=0.2)
+    writer.write([refresh_token_row('taken', 'u', 'c', None, expires())])
+    futures = [writer.submit([refresh_token_row(token, 'u', 'c', None,
+                                                expires())])
+               for token in ('a', 'taken', 'b')]
+    assert futures[0].result(5) is None
+    with pytest.raises(IntegrityError):
+        futures[1].result(5)
+    assert futures[2].result(5) is None
+    assert writer.retries == 1
+    assert writer.failures == 1
+    assert count_tokens(engine) == 3
+
+
+def blocked_writer(engine, timeout):
+    """Writer whose batches wait for the returned event before running."""
+    writer = GroupCommitWriter(engine, max_batch=1, max_wait=0,
+                               timeout=timeout)
+    gate = threading.Event()
+    execute = writer._execute  # pylint: disable=protected-access
+
+    def gated_execute(batch):
+        assert gate.wait(5)
+        execute(batch)
+
+    writer._execute = gated_execute  # pylint: disable=protected-access
+    return writer, gate
+
+
+def test_queued_write_times_out(group_app):
+    """
+    Test that a write still queued after the timeout is cancelled and never
+    committed, while a write whose batch has started is waited for.
+    """
+    with group_app.app_context():
+        engine = db.engine
+    writer, gate = blocked_writer(engine, timeout=0.05)
+    running = writer.submit([refresh_token_row('running', 'u', 'c', None,
+                                               expires())])
+    with pytest.raises(FutureTimeoutError):
+        writer.write([refresh_token_row('queued', 'u', 'c', None,
+                                        expires())])
+    gate.set()
+    assert running.result(5) is None
+    assert writer.timeouts == 1
+
+    gate.clear()
+    threading.Timer(0.2, gate.set).start()
+    started = time.monotonic()
+    writer.write([refresh_token_row('slow', 'u', 'c', None, expires())])
+    assert time.monotonic() - started >= 0.2
+    with engine.connect() as conn:
+        tokens = set(conn.execute(select(RefreshToken.token)).scalars())
+    assert tokens == {'running', 'slow'}
+
+
+def test_login_timeout_answers_503(group_app):
+    """
+    Test that a login whose write is cancelled answers 503 with Retry-After.
+    """
+    writer = group_app.extensions['group_commit']
+    with mock.patch.object(writer, 'write', side_effect=FutureTimeoutError):
+        response = group_app.test_client().post('/login', json={
+            'email': 'user@example.com', 'password': 'secret'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert response.json == {'message': 'Database busy, retry later'}
+
+
+def test_rows_cover_the_table():
+    """
+    Test that rows set every column but the server-side timestamp.
+    """
+    row = refresh_token_row('t', 'u', 'c', None, expires())
+    columns = {column.name for column in RefreshToken.__table__.columns}
+    assert set(row) == columns - {'created_at'}
+
+
+def test_disabled_by_default(app):
+    """
+    Test that without GROUP_COMMIT no writer is created.
+    """
+    assert 'group_commit' not in app.extensions
@@ -0,0 +1,72 @@
+"""
+test_gunicorn_conf.py
+---------------------
+This module contains tests for the Gunicorn configuration: worker sizing
+from the CPU count and environment overrides.
+"""
+import os
+import runpy
+
+import pytest
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'gunicorn.conf.py')
+
+
+@pytest.fixture
+def load_config(monkeypatch):
+    """Load gunicorn.conf.py with the given environment variables set."""
+    def _load(**env):
+        for name in ('GUNICORN_WORKERS', 'GUNICORN_THREADS',
+                     'GUNICORN_PRELOAD', 'GUNICORN_MAX_REQUESTS'):
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        return runpy.run_path(CONFIG_PATH)
+    return _load
+
+
+def test_defaults(load_config):
+    """
+    Test the default worker model: preloaded gthread workers sized from CPUs.
+    """
+    config = load_config()
+    assert config['worker_class'] == 'gthread'
+    assert config['preload_app'] is True
+    assert config['workers'] == 2 * config['available_cpus']() + 1
+    assert config['threads'] == 4
+    assert config['timeout'] > 0
+    assert 0 < config['max_requests_jitter'] < config['max_requests']
+
+
+def test_environment_overrides(load_config):
+    """
+    Test that GUNICORN_* variables override the defaults.
+    """
+    config = load_config(GUNICORN_WORKERS='3', GUNICORN_THREADS='8',
+                         GUNICORN_PRELOAD='false',
+                         GUNICORN_MAX_REQUESTS='0')
+    assert config['workers'] == 3
+    assert config['threads'] == 8
+    assert config['preload_app'] is False
+    assert config['max_requests'] == 0
+
+
+@pytest.mark.parametrize('cpu_max, expected', [
+    ('max 100000\n', None),
+    ('50000 100000\n', 1),
+    ('150000 100000\n', 2),
+    ('garbage\n', None),
+])
+def test_available_cpus_honors_cgroup_quota(load_config, tmp_path, cpu_max,
+                                            expected):
+    """
+    Test that the cgroup v2 CPU quota caps the detected CPU count.
+    """
+    available_cpus = load_config()['available_cpus']
+    path = tmp_path / 'cpu.max'
+    path.write_text(cpu_max)
+    unbounded = available_cpus(str(tmp_path / 'missing'))
+    if expected is None:
+        expected = unbounded
+    assert available_cpus(str(path)) == min(expected, unbounded)
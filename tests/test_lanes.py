@@ -0,0 +1,166 @@
+"""
+test_lanes.py
+-------------
+This module contains tests for the priority lanes: request classification,
+reserved capacity, bounded waiting and the 503 responses of saturated
+lanes.
+"""
+import threading
+
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.lanes import OVERLOADED, LaneScheduler, classify
+from app.models import db
+
+
+class LanesConfig(TestingConfig):
+    """Testing configuration with priority lanes on 4 threads."""
+    PRIORITY_LANES = True
+    LANE_CAPACITY = 4
+    LANE_VERIFY_RESERVED = 1
+    LANE_REFRESH_RESERVED = 1
+    LANE_RETRY_AFTER = 3
+
+
+@pytest.fixture
+def lanes_app():
+    """Application with priority lanes enabled."""
+    app = create_app(LanesConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def test_classify():
+    """
+    Test that endpoints map to their lanes and probes are never gated.
+    """
+    assert classify('/verify') == 'verify'
+    assert classify('/refresh') == 'refresh'
+    assert classify('/login') == 'login'
+    assert classify('/logout') == 'default'
+    assert classify('/ready') is None
+    assert classify('/metrics') is None
+
+
+def test_reservations_set_ceilings():
+    """
+    Test that lower lanes cannot use the slots reserved above them.
+    """
+    scheduler = LaneScheduler(4, {'verify': 1, 'refresh': 1})
+    ceilings = {name: lane.ceiling
+                for name, lane in scheduler.lanes.items()}
+    assert ceilings == {'verify': 4, 'refresh': 3, 'login': 2, 'default': 2}
+
+    assert scheduler.acquire('login')
+    assert scheduler.acquire('default')
+    assert not scheduler.acquire('login')
+    assert scheduler.acquire('refresh')
+    assert not scheduler.acquire('refresh')
+    assert scheduler.acquire('verify')
+    assert not scheduler.acquire('verify')
+    assert scheduler.lanes['login'].rejected == 1
+
+    # Verify and refresh still hold slots: login stays below its ceiling.
+    scheduler.release('login')
+    assert not scheduler.acquire('login')
+    scheduler.release('verify')
+    scheduler.release('refresh')
+    assert scheduler.acquire('login')
+
+
+def test_waiting_for_a_lane_slot():
+    """
+    Test that a request blocked by its lane limit waits for a release.
+    """
+    scheduler = LaneScheduler(4, {}, limits={'login': 1}, queue_depth=1,
+                              queue_timeout=5.0)
+    assert scheduler.acquire('login')
+    admitted = []
+    waiter = threading.Thread(
+        target=lambda: admitted.append(scheduler.acquire('login')))
+    waiter.start()
+    while scheduler.lanes['login'].waiting == 0:
+        pass
+    # The queue is full: further requests are rejected immediately.
+    assert not scheduler.acquire('login')
+    scheduler.release('login')
+    waiter.join(timeout=5)
+    assert admitted == [True]
+    assert scheduler.snapshot()['occupied'] == 1
+
+
+def test_waiting_at_the_ceiling():
+    """
+    Test that a request arriving at its lane's ceiling waits for a release,
+    without taking the slots reserved above it.
+    """
+    scheduler = LaneScheduler(4, {'verify': 1, 'refresh': 1}, queue_depth=1,
+                              queue_timeout=5.0)
+    assert scheduler.acquire('login') and scheduler.acquire('default')
+    admitted = []
+    waiter = threading.Thread(
+        target=lambda: admitted.append(scheduler.acquire('login')))
+    waiter.start()
+    while scheduler.lanes['login'].waiting == 0:
+        pass
+    assert not scheduler.acquire('login')
+    assert scheduler.acquire('refresh') and scheduler.acquire('verify')
+    scheduler.release('refresh')
+    scheduler.release('verify')
+    scheduler.release('default')
+    waiter.join(timeout=5)
+    assert admitted == [True]
+    snapshot = scheduler.snapshot()
+    assert snapshot['occupied'] == 2
+    assert snapshot['lanes']['login']['admitted'] == 2
+    assert snapshot['lanes']['login']['rejected'] == 1
+
+
+def test_waiting_times_out():
+    """
+    Test that a request gives up after the queue timeout.
+    """
+    scheduler = LaneScheduler(4, {}, limits={'login': 1}, queue_depth=1,
+                              queue_timeout=0.01)
+    assert scheduler.acquire('login')
+    assert not scheduler.acquire('login')
+    snapshot = scheduler.snapshot()
+    assert snapshot['occupied'] == 1
+    assert snapshot['lanes']['login']['rejected'] == 1
+    assert snapshot['lanes']['login']['waiting'] == 0
+
+
+def test_saturated_lane_returns_503(lanes_app):
+    """
+    Test that a saturated login lane answers 503 with Retry-After while
+    verify and probes are still served.
+    """
+    scheduler = lanes_app.extensions['lanes']
+    client = lanes_app.test_client()
+    assert scheduler.acquire('login') and scheduler.acquire('login')
+
+    response = client.post('/login', json={'email': 'a@b.c',
+                                           'password': 'x'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.json == {'message': OVERLOADED}
+
+    assert client.get('/verify', buffered=True).status_code == 401
+    assert client.get('/ready').status_code in (200, 503)
+    metrics = client.get('/metrics').json['lanes']
+    assert metrics['lanes']['login']['rejected'] == 1
+    assert metrics['lanes']['verify']['admitted'] == 1
+    # Only the two slots held by the test remain occupied.
+    assert metrics['occupied'] == 2
+
+
+def test_lanes_disabled_by_default(app):
+    """
+    Test that the lanes are only mounted when configured.
+    """
+    assert 'lanes' not in app.extensions
+    assert 'lanes' not in app.test_client().get('/metrics').json
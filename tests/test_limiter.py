@@ -0,0 +1,134 @@
+"""
+test_limiter.py
+---------------
+This module contains tests for the adaptive concurrency limiter: AIMD
+adaptation of the limit, early rejection and the 503 responses of the
+middleware.
+"""
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.lanes import OVERLOADED
+from app.limiter import AIMDLimit
+from app.models import db
+
+
+class LimiterConfig(TestingConfig):
+    """Testing configuration with the adaptive limit on."""
+    ADAPTIVE_LIMIT = True
+    LIMIT_INITIAL = 2
+    LIMIT_MIN = 1
+    LIMIT_MAX = 8
+    LANE_RETRY_AFTER = 3
+
+
+@pytest.fixture
+def limiter_app():
+    """Application with the adaptive concurrency limit enabled."""
+    app = create_app(LimiterConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def test_rejects_beyond_limit():
+    """
+    Test that requests beyond the limit are rejected until one finishes.
+    """
+    limit = AIMDLimit(2, 1, 8, latency_target=10.0)
+    first, second = limit.acquire(), limit.acquire()
+    assert first is not None and second is not None
+    assert limit.acquire() is None
+    limit.release(first)
+    assert limit.acquire() is not None
+    assert limit.summary()['rejected'] == 1
+    assert limit.summary()['inflight'] == 2
+
+
+def test_additive_increase_under_load():
+    """
+    Test that fast requests raise the limit only while it is in use.
+    """
+    limit = AIMDLimit(4, 1, 8, latency_target=10.0)
+    # One request at a time never reaches half of the limit.
+    for _ in range(10):
+        limit.release(limit.acquire())
+    assert limit.summary()['limit'] == 4
+
+    for _ in range(20):
+        held = [limit.acquire() for _ in range(int(limit.limit))]
+        for started in held:
+            limit.release(started)
+    assert limit.summary()['limit'] == 8
+
+
+def test_backs_off_once_per_round():
+    """
+    Test that slow or failed requests admitted together shrink the limit
+    once.
+    """
+    limit = AIMDLimit(8, 1, 8, latency_target=0.0, backoff=0.5)
+    held = [limit.acquire() for _ in range(4)]
+    for started in held:
+        limit.release(started)
+    assert limit.summary()['limit'] == 4
+    assert limit.summary()['congestion'] == 4
+
+    limit.latency_target = 10.0
+    limit.release(limit.acquire(), failed=True)
+    assert limit.summary()['limit'] == 2
+    for _ in range(10):
+        limit.release(limit.acquire(), failed=True)
+    assert limit.summary()['limit'] == 1
+
+
+def test_saturated_limit_returns_503(limiter_app):
+    """
+    Test that a full login limit answers 503 with Retry-After while other
+    classes and probes are still served.
+    """
+    limiter = limiter_app.extensions['limiter']
+    client = limiter_app.test_client()
+    login = limiter.limits['login']
+    held = [login.acquire(), login.acquire()]
+
+    response = client.post('/login', json={'email': 'a@b.c',
+                                           'password': 'x'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert response.json == {'message': OVERLOADED}
+
+    assert client.get('/verify', buffered=True).status_code == 401
+    assert client.get('/ready').status_code in (200, 503)
+    metrics = client.get('/metrics').json['limiter']
+    assert metrics['login']['rejected'] == 1
+    assert metrics['login']['inflight'] == 2
+    assert metrics['verify']['admitted'] == 1
+    assert metrics['verify']['inflight'] == 0
+    for started in held:
+        login.release(started)
+
+
+def test_server_errors_signal_congestion(limiter_app):
+    """
+    Test that a 5xx response counts as congestion.
+    """
+    @limiter_app.route('/boom')
+    def boom():
+        return 'boom', 500
+
+    client = limiter_app.test_client()
+    assert client.get('/boom', buffered=True).status_code == 500
+    summary = limiter_app.extensions['limiter'].snapshot()['default']
+    assert summary['congestion'] == 1
+    assert summary['inflight'] == 0
+
+
+def test_limiter_disabled_by_default(app):
+    """
+    Test that the limiter is only mounted when configured.
+    """
+    assert 'limiter' not in app.extensions
+    assert 'limiter' not in app.test_client().get('/metrics').json
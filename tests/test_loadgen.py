@@ -0,0 +1,68 @@
+"""
+test_loadgen.py
+---------------
+This module contains tests for the closed-loop load generator: per-window
+aggregation and a short session replay against a live local server wired
+to the user-service emulator.
+"""
+import threading
+import time
+
+import pytest
+from werkzeug.serving import make_server
+
+from benchmarks.loadgen import SampleSink, VirtualUser, aggregate
+
+
+def test_aggregate_windows_and_totals():
+    """
+    Test that samples are bucketed per window and endpoint with error rates.
+    """
+    samples = [
+        (0.1, 'verify', 1.0, True),
+        (0.2, 'verify', 3.0, False),
+        (1.5, 'verify', 2.0, True),
+        (1.6, 'login', 10.0, True),
+    ]
+    report = aggregate(samples, window=1.0)
+    assert [w['start_s'] for w in report['windows']] == [0.0, 1.0]
+    first = report['windows'][0]['endpoints']['verify']
+    assert first['requests'] == 2
+    assert first['error_rate'] == 0.5
+    assert report['totals']['verify']['requests'] == 3
+    assert report['totals']['login']['latency_ms']['p50'] == 10.0
+
+
+@pytest.fixture
+def live_server(app, user_service):
+    """Serve the test app over HTTP, using the emulated user service."""
+    server = make_server('127.0.0.1', 0, app)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', user_service
+    server.shutdown()
+
+
+def test_virtual_user_replays_workflow(live_server):
+    """
+    Test that a virtual user logs in through the stub, verifies, refreshes
+    and logs out, and that every call is recorded as a success.
+    """
+    base_url, emulator = live_server
+    profile = {
+        'verify_rate': 200.0,
+        'refresh_interval': 0.05,
+        'logout_probability': 0.2,
+        'bad_login_rate': 0.0,
+        'user_pool': 10,
+    }
+    sink = SampleSink()
+    user = VirtualUser(base_url, profile, time.monotonic(), sink, seed=3)
+    user.run(time.monotonic() + 1.0)
+
+    samples = sink.drain()
+    endpoints = {endpoint for _, endpoint, _, _ in samples}
+    assert {'login', 'verify', 'refresh', 'logout'} <= endpoints
+    assert emulator.requests >= 1
+    verify_ok = [ok for _, endpoint, _, ok in samples if endpoint == 'verify']
+    assert all(verify_ok)
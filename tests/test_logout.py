@@ -7,8 +7,13 @@ refresh token deletion, and cookie cleanup work as expected.
 import os
 import jwt
 from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects import postgresql
 from app.models.refresh_token import RefreshToken
+from app.models.token_blacklist import TokenBlacklist
 from app.models import db
+from app.resources.logout import logout_statements
+from app.revocation.events import CHANNEL
 
 
 def make_jwt(user_id=1, company_id=42, secret=None, expired=False):
@@ -169,3 +174,77 @@ def test_logout_expired_access_token(client, session):
     response = client.post('/logout')
     assert response.status_code == 200
     assert response.json['message'] == 'Logout successful'
+
+
+def test_logout_statements(client, session):
+    """
+    Test that logout sends only its writes: the blacklist insert and the
+    refresh token delete, without reading the refresh token first.
+    """
+    refresh_token = 'refresh-token-test'
+    db.session.add(RefreshToken(
+        token=refresh_token,
+        user_id=1,
+        company_id=42,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=1)
+    ))
+    db.session.commit()
+    client.set_cookie('access_token', make_jwt())
+    client.set_cookie('refresh_token', refresh_token)
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        statements.append(statement.split()[0])
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = client.post('/logout')
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert response.status_code == 200
+    assert statements == ['INSERT', 'DELETE']
+    assert db.session.scalar(
+        select(func.count()).select_from(RefreshToken)) == 0
+    assert db.session.scalar(
+        select(TokenBlacklist.jti)) == 'test-jti'
+
+
+def test_logout_is_one_statement_on_postgresql():
+    """
+    Test that on PostgreSQL the insert, the delete and the notification
+    are one statement.
+    """
+    entry = {'jti': 'j', 'user_id': '1', 'company_id': '42',
+             'expires_at': datetime.now(timezone.utc)}
+    statements = logout_statements('postgresql', 'refresh-token-test', entry,
+                                   ['{"revoked": []}'])
+    assert len(statements) == 1
+    compiled = statements[0].compile(dialect=postgresql.dialect())
+    sql = ' '.join(str(compiled).split())
+    assert ';' not in sql
+    ctes, _, select_list = sql.rpartition(') SELECT ')
+    assert ctes.startswith('WITH removed AS (DELETE FROM refresh_tokens ')
+    assert ' revoked AS (INSERT INTO token_blacklist ' in ctes
+    assert 'ON CONFLICT (jti) DO NOTHING' in ctes
+    assert 'pg_notify' not in ctes
+    # The notification is a column of the statement reading both CTEs.
+    assert 'FROM removed' in select_list and 'FROM revoked' in select_list
+    assert select_list.count('pg_notify(') == 1
+    assert set(compiled.params.values()) >= {CHANNEL, '{"revoked": []}'}
+
+    statements = logout_statements('postgresql', 'refresh-token-test')
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert 'token_blacklist' not in sql and 'pg_notify' not in sql
+
+
+def test_logout_twice(client):
+    """
+    Test that logging the same access token out twice succeeds.
+    """
+    client.set_cookie('access_token', make_jwt())
+    client.set_cookie('refresh_token', 'unknown')
+    assert client.post('/logout').status_code == 200
+    client.set_cookie('access_token', make_jwt())
+    client.set_cookie('refresh_token', 'unknown')
+    assert client.post('/logout').status_code == 200
@@ -0,0 +1,144 @@
+"""
+test_metrics.py
+---------------
+This module contains tests for the connection pool configuration and
+metrics: per-environment engine options, PgBouncer mode, checkout wait
+statistics and the /metrics endpoint.
+"""
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+from app.config import _engine_options
+from app.metrics import InstrumentedQueuePool, PoolStats, pool_snapshot
+
+PG_URL = 'postgresql://auth:secret@db/auth'
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """SQLite file engine with a single pooled connection and no overflow."""
+    engine = create_engine('sqlite:///' + str(tmp_path / 'pool.db'),
+                           poolclass=InstrumentedQueuePool, pool_size=1,
+                           max_overflow=0, pool_timeout=0.1)
+    yield engine
+    engine.dispose()
+
+
+def test_engine_options_for_postgres(monkeypatch):
+    """
+    Test queue pool options, with environment overrides.
+    """
+    for name in ('DB_POOL_MODE', 'DB_POOL_SIZE', 'DB_MAX_OVERFLOW',
+                 'DB_POOL_TIMEOUT'):
+        monkeypatch.delenv(name, raising=False)
+    options = _engine_options(PG_URL, 10, 20)
+    assert options['poolclass'] is InstrumentedQueuePool
+    assert options['pool_size'] == 10
+    assert options['max_overflow'] == 20
+    assert options['pool_pre_ping'] is True
+
+    monkeypatch.setenv('DB_POOL_SIZE', '3')
+    monkeypatch.setenv('DB_MAX_OVERFLOW', '0')
+    options = _engine_options(PG_URL, 10, 20)
+    assert (options['pool_size'], options['max_overflow']) == (3, 0)
+
+
+def test_engine_options_for_pgbouncer(monkeypatch):
+    """
+    Test that PgBouncer mode disables pooling and prepared statements.
+    """
+    monkeypatch.setenv('DB_POOL_MODE', 'pgbouncer')
+    options = _engine_options('postgresql+psycopg2://db/auth', 10, 20)
+    assert options == {'poolclass': NullPool, 'connect_args': {}}
+    options = _engine_options('postgresql+psycopg://db/auth', 10, 20)
+    assert options['connect_args'] == {'prepare_threshold': None}
+    options = _engine_options('postgresql+asyncpg://db/auth', 10, 20)
+    assert options['connect_args'] == {'statement_cache_size': 0}
+
+
+def test_engine_options_for_memory_sqlite():
+    """
+    Test that in-memory SQLite keeps Flask-SQLAlchemy's static pool.
+    """
+    options = _engine_options('sqlite:///:memory:', 10, 20)
+    assert 'poolclass' not in options
+    assert 'pool_size' not in options
+
+
+def test_pool_records_checkouts_and_timeouts(file_engine):
+    """
+    Test wait statistics, including a checkout timing out on a full pool.
+    """
+    with file_engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        snapshot = pool_snapshot(file_engine)
+        assert snapshot['checked_out'] == 1
+        with pytest.raises(PoolTimeoutError):
+            file_engine.connect()
+    snapshot = pool_snapshot(file_engine)
+    assert snapshot['class'] == 'InstrumentedQueuePool'
+    assert snapshot['checked_out'] == 0
+    assert snapshot['checkout']['checkouts'] == 1
+    assert snapshot['checkout']['timeouts'] == 1
+    assert snapshot['checkout']['wait_max_ms'] >= 100
+
+
+def test_pool_wait_under_contention(file_engine):
+    """
+    Test that a checkout waiting for a busy connection is measured.
+    """
+    conn = file_engine.connect()
+    waited = threading.Event()
+
+    def _second_checkout():
+        with file_engine.connect():
+            waited.set()
+
+    thread = threading.Thread(target=_second_checkout)
+    thread.start()
+    threading.Timer(0.03, conn.close).start()
+    thread.join()
+    assert waited.is_set()
+    stats = pool_snapshot(file_engine)['checkout']
+    assert stats['checkouts'] == 2
+    assert stats['wait_max_ms'] >= 20
+    assert stats['wait_histogram']['total'] == 2
+
+
+def test_stats_survive_dispose(file_engine):
+    """
+    Test that statistics are kept when the pool is recreated.
+    """
+    file_engine.connect().close()
+    file_engine.dispose()
+    assert pool_snapshot(file_engine)['checkout']['checkouts'] == 1
+
+
+def test_stats_histogram():
+    """
+    Test the cumulative wait histogram.
+    """
+    stats = PoolStats()
+    stats.observe(0.5)
+    stats.observe(7)
+    stats.observe(20000, timed_out=True)
+    summary = stats.summary()
+    assert summary['wait_histogram']['le_1ms'] == 1
+    assert summary['wait_histogram']['le_10ms'] == 2
+    assert summary['wait_histogram']['le_5000ms'] == 2
+    assert summary['wait_histogram']['total'] == 3
+
+
+def test_metrics_endpoint(client):
+    """
+    Test that /metrics reports the pool of the answering worker.
+    """
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['pool']['class']
+    assert isinstance(data['pid'], int)
@@ -0,0 +1,61 @@
+"""
+test_ready.py
+-------------
+This module contains tests for the readiness probe and the worker warm-up:
+connection pool warm-up, readiness gating and retries.
+"""
+from app.models import db
+from app.warmup import warm_pool, warm_worker
+
+
+def test_not_ready_before_warm_up(app):
+    """
+    Test that a fresh application is not ready until warmed.
+    """
+    readiness = app.extensions['readiness']
+    assert readiness.ready is False
+    assert warm_worker(app) is True
+    assert readiness.ready is True
+    assert readiness.error is None
+
+
+def test_ready_probe_warms_once(client, app, monkeypatch):
+    """
+    Test that the probe warms the worker once, then answers from memory.
+    """
+    calls = []
+    monkeypatch.setattr('app.resources.ready.warm_worker',
+                        lambda a: calls.append(a) or warm_worker(a))
+    response = client.get('/ready')
+    assert response.status_code == 200
+    assert response.get_json() == {'ready': True}
+    assert client.get('/ready').status_code == 200
+    assert len(calls) == 1
+
+
+def test_ready_probe_retries_failed_warm_up(client, app):
+    """
+    Test that a failed warm-up reports 503 and is retried after the interval.
+    """
+    db.drop_all()
+    readiness = app.extensions['readiness']
+    readiness.retry_interval = 3600
+    response = client.get('/ready')
+    assert response.status_code == 503
+    assert response.get_json() == {'ready': False}
+    assert readiness.error
+
+    # Not retried before the interval, even once the schema exists.
+    db.create_all()
+    assert client.get('/ready').status_code == 503
+
+    readiness.retry_interval = 0
+    assert client.get('/ready').status_code == 200
+
+
+def test_warm_pool_opens_connections(app):
+    """
+    Test that the requested number of connections is opened and returned.
+    """
+    assert warm_pool(2) == 2
+    assert warm_pool(0) == 0
@@ -4,9 +4,16 @@ test_refresh.py
 This module contains tests for the /refresh endpoint to ensure access token renewal,
 refresh token validation, and error handling work as expected.
 """
+import threading
 from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
 from app.models.refresh_token import RefreshToken
 from app.models import db
+from app.tokens import issue_access_token
 
 def make_refresh_token(user_id=1, company_id=42, expires=None):
     """
@@ -100,3 +107,42 @@ def test_refresh_expired_token(client):
     response = client.post('/refresh')
     assert response.status_code == 401
     assert response.json['message'] == 'Refresh token expired'
+
+@pytest.mark.parametrize('group_commit', [False, True])
+def test_concurrent_refreshes_rotate_once(tmp_path, monkeypatch, group_commit):
+    """
+    Test that of two concurrent refreshes of one token, only one gets a new
+    refresh token.
+    """
+    application = create_app(type('FileConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'auth.db'}",
+        'GROUP_COMMIT': group_commit,
+    }))
+    with application.app_context():
+        db.create_all()
+        token = make_refresh_token()
+    # Both requests look the token up before either rotates it.
+    barrier = threading.Barrier(2)
+
+    def issue_after_both_lookups(*args, **kwargs):
+        barrier.wait(5)
+        return issue_access_token(*args, **kwargs)
+
+    monkeypatch.setattr('app.resources.refresh.issue_access_token',
+                        issue_after_both_lookups)
+    statuses = []
+
+    def refresh():
+        client = application.test_client()
+        client.set_cookie('refresh_token', token)
+        statuses.append(client.post('/refresh').status_code)
+
+    threads = [threading.Thread(target=refresh) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == [200, 401]
+    with application.app_context():
+        assert RefreshToken.query.count() == 1
+        db.drop_all()
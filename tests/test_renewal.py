@@ -0,0 +1,163 @@
+"""
+test_renewal.py
+---------------
+This module contains tests for the sliding renewal of access tokens by
+GET /verify: which tokens are renewed, the per-JTI limit, the session
+limit, revocation, and identical cookies from the fast path.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from werkzeug.http import parse_cookie
+from werkzeug.test import Client
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+
+
+class RenewalConfig(TestingConfig):
+    """Testing configuration with sliding renewal enabled."""
+    SLIDING_RENEWAL = True
+    SLIDING_RENEWAL_WINDOW = 300
+    SLIDING_RENEWAL_INTERVAL = 60
+    SLIDING_RENEWAL_MAX_SESSION = 3600
+
+
+class FastRenewalConfig(RenewalConfig):
+    """Sliding renewal through the /verify fast path."""
+    VERIFY_FAST_PATH = True
+
+
+@pytest.fixture(params=[RenewalConfig, FastRenewalConfig],
+                ids=['resource', 'fast path'])
+def renewal_app(request):
+    """An application with sliding renewal, with and without fast path."""
+    application = create_app(request.param)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.drop_all()
+
+
+def make_token(expires_in, jti='renew-jti', auth_time=None):
+    """Sign an access token expiring in ``expires_in`` seconds."""
+    payload = {
+        'sub': '1',
+        'company_id': 42,
+        'email': 'test@example.com',
+        'jti': jti,
+        'exp': int(time.time() + expires_in),
+    }
+    if auth_time is not None:
+        payload['auth_time'] = auth_time
+    return jwt.encode(payload, os.environ['JWT_SECRET'], algorithm='HS256')
+
+
+def verify(application, token):
+    """Call GET /verify; return the status and the Set-Cookie headers."""
+    client = Client(application, use_cookies=False)
+    response = client.get('/verify',
+                          headers={'Cookie': f'access_token={token}'})
+    return response.status_code, response.headers.getlist('Set-Cookie')
+
+
+def renewed_token(cookies):
+    """Return the access token set by the response's only cookie."""
+    assert len(cookies) == 1
+    return parse_cookie(cookies[0].split(';')[0])['access_token']
+
+
+def test_token_far_from_expiry_is_not_renewed(renewal_app):
+    """
+    Test that a fresh token gets no new cookie.
+    """
+    assert verify(renewal_app, make_token(600)) == (200, [])
+
+
+def test_token_close_to_expiry_is_renewed(renewal_app):
+    """
+    Test that a token in the window gets a successor with the same
+    identity and login time, which /verify accepts.
+    """
+    auth_time = int(time.time()) - 600
+    status, cookies = verify(renewal_app,
+                             make_token(120, auth_time=auth_time))
+    assert status == 200
+    assert 'HttpOnly' in cookies[0] and 'Secure' in cookies[0]
+    assert 'SameSite=Strict' in cookies[0] and 'Path=/' in cookies[0]
+    token = renewed_token(cookies)
+    payload = jwt.decode(token, os.environ['JWT_SECRET'],
+                         algorithms=['HS256'])
+    assert payload['jti'] != 'renew-jti'
+    assert {key: payload[key] for key in ('sub', 'company_id', 'email',
+                                          'auth_time')} == {
+        'sub': '1', 'company_id': 42, 'email': 'test@example.com',
+        'auth_time': auth_time}
+    assert payload['exp'] > time.time() + 800
+    assert verify(renewal_app, token) == (200, [])
+
+
+def test_renewal_is_limited_per_jti(renewal_app):
+    """
+    Test that repeated calls with one token renew it once.
+    """
+    token = make_token(120)
+    assert len(verify(renewal_app, token)[1]) == 1
+    assert verify(renewal_app, token) == (200, [])
+    assert len(verify(renewal_app, make_token(120, jti='other'))[1]) == 1
+
+    summary = renewal_app.extensions['sliding_renewal'].summary()
+    assert summary['renewed'] == 2 and summary['limited'] == 1
+
+
+def test_session_limit(renewal_app):
+    """
+    Test that tokens are no longer renewed once the session is too old.
+    """
+    old_login = int(time.time()) - 3600
+    assert verify(renewal_app,
+                  make_token(120, auth_time=old_login)) == (200, [])
+    assert renewal_app.extensions['sliding_renewal'].ended == 1
+
+
+def test_revoked_token_is_not_renewed(renewal_app):
+    """
+    Test that a revoked token is rejected without a new cookie.
+    """
+    db.session.add(TokenBlacklist(
+        jti='renew-jti', user_id='1', company_id='42',
+        expires_at=datetime.now(timezone.utc) + timedelta(minutes=2)))
+    db.session.commit()
+    assert verify(renewal_app, make_token(120)) == (401, [])
+    assert renewal_app.extensions['sliding_renewal'].renewed == 0
+
+
+def test_fast_path_sets_the_same_cookie():
+    """
+    Test that the fast path's cookie has the attributes Flask sets.
+    """
+    attributes = []
+    for config in (RenewalConfig, FastRenewalConfig):
+        application = create_app(config)
+        with application.app_context():
+            db.create_all()
+            _, cookies = verify(application, make_token(120))
+            db.drop_all()
+        attributes.append([part for part in cookies[0].split('; ')[1:]
+                           if not part.startswith('Expires=')])
+    assert attributes[0] == attributes[1]
+
+
+def test_disabled_by_default(client):
+    """
+    Test that tokens close to expiry are not renewed unless enabled.
+    """
+    client.set_cookie('access_token', make_token(120))
+    response = client.get('/verify')
+    assert response.status_code == 200
+    assert 'Set-Cookie' not in response.headers
@@ -0,0 +1,257 @@
+"""
+test_revocation_events.py
+-------------------------
+This module contains tests for the propagation of revocations between
+nodes: event payloads, the polling fallback, leader election, trust of the
+shared set while it is in sync and, when a Postgres database is given in
+``POSTGRES_TEST_URL``, LISTEN/NOTIFY.
+"""
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import pytest
+from sqlalchemy.engine import Connection
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.revocation import events
+from app.revocation.events import (
+    MAX_PAYLOAD,
+    RevocationListener,
+    _payloads,
+    notification_payloads,
+)
+from app.revocation.shared import SharedRevocationSet
+from tests.test_verify import make_access_token
+
+
+def _node_config(database_url, shared_path, **overrides):
+    """Build the configuration of one node sharing ``database_url``."""
+    attributes = {
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'SQLALCHEMY_ENGINE_OPTIONS': {},
+        'REVOCATION_SHARED_SET': True,
+        'REVOCATION_SHARED_PATH': shared_path,
+        'REVOCATION_SHARED_CAPACITY': 1024,
+        'REVOCATION_SHARED_TRUST_MISSES': True,
+        'REVOCATION_EVENTS': True,
+        'REVOCATION_EVENTS_POLL_INTERVAL': 0.05,
+        **overrides,
+    }
+    return type('NodeConfig', (TestingConfig,), attributes)
+
+
+@pytest.fixture
+def nodes(tmp_path):
+    """Two nodes (own shared sets) sharing one SQLite database."""
+    database_url = f'sqlite:///{tmp_path}/auth.db'
+    apps = [create_app(_node_config(database_url,
+                                    str(tmp_path / f'node{n}.shm')))
+            for n in range(2)]
+    with apps[0].app_context():
+        db.create_all()
+    yield apps
+    for app in apps:
+        app.extensions['revocation_events'].stop(timeout=5)
+    with apps[0].app_context():
+        db.drop_all()
+
+
+def test_payloads_are_split():
+    """
+    Test that bulk revocations fit in notifications of bounded size.
+    """
+    entries = [(f'jti-{i:05d}-' + 'x' * 40, 2_000_000_000)
+               for i in range(1000)]
+    payloads = list(_payloads(entries, 1.5))
+    assert len(payloads) > 1
+    assert all(len(payload) <= MAX_PAYLOAD + 100 for payload in payloads)
+    decoded = [json.loads(payload) for payload in payloads]
+    assert {event['ts'] for event in decoded} == {1.5}
+    assert [jti for event in decoded for jti, _ in event['revoked']] == [
+        jti for jti, _ in entries]
+
+
+def test_notification_payloads():
+    """
+    Test that notification payloads carry the entries and the time of
+    publication.
+    """
+    before = time.time()
+    [payload] = notification_payloads([('jti', 2_000_000_000)])
+    event = json.loads(payload)
+    assert event['revoked'] == [['jti', 2_000_000_000]]
+    assert before <= event['ts'] <= time.time()
+
+
+def test_apply_payload(tmp_path):
+    """
+    Test that events are applied and their latency recorded, and that
+    malformed ones are ignored.
+    """
+    shared_set = SharedRevocationSet(str(tmp_path / 'set.shm'), 64)
+    listener = RevocationListener(None, shared_set)
+    now = time.time()
+    payload = json.dumps({'ts': now - 0.02,
+                          'revoked': [['a', now + 60], ['b', now + 60]]})
+    assert listener.apply_payload(payload, now=now) == 2
+    assert shared_set.contains('a') and shared_set.contains('b')
+    assert listener.apply_payload('not json') == 0
+    assert listener.apply_payload('{"ts": 1}') == 0
+
+    summary = listener.summary()
+    assert summary['events'] == {'notify': 2, 'poll': 0}
+    assert 19 < summary['latency_max_ms'] < 21
+    assert summary['latency_histogram']['le_50ms'] == 2
+
+
+def test_polling_propagates_logouts(nodes):
+    """
+    Test that a logout on one node reaches the other node's set by
+    polling, and that the receiving node then rejects the token without
+    a query.
+    """
+    node_a, node_b = nodes
+    listener = node_b.extensions['revocation_events']
+    assert not listener.can_listen()
+    with node_b.app_context():
+        assert listener.step() == 'poll'
+    shared_b = node_b.extensions['revocation_shared']
+    # Polled once: the set is complete only after seeding.
+    shared_b.seed(lambda: [])
+    assert shared_b.trusted()
+
+    token = make_access_token(jti='revoked-on-a')
+    with node_a.app_context():
+        client = node_a.test_client()
+        client.set_cookie('access_token', token)
+        client.set_cookie('refresh_token', 'unknown')
+        assert client.post('/logout').status_code == 200
+    assert not shared_b.contains('revoked-on-a')
+
+    assert listener.start()
+    deadline = time.monotonic() + 5
+    while not shared_b.contains('revoked-on-a'):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    with node_b.app_context():
+        client = node_b.test_client()
+        client.set_cookie('access_token', token)
+        response = client.get('/verify')
+        assert response.status_code == 401
+        assert response.json == {'message': 'Token revoked'}
+        metrics = client.get('/metrics').json
+    assert metrics['revocation_events']['mode'] == 'poll'
+    assert metrics['revocation_events']['events']['poll'] == 1
+    assert metrics['revocation_shared']['synced_age_s'] < 5
+
+
+def test_one_listener_per_host(tmp_path):
+    """
+    Test that only one worker of a host listens, and another takes over
+    when it stops.
+    """
+    path = str(tmp_path / 'set.shm')
+    app = create_app(_node_config(f'sqlite:///{tmp_path}/auth.db', path))
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+    first = RevocationListener(engine, SharedRevocationSet(path, 1024))
+    second = RevocationListener(engine, SharedRevocationSet(path, 1024))
+    first.poll_interval = second.poll_interval = 0.01
+    assert first.step() == 'poll'
+    assert second.step() == 'standby'
+    first.stop()
+    assert second.step() == 'poll'
+    second.stop()
+
+
+def test_poll_with_an_aware_clock(tmp_path):
+    """
+    Test that polls go on when the database clock has a time zone (now() on
+    PostgreSQL) and ``created_at`` has none.
+    """
+    path = str(tmp_path / 'set.shm')
+    app = create_app(_node_config(f'sqlite:///{tmp_path}/auth.db', path))
+    with app.app_context():
+        db.create_all()
+        db.session.add(TokenBlacklist(
+            jti='polled', user_id='u', company_id='c',
+            expires_at=datetime.now(timezone.utc) + timedelta(hours=1)))
+        db.session.commit()
+        engine = db.engine
+    clock = datetime.now(timezone(timedelta(hours=2))) - timedelta(hours=1)
+    execute = Connection.execute
+
+    def aware_execute(conn, statement, *args, **kwargs):
+        if statement is events.CLOCK_QUERY:
+            return mock.Mock(scalar_one=lambda: clock)
+        return execute(conn, statement, *args, **kwargs)
+
+    shared_set = SharedRevocationSet(path, 1024)
+    listener = RevocationListener(engine, shared_set)
+    with mock.patch.object(Connection, 'execute', aware_execute):
+        assert listener.poll() == 1
+    assert listener._cursor.tzinfo is None  # pylint: disable=protected-access
+    assert listener._cursor > clock.astimezone(  # pylint: disable=protected-access
+        timezone.utc).replace(tzinfo=None)
+    assert shared_set.contains('polled')
+    assert shared_set.summary()['synced_age_s'] < 5
+    assert listener.poll() == 1
+
+
+def test_misses_are_trusted_only_while_in_sync(tmp_path):
+    """
+    Test that a stale set stops answering for valid tokens.
+    """
+    shared_set = SharedRevocationSet(str(tmp_path / 'set.shm'), 64,
+                                     trust_misses=True)
+    shared_set.max_sync_lag = 10
+    shared_set.seed(lambda: [])
+    assert shared_set.trusted()
+    shared_set.mark_synced(time.time() - 11)
+    assert not shared_set.trusted()
+    assert shared_set.summary()['synced_age_s'] >= 11
+
+
+@pytest.mark.skipif(not os.environ.get('POSTGRES_TEST_URL'),
+                    reason='POSTGRES_TEST_URL is not set')
+def test_listen_notify(tmp_path):
+    """
+    Test that a logout committed on one node is applied by the other
+    node's listener through NOTIFY.
+    """
+    url = os.environ['POSTGRES_TEST_URL']
+    node_a, node_b = [
+        create_app(_node_config(url, str(tmp_path / f'node{n}.shm')))
+        for n in range(2)]
+    with node_a.app_context():
+        db.create_all()
+    listener = node_b.extensions['revocation_events']
+    try:
+        assert listener.start()
+        deadline = time.monotonic() + 5
+        while listener.mode != 'listen':
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        with node_a.app_context():
+            client = node_a.test_client()
+            client.set_cookie('access_token',
+                              make_access_token(jti='notified'))
+            client.set_cookie('refresh_token', 'unknown')
+            assert client.post('/logout').status_code == 200
+        shared_b = node_b.extensions['revocation_shared']
+        while not shared_b.contains('notified'):
+            assert time.monotonic() < deadline
+            time.sleep(0.001)
+        assert listener.summary()['events']['notify'] == 1
+    finally:
+        listener.stop(timeout=5)
+        with node_a.app_context():
+            db.drop_all()
@@ -0,0 +1,205 @@
+"""
+test_revocation_shared.py
+-------------------------
+This module contains tests for the revocation set shared by the workers of
+a host: lookups, expiry and eviction, concurrent writers in several
+processes and threads, seeding, and its use by /logout and /verify.
+"""
+import multiprocessing
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.revocation import shared as shared_module
+from app.revocation.shared import SharedRevocationSet, init_shared_set
+from app.verification import is_revoked
+from tests.test_verify import make_access_token
+
+
+@pytest.fixture
+def shared_path(tmp_path):
+    """Location of a shared revocation set file."""
+    return str(tmp_path / 'revocations.shm')
+
+
+def _shared_config(path, **overrides):
+    """Build a testing configuration with the shared set at ``path``."""
+    attributes = {
+        'REVOCATION_SHARED_SET': True,
+        'REVOCATION_SHARED_PATH': path,
+        'REVOCATION_SHARED_CAPACITY': 1024,
+        **overrides,
+    }
+    return type('SharedConfig', (TestingConfig,), attributes)
+
+
+def test_add_and_contains(shared_path):
+    """
+    Test that revocations are found until they expire.
+    """
+    shared_set = SharedRevocationSet(shared_path, 64)
+    now = time.time()
+    assert shared_set.add('a', now + 600)
+    assert shared_set.add('a', now + 900)
+    assert shared_set.add('expired', now - 1)
+    assert shared_set.contains('a')
+    assert not shared_set.contains('b')
+    assert not shared_set.contains('expired')
+    assert not shared_set.contains('a', now=now + 901)
+    assert shared_set.summary()['used'] == 1
+
+    # Another process opening the file sees the same table.
+    assert SharedRevocationSet(shared_path, 64).contains('a')
+    with pytest.raises(ValueError):
+        SharedRevocationSet(shared_path, 128)
+
+
+def test_expired_slots_are_reused(shared_path, monkeypatch):
+    """
+    Test that a full table makes room with expired entries first.
+    """
+    shared_set = SharedRevocationSet(shared_path, 4, max_probe=4)
+    now = time.time()
+    for i in range(4):
+        shared_set.add(f'jti-{i}', now + 10 * (i + 1))
+    monkeypatch.setattr(shared_module.time, 'time', lambda: now + 15)
+    assert shared_set.add('new', now + 600)
+    assert shared_set.contains('new')
+    assert not shared_set.contains('jti-0')
+    assert shared_set.contains('jti-1')
+    assert shared_set.summary()['evictions'] == 0
+
+
+@pytest.mark.parametrize('policy, kept', [('expiring', True),
+                                          ('reject', False)])
+def test_eviction_policies(shared_path, policy, kept):
+    """
+    Test both eviction policies on a full table, which stops being
+    complete.
+    """
+    shared_set = SharedRevocationSet(shared_path, 4, max_probe=4,
+                                     eviction=policy, trust_misses=True)
+    now = time.time()
+    shared_set.seed(lambda: [(f'jti-{i}', now + 100 * (i + 1))
+                             for i in range(4)])
+    assert shared_set.trusted()
+
+    assert shared_set.add('new', now + 600) is kept
+    assert shared_set.contains('new') is kept
+    # The entry expiring first is the one replaced.
+    assert shared_set.contains('jti-0') is not kept
+    assert all(shared_set.contains(f'jti-{i}') for i in range(1, 4))
+    summary = shared_set.summary()
+    assert summary['evictions'] == 1
+    assert not summary['complete'] and not shared_set.trusted()
+
+
+def _write_many(shared_set, prefix, count, expires_at):
+    """
+    Add ``count`` revocations from two threads of a new process, through
+    the set inherited from the parent or, given a path, opened anew.
+    """
+    if isinstance(shared_set, str):
+        shared_set = SharedRevocationSet(shared_set, 65536)
+    threads = [
+        threading.Thread(target=lambda offset=offset: [
+            shared_set.add(f'{prefix}-{i}', expires_at)
+            for i in range(offset, count, 2)])
+        for offset in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_concurrent_writers(shared_path):
+    """
+    Test that writers in several processes and threads lose no entry.
+    """
+    expires_at = time.time() + 600
+    parent = SharedRevocationSet(shared_path, 65536)
+    context = multiprocessing.get_context('fork')
+    writers = [context.Process(target=_write_many,
+                               args=(parent if n % 2 else shared_path,
+                                     f'p{n}', 5000, expires_at))
+               for n in range(4)]
+    for writer in writers:
+        writer.start()
+    for i in range(5000):
+        parent.add(f'parent-{i}', expires_at)
+    for writer in writers:
+        writer.join(timeout=60)
+        assert writer.exitcode == 0
+
+    assert parent.summary()['used'] == 25000
+    assert parent.summary()['evictions'] == 0
+    assert all(parent.contains(f'p{n}-{i}')
+               for n in range(4) for i in range(5000))
+    assert all(parent.contains(f'parent-{i}') for i in range(5000))
+
+
+def test_seed_and_trusted_misses(shared_path, tmp_path):
+    """
+    Test that a seeded set answers misses without the database only when
+    configured to.
+    """
+    down = create_engine(f'sqlite:///{tmp_path}/missing/auth.db')
+    now = time.time()
+    shared_set = SharedRevocationSet(shared_path, 64, trust_misses=True)
+    assert not shared_set.trusted()
+    assert shared_set.seed(lambda: [('seeded', now + 600),
+                                    ('old', now - 1)])
+    assert not shared_set.seed(lambda: pytest.fail('seeded twice'))
+    assert shared_set.summary()['used'] == 1
+
+    assert is_revoked(down, 'seeded', shared=shared_set)
+    assert not is_revoked(down, 'valid', shared=shared_set)
+
+    untrusted = SharedRevocationSet(shared_path, 64)
+    assert untrusted.complete() and not untrusted.trusted()
+    assert is_revoked(down, 'seeded', shared=untrusted)
+
+
+def test_logout_is_seen_by_other_workers(shared_path):
+    """
+    Test that a logout handled by one worker is rejected by another one
+    through the shared set alone.
+    """
+    config = _shared_config(shared_path)
+    worker_a, worker_b = create_app(config), create_app(config)
+    token = make_access_token(jti='logged-out')
+    with worker_a.app_context():
+        db.create_all()
+        client = worker_a.test_client()
+        client.set_cookie('access_token', token)
+        client.set_cookie('refresh_token', 'unknown')
+        assert client.post('/logout').status_code == 200
+        db.drop_all()
+
+    # Worker B's in-memory database does not hold the revocation.
+    with worker_b.app_context():
+        db.create_all()
+        client = worker_b.test_client()
+        client.set_cookie('access_token', token)
+        response = client.get('/verify')
+        assert response.status_code == 401
+        assert response.json == {'message': 'Token revoked'}
+        metrics = client.get('/metrics').json['revocation_shared']
+        assert metrics['used'] == 1 and metrics['capacity'] == 1024
+        db.drop_all()
+
+
+def test_capacity_mismatch_disables_the_set(shared_path):
+    """
+    Test that a set created with another capacity is not used.
+    """
+    SharedRevocationSet(shared_path, 64)
+    app = create_app(_shared_config(shared_path))
+    assert init_shared_set(app) is None
+    assert 'revocation_shared' not in app.extensions
@@ -0,0 +1,154 @@
+"""
+test_revocation_snapshot.py
+---------------------------
+This module contains tests for the memory-mapped revocation snapshot: the
+file format, its export from the blacklist, reloading, and its use by
+/verify, including the degraded mode when the database is unreachable.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.revocation.snapshot import (
+    RevocationSnapshot,
+    export_snapshot,
+    revocations_cli,
+    write_snapshot,
+)
+from app.verification import is_revoked
+from tests.test_verify import make_access_token
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Location of a snapshot file."""
+    return str(tmp_path / 'revocations.bin')
+
+
+@pytest.fixture
+def snapshot_app(snapshot_path):
+    """Application reading the snapshot at ``snapshot_path``."""
+    class SnapshotConfig(TestingConfig):
+        """Testing configuration with a revocation snapshot."""
+        REVOCATION_SNAPSHOT_PATH = snapshot_path
+        REVOCATION_SNAPSHOT_CHECK_INTERVAL = 0.0
+
+    app = create_app(SnapshotConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+def test_lookup(snapshot_path):
+    """
+    Test that listed, unexpired JTIs are found and others are not.
+    """
+    now = time.time()
+    entries = [(f'jti-{i}', now + 600) for i in range(1000)]
+    entries.append(('expired', now - 1))
+    assert write_snapshot(snapshot_path, entries) == 1001
+
+    snapshot = RevocationSnapshot(snapshot_path)
+    assert snapshot.contains('jti-0')
+    assert snapshot.contains('jti-999')
+    assert snapshot.contains('jti-500')
+    assert not snapshot.contains('jti-1000')
+    assert not snapshot.contains('expired')
+    summary = snapshot.summary()
+    assert summary['loaded'] and summary['entries'] == 1001
+    assert summary['age_s'] < 5
+
+
+def test_reload_and_malformed_files(snapshot_path):
+    """
+    Test that a replaced file is picked up and a bad one is ignored.
+    """
+    snapshot = RevocationSnapshot(snapshot_path, check_interval=0.0)
+    assert not snapshot.contains('a')
+    assert not snapshot.summary()['loaded']
+
+    write_snapshot(snapshot_path, [('a', time.time() + 600)])
+    assert snapshot.contains('a')
+    write_snapshot(snapshot_path, [('b', time.time() + 600)])
+    assert snapshot.contains('b') and not snapshot.contains('a')
+
+    # Snapshots are replaced, never rewritten in place.
+    with open(snapshot_path + '.new', 'wb') as fh:
+        fh.write(b'garbage' * 10)
+    os.replace(snapshot_path + '.new', snapshot_path)
+    # The last good snapshot stays in use.
+    assert snapshot.contains('b')
+    assert os.listdir(os.path.dirname(snapshot_path)) == ['revocations.bin']
+
+
+def test_export_and_cli(app, snapshot_path):
+    """
+    Test that only unexpired blacklist entries are exported.
+    """
+    now = datetime.now(timezone.utc)
+    db.session.add_all([
+        TokenBlacklist(jti='revoked', user_id='1', company_id='1',
+                       expires_at=now + timedelta(minutes=5)),
+        TokenBlacklist(jti='old', user_id='1', company_id='1',
+                       expires_at=now - timedelta(minutes=5)),
+    ])
+    db.session.commit()
+
+    assert export_snapshot(db.engine, snapshot_path) == 1
+    snapshot = RevocationSnapshot(snapshot_path)
+    assert snapshot.contains('revoked') and not snapshot.contains('old')
+
+    os.unlink(snapshot_path)
+    result = app.test_cli_runner().invoke(
+        revocations_cli, ['snapshot', '--path', snapshot_path])
+    assert result.exit_code == 0, result.output
+    assert '1 entries' in result.output
+    assert os.path.exists(snapshot_path)
+
+
+def test_verify_rejects_snapshot_entries(snapshot_app, snapshot_path):
+    """
+    Test that a token listed in the snapshot is rejected as revoked.
+    """
+    write_snapshot(snapshot_path, [('listed', time.time() + 600)])
+    client = snapshot_app.test_client()
+    client.set_cookie('access_token', make_access_token(jti='listed'))
+    response = client.get('/verify')
+    assert response.status_code == 401
+    assert response.json == {'message': 'Token revoked'}
+
+    client.set_cookie('access_token', make_access_token(jti='other'))
+    assert client.get('/verify').status_code == 200
+    metrics = client.get('/metrics').json['revocation_snapshot']
+    assert metrics['entries'] == 1 and metrics['degraded'] == 0
+
+
+def test_degraded_mode(snapshot_path, tmp_path):
+    """
+    Test that the snapshot answers alone while the database is down, and
+    only while it is recent enough.
+    """
+    down = create_engine(f'sqlite:///{tmp_path}/missing/auth.db')
+    snapshot = RevocationSnapshot(snapshot_path, check_interval=0.0,
+                                  max_age=60)
+    with pytest.raises(OperationalError):
+        is_revoked(down, 'anything', snapshot)
+
+    write_snapshot(snapshot_path, [('listed', time.time() + 600)])
+    assert is_revoked(down, 'listed', snapshot)
+    assert not is_revoked(down, 'other', snapshot)
+    assert snapshot.degraded == 1
+
+    write_snapshot(snapshot_path, [('listed', time.time() + 600)],
+                   generated_at=time.time() - 120)
+    with pytest.raises(OperationalError):
+        is_revoked(down, 'other', snapshot)
@@ -0,0 +1,244 @@
+"""
+test_roles.py
+-------------
+This module contains tests for the role claims embedded in access tokens at
+login and refresh: the per-user cache and its TTL, explicit invalidation,
+the fallback when the user service fails, and sliding renewal.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.refresh_token import RefreshToken
+from app.roles import parse_role_claims, upsert_roles
+from app.tokens import expand_claims, issue_access_token
+from benchmarks.user_service import DEFAULT_INTERNAL_TOKEN, make_roles, make_user
+
+EMAIL = 'grace@example.com'
+INTERNAL = {'X-Internal-Token': DEFAULT_INTERNAL_TOKEN}
+
+
+def roles_config(**overrides):
+    """Build a testing configuration with role claims enabled."""
+    return type('RolesConfig', (TestingConfig,),
+                {'ROLE_CLAIMS': True, **overrides})
+
+
+@pytest.fixture
+def roles_app(user_service):  # pylint: disable=unused-argument
+    """An application embedding role claims, with the user service emulator."""
+    application = create_app(roles_config())
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.drop_all()
+
+
+def access_claims(client):
+    """Return the expanded claims of the client's access token."""
+    token = client.get_cookie('access_token').value
+    return expand_claims(jwt.decode(token, os.environ['JWT_SECRET'],
+                                    algorithms=['HS256']))
+
+
+def login(client, email=EMAIL):
+    """Log in through POST /login."""
+    response = client.post('/login', json={'email': email,
+                                           'password': 'secret'})
+    assert response.status_code == 200
+    return response
+
+
+def test_parse_role_claims():
+    """
+    Test the validation of role claims.
+    """
+    assert parse_role_claims({'roles': ['a']}) == {'roles': ['a'],
+                                                   'permissions': []}
+    assert parse_role_claims({'roles': 'admin'}) is None
+    assert parse_role_claims({'roles': [], 'permissions': [1]}) is None
+    assert parse_role_claims(None) is None
+
+
+def test_login_embeds_cached_roles(roles_app, user_service):
+    """
+    Test that login embeds the roles, fetched once per user.
+    """
+    client = roles_app.test_client()
+    user_id = make_user(EMAIL)['id']
+    for _ in range(2):
+        login(client)
+        claims = access_claims(client)
+        assert {'roles': claims['roles'],
+                'permissions': claims['permissions']} == make_roles(user_id)
+    assert user_service.stats['roles'] == 1
+
+    response = client.get('/verify')
+    assert response.json['roles'] == make_roles(user_id)['roles']
+    assert response.json['permissions'] == make_roles(user_id)['permissions']
+    summary = client.get('/metrics').json['role_claims']
+    assert summary['hits'] == 1 and summary['misses'] == 1
+
+
+def test_compact_roles(user_service):  # pylint: disable=unused-argument
+    """
+    Test the compact keys of the role claims.
+    """
+    application = create_app(roles_config(TOKEN_PROFILE='compact'))
+    with application.app_context():
+        db.create_all()
+        client = application.test_client()
+        login(client)
+        token = client.get_cookie('access_token').value
+        payload = jwt.decode(token, os.environ['JWT_SECRET'],
+                             algorithms=['HS256'])
+        db.drop_all()
+    assert payload['r'] == ['member'] and 'roles' not in payload
+    assert payload['p']
+
+
+def test_roles_from_the_credential_check(roles_app, user_service,
+                                         monkeypatch):
+    """
+    Test that roles returned with the user save the roles call.
+    """
+    user = {**make_user(EMAIL), 'roles': ['owner'], 'permissions': []}
+    monkeypatch.setattr('app.resources.login.check_credentials',
+                        lambda email, password: user)
+    client = roles_app.test_client()
+    login(client)
+    assert access_claims(client)['roles'] == ['owner']
+    assert user_service.stats['roles'] == 0
+
+
+def test_refresh_embeds_email_and_roles(roles_app, user_service):
+    """
+    Test that refreshed access tokens keep the email and carry the roles.
+    """
+    client = roles_app.test_client()
+    login(client)
+    assert client.post('/refresh').status_code == 200
+    claims = access_claims(client)
+    assert claims['email'] == EMAIL
+    assert claims['roles'] == make_roles(make_user(EMAIL)['id'])['roles']
+    assert user_service.stats['roles'] == 1
+    assert RefreshToken.query.one().email == EMAIL
+
+
+def test_invalidation(roles_app, user_service):
+    """
+    Test that invalidated entries are fetched again at the next refresh.
+    """
+    client = roles_app.test_client()
+    login(client, 'other@example.com')
+    login(client)
+    assert client.post('/roles/invalidate', json={}).status_code == 403
+    response = client.post('/roles/invalidate', headers=INTERNAL,
+                           json={'user_ids': [make_user(EMAIL)['id']]})
+    assert response.json == {'invalidated': 1}
+    assert client.post('/roles/invalidate', headers=INTERNAL,
+                       json={'user_ids': 'x'}).status_code == 400
+
+    assert client.post('/refresh').status_code == 200
+    assert user_service.stats['roles'] == 3
+    response = client.post('/roles/invalidate', headers=INTERNAL)
+    assert response.json == {'invalidated': 2}
+
+
+def test_invalidation_during_a_fetch(roles_app):
+    """
+    Test that roles fetched before an invalidation are not cached.
+    """
+    role_claims = roles_app.extensions['role_claims']
+    stale = {'roles': ['stale'], 'permissions': []}
+
+    def fetch_then_invalidate(user_id):
+        role_claims.invalidate(db.session, [user_id])
+        db.session.commit()
+        return stale
+
+    role_claims.fetch = fetch_then_invalidate
+    claims, entry = role_claims.lookup('u-1')
+    assert claims == stale
+    db.session.execute(upsert_roles('sqlite', *entry))
+    db.session.commit()
+    assert role_claims.cached('u-1') is None
+
+    role_claims.fetch = lambda user_id: stale
+    _, entry = role_claims.lookup('u-1')
+    db.session.execute(upsert_roles('sqlite', *entry))
+    db.session.commit()
+    assert role_claims.cached('u-1') == stale
+
+
+def test_expired_entries_are_fetched_again(user_service):
+    """
+    Test that entries older than ROLE_CACHE_TTL are not used.
+    """
+    application = create_app(roles_config(ROLE_CACHE_TTL=0))
+    with application.app_context():
+        db.create_all()
+        client = application.test_client()
+        login(client)
+        login(client)
+        db.drop_all()
+    assert user_service.stats['roles'] == 2
+
+
+def test_user_service_failure_leaves_roles_out(roles_app, monkeypatch):
+    """
+    Test that logins succeed without roles when they cannot be fetched.
+    """
+    monkeypatch.delenv('INTERNAL_AUTH_TOKEN')
+    monkeypatch.setattr('app.resources.login.check_credentials',
+                        lambda email, password: make_user(email))
+    client = roles_app.test_client()
+    login(client)
+    claims = access_claims(client)
+    assert 'roles' not in claims and 'permissions' not in claims
+    assert 'roles' not in client.get('/verify').json
+    assert roles_app.extensions['role_claims'].errors == 1
+
+
+def test_role_endpoint_disabled(client, monkeypatch):
+    """
+    Test that invalidation answers 404 when role claims are disabled.
+    """
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', DEFAULT_INTERNAL_TOKEN)
+    response = client.post('/roles/invalidate', headers=INTERNAL)
+    assert response.status_code == 404
+
+
+def test_renewal_requires_fresh_roles(user_service):
+    """
+    Test that tokens with roles are renewed only while the cache is fresh.
+    """
+    application = create_app(roles_config(SLIDING_RENEWAL=True))
+    with application.app_context():
+        db.create_all()
+        client = application.test_client()
+        login(client)
+        user_id = make_user(EMAIL)['id']
+        issued = datetime.now(timezone.utc) - timedelta(minutes=14)
+        token, _ = issue_access_token(
+            {'sub': user_id, 'email': EMAIL, 'company_id': '1',
+             'auth_time': int(issued.timestamp()), 'roles': ['stale'],
+             'permissions': []},
+            os.environ['JWT_SECRET'], issued)
+        client.set_cookie('access_token', token)
+        assert client.get('/verify').json['roles'] == ['stale']
+        assert access_claims(client)['roles'] == ['member']
+
+        client.set_cookie('access_token', token)
+        client.post('/roles/invalidate', headers=INTERNAL)
+        renewal = application.extensions['sliding_renewal']
+        renewal._recent.clear()  # pylint: disable=protected-access
+        client.get('/verify')
+        assert client.get_cookie('access_token').value == token
+        assert renewal.summary()['stale_roles'] == 1
+        db.drop_all()
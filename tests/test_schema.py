@@ -0,0 +1,85 @@
+"""
+test_schema.py
+--------------
+This module contains tests for the start-up schema check: head revision
+parsing, the applied revision lookup and the skip-if-current upgrade.
+"""
+import click
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.schema import (
+    MIGRATIONS_DIR,
+    current_revisions,
+    head_revisions,
+    schema_is_current,
+    upgrade_if_needed,
+)
+
+
+def write_revision(directory, revision, down_revision):
+    """Write a minimal migration script."""
+    (directory / f'{revision}_step.py').write_text(
+        f'revision = {revision!r}\ndown_revision = {down_revision!r}\n')
+
+
+def test_head_revisions_of_the_project():
+    """
+    Test that the project's single head is found.
+    """
+    assert head_revisions() == {'7d4e2a9c1f63'}
+
+
+def test_head_revisions_with_branches(tmp_path):
+    """
+    Test head detection on a history with a branch merged back.
+    """
+    versions = tmp_path / 'versions'
+    versions.mkdir()
+    write_revision(versions, 'a', None)
+    write_revision(versions, 'b', 'a')
+    write_revision(versions, 'c', 'a')
+    assert head_revisions(str(tmp_path)) == {'b', 'c'}
+    write_revision(versions, 'd', ('b', 'c'))
+    assert head_revisions(str(tmp_path)) == {'d'}
+
+
+def test_upgrade_skipped_when_current(tmp_path):
+    """
+    Test that the upgrade runs on an empty database and is skipped after.
+    """
+    url = 'sqlite:///' + str(tmp_path / 'auth.db')
+
+    class FileConfig(TestingConfig):
+        """Testing configuration on a file database."""
+        SQLALCHEMY_DATABASE_URI = url
+
+    application = create_app(FileConfig)
+    assert current_revisions(url) == set()
+    assert not schema_is_current(url)
+    assert upgrade_if_needed(application) is True
+    assert current_revisions(url) == head_revisions(MIGRATIONS_DIR)
+    assert schema_is_current(url)
+    assert upgrade_if_needed(application) is False
+
+
+def test_cli_extensions_only_registered_for_commands():
+    """
+    Test that Migrate and Marshmallow are only set up under the Flask CLI.
+    """
+    application = create_app('app.config.TestingConfig')
+    assert 'migrate' not in application.extensions
+
+    with click.Context(click.Command('db')):
+        application = create_app('app.config.TestingConfig')
+    assert 'migrate' in application.extensions
+
+
+def test_unknown_extension_attribute():
+    """
+    Test that only the lazy extensions are served by the module.
+    """
+    import app  # pylint: disable=import-outside-toplevel
+    with pytest.raises(AttributeError):
+        getattr(app, 'not_an_extension')
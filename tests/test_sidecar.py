@@ -0,0 +1,176 @@
+"""
+test_sidecar.py
+---------------
+This module contains tests for the Unix socket verification sidecar
+(app/sidecar.py) and its client (auth_client/sidecar.py): answers identical
+to GET /verify, pipelining, and protocol errors.
+"""
+import os
+import socket
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.sidecar import VerifySidecar, encode_identity
+from app.tokens import issue_access_token
+from auth_client import AuthServiceUnavailable, SidecarClient, TokenRejected
+from auth_client.sidecar import decode_response
+
+CLAIMS = {'sub': 'u-1', 'email': 'zoë@example.com', 'company_id': 'c-1'}
+
+
+def access_token(claims=None, issued=None):
+    """Issue an access token for `CLAIMS`."""
+    return issue_access_token(claims or CLAIMS, os.environ['JWT_SECRET'],
+                              issued)[0]
+
+
+@pytest.fixture
+def sidecar(tmp_path):
+    """Serve the sidecar of an application; yield (app, server)."""
+    url = f"sqlite:///{tmp_path / 'auth.db'}"
+    application = create_app(type('SidecarConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': url,
+        'SIDECAR_SOCKET': str(tmp_path / 'verify.sock'),
+    }))
+    with application.app_context():
+        db.create_all()
+    server = VerifySidecar(application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield application, server
+    server.shutdown()
+    server.server_close()
+
+
+def test_identity_round_trip():
+    """
+    Test that identities decode as they were encoded, absent claims too.
+    """
+    identities = [
+        {'user_id': 'u-1', 'company_id': 'c-1', 'email': 'zoë@example.com',
+         'valid': True, 'roles': ['admin', 'member'], 'permissions': []},
+        {'user_id': 'u-2', 'company_id': None, 'email': None, 'valid': True},
+    ]
+    for identity in identities:
+        assert decode_response(encode_identity(identity)[4:]) == identity
+
+
+def test_answers_match_verify(sidecar):
+    """
+    Test that the sidecar answers what GET /verify answers.
+    """
+    application, server = sidecar
+    client = SidecarClient(application.config['SIDECAR_SOCKET'])
+    token = access_token({**CLAIMS, 'roles': ['admin'], 'permissions': []})
+    with application.test_client() as http:
+        http.set_cookie('access_token', token)
+        expected = http.get('/verify').json
+    assert client.verify(token) == expected
+    assert server.summary()['requests'] == 1
+    client.close()
+
+
+def test_rejections(sidecar):
+    """
+    Test that rejected tokens raise with the /verify messages.
+    """
+    application, server = sidecar
+    client = SidecarClient(application.config['SIDECAR_SOCKET'])
+    issued = datetime.now(timezone.utc) - timedelta(hours=1)
+    for token, message in ((None, 'Missing access token'),
+                           ('not-a-jwt', 'Invalid token'),
+                           ('é', 'Invalid token'),
+                           (access_token(issued=issued), 'Token expired')):
+        with pytest.raises(TokenRejected) as error:
+            client.verify(token)
+        assert error.value.message == message
+    assert server.summary()['rejected'] == 4
+
+
+def test_revoked_token(sidecar):
+    """
+    Test that a token revoked by /logout is rejected.
+    """
+    application, _ = sidecar
+    client = SidecarClient(application.config['SIDECAR_SOCKET'])
+    token = access_token()
+    with application.test_client() as http:
+        http.set_cookie('access_token', token)
+        http.set_cookie('refresh_token', 'unknown')
+        assert http.post('/logout').status_code == 200
+    with pytest.raises(TokenRejected) as error:
+        client.verify(token)
+    assert error.value.message == 'Token revoked'
+
+
+def test_pipelined_requests(sidecar):
+    """
+    Test that pipelined requests are answered in order, across batches.
+    """
+    application, server = sidecar
+    client = SidecarClient(application.config['SIDECAR_SOCKET'])
+    tokens = [access_token({**CLAIMS, 'sub': f'u-{n}'}) for n in range(50)]
+    tokens[7] = 'not-a-jwt'
+    results = client.verify_many(tokens, depth=16)
+    assert len(results) == 50
+    assert isinstance(results[7], TokenRejected)
+    assert [r['user_id'] for n, r in enumerate(results) if n != 7] == [
+        f'u-{n}' for n in range(50) if n != 7]
+    assert server.summary()['connections'] == 1
+
+
+def test_split_frames(sidecar):
+    """
+    Test that frames split across writes and several frames in one write
+    are both answered.
+    """
+    application, _ = sidecar
+    token = access_token().encode()
+    frame = struct.pack('>I', len(token)) + token
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(application.config['SIDECAR_SOCKET'])
+        sock.sendall(frame[:3])
+        sock.sendall(frame[3:] + frame)
+        stream = sock.makefile('rb')
+        for _ in range(2):
+            (length,) = struct.unpack('>I', stream.read(4))
+            assert decode_response(stream.read(length))['user_id'] == 'u-1'
+
+
+def test_oversized_frame_closes_the_connection(sidecar):
+    """
+    Test that a frame over SIDECAR_MAX_FRAME closes the connection.
+    """
+    application, _ = sidecar
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(application.config['SIDECAR_SOCKET'])
+        sock.sendall(struct.pack('>I', 1 << 20))
+        assert sock.recv(16) == b''
+
+
+def test_unreachable_sidecar(tmp_path):
+    """
+    Test that a missing socket raises AuthServiceUnavailable.
+    """
+    client = SidecarClient(str(tmp_path / 'missing.sock'))
+    with pytest.raises(AuthServiceUnavailable):
+        client.verify(access_token())
+
+
+def test_socket_file_lifecycle(sidecar):
+    """
+    Test the socket's permissions; closing the server removes it.
+    """
+    application, server = sidecar
+    path = application.config['SIDECAR_SOCKET']
+    assert os.stat(path).st_mode & 0o777 == 0o660
+    server.shutdown()
+    server.server_close()
+    assert not os.path.exists(path)
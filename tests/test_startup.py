@@ -0,0 +1,22 @@
+"""
+test_startup.py
+---------------
+This module runs the cold-start benchmark: application creation must not
+load CLI-only dependencies and the boot-time schema check must be skipped
+on an up-to-date database.
+"""
+from benchmarks.startup import measure_startup
+
+# Generous bound: catches an accidental heavy import, not small slowdowns.
+CREATE_APP_BUDGET_MS = 5000
+
+
+def test_cold_start():
+    """
+    Test the start-up path of a replica in fresh interpreters.
+    """
+    results = measure_startup(repeat=1)
+    create_app = results['create_app']
+    assert create_app['loaded_lazy_modules'] == []
+    assert create_app['latency_ms']['max'] < CREATE_APP_BUDGET_MS
+    assert results['schema_check']['skipped'] is True
@@ -0,0 +1,186 @@
+"""
+test_tokens.py
+--------------
+This module contains tests for the claim profiles of access tokens: their
+encoding and size, and their acceptance by /verify, /logout and the sliding
+renewal whatever the configured profile, including the user directory that
+serves emails for the minimal profile.
+"""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from werkzeug.test import Client
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.models.token_blacklist import TokenBlacklist
+from app.tokens import expand_claims, issue_access_token
+
+CLAIMS = {
+    'sub': '0b8e5a57-3b8f-4e43-9b7e-6c3f0f1d2a11',
+    'email': 'zoë@example.com',
+    'company_id': '9c2d3f40-1a2b-4c5d-8e9f-a0b1c2d3e4f5',
+    'auth_time': 1700000000,
+}
+USER = {'id': CLAIMS['sub'], 'email': CLAIMS['email'],
+        'company_id': CLAIMS['company_id']}
+
+
+def profile_config(profile, **overrides):
+    """Build a testing configuration issuing ``profile`` tokens."""
+    return type('ProfileConfig', (TestingConfig,),
+                {'TOKEN_PROFILE': profile, **overrides})
+
+
+@pytest.fixture(params=[False, True], ids=['resource', 'fast path'])
+def minimal_app(request, monkeypatch):
+    """An application issuing minimal tokens, with a stub user service."""
+    monkeypatch.setattr('app.resources.login.check_credentials',
+                        lambda email, password: USER)
+    application = create_app(profile_config(
+        'minimal', VERIFY_FAST_PATH=request.param))
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.drop_all()
+
+
+def decode(token):
+    """Decode a token without expanding its claims."""
+    return jwt.decode(token, os.environ['JWT_SECRET'], algorithms=['HS256'])
+
+
+@pytest.mark.parametrize('profile', ['full', 'compact', 'minimal'])
+def test_profiles_round_trip(profile):
+    """
+    Test that every profile expands back to the same identity.
+    """
+    token, _ = issue_access_token(CLAIMS, os.environ['JWT_SECRET'],
+                                  profile=profile)
+    claims = expand_claims(decode(token))
+    expected = dict(CLAIMS)
+    if profile == 'minimal':
+        del expected['email']
+    assert {key: claims[key] for key in expected} == expected
+    assert ('email' in claims) is (profile != 'minimal')
+    assert isinstance(claims['exp'], int) and claims['jti']
+
+
+def test_compact_tokens_are_smaller():
+    """
+    Test the encoding of compact tokens and their size.
+    """
+    secret = os.environ['JWT_SECRET']
+    sizes = {profile: len(issue_access_token(CLAIMS, secret,
+                                             profile=profile)[0])
+             for profile in ('full', 'compact', 'minimal')}
+    assert sizes['full'] > sizes['compact'] > sizes['minimal']
+    assert sizes['compact'] < 0.8 * sizes['full']
+
+    token, _ = issue_access_token(CLAIMS, secret, profile='compact')
+    assert jwt.get_unverified_header(token) == {'alg': 'HS256'}
+    assert set(decode(token)) == {'U', 'C', 'e', 'at', 'j', 'exp'}
+    assert len(decode(token)['j']) == 22
+
+
+def test_non_uuid_ids_are_kept_as_is():
+    """
+    Test that ids which are not canonical UUIDs keep their value and type.
+    """
+    claims = {'sub': 1, 'company_id': 'ACME-42', 'email': 'a@b.c'}
+    token, _ = issue_access_token(claims, os.environ['JWT_SECRET'],
+                                  profile='compact')
+    assert decode(token)['u'] == 1
+    expanded = expand_claims(decode(token))
+    assert expanded['sub'] == 1 and expanded['company_id'] == 'ACME-42'
+
+
+def test_unknown_profile_is_rejected():
+    """
+    Test that an unknown TOKEN_PROFILE fails at start-up.
+    """
+    with pytest.raises(ValueError):
+        create_app(profile_config('tiny'))
+
+
+def test_verify_accepts_every_profile(client):
+    """
+    Test that /verify reports the same identity for every profile.
+    """
+    secret = os.environ['JWT_SECRET']
+    for profile in ('full', 'compact'):
+        token, _ = issue_access_token(CLAIMS, secret, profile=profile)
+        client.set_cookie('access_token', token)
+        response = client.get('/verify')
+        assert response.status_code == 200
+        assert response.json == {
+            'user_id': CLAIMS['sub'], 'email': CLAIMS['email'],
+            'company_id': CLAIMS['company_id'], 'valid': True}
+
+
+def test_malformed_compact_claims_are_invalid(client):
+    """
+    Test that compact ids that do not unpack make the token invalid.
+    """
+    token = jwt.encode({'U': '!!', 'j': 'x', 'exp': int(time.time()) + 60},
+                       os.environ['JWT_SECRET'], algorithm='HS256')
+    client.set_cookie('access_token', token)
+    response = client.get('/verify')
+    assert response.status_code == 401
+    assert response.json == {'message': 'Invalid token'}
+
+
+def test_minimal_email_comes_from_the_directory(minimal_app):
+    """
+    Test that a minimal token's email is served by /verify from the
+    directory filled at login.
+    """
+    client = Client(minimal_app)
+    response = client.post('/login', json={'email': USER['email'],
+                                           'password': 'secret'})
+    assert response.status_code == 200
+    token = client.get_cookie('access_token').value
+    assert 'e' not in decode(token)
+
+    for _ in range(2):
+        response = client.get('/verify')
+        assert response.status_code == 200
+        assert response.json['email'] == USER['email']
+        assert response.json['user_id'] == USER['id']
+    directory = minimal_app.extensions['user_directory']
+    assert directory.misses == 1 and directory.hits == 1
+
+
+def test_minimal_token_logout(minimal_app):
+    """
+    Test that /logout revokes a minimal token under its JTI.
+    """
+    client = Client(minimal_app)
+    client.post('/login', json={'email': USER['email'], 'password': 'x'})
+    jti = decode(client.get_cookie('access_token').value)['j']
+    assert client.post('/logout').status_code == 200
+    assert TokenBlacklist.query.filter_by(jti=jti).count() == 1
+
+
+def test_renewal_keeps_the_profile():
+    """
+    Test that sliding renewal issues tokens of the configured profile.
+    """
+    application = create_app(profile_config('minimal', SLIDING_RENEWAL=True))
+    issued = datetime.now(timezone.utc) - timedelta(minutes=14)
+    claims = {**CLAIMS, 'auth_time': int(issued.timestamp())}
+    token, _ = issue_access_token(claims, os.environ['JWT_SECRET'], issued,
+                                  'minimal')
+    with application.app_context():
+        db.create_all()
+        client = application.test_client()
+        client.set_cookie('access_token', token)
+        assert client.get('/verify').status_code == 200
+        renewed = decode(client.get_cookie('access_token').value)
+        db.drop_all()
+    assert renewed['j'] != decode(token)['j']
+    assert 'e' not in renewed and renewed['U'] == decode(token)['U']
@@ -0,0 +1,200 @@
+"""
+test_tracing.py
+---------------
+This module contains tests for the lightweight tracer: trace-context parsing,
+request/JWT/DB spans, propagation to the user service and the exporters.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+import requests
+
+from app import create_app
+from app.config import TestingConfig
+from app.models import db
+from app.tracing import (
+    BatchSpanProcessor,
+    FileSpanExporter,
+    InMemorySpanExporter,
+    parse_traceparent,
+    start_span,
+    tracer,
+)
+from app.utils import check_credentials
+
+INCOMING_TRACE_ID = '4bf92f3577b34da6a3ce929d0e0e4736'
+INCOMING_PARENT_ID = '00f067aa0ba902b7'
+
+
+class TracingConfig(TestingConfig):
+    """Testing configuration with the in-memory span exporter."""
+    TRACING_ENABLED = True
+    TRACING_EXPORTER = 'memory'
+    TRACING_FLUSH_INTERVAL = 0.01
+
+
+@pytest.fixture
+def traced_app():
+    """Application with tracing enabled; the tracer is reset afterwards."""
+    application = create_app(TracingConfig)
+    with application.app_context():
+        db.create_all()
+        yield application
+        db.drop_all()
+    tracer.configure(None)
+
+
+def exported_spans(application):
+    """Flush the processor and return the exported span dictionaries."""
+    processor = application.extensions['tracing']
+    assert processor.force_flush()
+    return processor.exporter.spans
+
+
+def test_parse_traceparent():
+    """
+    Test that well-formed headers are parsed and invalid ones rejected.
+    """
+    header = f'00-{INCOMING_TRACE_ID}-{INCOMING_PARENT_ID}-01'
+    assert parse_traceparent(header) == (
+        INCOMING_TRACE_ID, INCOMING_PARENT_ID, '01')
+    assert parse_traceparent(None) is None
+    assert parse_traceparent('garbage') is None
+    assert parse_traceparent(f'00-{"0" * 32}-{INCOMING_PARENT_ID}-01') is None
+    assert parse_traceparent(f'ff-{INCOMING_TRACE_ID}-{INCOMING_PARENT_ID}-01') is None
+
+
+def test_disabled_tracer_returns_noop_span():
+    """
+    Test that spans cost nothing when tracing is not configured.
+    """
+    with start_span('noop') as span:
+        span.set_attribute('key', 'value')
+    assert not tracer.enabled
+
+
+def test_traced_app_after_tracer_reset(traced_app):
+    """
+    Test that a traced application keeps serving once the tracer has no
+    processor.
+    """
+    tracer.configure(None)
+    response = traced_app.test_client().get('/version')
+    assert response.status_code == 200
+    assert 'traceparent' not in response.headers
+
+
+def test_verify_request_spans(traced_app):
+    """
+    Test that /verify emits handler, JWT and DB spans in the incoming trace.
+    """
+    token = jwt.encode(
+        {
+            'sub': '1',
+            'jti': 'trace-jti',
+            'exp': datetime.now(timezone.utc) + timedelta(minutes=5),
+        },
+        os.environ['JWT_SECRET'],
+        algorithm='HS256'
+    )
+    client = traced_app.test_client()
+    client.set_cookie('access_token', token)
+    response = client.get('/verify', headers={
+        'traceparent': f'00-{INCOMING_TRACE_ID}-{INCOMING_PARENT_ID}-01'
+    })
+    assert response.status_code == 200
+
+    spans = exported_spans(traced_app)
+    by_name = {span['name']: span for span in spans}
+    root = by_name['GET /verify']
+    assert root['trace_id'] == INCOMING_TRACE_ID
+    assert root['parent_id'] == INCOMING_PARENT_ID
+    assert root['attributes']['http.status_code'] == 200
+    assert by_name['jwt.decode']['parent_id'] == root['span_id']
+    assert by_name['db.statement']['parent_id'] == root['span_id']
+    assert 'token_blacklist' in by_name['db.statement']['attributes']['db.statement']
+    assert all(span['trace_id'] == INCOMING_TRACE_ID for span in spans)
+
+
+def test_user_service_call_propagates_trace(traced_app, monkeypatch):
+    """
+    Test that the user-service call is traced and carries traceparent.
+    """
+    captured = {}
+
+    class FakeResp:
+        status_code = 200
+        text = 'ok'
+
+        def json(self):
+            return {'id': 7, 'email': 'foo@bar.com'}
+
+    def fake_post(*a, **k):
+        captured['headers'] = k['headers']
+        return FakeResp()
+
+    monkeypatch.setenv('FLASK_ENV', 'production')
+    monkeypatch.setenv('USER_SERVICE_URL', 'http://fake')
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', 'secret')
+    monkeypatch.setattr(requests, 'post', fake_post)
+
+    with start_span('login') as parent:
+        assert check_credentials('foo@bar.com', 'pass')['id'] == 7
+
+    spans = exported_spans(traced_app)
+    call = next(s for s in spans if s['name'] == 'user_service.verify_password')
+    assert call['parent_id'] == parent.span_id
+    assert call['attributes']['http.status_code'] == 200
+    assert captured['headers']['traceparent'] == (
+        f"00-{parent.trace_id}-{call['span_id']}-01")
+    assert captured['headers']['X-Internal-Token'] == 'secret'
+
+
+def test_file_exporter_writes_json_lines(tmp_path):
+    """
+    Test that the file exporter appends one JSON document per span.
+    """
+    path = tmp_path / 'spans.jsonl'
+    processor = BatchSpanProcessor(FileSpanExporter(str(path)),
+                                   flush_interval=0.01)
+    tracer.configure(processor)
+    try:
+        with start_span('outer'):
+            with start_span('inner', key='value'):
+                pass
+        assert processor.force_flush()
+    finally:
+        tracer.configure(None)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line['name'] for line in lines] == ['inner', 'outer']
+    assert lines[0]['parent_id'] == lines[1]['span_id']
+    assert lines[0]['attributes'] == {'key': 'value'}
+
+
+def test_processor_drops_instead_of_blocking():
+    """
+    Test that a full queue drops spans rather than blocking the caller.
+    """
+    release = threading.Event()
+
+    class BlockingExporter(InMemorySpanExporter):
+        def export(self, spans):
+            release.wait(5)
+            super().export(spans)
+
+    processor = BatchSpanProcessor(BlockingExporter(), max_queue_size=2,
+                                   max_batch_size=1, flush_interval=0.01)
+    tracer.configure(processor)
+    try:
+        for i in range(20):
+            with start_span(f'span-{i}'):
+                pass
+        assert processor.dropped > 0
+    finally:
+        release.set()
+        tracer.configure(None)
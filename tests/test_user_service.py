@@ -0,0 +1,131 @@
+"""
+test_user_service.py
+--------------------
+This module contains tests for the user-service emulator and for the
+production path of check_credentials (HTTP call, timeouts, JSON parsing)
+exercised against it.
+"""
+import random
+import time
+
+import pytest
+
+from app.utils import check_credentials
+from benchmarks.user_service import BAD_PASSWORD, FaultProfile, parse_latency
+
+
+@pytest.mark.parametrize("spec,low,high", [
+    ("0", 0.0, 0.0),
+    ("20", 0.020, 0.020),
+    ("fixed:5", 0.005, 0.005),
+    ("uniform:10,20", 0.010, 0.020),
+    ("lognormal:20,0.5", 0.0, 1.0),
+    ("exp:10", 0.0, 1.0),
+])
+def test_parse_latency(spec, low, high):
+    """
+    Test that latency specifications produce delays in the expected range.
+    """
+    sampler = parse_latency(spec)
+    rng = random.Random(0)
+    for _ in range(50):
+        assert low <= sampler(rng) <= high
+
+
+@pytest.mark.parametrize("spec", ["bogus:1", "uniform:1", "fixed:x"])
+def test_parse_latency_rejects_invalid_specs(spec):
+    """
+    Test that malformed latency specifications raise ValueError.
+    """
+    with pytest.raises(ValueError):
+        parse_latency(spec)
+
+
+def test_fault_profile_draws_outcomes_by_rate():
+    """
+    Test that outcomes are drawn with the configured probabilities.
+    """
+    faults = FaultProfile(reset_rate=0.1, error_rate=0.2)
+    rng = random.Random(1)
+    draws = [faults.draw_outcome(rng) for _ in range(5000)]
+    assert 0.07 < draws.count('reset') / 5000 < 0.13
+    assert 0.17 < draws.count('error') / 5000 < 0.23
+    assert set(draws) == {'reset', 'error', 'ok'}
+
+
+def test_check_credentials_success_over_http(user_service):
+    """
+    Test the real HTTP path of check_credentials against the emulator.
+    """
+    user = check_credentials('alice@example.com', 'secret')
+    assert user['email'] == 'alice@example.com'
+    assert user['id']
+    assert user_service.stats['requests'] == 1
+    assert user_service.stats['ok'] == 1
+
+
+def test_check_credentials_rejected_password(user_service):
+    """
+    Test that a 401 from the user service yields no user.
+    """
+    assert check_credentials('alice@example.com', BAD_PASSWORD) is None
+
+
+def test_check_credentials_wrong_internal_token(user_service, monkeypatch):
+    """
+    Test that the internal token is checked by the emulator.
+    """
+    monkeypatch.setenv('INTERNAL_AUTH_TOKEN', 'not-the-token')
+    assert check_credentials('alice@example.com', 'secret') is None
+
+
+def test_check_credentials_injected_error(user_service):
+    """
+    Test that injected 5xx answers yield no user.
+    """
+    user_service.faults.error_rate = 1.0
+    assert check_credentials('alice@example.com', 'secret') is None
+    assert user_service.stats['error'] == 1
+
+
+def test_check_credentials_connection_reset(user_service):
+    """
+    Test that a reset connection is handled as a connection error.
+    """
+    user_service.faults.reset_rate = 1.0
+    assert check_credentials('alice@example.com', 'secret') is None
+    assert user_service.stats['reset'] == 1
+
+
+def test_check_credentials_invalid_json(user_service):
+    """
+    Test that a non-JSON 200 body is handled as a decoding error.
+    """
+    user_service.faults.invalid_json_rate = 1.0
+    assert check_credentials('alice@example.com', 'secret') is None
+
+
+def test_check_credentials_timeout(user_service, monkeypatch):
+    """
+    Test that an upstream slower than USER_SERVICE_TIMEOUT yields no user.
+    """
+    monkeypatch.setenv('USER_SERVICE_TIMEOUT', '0.1')
+    user_service.faults.latency = '400'
+    started = time.monotonic()
+    assert check_credentials('alice@example.com', 'secret') is None
+    assert time.monotonic() - started < 0.4
+
+
+def test_check_credentials_slow_body(user_service, monkeypatch):
+    """
+    Test that a body stalling longer than the read timeout yields no user,
+    while a slow body within the timeout is still accepted.
+    """
+    monkeypatch.setenv('USER_SERVICE_TIMEOUT', '0.2')
+    user_service.faults.slow_body_rate = 1.0
+    user_service.faults.slow_body_chunks = 2
+    user_service.faults.slow_body_ms = 20
+    assert check_credentials('alice@example.com', 'secret')['id']
+
+    user_service.faults.slow_body_ms = 400
+    assert check_credentials('alice@example.com', 'secret') is None
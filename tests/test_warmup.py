@@ -0,0 +1,86 @@
+"""
+test_warmup.py
+--------------
+This module contains tests for the preload warm-up: hot-query compilation,
+import warm-up, gc.freeze and the fork safety of the span exporter.
+"""
+import gc
+
+from app.models import db
+from app.models.refresh_token import RefreshToken
+from app.models.token_blacklist import TokenBlacklist
+from app.tracing import BatchSpanProcessor, InMemorySpanExporter, Span
+from app.warmup import preload, warm_imports, warm_queries
+
+
+def test_warm_queries_fill_compiled_cache_and_leave_no_rows(app):
+    """
+    Test that hot queries are compiled and cached without persisting data.
+    """
+    cache = db.engine._compiled_cache  # pylint: disable=protected-access
+    before = len(cache)
+    assert warm_queries() is True
+    assert len(cache) > before
+    assert RefreshToken.query.count() == 0
+    assert TokenBlacklist.query.count() == 0
+
+    # Running the queries again hits the cache: nothing new is compiled.
+    filled = len(cache)
+    warm_queries()
+    assert len(cache) == filled
+
+
+def test_warm_queries_without_schema(app):
+    """
+    Test that a missing schema is reported instead of raised.
+    """
+    db.drop_all()
+    assert warm_queries() is False
+    db.create_all()
+
+
+def test_warm_imports():
+    """
+    Test that the JWT algorithms module is always warmed.
+    """
+    assert 'jwt.algorithms' in warm_imports()
+
+
+def test_preload_freezes_objects(app):
+    """
+    Test that preload moves surviving objects to the permanent generation.
+    """
+    try:
+        result = preload(app)
+        assert result['queries'] is True
+        assert result['frozen'] > 0
+        assert gc.get_freeze_count() == result['frozen']
+    finally:
+        gc.unfreeze()
+
+
+def test_preload_without_freeze(app):
+    """
+    Test that freezing can be disabled.
+    """
+    assert preload(app, freeze=False)['frozen'] == 0
+    assert gc.get_freeze_count() == 0
+
+
+def test_span_processor_restarts_after_fork():
+    """
+    Test that the exporter thread is restarted in a forked child.
+    """
+    exporter = InMemorySpanExporter()
+    processor = BatchSpanProcessor(exporter, flush_interval=0.01)
+    try:
+        parent_thread = processor._thread  # pylint: disable=protected-access
+        processor._after_fork()  # pylint: disable=protected-access
+        assert processor._thread is not parent_thread  # pylint: disable=protected-access
+        assert processor._thread.is_alive()  # pylint: disable=protected-access
+        span = Span(processor, 'op', '0' * 32, None)
+        span.end()
+        assert processor.force_flush()
+        assert len(exporter.spans) == 1
+    finally:
+        processor.shutdown()